@@ -0,0 +1,31 @@
+# backend/app/backfill_sales_rollup.py
+
+import argparse
+from datetime import date
+
+from .database import get_session_local
+from .services.sales_rollup import backfill
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reconstruye daily_sales_rollup a partir de point_of_sale_transactions."
+    )
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="Primer día (YYYY-MM-DD).")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="Último día (YYYY-MM-DD).")
+    args = parser.parse_args()
+
+    db = get_session_local()()
+    try:
+        rows = backfill(db, args.start, args.end)
+        db.commit()
+        print(f"Filas de rollup reconstruidas: {rows}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
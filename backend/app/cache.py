@@ -1,24 +1,52 @@
 """
 Sistema de caché con Redis para la aplicación
 """
-import json
-import pickle
+import asyncio
 from typing import Any, Optional, Union, Dict, List
 from datetime import timedelta
 import redis
+import redis.asyncio as aioredis
 from functools import wraps
 import hashlib
 import logging
+import re
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .cache_codec import cache_codec
+from .local_cache import local_cache, invalidation_bus
+from .metrics import metrics_registry
+from .single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
+# Contador de generación por namespace: las claves versionadas incluyen la
+# generación vigente (cache:<namespace>:v<gen>:<clave>) y se invalidan todas
+# a la vez con un INCR, sin recorrer el keyspace
+GENERATION_PREFIX = "cache:gen:"
+_VERSIONED_KEY = re.compile(r"^cache:([^:]+):v(\d+):")
+
+# Claves que no son caché y comparten la base de Redis: las ventas aceptadas en
+# modo reservas solo existen en estas colas hasta que el escritor las persiste
+# (services/stock_reservation). Los borrados masivos de caché no las tocan
+PROTECTED_PREFIXES = ("stock:reservations:", "stock:counter:")
+
+def _is_protected(key: Union[bytes, str]) -> bool:
+    return _key_text(key).startswith(PROTECTED_PREFIXES)
+
+def _key_text(key: Union[bytes, str]) -> str:
+    return key.decode() if isinstance(key, bytes) else key
+
 class CacheManager:
     """Gestor de caché con Redis"""
     
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
+    def __init__(self, redis_url: str = "redis://localhost:6379", async_max_connections: int = 50):
         self.redis_url = redis_url
+        self.async_max_connections = async_max_connections
         self.redis_client: Optional[redis.Redis] = None
-        self.async_redis_client: Optional[redis.Redis] = None
+        self.async_redis_client: Optional[aioredis.Redis] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
         
     def get_sync_client(self) -> redis.Redis:
         """Obtiene cliente Redis síncrono"""
@@ -33,38 +61,41 @@ class CacheManager:
             )
         return self.redis_client
     
-    async def get_async_client(self) -> redis.Redis:
-        """Obtiene cliente Redis asíncrono - usando cliente sync por compatibilidad"""
-        if self.async_redis_client is None:
-            self.async_redis_client = redis.from_url(
+    async def get_async_client(self) -> aioredis.Redis:
+        """
+        Obtiene cliente redis.asyncio (pool de conexiones propio)
+
+        Las conexiones quedan ligadas al event loop que las abre: si cambia el
+        loop (p. ej. asyncio.run en tareas o tests) se crea un pool nuevo.
+        """
+        loop = asyncio.get_running_loop()
+        if self.async_redis_client is None or self._async_loop is not loop:
+            self.async_redis_client = aioredis.from_url(
                 self.redis_url,
                 decode_responses=False,
+                max_connections=self.async_max_connections,
                 socket_connect_timeout=5,
                 socket_timeout=5,
-                retry_on_timeout=True
+                retry_on_timeout=True,
+                health_check_interval=30
             )
+            self._async_loop = loop
         return self.async_redis_client
     
+    async def aclose(self):
+        """Cierra el pool asíncrono (al apagar la aplicación)"""
+        client, self.async_redis_client = self.async_redis_client, None
+        if client is not None and self._async_loop is asyncio.get_running_loop():
+            await client.aclose()
+        self._async_loop = None
+    
     def _serialize(self, data: Any) -> bytes:
-        """Serializa datos para almacenar en Redis"""
-        try:
-            # Intentar JSON primero (más eficiente)
-            if isinstance(data, (dict, list, str, int, float, bool)) or data is None:
-                return json.dumps(data, default=str).encode('utf-8')
-            else:
-                # Usar pickle para objetos más complejos
-                return pickle.dumps(data)
-        except (TypeError, ValueError):
-            return pickle.dumps(data)
+        """Serializa datos para almacenar en Redis (ver cache_codec)"""
+        return cache_codec.encode(data)
     
     def _deserialize(self, data: bytes) -> Any:
-        """Deserializa datos desde Redis"""
-        try:
-            # Intentar JSON primero
-            return json.loads(data.decode('utf-8'))
-        except (json.JSONDecodeError, UnicodeDecodeError):
-            # Usar pickle como fallback
-            return pickle.loads(data)
+        """Deserializa datos desde Redis (formato actual o anterior)"""
+        return cache_codec.decode(data)
     
     def _generate_key(self, prefix: str, *args, **kwargs) -> str:
         """Genera clave única para el caché"""
@@ -138,18 +169,156 @@ class CacheManager:
             logger.error(f"Error deleting cache key {key}: {e}")
             return False
     
-    def delete_pattern(self, pattern: str) -> int:
-        """Elimina claves que coincidan con un patrón"""
+    async def adelete(self, key: str) -> bool:
+        """Elimina clave del caché (asíncrono)"""
         try:
-            client = self.get_sync_client()
-            keys = client.keys(pattern)
-            if keys:
-                return client.delete(*keys)
-            return 0
+            client = await self.get_async_client()
+            return bool(await client.delete(key))
+        except Exception as e:
+            logger.error(f"Error deleting async cache key {key}: {e}")
+            return False
+    
+    def delete_pattern(self, pattern: str, batch_size: int = 500) -> int:
+        """
+        Elimina claves que coincidan con un patrón
+
+        Recorre el keyspace con SCAN por bloques (KEYS bloquea Redis durante
+        todo el recorrido). Para invalidar un grupo de claves en caliente usar
+        bump_generation() con claves versionadas. Nunca borra PROTECTED_PREFIXES.
+        """
+        try:
+            return self._unlink_matching(pattern, batch_size)
         except Exception as e:
             logger.error(f"Error deleting cache pattern {pattern}: {e}")
             return 0
     
+    def _unlink_matching(self, pattern: str, batch_size: int) -> int:
+        client = self.get_sync_client()
+        removed = 0
+        batch = []
+        for key in client.scan_iter(match=pattern, count=batch_size):
+            if _is_protected(key):
+                continue
+            batch.append(key)
+            if len(batch) >= batch_size:
+                removed += client.unlink(*batch)
+                batch = []
+        if batch:
+            removed += client.unlink(*batch)
+        return removed
+    
+    async def adelete_pattern(self, pattern: str, batch_size: int = 500) -> int:
+        """Elimina claves que coincidan con un patrón (asíncrono, SCAN + UNLINK por bloques)"""
+        try:
+            client = await self.get_async_client()
+            removed = 0
+            batch = []
+            async for key in client.scan_iter(match=pattern, count=batch_size):
+                if _is_protected(key):
+                    continue
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    removed += await client.unlink(*batch)
+                    batch = []
+            if batch:
+                removed += await client.unlink(*batch)
+            return removed
+        except Exception as e:
+            logger.error(f"Error deleting async cache pattern {pattern}: {e}")
+            return 0
+    
+    def generation(self, namespace: str) -> int:
+        """Generación vigente del namespace (0 si nunca se ha invalidado)"""
+        try:
+            value = self.get_sync_client().get(GENERATION_PREFIX + namespace)
+            return int(value) if value is not None else 0
+        except Exception as e:
+            logger.error(f"Error reading cache generation {namespace}: {e}")
+            return 0
+    
+    async def ageneration(self, namespace: str) -> int:
+        """Generación vigente del namespace (asíncrono)"""
+        try:
+            client = await self.get_async_client()
+            value = await client.get(GENERATION_PREFIX + namespace)
+            return int(value) if value is not None else 0
+        except Exception as e:
+            logger.error(f"Error reading async cache generation {namespace}: {e}")
+            return 0
+    
+    def versioned_key(self, namespace: str, key: str) -> str:
+        """Clave con la generación vigente del namespace"""
+        return f"cache:{namespace}:v{self.generation(namespace)}:{key}"
+    
+    async def aversioned_key(self, namespace: str, key: str) -> str:
+        """Clave con la generación vigente del namespace (asíncrono)"""
+        return f"cache:{namespace}:v{await self.ageneration(namespace)}:{key}"
+    
+    def bump_generation(self, *namespaces: str) -> bool:
+        """Invalida todas las claves versionadas de los namespaces (un INCR por namespace)"""
+        try:
+            pipe = self.get_sync_client().pipeline(transaction=False)
+            for namespace in namespaces:
+                pipe.incr(GENERATION_PREFIX + namespace)
+                # La L1 de cada worker no usa generaciones: se vacía por pub/sub
+                invalidation_bus.publish(pipe, namespace)
+            pipe.execute()
+            metrics_registry.counter('cache_generation_bumps_total').increment(len(namespaces))
+            return True
+        except Exception as e:
+            logger.error(f"Error bumping cache generation {namespaces}: {e}")
+            return False
+    
+    def delete_versioned(self, namespace: str, keys: List[str]) -> bool:
+        """Borra claves versionadas concretas y las descarta de la L1 de todos los workers"""
+        keys = [str(key) for key in keys]
+        if not keys:
+            return True
+        try:
+            generation = self.generation(namespace)
+            pipe = self.get_sync_client().pipeline(transaction=False)
+            pipe.unlink(*[f"cache:{namespace}:v{generation}:{key}" for key in keys])
+            invalidation_bus.publish(pipe, namespace, keys)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting versioned cache keys {namespace}: {e}")
+            return False
+    
+    def reap_stale_generations(self, batch_size: int = 500) -> int:
+        """
+        Borra claves versionadas de generaciones anteriores
+
+        Las claves huérfanas tras un bump_generation() caducan por su TTL; este
+        barrido (SCAN por bloques, sin bloquear Redis) libera antes la memoria
+        y limpia las que no tienen expiración.
+        """
+        try:
+            client = self.get_sync_client()
+            counters = list(client.scan_iter(match=GENERATION_PREFIX + "*", count=batch_size))
+            if not counters:
+                return 0
+            current = {
+                _key_text(key)[len(GENERATION_PREFIX):]: int(value)
+                for key, value in zip(counters, client.mget(counters)) if value is not None
+            }
+            removed = 0
+            stale = []
+            for key in client.scan_iter(match="cache:*:v*", count=batch_size):
+                match = _VERSIONED_KEY.match(_key_text(key))
+                if match and int(match.group(2)) < current.get(match.group(1), 0):
+                    stale.append(key)
+                    if len(stale) >= batch_size:
+                        removed += client.unlink(*stale)
+                        stale = []
+            if stale:
+                removed += client.unlink(*stale)
+            metrics_registry.counter('cache_reaped_keys_total').increment(removed)
+            return removed
+        except Exception as e:
+            logger.error(f"Error reaping stale cache generations: {e}")
+            return 0
+    
     def exists(self, key: str) -> bool:
         """Verifica si existe una clave en el caché"""
         try:
@@ -159,23 +328,43 @@ class CacheManager:
             logger.error(f"Error checking cache key existence {key}: {e}")
             return False
     
+    async def aexists(self, key: str) -> bool:
+        """Verifica si existe una clave en el caché (asíncrono)"""
+        try:
+            client = await self.get_async_client()
+            return bool(await client.exists(key))
+        except Exception as e:
+            logger.error(f"Error checking async cache key existence {key}: {e}")
+            return False
+    
     def get_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas del caché"""
         try:
             client = self.get_sync_client()
-            info = client.info()
-            return {
-                "used_memory": info.get("used_memory_human", "N/A"),
-                "connected_clients": info.get("connected_clients", 0),
-                "total_commands_processed": info.get("total_commands_processed", 0),
-                "keyspace_hits": info.get("keyspace_hits", 0),
-                "keyspace_misses": info.get("keyspace_misses", 0),
-                "hit_rate": self._calculate_hit_rate(info)
-            }
+            return self._stats_from_info(client.info())
         except Exception as e:
             logger.error(f"Error getting cache stats: {e}")
             return {}
     
+    async def aget_stats(self) -> Dict[str, Any]:
+        """Obtiene estadísticas del caché (asíncrono)"""
+        try:
+            client = await self.get_async_client()
+            return self._stats_from_info(await client.info())
+        except Exception as e:
+            logger.error(f"Error getting async cache stats: {e}")
+            return {}
+    
+    def _stats_from_info(self, info: Dict) -> Dict[str, Any]:
+        return {
+            "used_memory": info.get("used_memory_human", "N/A"),
+            "connected_clients": info.get("connected_clients", 0),
+            "total_commands_processed": info.get("total_commands_processed", 0),
+            "keyspace_hits": info.get("keyspace_hits", 0),
+            "keyspace_misses": info.get("keyspace_misses", 0),
+            "hit_rate": self._calculate_hit_rate(info)
+        }
+    
     def _calculate_hit_rate(self, info: Dict) -> float:
         """Calcula la tasa de aciertos del caché"""
         hits = info.get("keyspace_hits", 0)
@@ -184,10 +373,15 @@ class CacheManager:
         return (hits / total * 100) if total > 0 else 0.0
     
     def flush_all(self) -> bool:
-        """Limpia todo el caché (usar con cuidado)"""
+        """
+        Limpia todo el caché (usar con cuidado)
+        
+        No usa FLUSHDB: la base de Redis también guarda las colas de reservas
+        de stock (PROTECTED_PREFIXES), que no se pueden regenerar.
+        """
         try:
-            client = self.get_sync_client()
-            return client.flushdb()
+            self._unlink_matching("*", 500)
+            return True
         except Exception as e:
             logger.error(f"Error flushing cache: {e}")
             return False
@@ -197,6 +391,18 @@ cache_manager = CacheManager()
 
 # Decoradores para cachear funciones
 
+_SESSION_TYPES = (Session, AsyncSession)
+
+def _local_key(func, args: tuple, kwargs: dict) -> str:
+    """Clave del resultado en su namespace (las sesiones de BD no forman parte de la clave)"""
+    key_args = tuple(arg for arg in args if not isinstance(arg, _SESSION_TYPES))
+    key_kwargs = sorted((name, value) for name, value in kwargs.items() if not isinstance(value, _SESSION_TYPES))
+    key_data = f"{key_args}:{key_kwargs}"
+    return f"{func.__name__}:{hashlib.md5(key_data.encode()).hexdigest()}"
+
+def _ttl_seconds(expire: Optional[Union[int, timedelta]]) -> Optional[int]:
+    return int(expire.total_seconds()) if isinstance(expire, timedelta) else expire
+
 def cached(
     expire: Optional[Union[int, timedelta]] = None,
     key_prefix: str = "func",
@@ -216,23 +422,64 @@ def cached(
             if skip_cache:
                 return func(*args, **kwargs)
             
-            # Generar clave del caché
-            cache_key = cache_manager._generate_key(
-                f"{key_prefix}:{func.__name__}", *args, **kwargs
-            )
+            local_key = _local_key(func, args, kwargs)
             
-            # Intentar obtener del caché
-            cached_result = cache_manager.get(cache_key)
-            if cached_result is not None:
-                logger.debug(f"Cache hit for {cache_key}")
-                return cached_result
+            # L1 del proceso
+            local_result = local_cache.get(key_prefix, local_key)
+            if local_result is not None:
+                return local_result
+            epoch = local_cache.epoch(key_prefix)
+            local_ttl = _ttl_seconds(expire)
             
-            # Ejecutar función y cachear resultado
-            logger.debug(f"Cache miss for {cache_key}")
-            result = func(*args, **kwargs)
+            # Redis (versionada por key_prefix); en un fallo solo una llamada
+            # ejecuta la función y el resto espera o sirve el valor anterior
+            cache_key = cache_manager.versioned_key(key_prefix, local_key)
+            result = single_flight.fetch(
+                cache_manager.get_sync_client, cache_key, lambda: func(*args, **kwargs),
+                local_ttl, cache_manager._serialize, cache_manager._deserialize
+            )
             
             if result is not None:  # Solo cachear si hay resultado
-                cache_manager.set(cache_key, result, expire)
+                local_cache.set(key_prefix, local_key, result, local_ttl, epoch=epoch)
+            
+            return result
+        
+        return wrapper
+    return decorator
+
+def async_cached(
+    expire: Optional[Union[int, timedelta]] = None,
+    key_prefix: str = "func",
+    skip_cache: bool = False
+):
+    """
+    Variante de @cached para funciones async def (p. ej. rutas async de FastAPI)
+    
+    Usa el pool redis.asyncio, así que las esperas a Redis no bloquean el
+    event loop. Comparte claves, L1 e invalidación con @cached.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if skip_cache:
+                return await func(*args, **kwargs)
+            
+            local_key = _local_key(func, args, kwargs)
+            
+            local_result = local_cache.get(key_prefix, local_key)
+            if local_result is not None:
+                return local_result
+            epoch = local_cache.epoch(key_prefix)
+            local_ttl = _ttl_seconds(expire)
+            
+            cache_key = await cache_manager.aversioned_key(key_prefix, local_key)
+            result = await single_flight.afetch(
+                cache_manager.get_async_client, cache_key, lambda: func(*args, **kwargs),
+                local_ttl, cache_manager._serialize, cache_manager._deserialize
+            )
+            
+            if result is not None:
+                local_cache.set(key_prefix, local_key, result, local_ttl, epoch=epoch)
             
             return result
         
@@ -243,6 +490,10 @@ def invalidate_cache_pattern(pattern: str):
     """Invalida caché por patrón"""
     return cache_manager.delete_pattern(pattern)
 
+def invalidate_cache_namespace(*namespaces: str):
+    """Invalida las claves de @cached(key_prefix=...) y demás claves versionadas del namespace"""
+    return cache_manager.bump_generation(*namespaces)
+
 def invalidate_cache_key(key: str):
     """Invalida una clave específica del caché"""
     return cache_manager.delete(key)
@@ -285,8 +536,7 @@ def get_cached_product_list(skip: int = 0, limit: int = 20):
 
 def invalidate_products_cache():
     """Invalida todo el caché de productos"""
-    cache_manager.delete_pattern("cache:products:*")
-    cache_manager.delete_pattern("cache:product_search:*")
+    cache_manager.bump_generation("product", "products", "product_search")
 
 def cache_user_session(user_id: int, session_data: Dict):
     """Cachea datos de sesión de usuario"""
@@ -0,0 +1,291 @@
+"""
+Codec de los valores guardados en Redis
+
+Formato v1: [versión (1 byte)][compresión (1 byte)][payload msgpack]
+
+- Los modelos ORM y esquemas pydantic registrados se codifican como tipos
+  extendidos de msgpack: etiqueta del tipo + huella de sus campos + valores
+  en orden, sin nombres de campo ni estado interno de SQLAlchemy. Si los campos
+  cambian (migración), la huella no coincide y el valor se trata como fallo
+- Decimal, datetime y date tienen su propio tipo extendido; lo que msgpack no
+  sabe representar se guarda con pickle dentro de un tipo extendido
+- El payload se comprime (zstd, lz4 o zlib) solo por encima de
+  compress_threshold bytes: por debajo la compresión cuesta más de lo que ahorra
+
+Despliegue: decode() entiende también los formatos anteriores (JSON, pickle y
+pickle con gzip), así que los valores ya guardados siguen sirviendo. Con
+write_version=0 se sigue escribiendo el formato anterior de cada llamador
+(legacy=LEGACY_JSON, LEGACY_PICKLE o LEGACY_GZIP_PICKLE) hasta que todos los
+workers lean v1; después se activa write_version=1. Una versión desconocida
+lanza CodecError y quien lee lo trata como un fallo de caché.
+"""
+import datetime
+import decimal
+import gzip
+import json
+import pickle
+import threading
+import zlib
+from typing import Any, Callable, Dict, List
+
+import msgpack
+
+from .logging_config import get_logger
+from .metrics import metrics_registry
+
+logger = get_logger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZSTD = 1
+COMPRESSION_LZ4 = 2
+COMPRESSION_ZLIB = 3
+
+# Formato anterior de cada llamador, para write_version=0
+LEGACY_JSON = "json"  # CacheManager: JSON para tipos básicos, pickle para el resto
+LEGACY_PICKLE = "pickle"  # IntelligentCache
+LEGACY_GZIP_PICKLE = "gzip_pickle"  # AdvancedCache con compresión
+
+_COMPRESSION_IDS = {"none": COMPRESSION_NONE, "zstd": COMPRESSION_ZSTD, "lz4": COMPRESSION_LZ4, "zlib": COMPRESSION_ZLIB}
+
+# Tipos extendidos de msgpack: 1-15 reservados para el codec, 16-127 para tipos registrados
+_EXT_PICKLE = 1
+_EXT_DATETIME = 2
+_EXT_DATE = 3
+_EXT_DECIMAL = 4
+
+
+class CodecError(ValueError):
+    """Valor con un formato que este worker no sabe leer"""
+
+
+def _fingerprint(fields: List[str]) -> int:
+    return zlib.crc32(",".join(fields).encode()) & 0xFFFF
+
+
+class _TypeCodec:
+    __slots__ = ("cls", "tag", "fields", "fingerprint", "build")
+
+    def __init__(self, cls: type, tag: int, fields: List[str], build: Callable[[type, Dict[str, Any]], Any]):
+        self.cls = cls
+        self.tag = tag
+        self.fields = fields
+        self.fingerprint = _fingerprint(fields)
+        self.build = build
+
+
+def _build_model(cls, values: Dict[str, Any]):
+    from sqlalchemy.orm import make_transient_to_detached
+    from sqlalchemy.orm.attributes import manager_of_class
+
+    # Como al cargar una fila (sin __init__ ni atributos modificados) y, como una
+    # instancia deserializada con pickle, desligada de la sesión
+    instance = manager_of_class(cls).new_instance()
+    instance.__dict__.update(values)
+    make_transient_to_detached(instance)
+    return instance
+
+
+def _build_schema(cls, values: Dict[str, Any]):
+    # Los valores salen de una instancia ya validada
+    return cls.model_construct(**values)
+
+
+class CacheCodec:
+    """Codificación compacta y versionada de los valores de la caché"""
+
+    def __init__(self, compression: str = "zstd", compress_threshold: int = 1024, write_version: int = VERSION):
+        self._types: Dict[type, _TypeCodec] = {}
+        self._tags: Dict[int, _TypeCodec] = {}
+        self._lock = threading.Lock()
+        self._defaults_loaded = False
+        self.configure(compression, compress_threshold, write_version)
+
+    def configure(self, compression: str, compress_threshold: int, write_version: int = VERSION):
+        if write_version not in (0, VERSION):
+            raise ValueError(f"Versión de codec no soportada: {write_version}")
+        self.compression = self._available_compression(compression)
+        self.compress_threshold = compress_threshold
+        self.write_version = write_version
+
+    @staticmethod
+    def _available_compression(name: str) -> int:
+        if name not in _COMPRESSION_IDS:
+            raise ValueError(f"Compresión desconocida: {name}")
+        compression = _COMPRESSION_IDS[name]
+        if compression == COMPRESSION_ZSTD and zstandard is None or \
+                compression == COMPRESSION_LZ4 and lz4_frame is None:
+            logger.warning("Cache compression library not installed, using zlib", compression=name)
+            return COMPRESSION_ZLIB
+        return compression
+
+    # Registro de tipos
+
+    def register_model(self, cls: type, tag: int):
+        """Registra un modelo ORM: se guardan sus columnas, no el estado de la instancia"""
+        from sqlalchemy import inspect
+
+        fields = [attr.key for attr in inspect(cls).column_attrs]
+        self._register(_TypeCodec(cls, tag, fields, _build_model))
+
+    def register_schema(self, cls: type, tag: int):
+        """Registra un esquema pydantic (v2)"""
+        self._register(_TypeCodec(cls, tag, list(cls.model_fields), _build_schema))
+
+    def _register(self, type_codec: _TypeCodec):
+        if not 16 <= type_codec.tag <= 127:
+            raise ValueError("Las etiquetas de tipos registrados van de 16 a 127")
+        with self._lock:
+            current = self._tags.get(type_codec.tag)
+            if current is not None and current.cls is not type_codec.cls:
+                raise ValueError(f"Etiqueta {type_codec.tag} ya usada por {current.cls.__name__}")
+            self._types[type_codec.cls] = type_codec
+            self._tags[type_codec.tag] = type_codec
+
+    def _ensure_defaults(self):
+        if self._defaults_loaded:
+            return
+        with self._lock:
+            if self._defaults_loaded:
+                return
+            self._defaults_loaded = True
+        # Import diferido: models y schemas cargan la configuración, que a su vez importa la caché
+        from . import models, schemas
+
+        self.register_model(models.Product, 16)
+        self.register_model(models.Distributor, 17)
+        self.register_schema(schemas.Product, 32)
+        self.register_schema(schemas.Distributor, 33)
+        self.register_schema(schemas.ProductList, 34)
+
+    # Codificación
+
+    def encode(self, value: Any, compress: bool = True, legacy: str = LEGACY_JSON) -> bytes:
+        """Codifica en v1, o con write_version=0 en el formato anterior indicado por legacy"""
+        if self.write_version == 0:
+            return self._encode_legacy(value, legacy)
+        self._ensure_defaults()
+        payload = self._pack(value)
+        compression = COMPRESSION_NONE
+        if compress and self.compression != COMPRESSION_NONE and len(payload) >= self.compress_threshold:
+            compression = self.compression
+            payload = self._compress(compression, payload)
+        return bytes((VERSION, compression)) + payload
+
+    def decode(self, data: bytes) -> Any:
+        if not data:
+            raise CodecError("Valor vacío")
+        version = data[0]
+        if version != VERSION:
+            return self._decode_legacy(data)
+        if len(data) < 2:
+            raise CodecError("Cabecera incompleta")
+        self._ensure_defaults()
+        payload = self._decompress(data[1], memoryview(data)[2:])
+        return msgpack.unpackb(payload, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+    def _default(self, value: Any):
+        type_codec = self._types.get(type(value))
+        if type_codec is not None:
+            values = [type_codec.fingerprint]
+            values.extend(getattr(value, name) for name in type_codec.fields)
+            return msgpack.ExtType(type_codec.tag, self._pack(values))
+        if isinstance(value, decimal.Decimal):
+            return msgpack.ExtType(_EXT_DECIMAL, str(value).encode())
+        if isinstance(value, datetime.datetime):
+            return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode())
+        if isinstance(value, datetime.date):
+            return msgpack.ExtType(_EXT_DATE, value.isoformat().encode())
+        metrics_registry.counter('cache_codec_pickle_fallbacks_total').increment()
+        return msgpack.ExtType(_EXT_PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _pack(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=self._default, use_bin_type=True)
+
+    def _ext_hook(self, code: int, data: bytes):
+        if code == _EXT_DECIMAL:
+            return decimal.Decimal(data.decode())
+        if code == _EXT_DATETIME:
+            return datetime.datetime.fromisoformat(data.decode())
+        if code == _EXT_DATE:
+            return datetime.date.fromisoformat(data.decode())
+        if code == _EXT_PICKLE:
+            return pickle.loads(data)
+        type_codec = self._tags.get(code)
+        if type_codec is None:
+            raise CodecError(f"Tipo extendido desconocido: {code}")
+        values = msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+        if values[0] != type_codec.fingerprint or len(values) != len(type_codec.fields) + 1:
+            raise CodecError(f"Los campos de {type_codec.cls.__name__} han cambiado")
+        return type_codec.build(type_codec.cls, dict(zip(type_codec.fields, values[1:])))
+
+    @staticmethod
+    def _compress(compression: int, payload: bytes) -> bytes:
+        if compression == COMPRESSION_ZSTD:
+            return zstandard.ZstdCompressor(level=3).compress(payload)
+        if compression == COMPRESSION_LZ4:
+            return lz4_frame.compress(payload)
+        return zlib.compress(payload, 6)
+
+    @staticmethod
+    def _decompress(compression: int, payload) -> bytes:
+        if compression == COMPRESSION_NONE:
+            return payload
+        if compression == COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise CodecError("zstandard no instalado")
+            return zstandard.ZstdDecompressor().decompress(payload)
+        if compression == COMPRESSION_LZ4:
+            if lz4_frame is None:
+                raise CodecError("lz4 no instalado")
+            return lz4_frame.decompress(payload)
+        if compression == COMPRESSION_ZLIB:
+            return zlib.decompress(payload)
+        raise CodecError(f"Compresión desconocida: {compression}")
+
+    # Formato anterior (CacheManager: JSON o pickle; IntelligentCache: pickle; AdvancedCache: pickle con gzip)
+
+    @staticmethod
+    def _encode_legacy(value: Any, legacy: str) -> bytes:
+        if legacy == LEGACY_PICKLE:
+            return pickle.dumps(value)
+        if legacy == LEGACY_GZIP_PICKLE:
+            return gzip.compress(pickle.dumps(value))
+        if legacy != LEGACY_JSON:
+            raise ValueError(f"Formato anterior desconocido: {legacy}")
+        try:
+            if isinstance(value, (dict, list, str, int, float, bool)) or value is None:
+                return json.dumps(value, default=str).encode('utf-8')
+        except (TypeError, ValueError):
+            pass
+        return pickle.dumps(value)
+
+    @staticmethod
+    def _decode_legacy(data: bytes) -> Any:
+        metrics_registry.counter('cache_codec_legacy_reads_total').increment()
+        first = data[0]
+        if first == 0x80:
+            return pickle.loads(data)
+        if data[:2] == b"\x1f\x8b":
+            return pickle.loads(gzip.decompress(data))
+        if first in b'{["-0123456789tfn':
+            try:
+                return json.loads(data)
+            except ValueError as e:
+                raise CodecError(f"JSON inválido: {e}") from e
+        raise CodecError(f"Versión de codec desconocida: {first}")
+
+
+# Instancia global
+cache_codec = CacheCodec()
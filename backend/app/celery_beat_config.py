@@ -20,6 +20,12 @@ CELERY_BEAT_SCHEDULE = {
         'options': {'queue': 'reports'}
     },
     
+    'analytics-parquet-export': {
+        'task': 'app.tasks.report_tasks.export_sales_parquet_task',
+        'schedule': crontab(hour=1, minute=30),  # Todos los días a las 1:30 AM (día anterior completo)
+        'options': {'queue': 'reports'}
+    },
+    
     'daily-summary-notification': {
         'task': 'app.tasks.notification_tasks.send_daily_summary_task',
         'schedule': crontab(hour=7, minute=30),  # Todos los días a las 7:30 AM
@@ -50,6 +56,32 @@ CELERY_BEAT_SCHEDULE = {
         'options': {'queue': 'inventory'}
     },
     
+    'fold-inventory-ledger': {
+        'task': 'app.tasks.inventory_tasks.fold_inventory_ledger_task',
+        'schedule': timedelta(minutes=5),  # Cada 5 minutos
+        'options': {'queue': 'inventory'}
+    },
+    
+    'checkpoint-inventory-ledger': {
+        'task': 'app.tasks.inventory_tasks.fold_inventory_ledger_task',
+        'schedule': crontab(hour=0, minute=15),  # Todos los días a las 00:15
+        'kwargs': {'checkpoint': True},
+        'options': {'queue': 'inventory'}
+    },
+    
+    'drain-stock-reservations': {
+        'task': 'app.tasks.inventory_tasks.drain_stock_reservations_task',
+        'schedule': timedelta(seconds=2),  # Solo trabaja con stock_reservation_enabled
+        'options': {'queue': 'inventory'}
+    },
+    
+    'reconcile-stock-reservations': {
+        'task': 'app.tasks.inventory_tasks.drain_stock_reservations_task',
+        'schedule': timedelta(minutes=1),
+        'kwargs': {'reconcile': True},
+        'options': {'queue': 'inventory'}
+    },
+    
     'check-overdue-consignments': {
         'task': 'app.tasks.inventory_tasks.check_overdue_consignments_task',
         'schedule': crontab(hour=10, minute=0),  # Todos los días a las 10:00 AM
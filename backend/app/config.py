@@ -21,6 +21,44 @@ class Settings(BaseSettings):
     postgres_password: Optional[str] = None
     postgres_db: Optional[str] = None
     
+    # Pool de conexiones (por proceso). Si no se fijan, se derivan de
+    # db_max_connections repartido entre el número de workers
+    workers: int = 1  # Variable WORKERS usada por gunicorn en render-startup.sh
+    db_max_connections: int = 60
+    db_pool_size: Optional[int] = None
+    db_max_overflow: Optional[int] = None
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 3600  # Reciclar conexiones cada hora
+    
+    # Réplicas de lectura (opcional): URLs separadas por comas
+    database_replica_urls: str = ""
+    database_replica_max_lag_seconds: float = 5.0
+    database_replica_health_check_interval: float = 10.0
+    
+    # Instrumentación de sentencias SQL (fingerprints, latencias, detección N+1)
+    db_query_instrumentation_enabled: bool = True
+    db_n_plus_one_threshold: int = 10  # Mismo fingerprint más de N veces por request
+    
+    # Ledger de inventario: solo se aplican a los saldos movimientos con esta antigüedad
+    inventory_ledger_fold_lag_seconds: int = 60
+    
+    # Ingesta en bloque de ventas POST /pos/sales/batch
+    pos_batch_max_sales: int = 500
+    pos_batch_default_mode: str = "best_effort"  # all_or_nothing o best_effort
+    
+    # Cabecera Idempotency-Key en POST /pos/sales
+    idempotency_key_ttl: int = 86400  # Tiempo que se conserva la respuesta de una clave
+    idempotency_pending_ttl: int = 30  # Reserva de una petición en curso (por si el proceso muere)
+    idempotency_wait_timeout: float = 10.0  # Espera máxima de un duplicado concurrente
+    
+    # Modo de reservas de stock en Redis (ventas sin bloqueos de fila en products)
+    stock_reservation_enabled: bool = False
+    # Redis propio para contadores y colas de reservas (None: el de la caché).
+    # Debe persistir (appendonly yes): las ventas aceptadas solo existen ahí
+    stock_reservation_redis_url: Optional[str] = None
+    stock_reservation_batch_size: int = 500  # Ventas por lote del escritor en segundo plano
+    stock_reservation_writer_lock_ttl: int = 120  # Cerrojo del escritor (por si el worker muere)
+    
     # Seguridad JWT - usar Vault si está disponible
     secret_key: str = None
     algorithm: str = "HS256"
@@ -34,7 +72,31 @@ class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379"
     redis_cache_enabled: bool = True
+    redis_async_max_connections: int = 50  # Pool redis.asyncio por worker
+    l1_cache_enabled: bool = True  # Caché en memoria por worker invalidada por pub/sub
+    l1_cache_max_bytes: int = 64 * 1024 * 1024  # Tamaño máximo de la L1 (valores serializados)
+    l1_cache_ttl: int = 60  # TTL máximo de una entrada en la L1
+    l1_cache_channel: str = "cache:invalidate"  # Canal de Redis para las invalidaciones
     redis_cache_default_ttl: int = 300  # 5 minutos por defecto
+    cache_stale_ttl: int = 30  # Segundos que se sirve un valor viejo mientras otro recalcula
+    cache_lock_ttl: float = 10.0  # Caducidad del lock de recálculo (single-flight)
+    cache_lock_wait: float = 2.0  # Espera máxima al recálculo de otro worker sin valor viejo
+    cache_codec_compression: str = "zstd"  # zstd, lz4, zlib o none
+    cache_codec_compress_threshold: int = 1024  # Bytes a partir de los que se comprime un valor
+    cache_codec_write_version: int = 1  # 0 escribe el formato anterior (despliegue gradual)
+    count_cache_ttl: int = 600  # Cota de deriva de los conteos cacheados
+    product_count_default_mode: str = "exact"  # exact, cached o estimate
+    inventory_snapshot_ttl: int = 30  # Snapshot de /reports/inventory-status
+    export_chunk_size: int = 2000  # Filas por bloque en /reports/export/*
+    analytics_export_dir: str = "./analytics"  # Dataset Parquet de ventas (sales_items/month=AAAA-MM)
+    analytics_export_late_margin: int = 900  # Segundos de solape al buscar ventas tardías (transacciones largas)
+    top_sellers_enabled: bool = True  # Ranking en tiempo real en Redis (/reports/top-sellers/realtime)
+    top_sellers_capacity: int = 200  # Productos por resumen Space-Saving
+    report_period_cache_ttl: int = 30 * 86400  # Resultados de periodos cerrados (solo cambian por ediciones tardías)
+    stock_forecast_window_days: int = 28  # Días cerrados de ventas para la velocidad de cada producto
+    stock_forecast_alpha: float = 0.2  # Suavizado exponencial (más alto = más peso a los últimos días)
+    stock_forecast_lead_time_days: float = 7  # Plazo de reposición para el punto de pedido
+    stock_forecast_service_z: float = 1.65  # Stock de seguridad (1.65 ~ 95% de nivel de servicio)
     
     # Vault
     vault_enabled: bool = False
@@ -79,6 +141,10 @@ class Settings(BaseSettings):
     def cookie_samesite(self) -> str:
         return "strict" if self.is_production else "lax"
     
+    @property
+    def database_replica_urls_list(self) -> List[str]:
+        return [url.strip() for url in self.database_replica_urls.split(",") if url.strip()]
+    
     @property
     def allowed_hosts_list(self) -> List[str]:
         return [host.strip() for host in self.allowed_hosts.split(",")]
@@ -190,4 +256,19 @@ settings = Settings()
 # Inicializar el gestor de caché con la configuración
 if settings.redis_cache_enabled:
     from .cache import cache_manager
-    cache_manager.redis_url = settings.redis_url
\ No newline at end of file
+    cache_manager.redis_url = settings.redis_url
+    cache_manager.async_max_connections = settings.redis_async_max_connections
+
+    from .local_cache import local_cache, invalidation_bus
+    local_cache.configure(settings.l1_cache_max_bytes, settings.l1_cache_ttl)
+    invalidation_bus.channel = settings.l1_cache_channel
+
+    from .cache_codec import cache_codec
+    cache_codec.configure(
+        settings.cache_codec_compression,
+        settings.cache_codec_compress_threshold,
+        settings.cache_codec_write_version
+    )
+
+    from .single_flight import single_flight
+    single_flight.configure(settings.cache_stale_ttl, settings.cache_lock_ttl, settings.cache_lock_wait)
\ No newline at end of file
@@ -1,21 +1,69 @@
 from sqlalchemy.orm import Session, joinedload, selectinload
-from sqlalchemy import or_, func, desc, asc
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, func, desc, asc, select, bindparam, update, insert
+from sqlalchemy.exc import IntegrityError
 from . import models, schemas
-from .exceptions import NotFoundError, DuplicateError, InsufficientStockError, ValidationError
-from datetime import datetime
+from .exceptions import AppException, NotFoundError, DuplicateError, InsufficientStockError, ValidationError, BusinessLogicError
+from .config import settings
+from .metrics import metrics_registry
+from .pagination import keyset_paginate
+from datetime import datetime, timedelta
 from .utils import security
 from .utils.search import search_products_secure, SearchPerformanceTracker
 from .cache import cached, CacheConfig, cache_manager # Importar 'cached' y 'CacheConfig'
 from .decorators.audit_decorator import audit_create, audit_update, audit_delete, audit_search, audit_sale
 from .utils.performance_optimizer import cache_expensive_operation, optimize_db_session, monitor_performance
 from .services.intelligent_cache import ProductCacheManager, cache_product_operation
+from .services.count_provider import product_count
+from .services.inventory_ledger import record_movement
+from .services.stock_reservation import stock_reservation
+from .services import sales_rollup, inventory_status, period_reports, stock_forecast
+from .services.top_sellers import top_sellers
 import time
 
+# Sentencias precompiladas para las rutas más calientes (login, detalle de
+# producto, validación de SKU). Se construyen una vez por proceso con bindparam;
+# SQLAlchemy reutiliza su forma compilada en cada ejecución en lugar de
+# reconstruir y volver a compilar un db.query(...) por llamada.
+_PRODUCT_BY_ID_STMT = select(models.Product)\
+    .where(models.Product.id == bindparam("product_id")).limit(1)
+_PRODUCT_ID_BY_SKU_STMT = select(models.Product.id)\
+    .where(models.Product.sku == bindparam("sku")).limit(1)
+_PRODUCT_ID_BY_SKU_EXCLUDING_STMT = select(models.Product.id)\
+    .where(models.Product.sku == bindparam("sku"), models.Product.id != bindparam("product_id")).limit(1)
+_USER_BY_USERNAME_STMT = select(models.User)\
+    .where(models.User.username == bindparam("username")).limit(1)
+_DISTRIBUTOR_BY_ACCESS_CODE_STMT = select(models.Distributor)\
+    .where(models.Distributor.access_code == bindparam("access_code")).limit(1)
+
+def _stock_changed(deltas: dict = None, counters: bool = True):
+    """
+    Tras confirmar un cambio de productos o stock: ajusta los contadores del
+    modo de reservas (salvo que el cambio ya se reservara en ellos), invalida el
+    snapshot del estado del inventario y descarta los productos afectados de la
+    caché (Redis y L1 de todos los workers)
+    """
+    for product_id, delta in (deltas or {}).items() if counters else ():
+        stock_reservation.adjust(product_id, delta)
+    inventory_status.invalidate()
+    if deltas:
+        ProductCacheManager.invalidate_products(deltas.keys())
+
+def sku_exists(db: Session, sku: str, exclude_product_id: int = None) -> bool:
+    """Indica si el SKU ya está en uso (opcionalmente ignorando un producto)"""
+    if exclude_product_id is None:
+        return db.execute(_PRODUCT_ID_BY_SKU_STMT, {"sku": sku}).first() is not None
+    return db.execute(
+        _PRODUCT_ID_BY_SKU_EXCLUDING_STMT, {"sku": sku, "product_id": exclude_product_id}
+    ).first() is not None
+
 # Funciones CRUD para Product
 def get_product(db: Session, product_id: int):
     """Obtiene un producto por ID con caché inteligente"""
     
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    product = db.execute(_PRODUCT_BY_ID_STMT, {"product_id": product_id}).scalars().first()
     if not product:
         raise NotFoundError(f"Producto con ID {product_id} no encontrado")
     return product
@@ -29,9 +77,16 @@ def get_products(db: Session, skip: int = 0, limit: int = 100):
     # Para simplificar, usar directamente la DB por ahora
     return fetch_products()
 
-def get_products_count(db: Session) -> int:
-    """Obtiene el número total de productos"""
-    return db.query(func.count(models.Product.id)).scalar()
+def get_products_keyset(db: Session, cursor: str = None, limit: int = 100):
+    """Página de productos ordenada por (name, id) a partir de un cursor"""
+    return keyset_paginate(
+        db.query(models.Product), "products",
+        [models.Product.name, models.Product.id], limit, cursor
+    )
+
+def get_products_count(db: Session, mode: str = "exact") -> int:
+    """Obtiene el número total de productos (exact, cached o estimate)"""
+    return product_count.count(db, mode)
 
 def search_products(db: Session, query: str, limit: int = 10):
     """
@@ -87,8 +142,7 @@ def search_products_with_metrics(db: Session, query: str, limit: int = 10):
 
 def create_product(db: Session, product: schemas.ProductCreate):
     # Validar que no exista un producto con el mismo SKU
-    existing_product = db.query(models.Product).filter(models.Product.sku == product.sku).first()
-    if existing_product:
+    if sku_exists(db, product.sku):
         raise DuplicateError(f"❌ SKU duplicado: Ya existe un producto con el código '{product.sku}'. Cada producto debe tener un SKU único en el inventario.")
     
     # Validaciones de negocio
@@ -104,8 +158,16 @@ def create_product(db: Session, product: schemas.ProductCreate):
     try:
         db_product = models.Product(**product.dict())
         db.add(db_product)
+        db.flush()
+        record_movement(
+            db, db_product.id, models.InventoryMovementType.opening_balance,
+            db_product.stock_quantity, reference=f"product:{db_product.id}"
+        )
         db.commit()
         db.refresh(db_product)
+        product_count.adjust(+1)
+        _stock_changed()
+        ProductCacheManager.invalidate_product(db_product.id)
         
         return db_product
     except Exception as e:
@@ -119,11 +181,7 @@ def update_product(db: Session, product_id: int, product_update: schemas.Product
     
     # Validaciones de negocio
     if 'sku' in update_data:
-        existing_product = db.query(models.Product).filter(
-            models.Product.sku == update_data['sku'],
-            models.Product.id != product_id
-        ).first()
-        if existing_product:
+        if sku_exists(db, update_data['sku'], exclude_product_id=product_id):
             raise DuplicateError(f"❌ SKU duplicado: Ya existe otro producto con el código '{update_data['sku']}'. Cada producto debe tener un SKU único en el inventario.")
     
     if 'cost_price' in update_data and update_data['cost_price'] < 0:
@@ -140,22 +198,49 @@ def update_product(db: Session, product_id: int, product_update: schemas.Product
         raise ValidationError("El precio de venta no puede ser menor al precio de costo")
     
     try:
+        stock_delta = 0
+        if 'stock_quantity' in update_data:
+            stock_delta = update_data['stock_quantity'] - db_product.stock_quantity
+            record_movement(
+                db, product_id, models.InventoryMovementType.adjustment,
+                stock_delta, reference=f"product_update:{product_id}"
+            )
         for key, value in update_data.items():
             setattr(db_product, key, value)
         db.commit()
         db.refresh(db_product)
+        _stock_changed({product_id: stock_delta})
+        ProductCacheManager.invalidate_product(product_id)
         
         return db_product
     except Exception as e:
         db.rollback()
         raise ValidationError(f"Error al actualizar producto: {str(e)}")
 
+def delete_product(db: Session, product_id: int):
+    db_product = get_product(db, product_id)  # Ya lanza NotFoundError si no existe
+    
+    try:
+        db.delete(db_product)
+        db.commit()
+        product_count.adjust(-1)
+        _stock_changed()
+        ProductCacheManager.invalidate_product(product_id)
+        return db_product
+    except IntegrityError:
+        db.rollback()
+        raise BusinessLogicError(
+            f"El producto {product_id} tiene ventas o préstamos asociados y no puede eliminarse"
+        )
+
 # Funciones CRUD para Distributor
 def get_distributor(db: Session, distributor_id: int):
     return db.query(models.Distributor).filter(models.Distributor.id == distributor_id).first()
 
 def get_distributor_by_access_code(db: Session, access_code: str):
-    distributor = db.query(models.Distributor).filter(models.Distributor.access_code == access_code).first()
+    distributor = db.execute(
+        _DISTRIBUTOR_BY_ACCESS_CODE_STMT, {"access_code": access_code}
+    ).scalars().first()
     if not distributor:
         raise NotFoundError("Distribuidor no encontrado con el código de acceso proporcionado")
     return distributor
@@ -171,7 +256,7 @@ def create_distributor(db: Session, distributor: schemas.DistributorCreate):
     db.refresh(db_distributor)
     
     # Invalidar caché de distribuidores
-    cache_manager.delete_pattern("cache:distributors:*")
+    cache_manager.bump_generation("distributors")
     
     return db_distributor
 
@@ -180,7 +265,7 @@ def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
 def get_user_by_username(db: Session, username: str):
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = db.execute(_USER_BY_USERNAME_STMT, {"username": username}).scalars().first()
     if not user:
         raise NotFoundError(f"Usuario '{username}' no encontrado")
     return user
@@ -188,6 +273,10 @@ def get_user_by_username(db: Session, username: str):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def get_users_keyset(db: Session, cursor: str = None, limit: int = 100):
+    """Página de usuarios ordenada por id a partir de un cursor"""
+    return keyset_paginate(db.query(models.User), "users", [models.User.id], limit, cursor)
+
 def create_user(db: Session, user: schemas.UserCreate):
     hashed_password = security.get_password_hash(user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password, role=user.role)
@@ -197,73 +286,405 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 # Funciones para Ventas
-def create_pos_sale(db: Session, sale: schemas.PointOfSaleTransactionCreate, user_id: int):
-    # Validaciones iniciales
-    if not sale.items:
+
+# Descuento condicional de stock: solo afecta a la fila si hay stock suficiente,
+# así que dos cajas vendiendo el mismo producto no pueden dejarlo en negativo
+_DECREMENT_STOCK_STMT = update(models.Product)\
+    .where(
+        models.Product.id == bindparam("product_id"),
+        models.Product.stock_quantity >= bindparam("quantity")
+    )\
+    .values(stock_quantity=models.Product.stock_quantity - bindparam("quantity"))\
+    .returning(models.Product.id, models.Product.selling_price, models.Product.stock_quantity)
+
+def _sale_quantities(items) -> dict:
+    """Valida las cantidades y agrupa por producto"""
+    if not items:
         raise ValidationError("La venta debe tener al menos un producto")
-    
-    # Cargar todos los productos de una vez para evitar consultas múltiples
-    product_ids = [item.product_id for item in sale.items]
-    products = db.query(models.Product).filter(models.Product.id.in_(product_ids)).all()
-    products_dict = {p.id: p for p in products}
-    
-    # Verificar que todos los productos existen
-    missing_products = set(product_ids) - set(products_dict.keys())
-    if missing_products:
-        raise NotFoundError(f"Productos no encontrados: {missing_products}")
-    
-    total_amount = 0
-    insufficient_stock_items = []
-    
-    # Validar stock y calcular total
-    for item in sale.items:
+    quantities = {}
+    for item in items:
         if item.quantity_sold <= 0:
             raise ValidationError(f"La cantidad debe ser mayor a 0 para el producto {item.product_id}")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity_sold
+    return quantities
+
+def _decrement_stock(db: Session, quantities: dict) -> dict:
+    """
+    Descuenta stock con UPDATE ... WHERE stock_quantity >= :q RETURNING
+
+    Las filas se bloquean en orden de product_id para que ventas concurrentes
+    con varios productos no se interbloqueen. Devuelve {product_id: selling_price}
+    de los productos descontados; los que falten no existían o no tenían stock.
+    """
+    prices = {}
+    for product_id in sorted(quantities):
+        row = db.execute(
+            _DECREMENT_STOCK_STMT,
+            {"product_id": product_id, "quantity": quantities[product_id]},
+            execution_options={"synchronize_session": False}
+        ).first()
+        if row is None:
+            break
+        prices[row.id] = row.selling_price
         
-        product = products_dict[item.product_id]
-        if product.stock_quantity < item.quantity_sold:
-            insufficient_stock_items.append({
-                "product_id": item.product_id,
-                "product_name": product.name,
-                "requested": item.quantity_sold,
-                "available": product.stock_quantity
-            })
-        total_amount += product.selling_price * item.quantity_sold
+        # Si el Product ya está cargado en la sesión, reflejar el stock devuelto
+        loaded = db.identity_map.get(identity_key(models.Product, row.id))
+        if loaded is not None:
+            set_committed_value(loaded, "stock_quantity", row.stock_quantity)
+    return prices
+
+def _stock_failure(db: Session, quantities: dict) -> Exception:
+    """Construye el error de una venta rechazada (producto inexistente o sin stock)"""
+    products = {
+        p.id: p for p in db.query(models.Product).filter(models.Product.id.in_(list(quantities)))
+    }
+    missing_products = set(quantities) - set(products)
+    if missing_products:
+        return NotFoundError(f"Productos no encontrados: {missing_products}")
     
-    if insufficient_stock_items:
-        raise InsufficientStockError(
-            "Stock insuficiente para algunos productos",
-            details={"insufficient_items": insufficient_stock_items}
-        )
+    insufficient_stock_items = [
+        {
+            "product_id": product_id,
+            "product_name": products[product_id].name,
+            "requested": quantity,
+            "available": products[product_id].stock_quantity
+        }
+        for product_id, quantity in quantities.items()
+        if products[product_id].stock_quantity < quantity
+    ]
+    return InsufficientStockError(
+        "Stock insuficiente para algunos productos",
+        details={"insufficient_items": insufficient_stock_items}
+    )
+
+def create_pos_sale(db: Session, sale: schemas.PointOfSaleTransactionCreate, user_id: int):
+    """
+    Registra una venta en una única transacción
+
+    El stock se descuenta con UPDATEs condicionales (sin leer-validar-escribir en
+    Python), los ítems y los movimientos de inventario se insertan en bloque y
+    todo se confirma con un solo commit.
+
+    Con stock_reservation_enabled el stock se reserva antes en los contadores de
+    Redis, igual que las ventas encoladas, y se devuelve si la venta no se confirma.
+    """
+    quantities = _sale_quantities(sale.items)
+    held = stock_reservation.reserve_direct(db, quantities) if settings.stock_reservation_enabled else None
     
     try:
+        prices = _decrement_stock(db, quantities)
+        if len(prices) != len(quantities):
+            db.rollback()
+            raise _stock_failure(db, quantities)
+        
+        transaction_time = datetime.utcnow()
         db_sale = models.PointOfSaleTransaction(
             user_id=user_id,
-            total_amount=total_amount,
-            transaction_time=datetime.utcnow()
+            total_amount=sum(prices[pid] * qty for pid, qty in quantities.items()),
+            transaction_time=transaction_time
         )
         db.add(db_sale)
+        db.flush()
+        
+        db.execute(insert(models.PointOfSaleItem), [
+            {
+                "transaction_id": db_sale.id,
+                "product_id": product_id,
+                "quantity_sold": quantity,
+                "price_at_time_of_sale": prices[product_id]
+            }
+            for product_id, quantity in quantities.items()
+        ])
+        db.execute(insert(models.InventoryMovement), [
+            {
+                "product_id": product_id,
+                "movement_type": models.InventoryMovementType.sale,
+                "quantity": -quantity,
+                "reference": f"sale:{db_sale.id}",
+                "created_at": transaction_time
+            }
+            for product_id, quantity in quantities.items()
+        ])
+        sales_rollup.rollup_sales(db, [(user_id, transaction_time, db_sale.total_amount, sum(quantities.values()))])
+        
         db.commit()
+    except (NotFoundError, InsufficientStockError):
+        stock_reservation.release_direct(held)
+        raise
+    except Exception as e:
+        db.rollback()
+        stock_reservation.release_direct(held)
+        raise ValidationError(f"Error al procesar la venta: {str(e)}")
+    
+    stock_reservation.finish_direct(held)
+    _stock_changed({product_id: -quantity for product_id, quantity in quantities.items()}, counters=held is None)
+    top_sellers.record([(transaction_time, [
+        (product_id, quantity, prices[product_id] * quantity) for product_id, quantity in quantities.items()
+    ])])
+    return db_sale
+
+# Ingesta en bloque de ventas (cajas que estuvieron sin conexión)
 
-        # Crear ítems y actualizar stock en una sola operación
-        for item in sale.items:
-            product = products_dict[item.product_id]
-            product.stock_quantity -= item.quantity_sold
-            db_item = models.PointOfSaleItem(
-                transaction_id=db_sale.id,
-                product_id=item.product_id,
-                quantity_sold=item.quantity_sold,
-                price_at_time_of_sale=product.selling_price
+POS_BATCH_MODES = ("all_or_nothing", "best_effort")
+
+def _copy_rows(db: Session, model, rows: list):
+    """
+    Inserta filas en bloque: COPY en PostgreSQL (psycopg2), executemany en el resto
+
+    Todas las filas deben traer las mismas columnas; los valores por defecto de
+    servidor (p. ej. el id serial) se aplican igual que en un INSERT.
+    """
+    if not rows:
+        return
+    connection = db.connection()
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        import csv
+        import io
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                "\\N" if row[c] is None else getattr(row[c], "value", row[c]) for c in columns
+            ])
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
             )
-            db.add(db_item)
+        finally:
+            cursor.close()
+    else:
+        db.execute(insert(model), rows)
 
-        db.commit()
-        db.refresh(db_sale)
-        return db_sale
+def _reject_duplicate_times(db: Session, parsed: list, user_id: int):
+    """
+    Rechaza las ventas cuya hora de caja ya está registrada para el usuario
+
+    (user_id, transaction_time) es único: una hora repetida dentro del lote o
+    ya presente en la base de datos (p. ej. un lote reenviado sin clave de
+    idempotencia) haría fallar el INSERT de todo el lote.
+    """
+    times = {entry["sale"].transaction_time for entry in parsed
+             if entry["error"] is None and entry["sale"].transaction_time is not None}
+    if not times:
+        return
+    taken = {
+        row.transaction_time
+        for row in db.query(models.PointOfSaleTransaction.transaction_time).filter(
+            models.PointOfSaleTransaction.user_id == user_id,
+            models.PointOfSaleTransaction.transaction_time.in_(times)
+        )
+    }
+    for entry in parsed:
+        transaction_time = entry["sale"].transaction_time
+        if entry["error"] is not None or transaction_time is None:
+            continue
+        if transaction_time in taken:
+            entry["error"] = DuplicateError(
+                "Ya existe una venta de este usuario con la misma hora",
+                details={"transaction_time": transaction_time.isoformat()}
+            )
+        else:
+            taken.add(transaction_time)
+
+def _allocate_batch_stock(db: Session, parsed: list, reserved: bool = False) -> dict:
+    """
+    Valida el stock de todo el lote en una sola pasada
+
+    Lee una vez el stock de todos los productos del lote (con FOR UPDATE donde
+    el dialecto lo admite, o de los contadores de Redis si `reserved`) y reparte
+    en el orden de llegada. Marca como rechazadas las ventas que no caben y
+    devuelve {product_id: unidades} a descontar por las aceptadas.
+    """
+    product_ids = sorted({pid for entry in parsed if entry["quantities"] for pid in entry["quantities"]})
+    if reserved:
+        # La columna no descuenta las ventas aún encoladas en Redis
+        available = stock_reservation.available(db, product_ids)
+    else:
+        available = {
+            row.id: row.stock_quantity
+            for row in db.query(models.Product.id, models.Product.stock_quantity)
+            .filter(models.Product.id.in_(product_ids))
+            .order_by(models.Product.id)
+            .with_for_update()
+        }
+    
+    totals = {}
+    for entry in parsed:
+        quantities = entry["quantities"]
+        if quantities is None or entry["error"] is not None:
+            continue
+        missing = [pid for pid in quantities if pid not in available]
+        short = [
+            {"product_id": pid, "requested": qty, "available": available[pid]}
+            for pid, qty in quantities.items()
+            if pid in available and available[pid] < qty
+        ]
+        if missing:
+            entry["error"] = NotFoundError(f"Productos no encontrados: {set(missing)}")
+        elif short:
+            entry["error"] = InsufficientStockError(
+                "Stock insuficiente para algunos productos",
+                details={"insufficient_items": short}
+            )
+        else:
+            for pid, qty in quantities.items():
+                available[pid] -= qty
+                totals[pid] = totals.get(pid, 0) + qty
+    return totals
+
+def create_pos_sales_batch(db: Session, sales: list, user_id: int, mode: str = "best_effort", max_attempts: int = 3) -> dict:
+    """
+    Registra un lote de ventas con una sola transacción
+
+    - all_or_nothing: si una venta no es válida no se registra ninguna
+    - best_effort: se registran las válidas y se informan las rechazadas
+
+    El stock de todo el lote se valida en una pasada y se descuenta con un UPDATE
+    condicional por producto; cabeceras, ítems y movimientos se insertan en
+    bloque. Si otra caja consume stock entre la lectura y el descuento se
+    reintenta el reparto completo.
+
+    Con stock_reservation_enabled el reparto usa los contadores de Redis y el
+    total del lote se reserva en ellos antes de escribir, como una venta más.
+    """
+    if mode not in POS_BATCH_MODES:
+        raise ValidationError(f"Modo de lote desconocido: {mode}", details={"modes": list(POS_BATCH_MODES)})
+    all_or_nothing = mode == "all_or_nothing"
+    reserved = settings.stock_reservation_enabled
+    
+    for attempt in range(1, max_attempts + 1):
+        parsed = []
+        for sale in sales:
+            entry = {"sale": sale, "quantities": None, "error": None}
+            try:
+                entry["quantities"] = _sale_quantities(sale.items)
+            except ValidationError as e:
+                entry["error"] = e
+            parsed.append(entry)
         
-    except Exception as e:
-        db.rollback()
-        raise ValidationError(f"Error al procesar la venta: {str(e)}")
+        held = None
+        try:
+            _reject_duplicate_times(db, parsed, user_id)
+            totals = _allocate_batch_stock(db, parsed, reserved)
+            rejected = [entry for entry in parsed if entry["error"] is not None]
+            if all_or_nothing and rejected:
+                db.rollback()
+                return _batch_result(mode, parsed, committed=False)
+            
+            try:
+                held = stock_reservation.reserve_direct(db, totals) if reserved else None
+            except InsufficientStockError:
+                prices = {}
+            else:
+                prices = _decrement_stock(db, totals)
+            if len(prices) != len(totals):
+                # Otra venta consumió stock después de la lectura
+                db.rollback()
+                stock_reservation.release_direct(held)
+                metrics_registry.counter('pos_batch_retries_total').increment()
+                if attempt < max_attempts:
+                    continue
+                raise BusinessLogicError("No se pudo reservar el stock del lote por concurrencia")
+            
+            accepted = [entry for entry in parsed if entry["error"] is None]
+            now = datetime.utcnow()
+            # (user_id, transaction_time) es único: las ventas sin hora propia
+            # reciben la hora de ingesta separada por microsegundos
+            headers = [
+                {
+                    "user_id": user_id,
+                    "transaction_time": entry["sale"].transaction_time or now + timedelta(microseconds=position),
+                    "total_amount": sum(prices[pid] * qty for pid, qty in entry["quantities"].items())
+                }
+                for position, entry in enumerate(accepted)
+            ]
+            if headers:
+                ids = db.execute(
+                    insert(models.PointOfSaleTransaction).returning(
+                        models.PointOfSaleTransaction.id, sort_by_parameter_order=True
+                    ),
+                    headers
+                ).scalars().all()
+            else:
+                ids = []
+            
+            items, movements = [], []
+            for entry, header, transaction_id in zip(accepted, headers, ids):
+                entry["transaction_id"] = transaction_id
+                entry["total_amount"] = header["total_amount"]
+                for pid, qty in entry["quantities"].items():
+                    items.append({
+                        "transaction_id": transaction_id,
+                        "product_id": pid,
+                        "quantity_sold": qty,
+                        "price_at_time_of_sale": prices[pid]
+                    })
+                    # El ledger usa la hora de ingesta: el plegado de saldos no
+                    # vuelve a mirar movimientos anteriores a su marca de agua
+                    movements.append({
+                        "product_id": pid,
+                        "movement_type": models.InventoryMovementType.sale,
+                        "quantity": -qty,
+                        "reference": f"sale:{transaction_id}",
+                        "created_at": now
+                    })
+            _copy_rows(db, models.PointOfSaleItem, items)
+            _copy_rows(db, models.InventoryMovement, movements)
+            sales_rollup.rollup_sales(db, [
+                (user_id, header["transaction_time"], header["total_amount"], sum(entry["quantities"].values()))
+                for entry, header in zip(accepted, headers)
+            ])
+            
+            db.commit()
+        except AppException:
+            db.rollback()
+            stock_reservation.release_direct(held)
+            raise
+        except Exception as e:
+            db.rollback()
+            stock_reservation.release_direct(held)
+            raise ValidationError(f"Error al procesar el lote de ventas: {str(e)}")
+        
+        stock_reservation.finish_direct(held)
+        _stock_changed({pid: -qty for pid, qty in totals.items()}, counters=held is None)
+        top_sellers.record(
+            (header["transaction_time"], [(pid, qty, prices[pid] * qty) for pid, qty in entry["quantities"].items()])
+            for entry, header in zip(accepted, headers)
+        )
+        metrics_registry.counter('pos_batch_sales_total').increment(len(accepted))
+        metrics_registry.counter('pos_batch_rejected_total').increment(len(parsed) - len(accepted))
+        return _batch_result(mode, parsed, committed=True)
+
+def _batch_result(mode: str, parsed: list, committed: bool) -> dict:
+    results = []
+    for index, entry in enumerate(parsed):
+        result = {
+            "index": index,
+            "client_reference": entry["sale"].client_reference,
+            "status": "created",
+            "transaction_id": None,
+            "total_amount": None,
+            "error": None,
+            "details": None,
+        }
+        if entry["error"] is not None:
+            result.update(status="rejected", error=entry["error"].message, details=entry["error"].details or None)
+        elif committed:
+            result.update(transaction_id=entry["transaction_id"], total_amount=entry["total_amount"])
+        else:
+            result["status"] = "skipped"
+        results.append(result)
+    return {
+        "mode": mode,
+        "committed": committed,
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "rejected": sum(1 for r in results if r["status"] == "rejected"),
+        "results": results,
+    }
 
 # Funciones para Consignación
 def create_consignment_loan(db: Session, loan: schemas.ConsignmentLoanCreate):
@@ -286,13 +707,19 @@ def create_consignment_loan(db: Session, loan: schemas.ConsignmentLoanCreate):
         db_loan = models.ConsignmentLoan(**loan.dict())
         db.add(db_loan)
         
+        db.flush()
+        
         # Actualizar el stock del producto (restar cantidad prestada)
         product.stock_quantity -= loan.quantity_loaned
+        record_movement(
+            db, product.id, models.InventoryMovementType.consignment_loan,
+            -loan.quantity_loaned, reference=f"consignment_loan:{db_loan.id}"
+        )
         
         # Registrar la transacción en logs de auditoría si es necesario
         from .logging_config import get_logger
         logger = get_logger(__name__)
-        logger.business(
+        logger.audit(
             "consignment_loan_created",
             loan_id=db_loan.id,
             distributor_id=loan.distributor_id,
@@ -304,6 +731,7 @@ def create_consignment_loan(db: Session, loan: schemas.ConsignmentLoanCreate):
         
         db.commit()
         db.refresh(db_loan)
+        _stock_changed({loan.product_id: -loan.quantity_loaned})
         return db_loan
         
     except Exception as e:
@@ -318,6 +746,17 @@ def get_all_consignment_loans(db: Session, skip: int = 0, limit: int = 100):
         .order_by(desc(models.ConsignmentLoan.loan_date))\
         .offset(skip).limit(limit).all()
 
+def get_consignment_loans_keyset(db: Session, cursor: str = None, limit: int = 100):
+    """Página de préstamos ordenada por (loan_date, id) descendente a partir de un cursor"""
+    query = db.query(models.ConsignmentLoan)\
+        .options(joinedload(models.ConsignmentLoan.product))\
+        .options(joinedload(models.ConsignmentLoan.distributor))
+    return keyset_paginate(
+        query, "consignment_loans",
+        [models.ConsignmentLoan.loan_date, models.ConsignmentLoan.id], limit, cursor,
+        descending=True
+    )
+
 def get_distributor_loans(db: Session, distributor_id: int):
     """Obtiene los préstamos de un distribuidor con eager loading de productos"""
     return db.query(models.ConsignmentLoan)\
@@ -366,9 +805,15 @@ def create_consignment_report(db: Session, report: schemas.ConsignmentReportCrea
         db_report = models.ConsignmentReport(**report.dict())
         db.add(db_report)
         
+        db.flush()
+        
         # Devolver al stock solo los productos retornados (no vendidos)
         previous_stock = product.stock_quantity
         product.stock_quantity += report.quantity_returned
+        record_movement(
+            db, product.id, models.InventoryMovementType.consignment_return,
+            report.quantity_returned, reference=f"consignment_report:{db_report.id}"
+        )
         
         # Verificar si el préstamo está completamente reportado
         total_reported_final = total_previous + total_reported
@@ -378,7 +823,7 @@ def create_consignment_report(db: Session, report: schemas.ConsignmentReportCrea
         # Registrar la transacción en logs de auditoría
         from .logging_config import get_logger
         logger = get_logger(__name__)
-        logger.business(
+        logger.audit(
             "consignment_report_created",
             report_id=db_report.id,
             loan_id=report.loan_id,
@@ -393,6 +838,7 @@ def create_consignment_report(db: Session, report: schemas.ConsignmentReportCrea
         
         db.commit()
         db.refresh(db_report)
+        _stock_changed({loan.product_id: report.quantity_returned})
         return db_report
         
     except Exception as e:
@@ -401,24 +847,93 @@ def create_consignment_report(db: Session, report: schemas.ConsignmentReportCrea
 
 # Funciones optimizadas para reportes y consultas frecuentes
 
-def get_sales_with_details(db: Session, skip: int = 0, limit: int = 100, user_id: int = None):
-    """Obtiene transacciones de venta con detalles de productos y usuario usando eager loading"""
-    query = db.query(models.PointOfSaleTransaction)\
-        .options(joinedload(models.PointOfSaleTransaction.user))\
-        .options(selectinload(models.PointOfSaleTransaction.items).joinedload(models.PointOfSaleItem.product))
+def _sales_query(db: Session, user_id: int = None, start_date=None, end_date=None, headers_only: bool = False):
+    """
+    Consulta base de ventas con filtros en SQL
+
+    El rango de fechas es inclusivo por días y se traduce a
+    transaction_time >= inicio AND transaction_time < fin + 1 día, que con user_id
+    recorre idx_transaction_user_date (user_id, transaction_time). Con
+    headers_only se proyectan solo las columnas de la cabecera, sin cargar
+    usuario, ítems ni productos.
+    """
+    sale = models.PointOfSaleTransaction
+    if headers_only:
+        query = db.query(sale.id, sale.transaction_time, sale.total_amount, sale.user_id)
+    else:
+        query = db.query(sale)\
+            .options(joinedload(sale.user))\
+            .options(selectinload(sale.items).joinedload(models.PointOfSaleItem.product))
     
     if user_id:
-        query = query.filter(models.PointOfSaleTransaction.user_id == user_id)
-    
-    return query.order_by(desc(models.PointOfSaleTransaction.transaction_time))\
+        query = query.filter(sale.user_id == user_id)
+    if start_date:
+        query = query.filter(sale.transaction_time >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        query = query.filter(sale.transaction_time < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return query
+
+def get_sales_with_details(db: Session, skip: int = 0, limit: int = 100, user_id: int = None,
+                           start_date=None, end_date=None, headers_only: bool = False):
+    """Obtiene transacciones de venta con detalles de productos y usuario usando eager loading"""
+    sale = models.PointOfSaleTransaction
+    return _sales_query(db, user_id, start_date, end_date, headers_only)\
+        .order_by(desc(sale.transaction_time), desc(sale.id))\
         .offset(skip).limit(limit).all()
 
+def get_sales_with_details_keyset(db: Session, cursor: str = None, limit: int = 100, user_id: int = None,
+                                  start_date=None, end_date=None, headers_only: bool = False):
+    """
+    Página de ventas ordenada por (transaction_time, id) descendente a partir de un cursor
+
+    Con user_id el recorrido usa idx_transaction_user_date; sin él, idx_transaction_time_id.
+    """
+    return keyset_paginate(
+        _sales_query(db, user_id, start_date, end_date, headers_only), "sales",
+        [models.PointOfSaleTransaction.transaction_time, models.PointOfSaleTransaction.id],
+        limit, cursor, descending=True
+    )
+
+def _products_with_low_stock_stmt(threshold: int):
+    return select(models.Product)\
+        .where(models.Product.stock_quantity <= threshold)\
+        .order_by(asc(models.Product.stock_quantity), asc(models.Product.name))
+
 def get_products_with_low_stock(db: Session, threshold: int = 5):
     """Obtiene productos con stock bajo de forma optimizada"""
-    return db.query(models.Product)\
-        .filter(models.Product.stock_quantity <= threshold)\
-        .order_by(asc(models.Product.stock_quantity), asc(models.Product.name))\
-        .all()
+    return db.execute(_products_with_low_stock_stmt(threshold)).scalars().all()
+
+def get_products_with_low_stock_keyset(db: Session, threshold: int = 5, cursor: str = None, limit: int = 50):
+    """Productos con stock <= threshold paginados por (stock_quantity, name, id)"""
+    query = db.query(models.Product).filter(models.Product.stock_quantity <= threshold)
+    return keyset_paginate(
+        query, f"low_stock:{threshold}",
+        [models.Product.stock_quantity, models.Product.name, models.Product.id],
+        limit, cursor
+    )
+
+async def get_products_with_low_stock_async(db: AsyncSession, threshold: int = 5):
+    """Versión asíncrona de get_products_with_low_stock"""
+    result = await db.execute(_products_with_low_stock_stmt(threshold))
+    return result.scalars().all()
+
+def get_low_stock_forecast(db: Session, threshold: int = 5, include_reorder: bool = False):
+    """Productos con stock bajo (y opcionalmente bajo su punto de pedido) con días hasta rotura"""
+    products = list(db.execute(_products_with_low_stock_stmt(threshold)).scalars().all())
+    if include_reorder:
+        seen = {p.id for p in products}
+        reorder_ids = [pid for pid in stock_forecast.products_to_reorder(db) if pid not in seen]
+        # Por bloques para no superar el límite de parámetros del driver
+        for i in range(0, len(reorder_ids), 1000):
+            products += db.execute(
+                select(models.Product).where(models.Product.id.in_(reorder_ids[i:i + 1000]))
+            ).scalars().all()
+        products.sort(key=lambda p: (p.stock_quantity, p.name))
+    return stock_forecast.annotate(db, products)
+
+async def get_low_stock_forecast_async(db: AsyncSession, threshold: int = 5, include_reorder: bool = False):
+    """Versión asíncrona de get_low_stock_forecast (el cálculo corre en el hilo de la sesión)"""
+    return await db.run_sync(get_low_stock_forecast, threshold, include_reorder)
 
 def get_loans_by_status(db: Session, status: models.LoanStatus, skip: int = 0, limit: int = 100):
     """Obtiene préstamos por estado con eager loading"""
@@ -429,37 +944,55 @@ def get_loans_by_status(db: Session, status: models.LoanStatus, skip: int = 0, l
         .order_by(asc(models.ConsignmentLoan.return_due_date))\
         .offset(skip).limit(limit).all()
 
-def get_overdue_loans(db: Session):
-    """Obtiene préstamos vencidos"""
+def _overdue_loans_stmt():
     from datetime import date
-    return db.query(models.ConsignmentLoan)\
+    return select(models.ConsignmentLoan)\
         .options(joinedload(models.ConsignmentLoan.product))\
         .options(joinedload(models.ConsignmentLoan.distributor))\
-        .filter(
+        .where(
             models.ConsignmentLoan.status == models.LoanStatus.en_prestamo,
             models.ConsignmentLoan.return_due_date < date.today()
         )\
-        .order_by(asc(models.ConsignmentLoan.return_due_date))\
-        .all()
+        .order_by(asc(models.ConsignmentLoan.return_due_date))
 
-def get_sales_summary_by_date_range(db: Session, start_date, end_date):
-    """Obtiene resumen de ventas por rango de fechas"""
-    return db.query(
-        func.date(models.PointOfSaleTransaction.transaction_time).label('date'),
+def get_overdue_loans(db: Session):
+    """Obtiene préstamos vencidos"""
+    return db.execute(_overdue_loans_stmt()).scalars().all()
+
+async def get_overdue_loans_async(db: AsyncSession):
+    """Versión asíncrona de get_overdue_loans"""
+    result = await db.execute(_overdue_loans_stmt())
+    return result.scalars().all()
+
+def _sales_summary_by_date_range_stmt(start_date, end_date):
+    transaction_date = func.date(models.PointOfSaleTransaction.transaction_time)
+    return select(
+        transaction_date.label('date'),
         func.count(models.PointOfSaleTransaction.id).label('total_transactions'),
         func.sum(models.PointOfSaleTransaction.total_amount).label('total_sales')
-    ).filter(
+    ).where(
         models.PointOfSaleTransaction.transaction_time >= start_date,
         models.PointOfSaleTransaction.transaction_time <= end_date
     ).group_by(
-        func.date(models.PointOfSaleTransaction.transaction_time)
+        transaction_date
     ).order_by(
-        func.date(models.PointOfSaleTransaction.transaction_time)
-    ).all()
+        transaction_date
+    )
 
-def get_top_selling_products(db: Session, limit: int = 10, start_date=None, end_date=None):
-    """Obtiene los productos más vendidos"""
-    query = db.query(
+def get_sales_summary_by_date_range_raw(db: Session, start_date, end_date):
+    """Resumen por día agregando point_of_sale_transactions (referencia del rollup)"""
+    return db.execute(_sales_summary_by_date_range_stmt(start_date, end_date)).all()
+
+def get_sales_summary_by_date_range(db: Session, start_date, end_date):
+    """Obtiene resumen de ventas por rango de fechas desde daily_sales_rollup"""
+    return sales_rollup.sales_summary(db, start_date, end_date)
+
+async def get_sales_summary_by_date_range_async(db: AsyncSession, start_date, end_date):
+    """Versión asíncrona de get_sales_summary_by_date_range"""
+    return await db.run_sync(sales_rollup.sales_summary, start_date, end_date)
+
+def _top_selling_products_stmt(limit: int, start_date=None, end_date=None):
+    stmt = select(
         models.Product,
         func.sum(models.PointOfSaleItem.quantity_sold).label('total_sold'),
         func.sum(models.PointOfSaleItem.quantity_sold * models.PointOfSaleItem.price_at_time_of_sale).label('total_revenue')
@@ -470,10 +1003,43 @@ def get_top_selling_products(db: Session, limit: int = 10, start_date=None, end_
     )
     
     if start_date:
-        query = query.filter(models.PointOfSaleTransaction.transaction_time >= start_date)
+        stmt = stmt.where(models.PointOfSaleTransaction.transaction_time >= start_date)
     if end_date:
-        query = query.filter(models.PointOfSaleTransaction.transaction_time <= end_date)
+        stmt = stmt.where(models.PointOfSaleTransaction.transaction_time <= end_date)
     
-    return query.group_by(models.Product.id)\
+    return stmt.group_by(models.Product.id)\
         .order_by(desc('total_sold'))\
-        .limit(limit).all()
\ No newline at end of file
+        .limit(limit)
+
+def get_top_selling_products(db: Session, limit: int = 10, start_date=None, end_date=None):
+    """Obtiene los productos más vendidos"""
+    return db.execute(_top_selling_products_stmt(limit, start_date, end_date)).all()
+
+async def get_top_selling_products_async(db: AsyncSession, limit: int = 10, start_date=None, end_date=None):
+    """Versión asíncrona de get_top_selling_products"""
+    result = await db.execute(_top_selling_products_stmt(limit, start_date, end_date))
+    return result.all()
+
+def get_top_selling_products_by_periods(db: Session, limit: int, start_date, end_date):
+    """
+    Productos más vendidos en [start_date, end_date] a partir de la caché de
+    periodos cerrados; mismas filas (Product, total_sold, total_revenue) que
+    get_top_selling_products
+    """
+    report = period_reports.range_report(db, start_date, end_date)
+    ranked = sorted(report["products"].items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+    products = {
+        product.id: product
+        for product in db.execute(
+            select(models.Product).where(models.Product.id.in_([pid for pid, _ in ranked]))
+        ).scalars()
+    }
+    return [
+        (products[pid], units, revenue)
+        for pid, (units, revenue, _) in ranked
+        if pid in products
+    ]
+
+async def get_top_selling_products_by_periods_async(db: AsyncSession, limit: int, start_date, end_date):
+    """Versión asíncrona de get_top_selling_products_by_periods"""
+    return await db.run_sync(get_top_selling_products_by_periods, limit, start_date, end_date)
@@ -1,40 +1,287 @@
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
 from .config import settings
+from .metrics import metrics_registry
+from .utils.query_instrumentation import install_query_instrumentation
 
 Base = declarative_base()
 
-def get_db_session_maker(database_url: str):
-    # Configuración optimizada del engine con pooling
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que registra tiempos de espera y timeouts de checkout"""
+
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            metrics_registry.counter('db_pool_timeouts_total').increment()
+            raise
+        metrics_registry.histogram('db_pool_checkout_wait_seconds').observe(
+            time.perf_counter() - start_time
+        )
+        return connection
+
+
+def calculate_pool_sizing(workers: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Calcula pool_size y max_overflow por proceso a partir del número de workers
+
+    El presupuesto total de conexiones (db_max_connections) se reparte entre los
+    workers; dos tercios quedan como conexiones permanentes y el resto como overflow.
+    Los valores explícitos de db_pool_size / db_max_overflow tienen prioridad.
+    """
+    workers = max(1, workers or settings.workers)
+    per_worker = max(2, settings.db_max_connections // workers)
+
+    pool_size = settings.db_pool_size
+    if pool_size is None:
+        pool_size = max(1, (per_worker * 2) // 3)
+
+    max_overflow = settings.db_max_overflow
+    if max_overflow is None:
+        max_overflow = max(0, per_worker - pool_size)
+
+    return pool_size, max_overflow
+
+
+def _register_pool_metrics(engine: Engine):
+    """Publica el estado del pool en metrics_registry en cada checkout/checkin"""
+    def update_gauges(returning: int = 0):
+        # engine.pool se recrea en dispose(); no capturar la instancia
+        pool = engine.pool
+        metrics_registry.gauge('db_pool_size').set(pool.size())
+        metrics_registry.gauge('db_pool_checked_out').set(max(0, pool.checkedout() - returning))
+        metrics_registry.gauge('db_pool_overflow').set(max(0, pool.overflow()))
+
+    @event.listens_for(engine.pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics_registry.counter('db_pool_checkouts_total').increment()
+        update_gauges()
+
+    @event.listens_for(engine.pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        # El evento se emite antes de devolver la conexión a la cola
+        update_gauges(returning=1)
+
+    @event.listens_for(engine.pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics_registry.counter('db_pool_connections_opened_total').increment()
+
+
+def _create_engine(database_url: str) -> Engine:
+    """Crea un engine con pooling dimensionado según el número de workers"""
+    engine_kwargs: Dict[str, Any] = {
+        "pool_pre_ping": True,    # Verificar conexiones antes de usarlas
+        "pool_recycle": settings.db_pool_recycle,
+        # Configuración de echo para desarrollo (cambiar a False en producción)
+        "echo": False,
+    }
+
+    # SQLite en memoria no admite QueuePool; se deja el pool por defecto del dialecto
+    if database_url.startswith("sqlite") and ":memory:" in database_url:
+        engine = create_engine(database_url, **engine_kwargs)
+        install_query_instrumentation(engine)
+        return engine
+
+    pool_size, max_overflow = calculate_pool_sizing()
     engine = create_engine(
         database_url,
         # Configuración del pool de conexiones
-        poolclass=QueuePool,
-        pool_size=10,          # Número de conexiones permanentes en el pool
-        max_overflow=20,       # Número máximo de conexiones adicionales
-        pool_pre_ping=True,    # Verificar conexiones antes de usarlas
-        pool_recycle=3600,     # Reciclar conexiones cada hora
-        
-        # Configuración de echo para desarrollo (cambiar a False en producción)
-        echo=False,
-        
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db_pool_timeout,
         # Configuración adicional para PostgreSQL
         connect_args={
             "options": "-c timezone=utc"
-        } if "postgresql" in database_url else {}
+        } if "postgresql" in database_url else {},
+        **engine_kwargs
     )
-    
-    SessionLocal = sessionmaker(
-        autocommit=False, 
-        autoflush=False, 
-        bind=engine,
-        # Configuración adicional para mejor rendimiento
-        expire_on_commit=False
+    _register_pool_metrics(engine)
+    install_query_instrumentation(engine)
+    return engine
+
+
+# Registro de engines: uno por proceso y por URL de base de datos
+_engine_registry: Dict[str, Tuple[sessionmaker, Engine]] = {}
+_registry_lock = threading.Lock()
+
+
+def get_db_session_maker(database_url: str):
+    """
+    Devuelve (SessionLocal, engine) para la URL indicada
+
+    El engine se crea una sola vez por proceso y URL; las llamadas siguientes
+    reutilizan el mismo pool de conexiones.
+    """
+    entry = _engine_registry.get(database_url)
+    if entry is not None:
+        return entry
+
+    with _registry_lock:
+        entry = _engine_registry.get(database_url)
+        if entry is None:
+            engine = _create_engine(database_url)
+            SessionLocal = sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                bind=engine,
+                # Configuración adicional para mejor rendimiento
+                expire_on_commit=False
+            )
+            entry = (SessionLocal, engine)
+            _engine_registry[database_url] = entry
+    return entry
+
+
+def get_engine(database_url: Optional[str] = None) -> Engine:
+    """Obtiene el engine compartido (por defecto el de settings.database_url)"""
+    return get_db_session_maker(database_url or settings.database_url)[1]
+
+
+def get_session_local(database_url: Optional[str] = None) -> sessionmaker:
+    """Obtiene la fábrica de sesiones compartida (por defecto la de settings.database_url)"""
+    return get_db_session_maker(database_url or settings.database_url)[0]
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Estado de los pools registrados en este proceso"""
+    stats = {}
+    for database_url, (_, engine) in list(_engine_registry.items()):
+        pool = engine.pool
+        safe_url = database_url.split("@")[-1] if "@" in database_url else database_url
+        if isinstance(pool, QueuePool):
+            stats[safe_url] = {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "status": pool.status(),
+            }
+        else:
+            stats[safe_url] = {"status": pool.status()}
+    return stats
+
+
+def dispose_engines():
+    """Cierra todos los pools del proceso actual (apagado de la aplicación)"""
+    with _registry_lock:
+        for _, engine in _engine_registry.values():
+            engine.dispose()
+
+
+# ------------------------------------------------------------------
+# Ruta asíncrona (AsyncSession + asyncpg / aiosqlite)
+# ------------------------------------------------------------------
+
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+_async_engine_registry: Dict[str, Tuple[async_sessionmaker, AsyncEngine]] = {}
+
+
+def to_async_database_url(database_url: str) -> str:
+    """Convierte una URL síncrona al driver asíncrono equivalente"""
+    scheme, separator, rest = database_url.partition("://")
+    if not separator:
+        return database_url
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+def _create_async_engine(async_database_url: str) -> AsyncEngine:
+    """Crea un engine asíncrono con el mismo dimensionamiento que el síncrono"""
+    engine_kwargs: Dict[str, Any] = {
+        "pool_pre_ping": True,
+        "pool_recycle": settings.db_pool_recycle,
+        "echo": False,
+    }
+
+    if async_database_url.startswith("sqlite") and ":memory:" in async_database_url:
+        engine = create_async_engine(async_database_url, **engine_kwargs)
+        install_query_instrumentation(engine.sync_engine)
+        return engine
+
+    pool_size, max_overflow = calculate_pool_sizing()
+    engine = create_async_engine(
+        async_database_url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        # asyncpg no acepta "options"; la zona horaria va en server_settings
+        connect_args={
+            "server_settings": {"timezone": "utc"}
+        } if "asyncpg" in async_database_url else {},
+        **engine_kwargs
     )
-    
-    return SessionLocal, engine
+    _register_pool_metrics(engine.sync_engine)
+    install_query_instrumentation(engine.sync_engine)
+    return engine
+
+
+def get_async_db_session_maker(database_url: Optional[str] = None):
+    """
+    Devuelve (AsyncSessionLocal, async_engine) para la URL indicada
+
+    Acepta tanto la URL síncrona de settings como una URL con driver asíncrono;
+    igual que en la ruta síncrona, hay un único engine por proceso y URL.
+    """
+    async_database_url = to_async_database_url(database_url or settings.database_url)
+    entry = _async_engine_registry.get(async_database_url)
+    if entry is not None:
+        return entry
+
+    with _registry_lock:
+        entry = _async_engine_registry.get(async_database_url)
+        if entry is None:
+            engine = _create_async_engine(async_database_url)
+            AsyncSessionLocal = async_sessionmaker(
+                bind=engine,
+                class_=AsyncSession,
+                autoflush=False,
+                expire_on_commit=False
+            )
+            entry = (AsyncSessionLocal, engine)
+            _async_engine_registry[async_database_url] = entry
+    return entry
+
+
+def get_async_session_local(database_url: Optional[str] = None) -> async_sessionmaker:
+    """Obtiene la fábrica de sesiones asíncronas compartida"""
+    return get_async_db_session_maker(database_url)[0]
+
+
+async def dispose_async_engines():
+    """Cierra todos los pools asíncronos del proceso actual"""
+    for _, engine in list(_async_engine_registry.values()):
+        await engine.dispose()
+
+
+def _reset_pools_after_fork():
+    # Los procesos hijos (gunicorn, Celery prefork) reciben un pool nuevo y
+    # abandonan sin cerrarlas las conexiones heredadas del padre
+    for _, engine in list(_engine_registry.values()):
+        engine.dispose(close=False)
+    for _, async_engine in list(_async_engine_registry.values()):
+        async_engine.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
 
 # Crear instancias globales para compatibilidad
 SessionLocal, engine = get_db_session_maker(settings.database_url)
@@ -43,9 +290,9 @@ SessionLocal, engine = get_db_session_maker(settings.database_url)
 def get_db():
     """Dependencia para obtener sesión de base de datos"""
     from .logging_config import get_logger
-    
+
     logger = get_logger(__name__)
-    db = SessionLocal()
+    db = get_session_local()()
     try:
         yield db
     except Exception as e:
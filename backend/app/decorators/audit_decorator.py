@@ -12,7 +12,6 @@ import inspect
 
 from ..models.audit import AuditActionType, AuditSeverity
 from ..services.audit_service import AuditService
-from ..dependencies import get_db
 from ..logging_config import get_logger
 
 logger = get_logger(__name__)
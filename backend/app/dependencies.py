@@ -5,15 +5,13 @@ from . import models, auth
 
 # Esta función será sobrescrita en main.py para usar la SessionLocal correcta
 def get_db():
-    from .database import get_db_session_maker
-    from .config import settings
+    from .database import get_session_local
     from .logging_config import get_logger
     from .metrics import measure_db_query
     
-    # Crear sesión de base de datos
-    SessionLocal, engine = get_db_session_maker(settings.database_url)
+    # Sesión sobre el engine compartido del proceso (no crear un pool por request)
     logger = get_logger(__name__)
-    db = SessionLocal()
+    db = get_session_local()()
     try:
         with measure_db_query("session_lifecycle"):
             yield db
@@ -28,6 +26,62 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Sesión asíncrona para routers async def (no bloquea el event loop)"""
+    from .database import get_async_session_local
+    from .logging_config import get_logger
+    from .metrics import measure_db_query
+    
+    logger = get_logger(__name__)
+    async with get_async_session_local()() as db:
+        try:
+            with measure_db_query("async_session_lifecycle"):
+                yield db
+        except Exception as e:
+            logger.error(
+                "Async database session error",
+                error=e,
+                operation="async_session_lifecycle"
+            )
+            await db.rollback()
+            raise
+
+def get_read_db(request: Request):
+    """
+    Sesión de solo lectura: réplica sana en round-robin o el primario
+
+    Respeta el token read-your-writes (X-Consistency-Token) del cliente.
+    """
+    from .database import get_session_local
+    from .read_replicas import replica_router, CONSISTENCY_TOKEN_HEADER
+    from .metrics import measure_db_query
+    
+    read_url = replica_router.get_read_url(request.headers.get(CONSISTENCY_TOKEN_HEADER))
+    db = get_session_local(read_url)()
+    try:
+        with measure_db_query("read_session_lifecycle"):
+            yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    """Versión asíncrona de get_read_db para routers async def"""
+    from .database import get_async_session_local
+    from .read_replicas import replica_router, CONSISTENCY_TOKEN_HEADER
+    from .metrics import measure_db_query
+    
+    read_url = replica_router.get_read_url(request.headers.get(CONSISTENCY_TOKEN_HEADER))
+    async with get_async_session_local(read_url)() as db:
+        try:
+            with measure_db_query("async_read_session_lifecycle"):
+                yield db
+        except Exception:
+            await db.rollback()
+            raise
+
 # Alias para compatibilidad con otros routers
 async def get_current_user(
     request: Request,
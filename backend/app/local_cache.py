@@ -0,0 +1,278 @@
+"""
+Caché L1 en memoria del proceso con invalidación entre workers por Redis pub/sub
+
+Cada worker de uvicorn guarda aquí los resultados ya deserializados de la caché
+Redis (L2) para no repetir la ida a Redis ni el unpickle en lecturas calientes.
+
+- Acotada por bytes (tamaño serializado de cada valor), no por número de entradas
+- Expulsión LRU con admisión TinyLFU: con la caché llena, un valor nuevo solo
+  entra si su frecuencia estimada supera la de la víctima LRU, así que un
+  recorrido de claves frías no desplaza a las calientes
+- TTL por entrada, acotado por default_ttl (límite de lo que una entrada puede
+  vivir aquí aunque su TTL en Redis sea mayor)
+- Las escrituras publican en un canal de Redis (namespace y, opcionalmente,
+  claves) y el InvalidationBus de cada worker descarta esas entradas. Mientras
+  el bus no está suscrito la caché no sirve ni guarda nada: sin suscripción
+  no hay forma de enterarse de las escrituras de otros workers
+
+Las lecturas que rellenan la L1 tras un fallo toman antes epoch(namespace) y lo
+pasan a set(): si entre medias llegó una invalidación, el valor (posiblemente
+viejo) no se guarda.
+"""
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from .logging_config import get_logger
+from .metrics import metrics_registry
+
+logger = get_logger(__name__)
+
+_SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+_HALVE = bytes(i >> 1 for i in range(256))
+
+
+class FrequencySketch:
+    """Count-min sketch de 4 filas con contadores de 4 bits y envejecimiento periódico"""
+
+    def __init__(self, width: int = 4096):
+        self.width = width
+        self.rows = [bytearray(width) for _ in _SEEDS]
+        self.sample_size = 10 * width
+        self.additions = 0
+
+    def _indexes(self, item: Hashable):
+        h = hash(item)
+        return [((h ^ seed) * 0x01000193 & 0xFFFFFFFF) % self.width for seed in _SEEDS]
+
+    def increment(self, item: Hashable):
+        for row, i in zip(self.rows, self._indexes(item)):
+            if row[i] < 15:
+                row[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            # Reducir a la mitad para que la frecuencia refleje el uso reciente
+            for row in self.rows:
+                row[:] = row.translate(_HALVE)
+            self.additions //= 2
+
+    def estimate(self, item: Hashable) -> int:
+        return min(row[i] for row, i in zip(self.rows, self._indexes(item)))
+
+
+def _sizeof(value: Any) -> Optional[int]:
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+
+class LocalCache:
+    """LRU acotada por bytes con admisión TinyLFU y TTL por entrada"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, default_ttl: int = 60):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # Solo sirve entradas mientras el bus de invalidación está suscrito
+        self.active = False
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, int, float]]" = OrderedDict()
+        self._namespaces: Dict[str, set] = {}
+        self._epochs: Dict[str, int] = {}
+        self._clears = 0
+        self._bytes = 0
+        self._sketch = FrequencySketch()
+        self._lock = threading.Lock()
+
+    def configure(self, max_bytes: int, default_ttl: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.default_ttl = default_ttl
+            self._shrink(0)
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Valor guardado o None (fallo, expirado o caché inactiva)"""
+        if not self.active:
+            return None
+        entry_key = (namespace, key)
+        with self._lock:
+            self._sketch.increment(entry_key)
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._remove(entry_key)
+                entry = None
+            if entry is None:
+                metrics_registry.counter('l1_cache_misses_total').increment()
+                return None
+            self._entries.move_to_end(entry_key)
+        metrics_registry.counter('l1_cache_hits_total').increment()
+        return entry[0]
+
+    def epoch(self, namespace: str) -> Tuple[int, int]:
+        return self._clears, self._epochs.get(namespace, 0)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[int] = None,
+            epoch: Optional[Tuple[int, int]] = None) -> bool:
+        """Guarda el valor si cabe y TinyLFU lo admite; False si se descarta"""
+        if not self.active or value is None:
+            return False
+        size = _sizeof(value)
+        # Una sola entrada no puede ocupar más de 1/8 de la caché
+        if size is None or size > self.max_bytes // 8:
+            return False
+        entry_key = (namespace, key)
+        expires = time.monotonic() + min(ttl or self.default_ttl, self.default_ttl)
+        with self._lock:
+            if epoch is not None and epoch != (self._clears, self._epochs.get(namespace, 0)):
+                return False
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            if not self._shrink(size, candidate=entry_key):
+                metrics_registry.counter('l1_cache_admission_rejections_total').increment()
+                return False
+            self._entries[entry_key] = (value, size, expires)
+            self._namespaces.setdefault(namespace, set()).add(key)
+            self._bytes += size
+            self._publish_usage()
+        return True
+
+    def invalidate(self, namespace: str, keys: Optional[Iterable[str]] = None) -> int:
+        """Descarta las claves indicadas del namespace (todas si keys es None)"""
+        with self._lock:
+            self._epochs[namespace] = self._epochs.get(namespace, 0) + 1
+            present = self._namespaces.get(namespace, set())
+            targets = list(present) if keys is None else [key for key in keys if key in present]
+            for key in targets:
+                self._remove((namespace, key))
+            self._publish_usage()
+        metrics_registry.counter('l1_cache_invalidations_total').increment(len(targets))
+        return len(targets)
+
+    def clear(self):
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+            self._namespaces.clear()
+            self._bytes = 0
+            self._publish_usage()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = metrics_registry.counter('l1_cache_hits_total').value
+        misses = metrics_registry.counter('l1_cache_misses_total').value
+        return {
+            "active": self.active,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "evictions": metrics_registry.counter('l1_cache_evictions_total').value,
+            "admission_rejections": metrics_registry.counter('l1_cache_admission_rejections_total').value,
+        }
+
+    def _remove(self, entry_key: Tuple[str, str]):
+        _, size, _ = self._entries.pop(entry_key)
+        self._bytes -= size
+        keys = self._namespaces.get(entry_key[0])
+        if keys is not None:
+            keys.discard(entry_key[1])
+            if not keys:
+                del self._namespaces[entry_key[0]]
+
+    def _shrink(self, incoming: int, candidate: Optional[Tuple[str, str]] = None) -> bool:
+        """Libera espacio para incoming bytes; False si el candidato pierde frente a la víctima"""
+        now = time.monotonic()
+        while self._entries and self._bytes + incoming > self.max_bytes:
+            victim, (_, _, expires) = next(iter(self._entries.items()))
+            if candidate is not None and expires > now and \
+                    self._sketch.estimate(candidate) <= self._sketch.estimate(victim):
+                return False
+            self._remove(victim)
+            metrics_registry.counter('l1_cache_evictions_total').increment()
+        return self._bytes + incoming <= self.max_bytes
+
+    def _publish_usage(self):
+        metrics_registry.gauge('l1_cache_bytes').set(self._bytes)
+        metrics_registry.gauge('l1_cache_entries').set(len(self._entries))
+
+
+class InvalidationBus:
+    """Publica y aplica invalidaciones de la L1 entre workers por un canal de Redis"""
+
+    def __init__(self, cache: LocalCache, channel: str = "cache:invalidate"):
+        self.cache = cache
+        self.channel = channel
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def connected(self) -> bool:
+        return self.cache.active
+
+    def start(self, client_factory: Callable[[], Any]):
+        """Arranca el hilo suscriptor (una vez por proceso, tras el fork del worker)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen, args=(client_factory,), name="l1-cache-invalidation", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._deactivate()
+
+    def publish(self, client, namespace: str, keys: Optional[Iterable[str]] = None):
+        """Invalida en este proceso y publica para el resto (client puede ser un pipeline)"""
+        keys = None if keys is None else [str(key) for key in keys]
+        self.cache.invalidate(namespace, keys)
+        client.publish(self.channel, json.dumps({"ns": namespace, "keys": keys}))
+
+    def apply(self, data):
+        try:
+            message = json.loads(data)
+            self.cache.invalidate(message["ns"], message.get("keys"))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Invalid L1 cache invalidation message", error=str(e))
+
+    def _deactivate(self):
+        # Sin suscripción se pierden invalidaciones: vaciar y dejar de servir
+        self.cache.active = False
+        self.cache.clear()
+
+    def _listen(self, client_factory: Callable[[], Any]):
+        backoff = 0.5
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = client_factory().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.cache.clear()
+                self.cache.active = True
+                backoff = 0.5
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self.apply(message["data"])
+            except Exception as e:
+                metrics_registry.counter('l1_cache_bus_disconnects_total').increment()
+                logger.warning("L1 cache invalidation bus disconnected", error=str(e))
+                self._deactivate()
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+        self._deactivate()
+
+
+# Instancias globales (una por proceso)
+local_cache = LocalCache()
+invalidation_bus = InvalidationBus(local_cache)
@@ -4,7 +4,7 @@ from .routers import products, distributors, users, auth_router, pos, consignmen
 # from .routers import celery_jobs  # Comentado temporalmente - falta dependencia celery
 from .config import settings
 from . import models # Importar todos los modelos para que SQLAlchemy los descubra
-from .database import get_db_session_maker
+from .database import get_db_session_maker, dispose_engines, dispose_async_engines
 # from .middleware import (
 #     ErrorHandlingMiddleware, 
 #     PerformanceMiddleware, 
@@ -14,6 +14,11 @@ from .database import get_db_session_maker
 # from .middleware.security_headers import SecurityHeadersMiddleware, HTTPSRedirectMiddleware, SecurityValidationMiddleware
 # from .middleware.audit_middleware import AuditMiddleware, AuthAuditMiddleware
 # from .rate_limiter import RateLimitMiddleware
+from .middleware.consistency_token import ConsistencyTokenMiddleware
+from .middleware.query_tracking import QueryTrackingMiddleware
+from .read_replicas import replica_router, CONSISTENCY_TOKEN_HEADER
+from .pagination import NEXT_CURSOR_HEADER
+from .services.idempotency import IDEMPOTENT_REPLAY_HEADER
 from .logging_config import setup_logging
 from .metrics import metrics_registry
 import os
@@ -45,11 +50,20 @@ app.add_middleware(
         "Content-Type",
         "Authorization",
         "X-Requested-With",
-        "X-Request-ID"
+        "X-Request-ID",
+        CONSISTENCY_TOKEN_HEADER
     ],
-    expose_headers=["X-Request-ID", "X-RateLimit-Limit", "X-RateLimit-Remaining"],
+    expose_headers=["X-Request-ID", "X-RateLimit-Limit", "X-RateLimit-Remaining", CONSISTENCY_TOKEN_HEADER, "X-DB-Query-Count", NEXT_CURSOR_HEADER, IDEMPOTENT_REPLAY_HEADER],
 )
 
+# Token read-your-writes solo si hay réplicas de lectura configuradas
+if replica_router.enabled:
+    app.add_middleware(ConsistencyTokenMiddleware)
+
+# Conteo de consultas por request y detección de patrones N+1
+if settings.db_query_instrumentation_enabled:
+    app.add_middleware(QueryTrackingMiddleware)
+
 # Agregar middleware personalizado (orden importante)
 # app.add_middleware(HTTPSRedirectMiddleware)  # Primero: redireccionar a HTTPS
 # app.add_middleware(SecurityValidationMiddleware)  # Segundo: validaciones de seguridad
@@ -65,7 +79,7 @@ app.add_middleware(
 # if settings.redis_cache_enabled:
 #     app.add_middleware(ResponseCacheMiddleware, cache_ttl=settings.redis_cache_default_ttl)
 
-# Configuración de la base de datos para la aplicación principal
+# Configuración de la base de datos para la aplicación principal (engine compartido del registro)
 SessionLocal, engine = get_db_session_maker(settings.database_url)
 
 # Sobrescribir la dependencia get_db para la aplicación principal
@@ -138,6 +152,12 @@ async def startup_event():
         database_url=settings.database_url.split("@")[-1] if "@" in settings.database_url else "[hidden]"
     )
     audit_logger.start_periodic_flush()
+    
+    # L1 por worker: se activa al suscribirse al canal de invalidaciones
+    if settings.redis_cache_enabled and settings.l1_cache_enabled:
+        from .cache import cache_manager
+        from .local_cache import invalidation_bus
+        invalidation_bus.start(cache_manager.get_sync_client)
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -148,4 +168,10 @@ async def shutdown_event():
     logger.info(
         "Application shutting down",
         final_metrics=metrics_registry.get_summary()
-    )
\ No newline at end of file
+    )
+    from .local_cache import invalidation_bus
+    invalidation_bus.stop()
+    from .cache import cache_manager
+    await cache_manager.aclose()
+    dispose_engines()
+    await dispose_async_engines()
\ No newline at end of file
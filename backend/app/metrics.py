@@ -220,6 +220,7 @@ class MetricsRegistry:
         
         request_stats = self._request_duration.get_stats()
         db_stats = self._db_query_duration.get_stats()
+        pool_wait_stats = self.histogram('db_pool_checkout_wait_seconds').get_stats()
         
         return {
             'requests': {
@@ -237,7 +238,16 @@ class MetricsRegistry:
             'database': {
                 'query_count': db_stats['count'],
                 'avg_duration_ms': db_stats['avg'] * 1000,
-                'p95_duration_ms': db_stats['p95'] * 1000
+                'p95_duration_ms': db_stats['p95'] * 1000,
+                'pool': {
+                    'size': self.gauge('db_pool_size').value,
+                    'checked_out': self.gauge('db_pool_checked_out').value,
+                    'overflow': self.gauge('db_pool_overflow').value,
+                    'checkouts': self.counter('db_pool_checkouts_total').value,
+                    'timeouts': self.counter('db_pool_timeouts_total').value,
+                    'avg_wait_ms': pool_wait_stats['avg'] * 1000,
+                    'p95_wait_ms': pool_wait_stats['p95'] * 1000
+                }
             },
             'system': {
                 'active_connections': self._active_connections.value
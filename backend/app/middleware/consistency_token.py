@@ -0,0 +1,26 @@
+"""
+Middleware read-your-writes para el enrutamiento a réplicas de lectura
+"""
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from ..read_replicas import CONSISTENCY_TOKEN_HEADER, issue_consistency_token
+
+
+class ConsistencyTokenMiddleware(BaseHTTPMiddleware):
+    """
+    Emite un token de consistencia tras cada escritura exitosa
+
+    El cliente lo reenvía en el header X-Consistency-Token y las lecturas
+    siguientes evitan las réplicas que aún no han aplicado esa escritura.
+    """
+    
+    WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+    
+    async def dispatch(self, request: Request, call_next) -> Response:
+        response = await call_next(request)
+        
+        if request.method in self.WRITE_METHODS and response.status_code < 400:
+            response.headers[CONSISTENCY_TOKEN_HEADER] = issue_consistency_token()
+        
+        return response
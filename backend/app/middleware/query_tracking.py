@@ -0,0 +1,31 @@
+"""
+Middleware de seguimiento de consultas SQL por request
+"""
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from ..metrics import metrics_registry
+from ..utils.query_instrumentation import start_request_tracking
+
+
+class QueryTrackingMiddleware(BaseHTTPMiddleware):
+    """
+    Cuenta las consultas ejecutadas durante cada request
+
+    Expone el total en el header X-DB-Query-Count y registra como posible N+1
+    cualquier sentencia que se repita más de db_n_plus_one_threshold veces.
+    """
+    
+    async def dispatch(self, request: Request, call_next) -> Response:
+        tracker = start_request_tracking(f"{request.method} {request.url.path}")
+        response = await call_next(request)
+        
+        route = request.scope.get("route")
+        if route is not None:
+            tracker.label = f"{request.method} {route.path}"
+        
+        metrics_registry.histogram('db_queries_per_request').observe(tracker.total)
+        tracker.check_n_plus_one()
+        response.headers["X-DB-Query-Count"] = str(tracker.total)
+        
+        return response
@@ -9,7 +9,7 @@ Incluye modelos de base de datos y auditoría
 
 from .audit import AuditLog, SecurityAlert, LoginAttempt, AuditActionType, AuditSeverity
 from .audit_models import AuditLogEntry
-from .enums import UserRole, LoanStatus
+from .enums import UserRole, LoanStatus, InventoryMovementType
 from .main import (
     Product,
     Distributor,
@@ -19,6 +19,8 @@ from .main import (
     ConsignmentLoan,
     ConsignmentReport
 )
+from .inventory import InventoryMovement, ProductStockBalance, StockCheckpoint
+from .reporting import DailySalesRollup
 
 __all__ = [
     # Auditoría
@@ -32,6 +34,7 @@ __all__ = [
     # Enums
     'UserRole',
     'LoanStatus',
+    'InventoryMovementType',
     
     # Modelos principales
     'Product',
@@ -40,5 +43,13 @@ __all__ = [
     'PointOfSaleTransaction',
     'PointOfSaleItem',
     'ConsignmentLoan',
-    'ConsignmentReport'
+    'ConsignmentReport',
+    
+    # Inventario
+    'InventoryMovement',
+    'ProductStockBalance',
+    'StockCheckpoint',
+    
+    # Reportes
+    'DailySalesRollup'
 ]
\ No newline at end of file
@@ -10,4 +10,12 @@ class UserRole(str, enum.Enum):
 
 class LoanStatus(str, enum.Enum):
     en_prestamo = "en_prestamo"
-    devuelto = "devuelto"
\ No newline at end of file
+    devuelto = "devuelto"
+
+class InventoryMovementType(str, enum.Enum):
+    opening_balance = "opening_balance"        # Alta de producto o saldo inicial del ledger
+    sale = "sale"
+    consignment_loan = "consignment_loan"
+    consignment_return = "consignment_return"
+    adjustment = "adjustment"                  # Cambios manuales o masivos de stock
+    reconciliation = "reconciliation"
@@ -0,0 +1,59 @@
+# ==================================================================
+# MODELOS DE INVENTARIO - LEDGER DE MOVIMIENTOS Y SALDOS
+# ==================================================================
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+    ForeignKey,
+    Index,
+    Enum,
+)
+from ..database import Base
+from datetime import datetime
+from .enums import InventoryMovementType
+
+
+class InventoryMovement(Base):
+    """
+    Ledger de movimientos de inventario (solo inserciones)
+
+    quantity lleva signo: negativo para salidas (ventas, préstamos) y positivo
+    para entradas (devoluciones, ajustes al alza).
+    """
+    __tablename__ = "inventory_movements"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    movement_type = Column(Enum(InventoryMovementType), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    reference = Column(String(64), nullable=True, index=True)  # p.ej. "sale:123"
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class ProductStockBalance(Base):
+    """Saldo por producto con todos los movimientos hasta as_of ya aplicados"""
+    __tablename__ = "product_stock_balances"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    as_of = Column(DateTime, nullable=False, index=True)
+
+
+class StockCheckpoint(Base):
+    """Copia periódica de los saldos para consultas de stock a una fecha"""
+    __tablename__ = "stock_checkpoints"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    as_of = Column(DateTime, nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+
+# Movimientos de un producto en orden temporal (consultas a una fecha)
+Index('idx_movement_product_time', InventoryMovement.product_id, InventoryMovement.created_at)
+
+# Checkpoint más reciente anterior a una fecha
+Index('idx_checkpoint_asof_product', StockCheckpoint.as_of, StockCheckpoint.product_id, unique=True)
@@ -61,6 +61,7 @@ class PointOfSaleTransaction(Base):
     transaction_time = Column(DateTime, nullable=False, index=True)  # Índice para filtros de fecha
     total_amount = Column(Numeric(10, 2), nullable=False, index=True)  # Índice para reportes de ventas
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # Índice para filtros por usuario
+    reservation_id = Column(String(32), nullable=True)  # Reserva en Redis que originó la venta (modo reservas)
 
     user = relationship("User")
     items = relationship("PointOfSaleItem", back_populates="transaction")
@@ -112,6 +113,14 @@ class ConsignmentReport(Base):
 # Índice compuesto para búsquedas de transacciones por usuario y fecha
 Index('idx_transaction_user_date', PointOfSaleTransaction.user_id, PointOfSaleTransaction.transaction_time)
 
+# Índices compuestos para paginación por cursor (clave de ordenación + id)
+Index('idx_transaction_time_id', PointOfSaleTransaction.transaction_time, PointOfSaleTransaction.id)
+Index('idx_product_name_id', Product.name, Product.id)
+Index('idx_loan_date_id', ConsignmentLoan.loan_date, ConsignmentLoan.id)
+
+# Reservas de stock: el escritor en segundo plano no puede persistir dos veces la misma
+Index('idx_transaction_reservation_id', PointOfSaleTransaction.reservation_id, unique=True)
+
 # Índice compuesto para búsquedas de items por transacción y producto
 Index('idx_item_transaction_product', PointOfSaleItem.transaction_id, PointOfSaleItem.product_id)
 
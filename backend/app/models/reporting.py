@@ -0,0 +1,35 @@
+# ==================================================================
+# MODELOS DE REPORTES - AGREGADOS MANTENIDOS INCREMENTALMENTE
+# ==================================================================
+
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    Date,
+    DateTime,
+    Numeric,
+    ForeignKey,
+)
+from ..database import Base
+
+
+class DailySalesRollup(Base):
+    """
+    Ventas agregadas por día y usuario
+
+    Se actualiza en la misma transacción que cada venta; la tabla
+    point_of_sale_transactions sigue siendo la fuente de verdad y
+    app.backfill_sales_rollup la reconstruye a partir de ella.
+    """
+    __tablename__ = "daily_sales_rollup"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    transactions = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(12, 2), nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    # Última venta sumada al día: la exportación analítica reescribe los días
+    # ya exportados que reciben ventas tardías
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, index=True)
@@ -0,0 +1,113 @@
+"""
+Paginación por cursor (keyset)
+
+En lugar de OFFSET, cada página continúa a partir de la clave de ordenación del
+último elemento devuelto: `WHERE (col1, col2) > (:v1, :v2) ORDER BY col1, col2`.
+Con un índice compuesto sobre las columnas de ordenación el coste de una página
+no depende de su profundidad.
+
+El cursor es un token opaco (base64 url-safe) con el nombre del listado y los
+valores de la última fila; un cursor de otro listado se rechaza.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+from .exceptions import ValidationError
+
+# Header con el cursor de la página siguiente en los listados que devuelven una lista
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    if hasattr(value, "value"):  # Enum
+        return value.value
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "n" in value:
+            return Decimal(value["n"])
+    return value
+
+
+def encode_cursor(listing: str, values: Sequence[Any]) -> str:
+    """Genera el token opaco para continuar después de `values`"""
+    payload = json.dumps({"l": listing, "v": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(listing: str, token: str) -> Tuple[Any, ...]:
+    """Recupera los valores de la clave de ordenación a partir del token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload.get("l") != listing:
+            raise ValueError("cursor de otro listado")
+        return tuple(_decode_value(v) for v in payload["v"])
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValidationError("Cursor de paginación inválido", details={"cursor": token, "error": str(e)})
+
+
+def _after_clause(columns: Sequence[Any], values: Sequence[Any], descending: bool):
+    """
+    Expande (c1, c2, ...) > (v1, v2, ...) como OR de ANDs
+
+    Equivale a la comparación de tuplas pero la entienden todos los dialectos y
+    el planificador la resuelve con el índice compuesto.
+    """
+    clauses = []
+    for position, column in enumerate(columns):
+        equal_prefix = [columns[i] == values[i] for i in range(position)]
+        comparison = column < values[position] if descending else column > values[position]
+        clauses.append(and_(*equal_prefix, comparison))
+    return or_(*clauses)
+
+
+def keyset_paginate(
+    query: Query,
+    listing: str,
+    columns: Sequence[Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Aplica paginación por cursor a una consulta ORM
+
+    `columns` es la clave de ordenación y debe terminar en una columna única
+    (normalmente el id) para que el orden sea total. Devuelve los elementos de la
+    página y el cursor de la siguiente (None si no hay más).
+    """
+    if cursor:
+        values = decode_cursor(listing, cursor)
+        if len(values) != len(columns):
+            raise ValidationError("Cursor de paginación inválido", details={"cursor": cursor})
+        query = query.filter(_after_clause(columns, values, descending))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    next_cursor = encode_cursor(listing, [getattr(last, column.key) for column in columns])
+    return rows, next_cursor
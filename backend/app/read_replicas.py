@@ -0,0 +1,200 @@
+"""
+Enrutamiento de lecturas a réplicas de base de datos
+
+Las dependencias de solo lectura (reportes, búsqueda, listados) piden una URL
+al ReplicaRouter, que reparte en round-robin entre las réplicas sanas y vuelve
+al primario cuando ninguna sirve: réplica caída, lag por encima del umbral o
+réplica que todavía no ha aplicado la última escritura del cliente
+(token read-your-writes).
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from .config import settings
+from .database import get_engine
+from .logging_config import get_logger
+from .metrics import metrics_registry
+
+logger = get_logger(__name__)
+
+# Header con el que el cliente reenvía el token recibido tras una escritura
+CONSISTENCY_TOKEN_HEADER = "X-Consistency-Token"
+
+
+@dataclass
+class ReplicaStatus:
+    """Estado de salud de una réplica según el último chequeo"""
+    url: str
+    healthy: bool = False
+    lag_seconds: Optional[float] = None
+    checked_at: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def replayed_until(self) -> float:
+        """Instante (epoch) hasta el que la réplica tiene aplicados los cambios del primario"""
+        if not self.healthy or self.lag_seconds is None:
+            return 0.0
+        return self.checked_at - self.lag_seconds
+
+
+def issue_consistency_token() -> str:
+    """Genera el token read-your-writes: instante de la escritura en milisegundos"""
+    return str(int(time.time() * 1000))
+
+
+def parse_consistency_token(token: Optional[str]) -> Optional[float]:
+    """Convierte el token a epoch en segundos; tokens inválidos se ignoran"""
+    if not token:
+        return None
+    try:
+        return int(token) / 1000.0
+    except (TypeError, ValueError):
+        return None
+
+
+class ReplicaRouter:
+    """Selecciona la URL de base de datos para una lectura"""
+
+    # Lag por réplica en PostgreSQL; en el primario la función devuelve NULL
+    _PG_LAG_QUERY = text(
+        "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+    )
+
+    def __init__(
+        self,
+        primary_url: str,
+        replica_urls: List[str],
+        max_lag_seconds: float = 5.0,
+        health_check_interval: float = 10.0,
+    ):
+        self.primary_url = primary_url
+        self.max_lag_seconds = max_lag_seconds
+        self.health_check_interval = health_check_interval
+        self._replicas: Dict[str, ReplicaStatus] = {
+            url: ReplicaStatus(url=url) for url in replica_urls
+        }
+        self._order = list(replica_urls)
+        self._next_index = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._last_refresh = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._order)
+
+    def get_read_url(self, consistency_token: Optional[str] = None) -> str:
+        """
+        Devuelve la URL para una lectura
+
+        Si el cliente envía un token de escritura, solo se aceptan réplicas que
+        ya hayan aplicado los cambios hasta ese instante.
+        """
+        if not self.enabled:
+            return self.primary_url
+
+        self._maybe_refresh()
+        written_at = parse_consistency_token(consistency_token)
+
+        with self._lock:
+            for offset in range(len(self._order)):
+                index = (self._next_index + offset) % len(self._order)
+                status = self._replicas[self._order[index]]
+                if not self._is_eligible(status, written_at):
+                    continue
+                self._next_index = index + 1
+                metrics_registry.counter('db_replica_reads_total').increment()
+                return status.url
+
+        metrics_registry.counter('db_replica_fallbacks_total').increment()
+        return self.primary_url
+
+    def _is_eligible(self, status: ReplicaStatus, written_at: Optional[float]) -> bool:
+        if not status.healthy or status.lag_seconds is None:
+            return False
+        if status.lag_seconds > self.max_lag_seconds:
+            return False
+        if written_at is not None and status.replayed_until < written_at:
+            return False
+        return True
+
+    def _maybe_refresh(self):
+        """Lanza un chequeo en segundo plano si el último ya caducó (no bloquea la request)"""
+        if time.time() - self._last_refresh < self.health_check_interval:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.check_replicas()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def check_replicas(self) -> Dict[str, ReplicaStatus]:
+        """Chequea conectividad y lag de todas las réplicas"""
+        for url in self._order:
+            status = self._check_replica(url)
+            with self._lock:
+                self._replicas[url] = status
+            if not status.healthy:
+                logger.warning(
+                    "Read replica unavailable",
+                    replica=self._safe_url(url),
+                    error=status.error
+                )
+        self._last_refresh = time.time()
+        healthy = sum(1 for s in self._replicas.values() if s.healthy)
+        metrics_registry.gauge('db_replicas_healthy').set(healthy)
+        return dict(self._replicas)
+
+    def _check_replica(self, url: str) -> ReplicaStatus:
+        checked_at = time.time()
+        try:
+            with get_engine(url).connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag = float(connection.execute(self._PG_LAG_QUERY).scalar() or 0.0)
+                else:
+                    # Sin replicación nativa (p.ej. SQLite en desarrollo) el lag es 0
+                    connection.execute(text("SELECT 1"))
+                    lag = 0.0
+            return ReplicaStatus(url=url, healthy=True, lag_seconds=lag, checked_at=checked_at)
+        except Exception as e:
+            return ReplicaStatus(url=url, healthy=False, checked_at=checked_at, error=str(e))
+
+    def get_status(self) -> List[Dict]:
+        """Estado de las réplicas para endpoints de monitoreo"""
+        with self._lock:
+            return [
+                {
+                    "replica": self._safe_url(status.url),
+                    "healthy": status.healthy,
+                    "lag_seconds": status.lag_seconds,
+                    "eligible": self._is_eligible(status, None),
+                    "checked_at": status.checked_at,
+                    "error": status.error,
+                }
+                for status in self._replicas.values()
+            ]
+
+    @staticmethod
+    def _safe_url(url: str) -> str:
+        return url.split("@")[-1] if "@" in url else url
+
+
+# Instancia global del router de réplicas
+replica_router = ReplicaRouter(
+    primary_url=settings.database_url,
+    replica_urls=settings.database_replica_urls_list,
+    max_lag_seconds=settings.database_replica_max_lag_seconds,
+    health_check_interval=settings.database_replica_health_check_interval,
+)
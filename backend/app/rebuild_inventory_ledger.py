@@ -0,0 +1,42 @@
+# backend/app/rebuild_inventory_ledger.py
+
+import argparse
+from datetime import timedelta
+
+from .database import get_session_local
+from .services.inventory_ledger import rebuild_from_ledger, seed_opening_balances
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reconstruye saldos y checkpoints de stock a partir del ledger de movimientos."
+    )
+    parser.add_argument(
+        "--seed", action="store_true",
+        help="Registrar antes un opening_balance para los productos cuyo ledger no cuadra con stock_quantity."
+    )
+    parser.add_argument(
+        "--checkpoint-days", type=int, default=1,
+        help="Días entre checkpoints históricos (0 para no generar checkpoints)."
+    )
+    args = parser.parse_args()
+
+    db = get_session_local()()
+    try:
+        if args.seed:
+            seeded = seed_opening_balances(db)
+            print(f"Saldos iniciales registrados: {seeded}")
+
+        every = timedelta(days=args.checkpoint_days) if args.checkpoint_days > 0 else None
+        result = rebuild_from_ledger(db, checkpoint_every=every)
+        db.commit()
+        print(f"Saldos reconstruidos: {result['balances']}, checkpoints: {result['checkpoints']}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
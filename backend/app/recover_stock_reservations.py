@@ -0,0 +1,40 @@
+# backend/app/recover_stock_reservations.py
+
+import argparse
+
+from .database import get_session_local
+from .services.stock_reservation import WRITER_LOCK_KEY, stock_reservation
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Persiste las ventas reservadas en Redis que quedaron sin escribir y reconcilia los contadores de stock."
+    )
+    parser.add_argument(
+        "--force-unlock", action="store_true",
+        help="Liberar el cerrojo del escritor (solo si el worker que lo tenía ya no está en marcha)."
+    )
+    args = parser.parse_args()
+
+    if args.force_unlock:
+        stock_reservation._client().delete(WRITER_LOCK_KEY)
+
+    db = get_session_local()()
+    try:
+        result = stock_reservation.run_writer(db, reconcile=True)
+        if result["status"] == "skipped":
+            print("Otro escritor está en marcha; use --force-unlock si ya no existe")
+            return
+        print(
+            f"Ventas persistidas: {result['persisted']}, ya persistidas: {result['duplicates']}, "
+            f"contadores corregidos: {result['drift']}"
+        )
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from .. import models
 from ..dependencies import get_db, get_current_admin_user
 from ..cache import cache_manager, invalidate_products_cache
 from ..config import settings
+from ..local_cache import local_cache
 
 router = APIRouter(prefix="/admin/cache", tags=["cache-admin"])
 
@@ -17,11 +18,12 @@ async def get_cache_stats(
     if not settings.redis_cache_enabled:
         raise HTTPException(status_code=503, detail="Cache not enabled")
     
-    stats = cache_manager.get_stats()
+    stats = await cache_manager.aget_stats()
     return {
         "cache_enabled": True,
         "redis_url": settings.redis_url,
-        "stats": stats
+        "stats": stats,
+        "l1": local_cache.stats()
     }
 
 @router.post("/invalidate/products")
@@ -47,7 +49,7 @@ async def invalidate_distributors_cache(
         raise HTTPException(status_code=503, detail="Cache not enabled")
     
     try:
-        cache_manager.delete_pattern("cache:distributors:*")
+        cache_manager.bump_generation("distributors")
         return {"message": "Cache de distribuidores invalidado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error invalidating cache: {str(e)}")
@@ -78,9 +80,9 @@ async def cache_health_check() -> Dict[str, Any]:
     try:
         # Hacer una operación simple para verificar conectividad
         test_key = "health_check_test"
-        cache_manager.set(test_key, "test", 10)
-        result = cache_manager.get(test_key)
-        cache_manager.delete(test_key)
+        await cache_manager.aset(test_key, "test", 10)
+        result = await cache_manager.aget(test_key)
+        await cache_manager.adelete(test_key)
         
         return {
             "cache_enabled": True,
@@ -105,15 +107,19 @@ async def get_cache_keys(
         raise HTTPException(status_code=503, detail="Cache not enabled")
     
     try:
-        client = cache_manager.get_sync_client()
-        keys = client.keys(pattern)
+        client = await cache_manager.get_async_client()
         
-        # Limitar el número de claves retornadas
-        limited_keys = keys[:limit] if len(keys) > limit else keys
+        # SCAN por bloques en lugar de KEYS para no bloquear Redis
+        total_matches = 0
+        limited_keys = []
+        async for key in client.scan_iter(match=pattern, count=500):
+            total_matches += 1
+            if len(limited_keys) < limit:
+                limited_keys.append(key)
         
         return {
             "pattern": pattern,
-            "total_matches": len(keys),
+            "total_matches": total_matches,
             "returned_count": len(limited_keys),
             "keys": [key.decode('utf-8') if isinstance(key, bytes) else key for key in limited_keys]
         }
@@ -130,7 +136,7 @@ async def delete_cache_key(
         raise HTTPException(status_code=503, detail="Cache not enabled")
     
     try:
-        success = cache_manager.delete(key)
+        success = await cache_manager.adelete(key)
         if success:
             return {"message": f"Clave '{key}' eliminada exitosamente"}
         else:
@@ -148,8 +154,8 @@ async def get_cache_key_value(
         raise HTTPException(status_code=503, detail="Cache not enabled")
     
     try:
-        value = cache_manager.get(key)
-        exists = cache_manager.exists(key)
+        value = await cache_manager.aget(key)
+        exists = await cache_manager.aexists(key)
         
         return {
             "key": key,
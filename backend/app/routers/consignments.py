@@ -1,15 +1,32 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
 from sqlalchemy.orm import Session
 
 from .. import crud, schemas, models
 from ..dependencies import get_db, get_current_admin_user, get_current_distributor
+from ..exceptions import ValidationError, convert_to_http_exception
+from ..pagination import NEXT_CURSOR_HEADER
 
 router = APIRouter()
 
 @router.get("/consignments/loans", response_model=List[schemas.ConsignmentLoan], dependencies=[Depends(get_current_admin_user)])
-def get_all_loans(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_all_loans(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="Modo de paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor del header X-Next-Cursor (implica pagination=cursor)"),
+    db: Session = Depends(get_db)
+):
     """Obtiene todos los préstamos para administradores"""
+    if pagination == "cursor" or cursor:
+        try:
+            loans, next_cursor = crud.get_consignment_loans_keyset(db, cursor=cursor, limit=limit)
+        except ValidationError as e:
+            raise convert_to_http_exception(e)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return loans
     return crud.get_all_consignment_loans(db, skip=skip, limit=limit)
 
 @router.post("/consignments/loans", response_model=schemas.ConsignmentLoan, dependencies=[Depends(get_current_admin_user)])
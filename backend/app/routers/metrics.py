@@ -199,6 +199,23 @@ async def update_inventory_metrics(
         raise HTTPException(status_code=400, detail="Error al actualizar métricas")
 
 
+@router.get("/database/pool")
+async def get_database_pool_metrics(
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Obtiene el estado de los pools de conexiones y de las réplicas de lectura
+    """
+    from ..database import get_pool_stats
+    from ..read_replicas import replica_router
+    
+    return {
+        "pools": get_pool_stats(),
+        "replicas": replica_router.get_status(),
+        "summary": metrics_registry.get_summary().get("database", {}).get("pool", {})
+    }
+
+
 @router.get("/system/health")
 async def get_system_health():
     """
@@ -9,6 +9,8 @@ from sqlalchemy.orm import Session
 from ..dependencies import get_db, get_current_admin_user
 from ..services.intelligent_cache import intelligent_cache, ProductCacheManager
 from ..utils.performance_optimizer import PerformanceOptimizer, QueryOptimizer
+from ..utils.query_instrumentation import query_stats
+from ..config import settings
 from ..logging_config import get_logger
 
 router = APIRouter()
@@ -80,7 +82,7 @@ def invalidate_cache(
                 message = "Caché de todos los productos invalidado"
         
         elif cache_type == "search":
-            intelligent_cache.invalidate_pattern("search:*")
+            intelligent_cache.invalidate_namespace("product_search")
             message = "Caché de búsquedas invalidado"
         
         elif cache_type == "all":
@@ -251,6 +253,47 @@ def optimize_database(
         )
 
 
+@router.get("/performance/queries", dependencies=[Depends(get_current_admin_user)])
+def get_query_statistics(
+    limit: int = Query(20, ge=1, le=200, description="Número de fingerprints a devolver"),
+    order_by: str = Query(
+        "total_time_ms",
+        pattern="^(total_time_ms|calls|avg_ms|p95_ms|max_ms|rows)$",
+        description="Campo por el que ordenar"
+    )
+):
+    """
+    Estadísticas por sentencia SQL normalizada (fingerprint)
+    Requiere permisos de administrador
+    """
+    return {
+        "enabled": settings.db_query_instrumentation_enabled,
+        "queries": query_stats.top(limit=limit, order_by=order_by),
+    }
+
+
+@router.get("/performance/queries/n-plus-one", dependencies=[Depends(get_current_admin_user)])
+def get_n_plus_one_detections():
+    """
+    Requests recientes en las que una misma sentencia se repitió por encima del umbral
+    Requiere permisos de administrador
+    """
+    return {
+        "threshold": settings.db_n_plus_one_threshold,
+        "detections": query_stats.detections(),
+    }
+
+
+@router.post("/performance/queries/reset", dependencies=[Depends(get_current_admin_user)])
+def reset_query_statistics():
+    """
+    Reinicia las estadísticas de sentencias SQL
+    Requiere permisos de administrador
+    """
+    query_stats.reset()
+    return {"message": "Estadísticas de consultas reiniciadas"}
+
+
 @router.get("/performance/health")
 def get_performance_health():
     """
@@ -1,17 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
 from .. import crud, schemas, models
+from ..config import settings
 from ..dependencies import get_db, get_current_sales_staff_user
+from ..exceptions import AppException, convert_to_http_exception
+from ..logging_config import get_logger
+from ..services.idempotency import (
+    IDEMPOTENT_REPLAY_HEADER,
+    MAX_KEY_LENGTH,
+    IdempotencyConflict,
+    pos_sale_idempotency,
+    request_fingerprint,
+)
+from ..services.stock_reservation import stock_reservation
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
-@router.post("/pos/sales", response_model=schemas.PointOfSaleTransaction, dependencies=[Depends(get_current_sales_staff_user)])
-def create_sale(sale: schemas.PointOfSaleTransactionCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_sales_staff_user)):
-    db_sale = crud.create_pos_sale(db, sale, current_user.id)
+def _register_sale(db: Session, sale: schemas.PointOfSaleTransactionCreate, user_id: int):
+    """Registra la venta por el camino configurado y devuelve (código HTTP, cuerpo)"""
+    if settings.stock_reservation_enabled:
+        try:
+            reservation = stock_reservation.reserve_sale(db, sale.items, user_id)
+        except AppException as e:
+            raise convert_to_http_exception(e)
+        return status.HTTP_202_ACCEPTED, schemas.PointOfSaleReservation(**reservation).model_dump(mode="json")
+    
+    db_sale = crud.create_pos_sale(db, sale, user_id)
     if db_sale is None:
         raise HTTPException(status_code=400, detail="Invalid sale data or insufficient stock")
-    return db_sale
+    return status.HTTP_200_OK, schemas.PointOfSaleTransaction.model_validate(db_sale).model_dump(mode="json")
+
+@router.post(
+    "/pos/sales",
+    response_model=Union[schemas.PointOfSaleTransaction, schemas.PointOfSaleReservation],
+    dependencies=[Depends(get_current_sales_staff_user)]
+)
+def create_sale(
+    sale: schemas.PointOfSaleTransactionCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_sales_staff_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Registra una venta
+
+    Con stock_reservation_enabled el stock se reserva en Redis y la venta se
+    persiste en segundo plano: la respuesta es 202 con el reservation_id.
+
+    Con la cabecera Idempotency-Key, un reintento con la misma clave devuelve la
+    venta ya registrada sin volver a ejecutarla; un duplicado concurrente espera
+    a que termine el primero.
+    """
+    if not idempotency_key:
+        status_code, body = _register_sale(db, sale, current_user.id)
+        return JSONResponse(content=body, status_code=status_code)
+    
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key admite como máximo {MAX_KEY_LENGTH} caracteres")
+    
+    fingerprint = request_fingerprint(sale.model_dump())
+    try:
+        claim = pos_sale_idempotency.claim(current_user.id, idempotency_key, fingerprint)
+    except IdempotencyConflict as e:
+        status_code = status.HTTP_422_UNPROCESSABLE_ENTITY if e.reason == "payload_mismatch" else status.HTTP_409_CONFLICT
+        raise HTTPException(status_code=status_code, detail=str(e))
+    if claim.replayed:
+        return JSONResponse(
+            content=claim.response["body"],
+            status_code=claim.response["status_code"],
+            headers={IDEMPOTENT_REPLAY_HEADER: "true"}
+        )
+    
+    try:
+        status_code, body = _register_sale(db, sale, current_user.id)
+    except Exception:
+        pos_sale_idempotency.release(claim)
+        raise
+    
+    pos_sale_idempotency.complete(claim, fingerprint, {"status_code": status_code, "body": body})
+    return JSONResponse(content=body, status_code=status_code)
+
+@router.post("/pos/sales/batch", response_model=schemas.PointOfSaleBatchResponse)
+def create_sales_batch(
+    batch: schemas.PointOfSaleBatchCreate,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_sales_staff_user)
+):
+    """
+    Registra en una llamada las ventas que una caja encoló sin conexión
+
+    Devuelve un resultado por venta. En modo all_or_nothing, si alguna venta se
+    rechaza no se registra ninguna y la respuesta es 409.
+    """
+    if len(batch.sales) > settings.pos_batch_max_sales:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote supera el máximo de {settings.pos_batch_max_sales} ventas"
+        )
+    try:
+        result = crud.create_pos_sales_batch(
+            db, batch.sales, current_user.id, mode=batch.mode or settings.pos_batch_default_mode
+        )
+    except AppException as e:
+        raise convert_to_http_exception(e)
+    
+    if not result["committed"]:
+        response.status_code = status.HTTP_409_CONFLICT
+    logger.audit("pos_sales_batch", user_id=current_user.id, mode=result["mode"],
+                 created_sales=result["created"], rejected_sales=result["rejected"])
+    return result
 
 @router.post("/sales", response_model=schemas.PointOfSaleTransaction)
 def create_sale_test(sale: schemas.PointOfSaleTransactionCreate, db: Session = Depends(get_db)):
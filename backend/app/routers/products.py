@@ -4,7 +4,10 @@ from sqlalchemy.orm import Session
 import re
 
 from .. import crud, schemas, models
-from ..dependencies import get_db, get_current_admin_user
+from ..dependencies import get_db, get_read_db, get_current_admin_user
+from ..exceptions import ValidationError, NotFoundError, BusinessLogicError, convert_to_http_exception
+from ..services.count_provider import COUNT_MODES
+from ..config import settings
 from ..metrics import business_metrics
 from ..logging_config import get_secure_logger
 from ..security.input_validation import InputValidator, validate_query_param
@@ -78,16 +81,42 @@ def create_product(product: schemas.ProductCreate, request: Request, db: Session
 def read_products(
     skip: int = Query(0, ge=0, description="Número de productos a omitir"),
     limit: int = Query(20, ge=1, le=100, description="Número máximo de productos por página"),
-    db: Session = Depends(get_db)
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="Modo de paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor (implica pagination=cursor)"),
+    count: Optional[str] = Query(
+        None,
+        pattern=f"^({'|'.join(COUNT_MODES)})$",
+        description="Cálculo del total: exact, cached (contador en Redis) o estimate (estadísticas del planificador)"
+    ),
+    db: Session = Depends(get_read_db)
 ):
-    products = crud.get_products(db, skip=skip, limit=limit)
-    total = crud.get_products_count(db)
+    count_mode = count or settings.product_count_default_mode
+    total = crud.get_products_count(db, mode=count_mode)
+    
+    if pagination == "cursor" or cursor:
+        try:
+            products, next_cursor = crud.get_products_keyset(db, cursor=cursor, limit=limit)
+        except ValidationError as e:
+            raise convert_to_http_exception(e)
+        return {
+            "products": products,
+            "total": total,
+            "skip": 0,
+            "limit": limit,
+            "has_next": next_cursor is not None,
+            "next_cursor": next_cursor,
+            "count_mode": count_mode
+        }
+    
+    # Una fila extra indica si hay página siguiente sin depender de un total aproximado
+    products = crud.get_products(db, skip=skip, limit=limit + 1)
     return {
-        "products": products,
+        "products": products[:limit],
         "total": total,
         "skip": skip,
         "limit": limit,
-        "has_next": skip + limit < total
+        "has_next": len(products) > limit,
+        "count_mode": count_mode
     }
 
 @router.get("/products/search", response_model=List[schemas.Product])
@@ -116,13 +145,13 @@ def check_sku_availability(sku: str, db: Session = Depends(get_db)):
     normalized_sku = sku.strip().upper()
     
     # Buscar producto con este SKU
-    existing_product = db.query(models.Product).filter(models.Product.sku == normalized_sku).first()
+    exists = crud.sku_exists(db, normalized_sku)
     
     return {
         "sku": normalized_sku,
-        "available": existing_product is None,
-        "exists": existing_product is not None,
-        "message": "SKU disponible" if existing_product is None else f"SKU '{normalized_sku}' ya existe"
+        "available": not exists,
+        "exists": exists,
+        "message": "SKU disponible" if not exists else f"SKU '{normalized_sku}' ya existe"
     }
 
 @router.get("/products/suggest-names")
@@ -263,4 +292,21 @@ def update_product(product_id: int, product: schemas.ProductUpdate, db: Session
         selling_price=float(db_product.selling_price)
     )
     
-    return db_product
\ No newline at end of file
+    return db_product
+
+@router.delete("/products/{product_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(get_current_admin_user)])
+def delete_product(product_id: int, db: Session = Depends(get_db)):
+    try:
+        db_product = crud.delete_product(db, product_id)
+    except (NotFoundError, BusinessLogicError) as e:
+        raise convert_to_http_exception(e)
+    
+    # Log de auditoría
+    logger.info(
+        "product_deleted",
+        extra={
+            "product_id": db_product.id,
+            "product_name": db_product.name,
+            "product_sku": db_product.sku
+        }
+    )
@@ -1,12 +1,22 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date, datetime, timedelta
 
 from .. import crud, schemas, models
-from ..dependencies import get_db, get_current_admin_user, get_current_sales_staff_user
+from ..database import get_session_local
+from ..dependencies import get_read_db, get_async_read_db, get_current_admin_user, get_current_sales_staff_user
+from ..exceptions import ValidationError, convert_to_http_exception
+from ..pagination import NEXT_CURSOR_HEADER
+from ..read_replicas import replica_router, CONSISTENCY_TOKEN_HEADER
+from ..services import analytics_export, inventory_ledger, inventory_status, report_export
+from ..services.top_sellers import top_sellers
+from ..logging_config import get_logger
 
 router = APIRouter(prefix="/reports", tags=["reports"])
+logger = get_logger(__name__)
 
 # Schemas para reportes
 class SalesSummary(schemas.BaseModel):
@@ -22,12 +32,14 @@ class TopSellingProduct(schemas.BaseModel):
 class LowStockProduct(schemas.BaseModel):
     product: schemas.Product
     days_until_stockout: Optional[int] = None
+    reorder_point: int = 0
+    daily_velocity: float = 0
 
 @router.get("/sales-summary", response_model=List[SalesSummary])
 async def get_sales_summary(
     start_date: Optional[date] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
     end_date: Optional[date] = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: models.User = Depends(get_current_sales_staff_user)
 ):
     """Obtiene resumen de ventas por día en un rango de fechas"""
@@ -40,7 +52,7 @@ async def get_sales_summary(
     start_datetime = datetime.combine(start_date, datetime.min.time())
     end_datetime = datetime.combine(end_date, datetime.max.time())
     
-    summary = crud.get_sales_summary_by_date_range(db, start_datetime, end_datetime)
+    summary = await crud.get_sales_summary_by_date_range_async(db, start_datetime, end_datetime)
     
     return [
         SalesSummary(
@@ -56,10 +68,15 @@ async def get_top_selling_products(
     limit: int = Query(10, ge=1, le=50, description="Número de productos a retornar"),
     start_date: Optional[date] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
     end_date: Optional[date] = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: models.User = Depends(get_current_sales_staff_user)
 ):
-    """Obtiene los productos más vendidos"""
+    """
+    Obtiene los productos más vendidos
+
+    Con start_date el rango se resuelve con la caché de periodos cerrados y solo
+    hoy se agrega en vivo; sin él se agrega todo el histórico en SQL.
+    """
     start_datetime = None
     end_datetime = None
     
@@ -68,7 +85,12 @@ async def get_top_selling_products(
     if end_date:
         end_datetime = datetime.combine(end_date, datetime.max.time())
     
-    top_products = crud.get_top_selling_products(db, limit, start_datetime, end_datetime)
+    if start_datetime:
+        top_products = await crud.get_top_selling_products_by_periods_async(
+            db, limit, start_datetime, end_datetime or datetime.utcnow()
+        )
+    else:
+        top_products = await crud.get_top_selling_products_async(db, limit, start_datetime, end_datetime)
     
     return [
         TopSellingProduct(
@@ -79,76 +101,242 @@ async def get_top_selling_products(
         for item in top_products
     ]
 
-@router.get("/low-stock-products", response_model=List[schemas.Product])
+class TopSellerEntry(schemas.BaseModel):
+    product_id: int
+    units: int
+    revenue: float
+    max_error: int = 0
+
+class TopSellersLeaderboard(schemas.BaseModel):
+    window: str
+    source: str
+    approximate: bool
+    items: List[TopSellerEntry]
+
+@router.get("/top-sellers/realtime", response_model=TopSellersLeaderboard)
+def get_realtime_top_sellers(
+    window: str = Query("today", pattern="^(hour|today|7d)$", description="Última hora, hoy o últimos 7 días"),
+    limit: int = Query(10, ge=1, le=50, description="Número de productos a retornar"),
+    source: str = Query("auto", pattern="^(auto|redis|sql)$", description="sql: cálculo exacto para verificación"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_sales_staff_user)
+):
+    """
+    Productos más vendidos en una ventana reciente
+
+    El ranking se mantiene en Redis al registrar cada venta y se lee sin tocar
+    la base de datos; si Redis no responde (o con source=sql) se calcula en SQL.
+    """
+    used = source
+    if source != "sql":
+        try:
+            items = top_sellers.top(window, limit)
+            used = "redis"
+        except Exception as e:
+            if source == "redis":
+                raise HTTPException(status_code=503, detail="Ranking en tiempo real no disponible")
+            logger.warning("Realtime top sellers unavailable, using SQL", error=str(e))
+            used = "sql"
+    if used == "sql":
+        items = top_sellers.top_exact(db, window, limit)
+    
+    return {
+        "window": window,
+        "source": used,
+        "approximate": any(item.max_error for item in items),
+        "items": [item._asdict() for item in items],
+    }
+
+@router.get("/low-stock-products", response_model=List[LowStockProduct])
 async def get_low_stock_products(
     threshold: int = Query(5, ge=0, le=100, description="Umbral de stock bajo"),
-    db: Session = Depends(get_db),
+    include_reorder: bool = Query(False, description="Incluir productos en o bajo su punto de pedido"),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: models.User = Depends(get_current_sales_staff_user)
 ):
-    """Obtiene productos con stock bajo"""
-    return crud.get_products_with_low_stock(db, threshold)
+    """Obtiene productos con stock bajo con días estimados hasta rotura y punto de pedido"""
+    return await crud.get_low_stock_forecast_async(db, threshold, include_reorder)
 
 @router.get("/overdue-loans", response_model=List[schemas.ConsignmentLoan])
 async def get_overdue_loans(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: models.User = Depends(get_current_admin_user)
 ):
     """Obtiene préstamos vencidos"""
-    return crud.get_overdue_loans(db)
+    return await crud.get_overdue_loans_async(db)
+
+# Los endpoints que aún usan Session síncrona se declaran con def para que
+# FastAPI los ejecute en el threadpool y no bloqueen el event loop
+class SaleHeader(schemas.BaseModel):
+    id: int
+    transaction_time: datetime
+    total_amount: float
+    user_id: int
 
 @router.get("/sales-by-user")
-async def get_sales_by_user(
+def get_sales_by_user(
+    response: Response,
     user_id: Optional[int] = Query(None, description="ID del usuario"),
     start_date: Optional[date] = Query(None, description="Fecha de inicio"),
     end_date: Optional[date] = Query(None, description="Fecha de fin"),
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="Modo de paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor del header X-Next-Cursor (implica pagination=cursor)"),
+    fields: str = Query("full", pattern="^(full|headers)$", description="headers: solo la cabecera de cada venta"),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(get_current_sales_staff_user)
 ):
-    """Obtiene ventas por usuario con paginación"""
-    sales = crud.get_sales_with_details(db, skip, limit, user_id)
+    """Obtiene ventas por usuario con paginación (el rango de fechas se filtra en SQL)"""
+    if start_date and end_date and start_date > end_date:
+        raise convert_to_http_exception(ValidationError("start_date no puede ser posterior a end_date"))
     
-    # Filtrar por fechas si se proporcionan
-    if start_date or end_date:
-        filtered_sales = []
-        for sale in sales:
-            sale_date = sale.transaction_time.date()
-            if start_date and sale_date < start_date:
-                continue
-            if end_date and sale_date > end_date:
-                continue
-            filtered_sales.append(sale)
-        sales = filtered_sales
+    headers_only = fields == "headers"
+    if pagination == "cursor" or cursor:
+        try:
+            sales, next_cursor = crud.get_sales_with_details_keyset(
+                db, cursor, limit, user_id, start_date, end_date, headers_only
+            )
+        except ValidationError as e:
+            raise convert_to_http_exception(e)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        sales = crud.get_sales_with_details(db, skip, limit, user_id, start_date, end_date, headers_only)
     
+    if headers_only:
+        return [SaleHeader.model_validate(sale, from_attributes=True) for sale in sales]
     return sales
 
-@router.get("/inventory-status")
-async def get_inventory_status(
-    db: Session = Depends(get_db),
+class InventoryStatus(schemas.BaseModel):
+    total_products: int
+    low_stock_count: int
+    no_stock_count: int
+    total_inventory_cost_value: float
+    total_inventory_retail_value: float
+    snapshot_at: datetime
+    low_stock_products: List[schemas.Product]
+    no_stock_products: List[schemas.Product]
+    low_stock_next_cursor: Optional[str] = None
+    no_stock_next_cursor: Optional[str] = None
+
+@router.get("/inventory-status", response_model=InventoryStatus)
+def get_inventory_status(
+    limit: int = Query(50, ge=1, le=200, description="Productos por página en los listados"),
+    low_stock_cursor: Optional[str] = Query(None, description="Cursor de la página siguiente de stock bajo"),
+    no_stock_cursor: Optional[str] = Query(None, description="Cursor de la página siguiente sin stock"),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(get_current_sales_staff_user)
 ):
-    """Obtiene estado general del inventario"""
-    # Productos con stock bajo
-    low_stock = crud.get_products_with_low_stock(db, 5)
-    
-    # Productos sin stock
-    no_stock = crud.get_products_with_low_stock(db, 0)
-    
-    # Total de productos
-    total_products = crud.get_products_count(db)
-    
-    # Valor total del inventario
-    products = crud.get_products(db, 0, 10000)  # Obtener todos los productos
-    total_inventory_value = sum(p.cost_price * p.stock_quantity for p in products)
-    total_retail_value = sum(p.selling_price * p.stock_quantity for p in products)
+    """
+    Obtiene estado general del inventario
+
+    Los totales salen de una consulta agregada cacheada unos segundos (las
+    escrituras de productos y ventas la invalidan); los listados de stock bajo y
+    sin stock se paginan por cursor.
+    """
+    try:
+        snapshot = inventory_status.get_snapshot(db)
+        low_stock, low_stock_next = crud.get_products_with_low_stock_keyset(
+            db, inventory_status.LOW_STOCK_THRESHOLD, low_stock_cursor, limit
+        )
+        no_stock, no_stock_next = crud.get_products_with_low_stock_keyset(db, 0, no_stock_cursor, limit)
+    except ValidationError as e:
+        raise convert_to_http_exception(e)
     
     return {
-        "total_products": total_products,
-        "low_stock_count": len(low_stock),
-        "no_stock_count": len(no_stock),
-        "total_inventory_cost_value": float(total_inventory_value),
-        "total_inventory_retail_value": float(total_retail_value),
+        **snapshot,
         "low_stock_products": low_stock,
-        "no_stock_products": no_stock
-    }
\ No newline at end of file
+        "no_stock_products": no_stock,
+        "low_stock_next_cursor": low_stock_next,
+        "no_stock_next_cursor": no_stock_next,
+    }
+
+class StockAsOf(schemas.BaseModel):
+    product_id: int
+    stock_quantity: int
+
+@router.get("/stock-as-of", response_model=List[StockAsOf])
+def get_stock_as_of(
+    as_of: datetime = Query(..., description="Instante de la consulta (UTC)"),
+    product_id: Optional[List[int]] = Query(None, description="Filtrar por uno o varios productos"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_sales_staff_user)
+):
+    """Stock por producto en una fecha pasada, calculado desde el ledger de movimientos"""
+    stock = inventory_ledger.get_stock_as_of(db, as_of, product_id)
+    return [
+        {"product_id": pid, "stock_quantity": quantity}
+        for pid, quantity in sorted(stock.items())
+    ]
+
+def _export_response(body, name: str, fmt: str, compress: bool) -> StreamingResponse:
+    media_type = "application/gzip" if compress else report_export.EXPORT_FORMATS[fmt][0]
+    filename = report_export.export_filename(name, fmt, compress)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _export_session_factory(request: Request):
+    # El generador de StreamingResponse se consume después de retornar el
+    # endpoint, así que abre su propia sesión en vez de usar get_read_db
+    return get_session_local(replica_router.get_read_url(request.headers.get(CONSISTENCY_TOKEN_HEADER)))
+
+@router.get("/export/sales")
+def export_sales(
+    request: Request,
+    start_date: Optional[date] = Query(None, description="Fecha de inicio (YYYY-MM-DD)"),
+    end_date: Optional[date] = Query(None, description="Fecha de fin (YYYY-MM-DD)"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="csv o ndjson"),
+    gzip: bool = Query(False, description="Comprimir la descarga en gzip"),
+    current_user: models.User = Depends(get_current_sales_staff_user)
+):
+    """Exporta las líneas de venta del rango en streaming (memoria constante para cualquier rango)"""
+    if start_date and end_date and start_date > end_date:
+        raise convert_to_http_exception(ValidationError("start_date no puede ser posterior a end_date"))
+    
+    body = report_export.stream_sales(_export_session_factory(request), start_date, end_date, format, gzip)
+    return _export_response(body, "sales", format, gzip)
+
+@router.get("/export/inventory")
+def export_inventory(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="csv o ndjson"),
+    gzip: bool = Query(False, description="Comprimir la descarga en gzip"),
+    current_user: models.User = Depends(get_current_sales_staff_user)
+):
+    """Exporta stock y precios de todos los productos en streaming"""
+    body = report_export.stream_inventory(_export_session_factory(request), format, gzip)
+    return _export_response(body, "inventory", format, gzip)
+
+@router.post("/export/analytics")
+def run_analytics_export(
+    full: bool = Query(False, description="Reconstruir el dataset completo en vez de añadir los días nuevos"),
+    current_user: models.User = Depends(get_current_admin_user)
+):
+    """
+    Encola la exportación al dataset Parquet de analítica de los días completos aún no exportados
+
+    Se ejecuta en un worker con la tarea diaria export_sales_parquet_task (una
+    reconstrucción completa no cabe en una petición); el resultado se consulta
+    con el task_id devuelto.
+    """
+    # Import diferido: las tareas cargan Celery, que la API solo necesita al encolar
+    from ..tasks.report_tasks import export_sales_parquet_task
+
+    task = export_sales_parquet_task.delay(full=full)
+    logger.info("Analytics export queued", task_id=task.id, full=full, user=current_user.username)
+    return {
+        'task_id': task.id,
+        'message': 'Exportación analítica encolada',
+        'status': 'PENDING'
+    }
+
+@router.get("/export/analytics/manifest")
+def get_analytics_manifest(
+    current_user: models.User = Depends(get_current_admin_user)
+):
+    """Particiones, ficheros y filas del dataset Parquet de analítica"""
+    return analytics_export.read_manifest()
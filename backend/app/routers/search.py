@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 import time
 
 from .. import schemas
-from ..dependencies import get_db
+from ..dependencies import get_db, get_read_db
 from ..utils.fulltext_search import (
     FullTextSearchEngine, 
     SearchSuggestionEngine, 
@@ -28,11 +28,13 @@ def search_products_advanced(
     use_fulltext: bool = Query(True, description="Usar búsqueda full-text avanzada"),
     boost_exact: bool = Query(True, description="Priorizar coincidencias exactas"),
     include_fuzzy: bool = Query(True, description="Incluir búsqueda difusa"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db)
 ):
     """
     Búsqueda avanzada de productos con full-text search
     Soporta múltiples estrategias de búsqueda y optimizaciones
+    La búsqueda se lee de una réplica; las analíticas se escriben en el primario
     """
     start_time = time.time()
     
@@ -40,7 +42,7 @@ def search_products_advanced(
         if use_fulltext:
             # Usar motor de búsqueda avanzado
             results = FullTextSearchEngine.search_products_advanced(
-                db=db,
+                db=read_db,
                 query=q,
                 limit=limit,
                 use_postgresql=True,
@@ -50,7 +52,7 @@ def search_products_advanced(
         else:
             # Usar búsqueda básica mejorada
             results = FullTextSearchEngine.search_products_advanced(
-                db=db,
+                db=read_db,
                 query=q,
                 limit=limit,
                 use_postgresql=False,
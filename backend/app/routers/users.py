@@ -1,9 +1,11 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
 from sqlalchemy.orm import Session
 
 from .. import crud, schemas, models
 from ..dependencies import get_db, get_current_admin_user
+from ..exceptions import ValidationError, convert_to_http_exception
+from ..pagination import NEXT_CURSOR_HEADER
 from ..logging_config import get_secure_logger
 from ..security.endpoint_security import secure_endpoint, admin_required, validate_json_input
 from ..security.input_validation import InputValidator
@@ -82,7 +84,22 @@ def create_user(user: schemas.UserCreate, request: Request, db: Session = Depend
     return new_user
 
 @router.get("/users/", response_model=List[schemas.User], dependencies=[Depends(get_current_admin_user)])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="Modo de paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor del header X-Next-Cursor (implica pagination=cursor)"),
+    db: Session = Depends(get_db)
+):
+    if pagination == "cursor" or cursor:
+        try:
+            users, next_cursor = crud.get_users_keyset(db, cursor=cursor, limit=limit)
+        except ValidationError as e:
+            raise convert_to_http_exception(e)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return users
     users = crud.get_users(db, skip=skip, limit=limit)
     return users
 
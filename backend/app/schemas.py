@@ -1,6 +1,6 @@
 from pydantic import BaseModel, validator, Field
 from datetime import datetime, date
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from decimal import Decimal
 
 from .models import UserRole, LoanStatus
@@ -115,6 +115,8 @@ class ProductList(BaseModel):
     skip: int
     limit: int
     has_next: bool
+    next_cursor: Optional[str] = None  # Solo en paginación por cursor
+    count_mode: str = "exact"  # Cómo se calculó total: exact, cached o estimate
 
 
 # Esquemas para Distributor
@@ -242,6 +244,51 @@ class PointOfSaleTransaction(PointOfSaleTransactionBase):
         from_attributes = True
 
 
+class PointOfSaleReservationItem(BaseModel):
+    product_id: int
+    quantity_sold: int
+    price_at_time_of_sale: float
+
+
+class PointOfSaleReservation(BaseModel):
+    """Venta aceptada en el modo de reservas de stock, pendiente de persistir"""
+    reservation_id: str
+    status: str = "pending"
+    user_id: int
+    transaction_time: datetime
+    total_amount: float
+    items: List[PointOfSaleReservationItem]
+
+
+class PointOfSaleBatchSale(PointOfSaleTransactionCreate):
+    """Venta encolada por una caja sin conexión"""
+    client_reference: Optional[str] = Field(None, max_length=64, description="Identificador local de la venta en la caja")
+    transaction_time: Optional[datetime] = Field(None, description="Momento de la venta en la caja (por defecto, el de ingesta)")
+
+
+class PointOfSaleBatchCreate(BaseModel):
+    sales: List[PointOfSaleBatchSale] = Field(..., min_items=1, description="Ventas a registrar en orden de llegada")
+    mode: Optional[str] = Field(None, description="all_or_nothing o best_effort (por defecto, el configurado)")
+
+
+class PointOfSaleBatchResult(BaseModel):
+    index: int
+    client_reference: Optional[str] = None
+    status: str  # created, rejected o skipped (lote all_or_nothing no aplicado)
+    transaction_id: Optional[int] = None
+    total_amount: Optional[float] = None
+    error: Optional[str] = None
+    details: Optional[Dict[str, Any]] = None
+
+
+class PointOfSaleBatchResponse(BaseModel):
+    mode: str
+    committed: bool
+    created: int
+    rejected: int
+    results: List[PointOfSaleBatchResult]
+
+
 # Esquemas para ConsignmentLoan
 class ConsignmentLoanBase(BaseModel):
     distributor_id: int
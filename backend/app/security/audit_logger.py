@@ -13,10 +13,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
 
-from ..database import Base, get_db
+from ..database import Base, get_session_local
 from ..config import settings
 from ..logging_config import get_secure_logger
 from ..models.audit_models import AuditLogEntry
@@ -274,7 +272,7 @@ class AuditLogger:
         """Escribir entrada de auditoría a la base de datos"""
         if not db:
             # Obtener sesión de base de datos
-            db = next(get_db())
+            db = get_session_local()()
         
         try:
             db.add(audit_entry)
@@ -302,7 +300,7 @@ class AuditLogger:
             return
         
         if not db:
-            db = next(get_db())
+            db = get_session_local()()
         
         try:
             # Escribir todas las entradas en batch
@@ -347,7 +345,7 @@ class AuditLogger:
         days_to_keep = days_to_keep or self.retention_days
         cutoff_date = datetime.utcnow() - timedelta(days=days_to_keep)
         
-        db = next(get_db())
+        db = get_session_local()()
         try:
             # Eliminar entradas antiguas
             deleted_count = db.query(AuditLogEntry).filter(
@@ -379,7 +377,7 @@ class AuditLogger:
     ) -> List[Dict[str, Any]]:
         """Obtener trail de auditoría con filtros"""
         
-        db = next(get_db())
+        db = get_session_local()()
         try:
             query = db.query(AuditLogEntry)
             
@@ -459,7 +457,7 @@ class AuditLogger:
         if not end_date:
             end_date = datetime.utcnow()
         
-        db = next(get_db())
+        db = get_session_local()()
         try:
             base_query = db.query(AuditLogEntry).filter(
                 AuditLogEntry.timestamp >= start_date,
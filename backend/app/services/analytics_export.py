@@ -0,0 +1,311 @@
+# ==================================================================
+# EXPORTACIÓN ANALÍTICA - PARQUET PARTICIONADO POR MES
+# ==================================================================
+
+"""
+Snapshot columnar de las líneas de venta para analítica.
+
+Cada ejecución escribe point_of_sale_items unido a su transacción y producto
+en ficheros Parquet bajo <analytics_export_dir>/sales_items/month=AAAA-MM/.
+Es incremental: solo exporta los días completos posteriores al último día ya
+exportado (el día en curso nunca se exporta, aún recibe ventas), con un
+fichero nuevo por mes tocado, así que los ficheros existentes no se reescriben.
+
+Las filas se leen con cursor del servidor en bloques de export_chunk_size y
+cada bloque se convierte en un RecordBatch de Arrow; las columnas derivadas
+(día, importe de línea) se calculan con pyarrow.compute sobre el bloque entero.
+
+_manifest.json es la fuente de verdad para los lectores: lista las particiones,
+sus ficheros y el número de filas, y se reemplaza de forma atómica al final.
+Un fichero que no aparezca en el manifest es restos de una ejecución fallida.
+
+Las ventas que llegan a un día ya exportado (lotes de cajas sin conexión con
+su hora de caja, reservas persistidas después de medianoche) se detectan por
+daily_sales_rollup.updated_at, que se escribe en la misma transacción que la
+venta: cada ejecución busca los días tocados desde el inicio de la anterior
+(menos analytics_export_late_margin, por las transacciones que tardan en
+confirmar) y reescribe los ficheros que los contienen. Las ediciones que no
+pasan por el rollup no se reflejan; full=True reconstruye el dataset completo en un directorio aparte (.sales_items.rebuild)
+y solo al terminar lo intercambia con el actual, así que los lectores siguen
+viendo el dataset anterior mientras dura la reconstrucción y un fallo a medias
+lo deja intacto.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import DailySalesRollup, PointOfSaleItem, PointOfSaleTransaction, Product
+from .report_export import iter_row_chunks
+from .sales_rollup import _as_date
+
+logger = get_logger(__name__)
+
+DATASET = "sales_items"
+MANIFEST_NAME = "_manifest.json"
+LOCK_NAME = f".{DATASET}.lock"
+REBUILD_NAME = f".{DATASET}.rebuild"
+RETIRED_NAME = f".{DATASET}.old"
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("transaction_id", pa.int64()),
+        ("transaction_time", pa.timestamp("us")),
+        ("day", pa.date32()),
+        ("user_id", pa.int64()),
+        ("transaction_total", pa.decimal128(10, 2)),
+        ("product_id", pa.int64()),
+        ("sku", pa.string()),
+        ("product_name", pa.string()),
+        ("quantity_sold", pa.int32()),
+        ("unit_price", pa.decimal128(10, 2)),
+        ("line_total", pa.decimal128(12, 2)),
+    ])
+
+
+# Columnas leídas de la base de datos, en el orden de las filas
+_SOURCE_COLUMNS = [
+    "transaction_id", "transaction_time", "user_id", "transaction_total",
+    "product_id", "sku", "product_name", "quantity_sold", "unit_price",
+]
+
+
+def _items_stmt(start: datetime, end: datetime):
+    time = PointOfSaleTransaction.transaction_time
+    return select(
+        PointOfSaleTransaction.id,
+        time,
+        PointOfSaleTransaction.user_id,
+        PointOfSaleTransaction.total_amount,
+        PointOfSaleItem.product_id,
+        Product.sku,
+        Product.name,
+        PointOfSaleItem.quantity_sold,
+        PointOfSaleItem.price_at_time_of_sale,
+    ).join(
+        PointOfSaleItem, PointOfSaleItem.transaction_id == PointOfSaleTransaction.id
+    ).join(
+        Product, Product.id == PointOfSaleItem.product_id
+    ).where(time >= start, time < end).order_by(time, PointOfSaleTransaction.id, PointOfSaleItem.id)
+
+
+def to_record_batch(rows):
+    """Convierte un bloque de filas en un RecordBatch con las columnas derivadas"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    schema = arrow_schema()
+    columns = dict(zip(_SOURCE_COLUMNS, zip(*rows)))
+    arrays = {name: pa.array(columns[name], type=schema.field(name).type) for name in _SOURCE_COLUMNS}
+    arrays["day"] = pc.cast(arrays["transaction_time"], pa.date32())
+    arrays["line_total"] = pc.cast(
+        pc.multiply(arrays["unit_price"], pc.cast(arrays["quantity_sold"], pa.decimal128(10, 0))),
+        schema.field("line_total").type
+    )
+    return pa.RecordBatch.from_arrays([arrays[name] for name in schema.names], schema=schema)
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def dataset_dir(base_dir: Optional[str] = None) -> str:
+    return os.path.join(base_dir or settings.analytics_export_dir, DATASET)
+
+
+def read_manifest(base_dir: Optional[str] = None) -> Dict[str, Any]:
+    return _load_manifest(dataset_dir(base_dir))
+
+
+def _load_manifest(directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"dataset": DATASET, "last_exported_day": None, "total_rows": 0, "partitions": {}}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _swap_in(rebuilt: str, directory: str, base_dir: str):
+    """Sustituye el dataset por el reconstruido; el anterior se borra después del cambio"""
+    retired = os.path.join(base_dir, RETIRED_NAME)
+    if os.path.isdir(retired):
+        shutil.rmtree(retired)
+    if os.path.isdir(directory):
+        os.rename(directory, retired)
+    os.rename(rebuilt, directory)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def _write_month(db: Session, directory: str, first_day: date, last_day: date) -> Optional[Dict[str, Any]]:
+    """Escribe las ventas de [first_day, last_day] (mismo mes) en un fichero nuevo de la partición"""
+    import pyarrow.parquet as pq
+
+    partition = f"month={first_day:%Y-%m}"
+    filename = f"part-{first_day:%Y%m%d}-{last_day:%Y%m%d}.parquet"
+    path = os.path.join(directory, partition, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    stmt = _items_stmt(
+        datetime.combine(first_day, datetime.min.time()),
+        datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+    )
+    rows = 0
+    writer = None
+    try:
+        for chunk in iter_row_chunks(db, stmt):
+            if writer is None:
+                writer = pq.ParquetWriter(path + ".tmp", arrow_schema(), compression="zstd")
+            writer.write_batch(to_record_batch(chunk))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        return None
+    os.replace(path + ".tmp", path)
+    return {"path": f"{partition}/{filename}", "first_day": first_day.isoformat(),
+            "last_day": last_day.isoformat(), "rows": rows}
+
+
+def _add_part(manifest: Dict[str, Any], part: Dict[str, Any]):
+    partition = manifest["partitions"].setdefault(part["path"].split("/")[0], {"rows": 0, "files": []})
+    partition["files"].append(part)
+    partition["rows"] += part["rows"]
+    manifest["total_rows"] += part["rows"]
+
+
+def _late_days(db: Session, manifest: Dict[str, Any]) -> Set[date]:
+    """Días ya exportados que recibieron ventas desde el inicio de la ejecución anterior"""
+    if not manifest.get("checked_at") or not manifest["last_exported_day"]:
+        return set()
+    since = datetime.fromisoformat(manifest["checked_at"]) - timedelta(seconds=settings.analytics_export_late_margin)
+    stmt = select(DailySalesRollup.day).where(
+        DailySalesRollup.updated_at >= since,
+        DailySalesRollup.day <= date.fromisoformat(manifest["last_exported_day"])
+    ).distinct()
+    return {_as_date(day) for day in db.execute(stmt).scalars()}
+
+
+def _rewrite_days(db: Session, directory: str, manifest: Dict[str, Any], days: Set[date]) -> List[Dict[str, Any]]:
+    """Reescribe los ficheros que contienen alguno de los días; los días sin fichero reciben uno nuevo"""
+    rewritten = []
+    pending = set(days)
+    for partition in manifest["partitions"].values():
+        files = []
+        for part in partition["files"]:
+            first_day, last_day = date.fromisoformat(part["first_day"]), date.fromisoformat(part["last_day"])
+            covered = {day for day in pending if first_day <= day <= last_day}
+            if not covered:
+                files.append(part)
+                continue
+            pending -= covered
+            # Mismo nombre: el fichero se sustituye de forma atómica
+            new_part = _write_month(db, directory, first_day, last_day)
+            new_rows = new_part["rows"] if new_part else 0
+            partition["rows"] += new_rows - part["rows"]
+            manifest["total_rows"] += new_rows - part["rows"]
+            if new_part is None:
+                os.remove(os.path.join(directory, part["path"]))
+            else:
+                files.append(new_part)
+                rewritten.append(new_part)
+        partition["files"] = files
+    for day in sorted(pending):
+        part = _write_month(db, directory, day, day)
+        if part is not None:
+            _add_part(manifest, part)
+            rewritten.append(part)
+    return rewritten
+
+
+def export_incremental(db: Session, base_dir: Optional[str] = None, until: Optional[date] = None,
+                       full: bool = False) -> Dict[str, Any]:
+    """
+    Exporta los días completos pendientes hasta `until` (por defecto ayer) y
+    reescribe los ya exportados que recibieron ventas tardías.
+
+    Devuelve el resumen de la ejecución; status "skipped" si otra exportación
+    tiene el cerrojo del directorio.
+    """
+    base_dir = base_dir or settings.analytics_export_dir
+    directory = dataset_dir(base_dir)
+    os.makedirs(base_dir, exist_ok=True)
+
+    with open(os.path.join(base_dir, LOCK_NAME), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return {"status": "skipped", "reason": "export already running"}
+
+        # Una reconstrucción se escribe aparte; restos de otra fallida se descartan
+        target = os.path.join(base_dir, REBUILD_NAME) if full else directory
+        if full and os.path.isdir(target):
+            shutil.rmtree(target)
+        os.makedirs(target, exist_ok=True)
+
+        manifest = _load_manifest(target)
+        checked_at = datetime.utcnow()
+        rewritten = _rewrite_days(db, target, manifest, _late_days(db, manifest))
+        until = until or date.today() - timedelta(days=1)
+        if manifest["last_exported_day"]:
+            start = date.fromisoformat(manifest["last_exported_day"]) + timedelta(days=1)
+        else:
+            first_sale = db.execute(select(func.min(PointOfSaleTransaction.transaction_time))).scalar()
+            start = first_sale.date() if first_sale else until + timedelta(days=1)
+
+        written = []
+        month = _month_start(start) if start <= until else None
+        while month is not None and month <= until:
+            first_day = max(start, month)
+            last_day = min(until, _next_month(month) - timedelta(days=1))
+            part = _write_month(db, target, first_day, last_day)
+            if part is not None:
+                _add_part(manifest, part)
+                written.append(part)
+            month = _next_month(month)
+
+        if start <= until:
+            manifest["last_exported_day"] = until.isoformat()
+        if start <= until or rewritten:
+            manifest["updated_at"] = datetime.utcnow().isoformat()
+        # Punto de partida de la búsqueda de ventas tardías de la siguiente ejecución
+        manifest["checked_at"] = checked_at.isoformat()
+        _write_manifest(target, manifest)
+        if full:
+            _swap_in(target, directory, base_dir)
+
+        rows = sum(part["rows"] for part in written + rewritten)
+        metrics_registry.counter('analytics_export_rows_total').increment(rows)
+        logger.info("Analytics export completed", files=len(written), rewritten=len(rewritten), rows=rows,
+                    last_exported_day=manifest["last_exported_day"])
+        return {
+            "status": "completed",
+            "files": written,
+            "rewritten": rewritten,
+            "rows": rows,
+            "last_exported_day": manifest["last_exported_day"],
+        }
@@ -0,0 +1,127 @@
+# ==================================================================
+# PROVEEDOR DE CONTEOS - EXACTO, CACHEADO O ESTIMADO
+# ==================================================================
+
+from typing import Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from ..cache import cache_manager
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import Product
+
+logger = get_logger(__name__)
+
+COUNT_MODES = ("exact", "cached", "estimate")
+
+# Incrementa solo si la clave existe (en un paso: si caduca entre la comprobación
+# y el INCRBY, este la recrearía con el delta como valor y sin TTL)
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+
+class CountProvider:
+    """
+    Total de filas de una tabla con tres niveles de coste
+
+    - exact: SELECT count(*) en cada llamada
+    - cached: contador en Redis que los caminos de alta/baja ajustan con INCRBY;
+      si falta la clave (o Redis no responde) se recalcula con un conteo exacto
+    - estimate: estadísticas del planificador (pg_class.reltuples en PostgreSQL,
+      sqlite_stat1 en SQLite); sin estadísticas se vuelve al conteo exacto
+    """
+
+    def __init__(self, model, cache_ttl: Optional[int] = None):
+        self.model = model
+        self.table_name = model.__tablename__
+        self.cache_key = f"count:{self.table_name}"
+        self.cache_ttl = cache_ttl or settings.count_cache_ttl
+
+    def count(self, db: Session, mode: str = "exact") -> int:
+        if mode not in COUNT_MODES:
+            raise ValueError(f"Modo de conteo desconocido: {mode}")
+        metrics_registry.counter(f'count_provider_{mode}_total').increment()
+
+        if mode == "cached":
+            return self.cached_count(db)
+        if mode == "estimate":
+            return self.estimated_count(db)
+        return self.exact_count(db)
+
+    def exact_count(self, db: Session) -> int:
+        return db.query(func.count(self.model.id)).scalar() or 0
+
+    def cached_count(self, db: Session) -> int:
+        # Entero plano de Redis (no pasa por el codec de la caché) para que
+        # adjust() pueda aplicarle INCRBY
+        try:
+            client = cache_manager.get_sync_client()
+            cached = client.get(self.cache_key)
+            if cached is not None:
+                return int(cached)
+        except Exception as e:
+            logger.warning("Cached count unavailable", table=self.table_name, error=str(e))
+            return self.exact_count(db)
+
+        total = self.exact_count(db)
+        try:
+            client.set(self.cache_key, total, ex=self.cache_ttl)
+        except Exception as e:
+            logger.warning("Cached count store failed", table=self.table_name, error=str(e))
+        return total
+
+    def estimated_count(self, db: Session) -> int:
+        dialect = db.get_bind().dialect.name
+        estimate = None
+        try:
+            if dialect == "postgresql":
+                estimate = db.execute(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+                    {"table": self.table_name}
+                ).scalar()
+            elif dialect == "sqlite":
+                has_stats = db.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                ).scalar()
+                if has_stats:
+                    stat = db.execute(
+                        text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table LIMIT 1"),
+                        {"table": self.table_name}
+                    ).scalar()
+                    # El primer entero de stat es el número de filas
+                    estimate = int(stat.split()[0]) if stat else None
+        except Exception as e:
+            logger.warning("Count estimate unavailable", table=self.table_name, error=str(e))
+
+        # reltuples es -1 (PG 14+) mientras la tabla no se ha analizado nunca
+        if estimate is None or estimate < 0:
+            return self.exact_count(db)
+        return int(estimate)
+
+    def adjust(self, delta: int):
+        """
+        Ajusta el contador cacheado tras un alta (+1) o baja (-1) confirmada
+
+        Solo se incrementa si la clave existe: si no, el siguiente conteo
+        cacheado la recalcula desde la base de datos.
+        """
+        try:
+            cache_manager.get_sync_client().eval(ADJUST_SCRIPT, 1, self.cache_key, delta)
+        except Exception as e:
+            # Sin Redis el contador caduca por TTL; invalidar para no servir un valor viejo
+            logger.warning("Cached count adjust failed", table=self.table_name, error=str(e))
+            cache_manager.delete(self.cache_key)
+
+    def invalidate(self):
+        cache_manager.delete(self.cache_key)
+
+
+# Instancia global para el catálogo de productos
+product_count = CountProvider(Product)
@@ -0,0 +1,176 @@
+# ==================================================================
+# IDEMPOTENCIA - RESULTADOS DE POST REPETIDOS SOBRE REDIS
+# ==================================================================
+
+"""
+Almacén de claves de idempotencia sobre el cliente Redis de cache_manager
+
+Cada clave pasa por dos estados:
+
+- pending: la primera petición la reserva con SET NX (con un TTL corto por si
+  el proceso muere a mitad de la operación)
+- done: al terminar se guarda la respuesta serializada con el TTL configurado
+
+Una repetición de una clave terminada devuelve la respuesta guardada sin tocar
+la base de datos; una repetición concurrente espera a que la primera termine.
+Si la operación falla la clave se libera para que el reintento la ejecute.
+
+complete y release solo actúan si la clave sigue reservada con el token de la
+petición (comparación y escritura en un script Lua atómico): si la reserva
+expiró y otra petición la tomó, no se pisa ni se borra su estado.
+"""
+
+import hashlib
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from ..cache import cache_manager
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+
+logger = get_logger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+# Marca las respuestas servidas desde el almacén en lugar de ejecutarse
+IDEMPOTENT_REPLAY_HEADER = "Idempotent-Replayed"
+
+# Guarda la respuesta solo si la reserva pendiente sigue siendo de este token
+COMPLETE_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if raw and cjson.decode(raw)['token'] == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Borra la reserva solo si sigue siendo de este token
+RELEASE_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if raw and cjson.decode(raw)['token'] == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class IdempotencyConflict(Exception):
+    """La clave se reutilizó con otro payload o la petición original no terminó a tiempo"""
+
+    def __init__(self, message: str, reason: str):
+        self.reason = reason
+        super().__init__(message)
+
+
+@dataclass
+class IdempotencyClaim:
+    """Resultado de reservar una clave"""
+    key: str
+    token: Optional[str] = None  # Presente si esta petición es la dueña de la clave
+    response: Optional[Dict[str, Any]] = None  # Respuesta guardada de una ejecución previa
+
+    @property
+    def replayed(self) -> bool:
+        return self.response is not None
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Huella del cuerpo de la petición para detectar claves reutilizadas con otro payload"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        namespace: str,
+        ttl: Optional[int] = None,
+        pending_ttl: Optional[int] = None,
+        wait_timeout: Optional[float] = None,
+        poll_interval: float = 0.05,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl or settings.idempotency_key_ttl
+        self.pending_ttl = pending_ttl or settings.idempotency_pending_ttl
+        self.wait_timeout = wait_timeout if wait_timeout is not None else settings.idempotency_wait_timeout
+        self.poll_interval = poll_interval
+
+    def _redis_key(self, scope: Any, key: str) -> str:
+        return f"idempotency:{self.namespace}:{scope}:{key}"
+
+    def claim(self, scope: Any, key: str, fingerprint: str) -> IdempotencyClaim:
+        """
+        Reserva la clave o recupera el resultado de la petición que ya la usó
+
+        `scope` separa las claves por usuario. Sin Redis se devuelve una
+        reserva sin token y la petición se procesa sin idempotencia.
+        """
+        redis_key = self._redis_key(scope, key)
+        token = uuid.uuid4().hex
+        pending = json.dumps({"state": "pending", "token": token, "fingerprint": fingerprint})
+        deadline = time.monotonic() + self.wait_timeout
+
+        try:
+            client = cache_manager.get_sync_client()
+            while True:
+                if client.set(redis_key, pending, nx=True, ex=self.pending_ttl):
+                    metrics_registry.counter('idempotency_claims_total').increment()
+                    return IdempotencyClaim(key=redis_key, token=token)
+
+                raw = client.get(redis_key)
+                if raw is None:
+                    continue  # Expiró o se liberó entre SET y GET
+                record = json.loads(raw)
+                if record.get("fingerprint") != fingerprint:
+                    metrics_registry.counter('idempotency_conflicts_total').increment()
+                    raise IdempotencyConflict(
+                        "La clave de idempotencia ya se usó con otra petición", reason="payload_mismatch"
+                    )
+                if record["state"] == "done":
+                    metrics_registry.counter('idempotency_replays_total').increment()
+                    return IdempotencyClaim(key=redis_key, response=record["response"])
+
+                if time.monotonic() >= deadline:
+                    metrics_registry.counter('idempotency_conflicts_total').increment()
+                    raise IdempotencyConflict(
+                        "La petición original con esta clave sigue en curso", reason="in_flight"
+                    )
+                metrics_registry.counter('idempotency_waits_total').increment()
+                time.sleep(self.poll_interval)
+        except IdempotencyConflict:
+            raise
+        except Exception as e:
+            logger.warning("Idempotency store unavailable", key=redis_key, error=str(e))
+            return IdempotencyClaim(key=redis_key)
+
+    def complete(self, claim: IdempotencyClaim, fingerprint: str, response: Dict[str, Any]):
+        """Guarda la respuesta de la petición dueña de la clave"""
+        if claim.token is None:
+            return
+        record = json.dumps({"state": "done", "fingerprint": fingerprint, "response": response}, default=str)
+        try:
+            stored = cache_manager.get_sync_client().eval(
+                COMPLETE_SCRIPT, 1, claim.key, claim.token, record, self.ttl
+            )
+            if not stored:
+                metrics_registry.counter('idempotency_lost_claims_total').increment()
+                logger.warning("Idempotency claim expired before completing", key=claim.key)
+        except Exception as e:
+            logger.warning("Idempotency result not stored", key=claim.key, error=str(e))
+
+    def release(self, claim: IdempotencyClaim):
+        """Libera una clave reservada cuya operación falló"""
+        if claim.token is None:
+            return
+        try:
+            cache_manager.get_sync_client().eval(RELEASE_SCRIPT, 1, claim.key, claim.token)
+        except Exception as e:
+            logger.warning("Idempotency key not released", key=claim.key, error=str(e))
+
+
+# Almacén para el alta de ventas POS
+pos_sale_idempotency = IdempotencyStore("pos_sales")
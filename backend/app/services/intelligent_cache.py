@@ -11,7 +11,10 @@ from dataclasses import dataclass
 from enum import Enum
 
 from ..cache import cache_manager
+from ..cache_codec import LEGACY_PICKLE, cache_codec
+from ..local_cache import local_cache
 from ..logging_config import get_logger
+from ..single_flight import single_flight
 from ..models import Product
 
 logger = get_logger(__name__)
@@ -75,44 +78,63 @@ class IntelligentCache:
         start_time = time.time()
         
         try:
-            # Intentar obtener del caché
-            cached_value = self._get_from_cache(key)
-            
-            if cached_value is not None:
-                # Cache hit
-                self._record_access(key, hit=True, response_time=time.time() - start_time)
-                self._update_access_pattern(key)
-                
-                # Verificar si necesita pre-renovación
-                self._check_preemptive_refresh(key, fetch_function, ttl)
-                
+            if not fetch_function:
+                cached_value = self._get_from_cache(key)
+                if cached_value is not None:
+                    self._record_access(key, hit=True, response_time=time.time() - start_time)
+                    self._update_access_pattern(key)
                 return cached_value
             
-            # Cache miss - obtener datos
-            if fetch_function:
-                fresh_data = fetch_function()
-                
-                # Guardar en caché con estrategia inteligente
-                self._set_in_cache(
-                    key=key,
-                    value=fresh_data,
-                    ttl=self._calculate_intelligent_ttl(key, ttl, priority),
-                    priority=priority,
-                    strategy=strategy
-                )
-                
-                response_time = time.time() - start_time
-                self._record_access(key, hit=False, response_time=response_time)
-                self._update_access_pattern(key)
-                
-                return fresh_data
+            # Single-flight: en un fallo solo una petición (de este proceso y,
+            # con el lock de Redis, de todos los workers) ejecuta fetch_function.
+            # Al acercarse la expiración la renueva una sola mientras el resto
+            # sirve el valor anterior, lo que sustituye a la renovación preventiva
+            computed = []
             
-            return None
+            def compute():
+                computed.append(True)
+                return fetch_function()
+            
+            value = single_flight.fetch(
+                cache_manager.get_sync_client, key, compute,
+                self._calculate_intelligent_ttl(key, ttl, priority),
+                lambda data: self._encode(key, data), cache_codec.decode
+            )
+            
+            self._record_access(key, hit=not computed, response_time=time.time() - start_time)
+            self._update_access_pattern(key)
+            
+            return value
             
         except Exception as e:
             logger.error(f"Error en caché inteligente para clave {key}: {str(e)}")
             return None
     
+    def get_versioned(
+        self,
+        namespace: str,
+        key: str,
+        fetch_function: Callable = None,
+        ttl: int = 3600,
+        priority: CachePriority = CachePriority.MEDIUM,
+        strategy: CacheStrategy = CacheStrategy.LRU
+    ) -> Any:
+        """
+        get() sobre una clave versionada del namespace, con la L1 del proceso delante
+        
+        Se invalida con invalidate_namespace() o cache_manager.delete_versioned(),
+        que también avisan a la L1 del resto de workers.
+        """
+        
+        value = local_cache.get(namespace, key)
+        if value is not None:
+            return value
+        
+        epoch = local_cache.epoch(namespace)
+        value = self.get(cache_manager.versioned_key(namespace, key), fetch_function, ttl, priority, strategy)
+        local_cache.set(namespace, key, value, ttl, epoch=epoch)
+        return value
+    
     def set(
         self,
         key: str,
@@ -150,20 +172,25 @@ class IntelligentCache:
             logger.error(f"Error invalidando caché para clave {key}: {str(e)}")
     
     def invalidate_pattern(self, pattern: str):
-        """Invalida entradas del caché que coincidan con un patrón"""
+        """
+        Invalida entradas del caché que coincidan con un patrón
+        
+        Recorre Redis con SCAN; las claves de ProductCacheManager se invalidan
+        con invalidate_namespace() sin recorrer el keyspace.
+        """
         
         try:
-            redis_client = cache_manager.get_sync_client()
-            if redis_client:
-                # Buscar claves que coincidan con el patrón
-                matching_keys = redis_client.keys(pattern)
-                if matching_keys:
-                    redis_client.delete(*matching_keys)
-                    logger.info(f"Invalidadas {len(matching_keys)} entradas con patrón: {pattern}")
+            removed = cache_manager.delete_pattern(pattern)
+            if removed:
+                logger.info(f"Invalidadas {removed} entradas con patrón: {pattern}")
             
         except Exception as e:
             logger.error(f"Error invalidando patrón {pattern}: {str(e)}")
     
+    def invalidate_namespace(self, *namespaces: str):
+        """Invalida todas las claves versionadas de los namespaces (O(1) por namespace)"""
+        cache_manager.bump_generation(*namespaces)
+    
     def get_metrics(self) -> Dict[str, Any]:
         """Obtiene métricas del sistema de caché"""
         
@@ -242,8 +269,7 @@ class IntelligentCache:
             
             cached_data = redis_client.get(key)
             if cached_data:
-                import pickle
-                return pickle.loads(cached_data)
+                return cache_codec.decode(cached_data)
             
             return None
             
@@ -251,6 +277,15 @@ class IntelligentCache:
             logger.debug(f"Error obteniendo del caché {key}: {str(e)}")
             return None
     
+    def _encode(self, key: str, value: Any) -> bytes:
+        """Serializa para Redis registrando el tamaño en las métricas de la clave"""
+        
+        serialized_data = cache_codec.encode(value, legacy=LEGACY_PICKLE)
+        if key not in self.metrics:
+            self.metrics[key] = CacheMetrics()
+        self.metrics[key].size_bytes = len(serialized_data)
+        return serialized_data
+    
     def _set_in_cache(
         self,
         key: str,
@@ -266,8 +301,7 @@ class IntelligentCache:
             if not redis_client:
                 return
             
-            import pickle
-            serialized_data = pickle.dumps(value)
+            serialized_data = cache_codec.encode(value, legacy=LEGACY_PICKLE)
             
             # Establecer con TTL
             redis_client.setex(key, ttl, serialized_data)
@@ -376,40 +410,6 @@ class IntelligentCache:
         except Exception as e:
             logger.debug(f"Error actualizando patrón de acceso: {str(e)}")
     
-    def _check_preemptive_refresh(self, key: str, fetch_function: Callable, ttl: int):
-        """Verifica si se necesita renovación preemptiva del caché"""
-        
-        try:
-            redis_client = cache_manager.get_sync_client()
-            if not redis_client or not fetch_function:
-                return
-            
-            # Verificar TTL restante
-            remaining_ttl = redis_client.ttl(key)
-            
-            # Si queda menos del 20% del TTL y es una clave frecuentemente accedida
-            if remaining_ttl > 0 and remaining_ttl < (ttl * 0.2):
-                if key in self.metrics and self.metrics[key].access_frequency > 10:
-                    
-                    # Renovar en background (fire-and-forget)
-                    try:
-                        fresh_data = fetch_function()
-                        self._set_in_cache(
-                            key=key,
-                            value=fresh_data,
-                            ttl=ttl,
-                            priority=CachePriority.MEDIUM,
-                            strategy=CacheStrategy.LRU
-                        )
-                        
-                        logger.debug(f"Renovación preemptiva para clave: {key}")
-                        
-                    except Exception as e:
-                        logger.debug(f"Error en renovación preemptiva: {str(e)}")
-            
-        except Exception as e:
-            logger.debug(f"Error verificando renovación preemptiva: {str(e)}")
-    
     def _calculate_cache_efficiency(self) -> float:
         """Calcula eficiencia general del caché"""
         
@@ -448,10 +448,9 @@ class ProductCacheManager:
     def get_product(product_id: int, fetch_function: Callable = None) -> Optional[Product]:
         """Obtiene producto con caché inteligente"""
         
-        key = f"product:{product_id}"
-        
-        return intelligent_cache.get(
-            key=key,
+        return intelligent_cache.get_versioned(
+            namespace="product",
+            key=str(product_id),
             fetch_function=fetch_function,
             ttl=3600,  # 1 hora
             priority=CachePriority.HIGH,
@@ -462,10 +461,9 @@ class ProductCacheManager:
     def get_products_list(skip: int = 0, limit: int = 20, fetch_function: Callable = None) -> Optional[List[Product]]:
         """Obtiene lista de productos con caché"""
         
-        key = f"products:list:{skip}:{limit}"
-        
-        return intelligent_cache.get(
-            key=key,
+        return intelligent_cache.get_versioned(
+            namespace="products",
+            key=f"list:{skip}:{limit}",
             fetch_function=fetch_function,
             ttl=1800,  # 30 minutos
             priority=CachePriority.MEDIUM,
@@ -479,10 +477,9 @@ class ProductCacheManager:
         # Normalizar query para cache key
         normalized_query = query.lower().strip()
         query_hash = hashlib.md5(normalized_query.encode()).hexdigest()[:8]
-        key = f"search:{query_hash}:{limit}"
-        
-        return intelligent_cache.get(
-            key=key,
+        return intelligent_cache.get_versioned(
+            namespace="product_search",
+            key=f"{query_hash}:{limit}",
             fetch_function=fetch_function,
             ttl=900,  # 15 minutos
             priority=CachePriority.MEDIUM,
@@ -494,21 +491,24 @@ class ProductCacheManager:
         """Invalida caché de un producto específico"""
         
         # Invalidar producto individual
-        intelligent_cache.invalidate(f"product:{product_id}")
+        cache_manager.delete_versioned("product", [product_id])
         
-        # Invalidar listas que podrían contener este producto
-        intelligent_cache.invalidate_pattern("products:list:*")
-        intelligent_cache.invalidate_pattern("search:*")
+        # Invalidar listas y búsquedas que podrían contener este producto
+        intelligent_cache.invalidate_namespace("products", "product_search")
         
         logger.info(f"Caché invalidado para producto: {product_id}")
     
+    @staticmethod
+    def invalidate_products(product_ids: List[int]):
+        """Invalida las entradas individuales de productos cuyo stock cambió"""
+        
+        cache_manager.delete_versioned("product", list(product_ids))
+    
     @staticmethod
     def invalidate_all_products():
         """Invalida todo el caché relacionado con productos"""
         
-        intelligent_cache.invalidate_pattern("product:*")
-        intelligent_cache.invalidate_pattern("products:*")
-        intelligent_cache.invalidate_pattern("search:*")
+        intelligent_cache.invalidate_namespace("product", "products", "product_search")
         
         logger.info("Todo el caché de productos invalidado")
     
@@ -0,0 +1,242 @@
+# ==================================================================
+# LEDGER DE INVENTARIO - MOVIMIENTOS, SALDOS Y CHECKPOINTS
+# ==================================================================
+
+"""
+Cada cambio de stock se registra como una fila en inventory_movements dentro de
+la misma transacción que lo provoca. A partir del ledger:
+
+- fold_movements() aplica de forma incremental los movimientos nuevos a
+  product_stock_balances (tarea periódica, fuera del camino de la venta)
+- create_checkpoint() copia los saldos a stock_checkpoints
+- get_stock_as_of() responde "stock a la fecha X" partiendo del checkpoint o
+  saldo más reciente anterior a X y sumando solo los movimientos posteriores
+- rebuild_from_ledger() reconstruye saldos y checkpoints desde cero
+
+Los saldos solo incluyen movimientos con más de inventory_ledger_fold_lag_seconds
+de antigüedad, para no dejar atrás transacciones que aún no han confirmado.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import (
+    InventoryMovement,
+    InventoryMovementType,
+    Product,
+    ProductStockBalance,
+    StockCheckpoint,
+)
+
+logger = get_logger(__name__)
+
+
+def record_movement(
+    db: Session,
+    product_id: int,
+    movement_type: InventoryMovementType,
+    quantity: int,
+    reference: Optional[str] = None,
+    created_at: Optional[datetime] = None,
+) -> Optional[InventoryMovement]:
+    """
+    Añade un movimiento al ledger en la sesión actual (sin commit)
+
+    El llamador confirma la transacción junto con el cambio de stock.
+    """
+    if quantity == 0:
+        return None
+    movement = InventoryMovement(
+        product_id=product_id,
+        movement_type=movement_type,
+        quantity=quantity,
+        reference=reference,
+        created_at=created_at or datetime.utcnow(),
+    )
+    db.add(movement)
+    metrics_registry.counter('inventory_movements_total').increment()
+    return movement
+
+
+def _fold_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=settings.inventory_ledger_fold_lag_seconds)
+
+
+def fold_movements(db: Session, cutoff: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Aplica a los saldos los movimientos con created_at en (as_of, cutoff]
+
+    Todos los saldos comparten el mismo as_of, así que una sola agregación por
+    producto basta para avanzarlos. No hace commit.
+    """
+    cutoff = cutoff or _fold_cutoff()
+    watermark = db.query(func.max(ProductStockBalance.as_of)).scalar()
+    if watermark is not None and cutoff <= watermark:
+        return {"products": 0, "movements": 0}
+
+    query = db.query(
+        InventoryMovement.product_id,
+        func.sum(InventoryMovement.quantity),
+        func.count(InventoryMovement.id),
+    ).filter(InventoryMovement.created_at <= cutoff)
+    if watermark is not None:
+        query = query.filter(InventoryMovement.created_at > watermark)
+    deltas = query.group_by(InventoryMovement.product_id).all()
+
+    balances = {
+        balance.product_id: balance
+        for balance in db.query(ProductStockBalance).filter(
+            ProductStockBalance.product_id.in_([product_id for product_id, _, _ in deltas])
+        )
+    } if deltas else {}
+
+    applied = 0
+    for product_id, delta, count in deltas:
+        balance = balances.get(product_id)
+        if balance is None:
+            db.add(ProductStockBalance(product_id=product_id, quantity=int(delta), as_of=cutoff))
+        else:
+            balance.quantity += int(delta)
+        applied += count
+
+    db.query(ProductStockBalance).update({ProductStockBalance.as_of: cutoff}, synchronize_session=False)
+    db.flush()
+    metrics_registry.counter('inventory_movements_folded_total').increment(applied)
+    return {"products": len(deltas), "movements": applied}
+
+
+def create_checkpoint(db: Session, cutoff: Optional[datetime] = None) -> int:
+    """Avanza los saldos hasta cutoff y los copia a stock_checkpoints. No hace commit."""
+    fold_movements(db, cutoff)
+    as_of = db.query(func.max(ProductStockBalance.as_of)).scalar()
+    if as_of is None:
+        return 0
+    if db.query(StockCheckpoint.id).filter(StockCheckpoint.as_of == as_of).first():
+        return 0
+
+    balances = db.query(ProductStockBalance.product_id, ProductStockBalance.quantity).all()
+    db.bulk_insert_mappings(StockCheckpoint, [
+        {"product_id": product_id, "as_of": as_of, "quantity": quantity}
+        for product_id, quantity in balances
+    ])
+    db.flush()
+    return len(balances)
+
+
+def get_stock_as_of(
+    db: Session,
+    at: datetime,
+    product_ids: Optional[Iterable[int]] = None,
+) -> Dict[int, int]:
+    """
+    Stock por producto en el instante `at` según el ledger
+
+    Base: el saldo materializado si su as_of <= at, si no el checkpoint más
+    reciente anterior a `at`. Sobre esa base solo se suman los movimientos de
+    (base, at].
+    """
+    product_ids = list(product_ids) if product_ids is not None else None
+
+    base_time = None
+    base: Dict[int, int] = {}
+
+    balance_as_of = db.query(func.max(ProductStockBalance.as_of)).scalar()
+    if balance_as_of is not None and balance_as_of <= at:
+        base_time = balance_as_of
+        query = db.query(ProductStockBalance.product_id, ProductStockBalance.quantity)
+        if product_ids is not None:
+            query = query.filter(ProductStockBalance.product_id.in_(product_ids))
+        base = dict(query.all())
+    else:
+        checkpoint_as_of = db.query(func.max(StockCheckpoint.as_of))\
+            .filter(StockCheckpoint.as_of <= at).scalar()
+        if checkpoint_as_of is not None:
+            base_time = checkpoint_as_of
+            query = db.query(StockCheckpoint.product_id, StockCheckpoint.quantity)\
+                .filter(StockCheckpoint.as_of == checkpoint_as_of)
+            if product_ids is not None:
+                query = query.filter(StockCheckpoint.product_id.in_(product_ids))
+            base = dict(query.all())
+
+    query = db.query(InventoryMovement.product_id, func.sum(InventoryMovement.quantity))\
+        .filter(InventoryMovement.created_at <= at)
+    if base_time is not None:
+        query = query.filter(InventoryMovement.created_at > base_time)
+    if product_ids is not None:
+        query = query.filter(InventoryMovement.product_id.in_(product_ids))
+
+    stock = dict(base)
+    for product_id, delta in query.group_by(InventoryMovement.product_id):
+        stock[product_id] = stock.get(product_id, 0) + int(delta)
+
+    if product_ids is not None:
+        return {product_id: stock.get(product_id, 0) for product_id in product_ids}
+    return stock
+
+
+def seed_opening_balances(db: Session, at: Optional[datetime] = None) -> int:
+    """
+    Registra un opening_balance para los productos cuyo ledger no cuadra con stock_quantity
+
+    Se usa al activar el ledger sobre datos existentes. No hace commit.
+    """
+    ledger = dict(
+        db.query(InventoryMovement.product_id, func.sum(InventoryMovement.quantity))
+        .group_by(InventoryMovement.product_id)
+        .all()
+    )
+    seeded = 0
+    for product_id, stock_quantity in db.query(Product.id, Product.stock_quantity):
+        difference = stock_quantity - int(ledger.get(product_id, 0))
+        if record_movement(db, product_id, InventoryMovementType.opening_balance,
+                           difference, reference="ledger:opening", created_at=at):
+            seeded += 1
+    db.flush()
+    return seeded
+
+
+def ledger_drift(db: Session) -> Dict[int, Dict[str, int]]:
+    """Productos cuyo stock_quantity no coincide con la suma del ledger"""
+    ledger = dict(
+        db.query(InventoryMovement.product_id, func.sum(InventoryMovement.quantity))
+        .group_by(InventoryMovement.product_id)
+        .all()
+    )
+    return {
+        product_id: {"stock_quantity": stock_quantity, "ledger": int(ledger.get(product_id, 0))}
+        for product_id, stock_quantity in db.query(Product.id, Product.stock_quantity)
+        if stock_quantity != int(ledger.get(product_id, 0))
+    }
+
+
+def rebuild_from_ledger(db: Session, checkpoint_every: Optional[timedelta] = timedelta(days=1)) -> Dict[str, int]:
+    """
+    Descarta saldos y checkpoints y los recalcula desde el ledger. No hace commit.
+
+    Con checkpoint_every se generan checkpoints en cada frontera de periodo
+    entre el primer movimiento y el corte actual.
+    """
+    db.query(StockCheckpoint).delete(synchronize_session=False)
+    db.query(ProductStockBalance).delete(synchronize_session=False)
+    db.flush()
+
+    cutoff = _fold_cutoff()
+    checkpoints = 0
+    first = db.query(func.min(InventoryMovement.created_at)).scalar()
+    if first is not None and checkpoint_every:
+        boundary = datetime.combine(first.date(), datetime.min.time()) + checkpoint_every
+        while boundary < cutoff:
+            if create_checkpoint(db, boundary):
+                checkpoints += 1
+            boundary += checkpoint_every
+
+    fold_movements(db, cutoff)
+    balances = db.query(func.count(ProductStockBalance.product_id)).scalar()
+    logger.info("Inventory ledger rebuilt", balances=balances, checkpoints=checkpoints)
+    return {"balances": balances, "checkpoints": checkpoints}
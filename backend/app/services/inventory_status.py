@@ -0,0 +1,73 @@
+# ==================================================================
+# ESTADO DEL INVENTARIO - TOTALES AGREGADOS EN SQL CON SNAPSHOT CACHEADO
+# ==================================================================
+
+"""
+Totales del inventario con una sola consulta agregada (conteos y valor a coste
+y a precio de venta) y un snapshot en Redis de vida corta.
+
+Las escrituras de productos y ventas llaman a invalidate() después de confirmar,
+así que el snapshot solo puede quedar desfasado durante inventory_snapshot_ttl
+si Redis no acepta el borrado.
+"""
+
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from ..cache import cache_manager
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import Product
+
+logger = get_logger(__name__)
+
+SNAPSHOT_KEY = "inventory:snapshot"
+
+# Umbral de stock bajo del panel de inventario
+LOW_STOCK_THRESHOLD = 5
+
+
+def _totals_stmt(low_stock_threshold: int):
+    stock = Product.stock_quantity
+    return select(
+        func.count(Product.id).label("total_products"),
+        func.coalesce(func.sum(Product.cost_price * stock), 0).label("cost_value"),
+        func.coalesce(func.sum(Product.selling_price * stock), 0).label("retail_value"),
+        func.coalesce(func.sum(case((stock <= low_stock_threshold, 1), else_=0)), 0).label("low_stock"),
+        func.coalesce(func.sum(case((stock <= 0, 1), else_=0)), 0).label("no_stock"),
+    )
+
+
+def compute_totals(db: Session, low_stock_threshold: int = LOW_STOCK_THRESHOLD) -> Dict[str, Any]:
+    """Totales del inventario calculados en la base de datos"""
+    row = db.execute(_totals_stmt(low_stock_threshold)).one()
+    return {
+        "total_products": row.total_products,
+        "low_stock_count": int(row.low_stock),
+        "no_stock_count": int(row.no_stock),
+        "total_inventory_cost_value": float(row.cost_value),
+        "total_inventory_retail_value": float(row.retail_value),
+        "snapshot_at": datetime.utcnow().isoformat(),
+    }
+
+
+def get_snapshot(db: Session) -> Dict[str, Any]:
+    """Totales del inventario desde el snapshot cacheado (o recalculados si no hay)"""
+    snapshot = cache_manager.get(SNAPSHOT_KEY)
+    if snapshot is not None:
+        metrics_registry.counter('inventory_snapshot_hits_total').increment()
+        return snapshot
+
+    metrics_registry.counter('inventory_snapshot_misses_total').increment()
+    snapshot = compute_totals(db)
+    cache_manager.set(SNAPSHOT_KEY, snapshot, settings.inventory_snapshot_ttl)
+    return snapshot
+
+
+def invalidate():
+    """Descarta el snapshot tras un cambio confirmado de productos o stock"""
+    cache_manager.delete(SNAPSHOT_KEY)
@@ -0,0 +1,224 @@
+# ==================================================================
+# CACHÉ DE REPORTES POR PERIODOS CERRADOS
+# ==================================================================
+
+"""
+Resultados de reporte por periodo cerrado (día, semana ISO o mes) en Redis.
+
+Un periodo está cerrado cuando termina antes de hoy (UTC): sus ventas ya no
+cambian salvo por una edición tardía, así que su resultado se guarda sin
+expiración corta. Un rango [inicio, fin] se resuelve así:
+
+- los días completos y cerrados se cubren con el menor número de periodos
+  (meses completos, luego semanas lunes-domingo, luego días sueltos) y cada
+  uno se lee de la caché o se calcula y se guarda
+- los tramos parciales de los extremos y el periodo abierto (hoy) se calculan
+  en vivo sobre point_of_sale_transactions
+
+Cada periodo guarda ventas por día, por usuario y por producto, de modo que el
+mismo resultado sirve para agrupar por día/semana/mes, para el ranking de
+productos y para el desglose por usuario.
+
+Invalidación: sales_rollup marca en db.info los días que recibe una
+transacción (ventas con fecha pasada, reservas persistidas tras medianoche,
+backfill) y tras el commit llama a invalidate_days(), que borra el día, su
+semana y su mes y los deja marcados unos segundos para que un cálculo
+concurrente que empezó antes del cambio no vuelva a guardar el resultado viejo.
+"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..cache import cache_manager
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import PointOfSaleItem, PointOfSaleTransaction
+from .sales_rollup import ALL_DAYS, _as_date, _raw_daily_stmt, daily_rows
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "report:period:"
+
+# Ventana en la que un periodo recién invalidado no se vuelve a cachear
+DIRTY_TTL = 60
+
+
+def _period_key(kind: str, start: date) -> str:
+    return f"{KEY_PREFIX}{kind}:{start.isoformat()}"
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def plan_periods(first_day: date, last_day: date) -> List[Tuple[str, date, date]]:
+    """Cubre [first_day, last_day] con meses completos, semanas completas y días sueltos"""
+    periods = []
+    day = first_day
+    while day <= last_day:
+        month_end = _next_month(day) - timedelta(days=1)
+        if day.day == 1 and month_end <= last_day:
+            periods.append(("month", day, month_end))
+        elif day.weekday() == 0 and day + timedelta(days=6) <= last_day:
+            periods.append(("week", day, day + timedelta(days=6)))
+        else:
+            periods.append(("day", day, day))
+        day = periods[-1][2] + timedelta(days=1)
+    return periods
+
+
+def _empty() -> Dict[str, Dict]:
+    return {"days": {}, "users": {}, "products": {}}
+
+
+def _add(target: List, values: Iterable):
+    for i, value in enumerate(values):
+        target[i] += value
+
+
+def _compute(db: Session, start: datetime, end: datetime, end_inclusive: bool) -> Dict[str, Dict]:
+    """Ventas por día, usuario y producto con transaction_time en el intervalo"""
+    time = PointOfSaleTransaction.transaction_time
+    condition = (time >= start) & ((time <= end) if end_inclusive else (time < end))
+    result = _empty()
+
+    if not end_inclusive and start.time() == datetime.min.time() and end.time() == datetime.min.time():
+        # Días completos: del rollup diario
+        rows = daily_rows(db, start, end - timedelta(microseconds=1)).items()
+    else:
+        rows = [
+            ((_as_date(row.day), row.user_id), [row.transactions, Decimal(row.revenue or 0), int(row.units)])
+            for row in db.execute(_raw_daily_stmt(condition))
+        ]
+    for (day, user_id), (transactions, revenue, units) in rows:
+        _add(result["days"].setdefault(day, [0, Decimal("0"), 0]), (transactions, revenue, units))
+        _add(result["users"].setdefault(user_id, [0, Decimal("0"), 0]), (transactions, revenue, units))
+
+    products = select(
+        PointOfSaleItem.product_id,
+        func.sum(PointOfSaleItem.quantity_sold),
+        func.sum(PointOfSaleItem.quantity_sold * PointOfSaleItem.price_at_time_of_sale),
+        func.count(PointOfSaleItem.id),
+    ).join(
+        PointOfSaleTransaction, PointOfSaleItem.transaction_id == PointOfSaleTransaction.id
+    ).where(condition).group_by(PointOfSaleItem.product_id)
+    for product_id, units, revenue, lines in db.execute(products):
+        result["products"][product_id] = [int(units), Decimal(revenue or 0), lines]
+    return result
+
+
+def _encode(report: Dict[str, Dict]) -> Dict[str, Dict]:
+    # JSON solo admite claves de texto; los importes viajan como texto exacto
+    return {
+        section: {str(key): [str(v) if isinstance(v, Decimal) else v for v in values]
+                  for key, values in entries.items()}
+        for section, entries in report.items()
+    }
+
+
+def _decode(cached: Dict[str, Dict]) -> Dict[str, Dict]:
+    return {
+        "days": {date.fromisoformat(k): [v[0], Decimal(v[1]), v[2]] for k, v in cached["days"].items()},
+        "users": {int(k): [v[0], Decimal(v[1]), v[2]] for k, v in cached["users"].items()},
+        "products": {int(k): [v[0], Decimal(v[1]), v[2]] for k, v in cached["products"].items()},
+    }
+
+
+def _merge(target: Dict[str, Dict], source: Dict[str, Dict]):
+    for section, entries in source.items():
+        for key, values in entries.items():
+            current = target[section].get(key)
+            if current is None:
+                target[section][key] = list(values)
+            else:
+                _add(current, values)
+
+
+def _closed_period(db: Session, kind: str, first_day: date, last_day: date) -> Dict[str, Dict]:
+    key = _period_key(kind, first_day)
+    cached = cache_manager.get(key)
+    if cached is not None:
+        metrics_registry.counter('report_period_cache_hits_total').increment()
+        metrics_registry.record_cache_hit("report_period")
+        return _decode(cached)
+
+    metrics_registry.counter('report_period_cache_misses_total').increment()
+    metrics_registry.record_cache_miss("report_period")
+    report = _compute(db, _day_start(first_day), _day_start(last_day + timedelta(days=1)), end_inclusive=False)
+    if not cache_manager.exists(key + ":dirty"):
+        cache_manager.set(key, _encode(report), settings.report_period_cache_ttl)
+    return report
+
+
+def range_report(db: Session, start_dt: datetime, end_dt: datetime,
+                 today: Optional[date] = None) -> Dict[str, Dict]:
+    """
+    Ventas por día, usuario y producto con transaction_time en [start_dt, end_dt]
+
+    Devuelve {"days": {date: [transacciones, ingresos, unidades]},
+    "users": {user_id: [...]}, "products": {product_id: [unidades, ingresos, líneas]}}.
+    """
+    report = _empty()
+    if start_dt > end_dt:
+        return report
+    today = today or datetime.utcnow().date()
+
+    first_full = start_dt.date() if start_dt.time() == datetime.min.time() else start_dt.date() + timedelta(days=1)
+    last_full = end_dt.date() if end_dt.time() == datetime.max.time() else end_dt.date() - timedelta(days=1)
+    last_closed = min(last_full, today - timedelta(days=1))
+
+    if first_full > last_closed:
+        _merge(report, _compute(db, start_dt, end_dt, end_inclusive=True))
+        return report
+
+    if start_dt < _day_start(first_full):
+        _merge(report, _compute(db, start_dt, _day_start(first_full), end_inclusive=False))
+    for kind, first_day, last_day in plan_periods(first_full, last_closed):
+        _merge(report, _closed_period(db, kind, first_day, last_day))
+    open_start = _day_start(last_closed + timedelta(days=1))
+    if end_dt >= open_start:
+        _merge(report, _compute(db, open_start, end_dt, end_inclusive=True))
+    return report
+
+
+def invalidate_days(days, today: Optional[date] = None):
+    """Descarta los periodos cerrados que contienen alguno de los días"""
+    if days == ALL_DAYS:
+        removed = cache_manager.delete_pattern(f"{KEY_PREFIX}*")
+        metrics_registry.counter('report_period_cache_invalidations_total').increment(removed or 0)
+        return
+    today = today or datetime.utcnow().date()
+    keys = set()
+    for day in days:
+        if day >= today:
+            continue
+        keys.update((
+            _period_key("day", day),
+            _period_key("week", _week_start(day)),
+            _period_key("month", day.replace(day=1)),
+        ))
+    if not keys:
+        return
+    try:
+        pipe = cache_manager.get_sync_client().pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key + ":dirty", 1, ex=DIRTY_TTL)
+            pipe.delete(key)
+        pipe.execute()
+        metrics_registry.counter('report_period_cache_invalidations_total').increment(len(keys))
+    except Exception as e:
+        logger.warning("Report period cache invalidation failed", periods=len(keys), error=str(e))
+
@@ -0,0 +1,179 @@
+# ==================================================================
+# EXPORTACIÓN EN STREAMING - CSV / NDJSON POR BLOQUES
+# ==================================================================
+
+"""
+Exportación de ventas e inventario sin materializar el resultado.
+
+Las consultas se ejecutan con stream_results (cursor del servidor en
+PostgreSQL) y yield_per, así que en memoria solo hay un bloque de
+settings.export_chunk_size filas a la vez. Cada bloque se serializa a CSV o
+NDJSON y, si se pide, se comprime en gzip al vuelo con un único compresor que
+se va vaciando por bloques: la memoria no depende del tamaño del rango.
+
+Los generadores abren y cierran su propia sesión porque StreamingResponse los
+consume después de que el endpoint haya retornado.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import PointOfSaleItem, PointOfSaleTransaction, Product
+
+logger = get_logger(__name__)
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+SALES_COLUMNS = [
+    "transaction_id", "transaction_time", "user_id", "total_amount",
+    "product_id", "sku", "product_name", "quantity_sold", "price_at_time_of_sale",
+]
+
+INVENTORY_COLUMNS = [
+    "id", "sku", "name", "stock_quantity", "cost_price", "selling_price",
+]
+
+
+def _sales_stmt(start_date: Optional[date], end_date: Optional[date]):
+    """Una fila por línea de venta, en orden estable (tiempo, transacción, línea)"""
+    time = PointOfSaleTransaction.transaction_time
+    conditions = []
+    if start_date:
+        conditions.append(time >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        conditions.append(time < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return select(
+        PointOfSaleTransaction.id.label("transaction_id"),
+        time,
+        PointOfSaleTransaction.user_id,
+        PointOfSaleTransaction.total_amount,
+        PointOfSaleItem.product_id,
+        Product.sku,
+        Product.name.label("product_name"),
+        PointOfSaleItem.quantity_sold,
+        PointOfSaleItem.price_at_time_of_sale,
+    ).join(
+        PointOfSaleItem, PointOfSaleItem.transaction_id == PointOfSaleTransaction.id
+    ).join(
+        Product, Product.id == PointOfSaleItem.product_id
+    ).where(*conditions).order_by(time, PointOfSaleTransaction.id, PointOfSaleItem.id)
+
+
+def _inventory_stmt():
+    return select(
+        Product.id, Product.sku, Product.name, Product.stock_quantity,
+        Product.cost_price, Product.selling_price,
+    ).order_by(Product.id)
+
+
+def iter_row_chunks(db: Session, stmt, chunk_size: Optional[int] = None) -> Iterator[Sequence]:
+    """Filas de stmt en bloques de chunk_size leídos con cursor del servidor"""
+    chunk_size = chunk_size or settings.export_chunk_size
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def encode_chunks(chunks: Iterable[Sequence], columns: List[str], fmt: str) -> Iterator[bytes]:
+    """Serializa cada bloque de filas a CSV (con cabecera) o NDJSON"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación desconocido: {fmt}")
+
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(
+                [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                for row in rows
+            )
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+        return
+
+    for rows in chunks:
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(columns, row)), default=_json_default))
+            buffer.write("\n")
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Comprime el flujo en formato gzip bloque a bloque"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _stream(session_factory: Callable[[], Session], stmt, columns: List[str], fmt: str,
+            compress: bool, name: str, chunk_size: Optional[int]) -> Iterator[bytes]:
+    db = session_factory()
+    rows = 0
+
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    try:
+        body = encode_chunks(counted(iter_row_chunks(db, stmt, chunk_size)), columns, fmt)
+        yield from gzip_chunks(body) if compress else body
+    finally:
+        db.close()
+        metrics_registry.counter('report_export_rows_total').increment(rows)
+        logger.info("Report export streamed", export=name, format=fmt, gzip=compress, rows=rows)
+
+
+def stream_sales(session_factory: Callable[[], Session], start_date: Optional[date] = None,
+                 end_date: Optional[date] = None, fmt: str = "csv", compress: bool = False,
+                 chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """Líneas de venta con su cabecera de transacción en el rango [start_date, end_date]"""
+    return _stream(session_factory, _sales_stmt(start_date, end_date), SALES_COLUMNS,
+                   fmt, compress, "sales", chunk_size)
+
+
+def stream_inventory(session_factory: Callable[[], Session], fmt: str = "csv", compress: bool = False,
+                     chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """Stock y precios de todos los productos"""
+    return _stream(session_factory, _inventory_stmt(), INVENTORY_COLUMNS,
+                   fmt, compress, "inventory", chunk_size)
+
+
+def export_filename(name: str, fmt: str, compress: bool) -> str:
+    extension = EXPORT_FORMATS[fmt][1]
+    return f"{name}.{extension}.gz" if compress else f"{name}.{extension}"
@@ -0,0 +1,223 @@
+# ==================================================================
+# ROLLUP DIARIO DE VENTAS - AGREGADO POR DÍA Y USUARIO
+# ==================================================================
+
+"""
+daily_sales_rollup guarda (día, usuario) -> transacciones, ingresos y unidades.
+
+- rollup_sales() suma las ventas nuevas con un upsert dentro de la transacción
+  de la venta, así que el agregado nunca ve una venta sin confirmar
+- backfill() lo reconstruye desde point_of_sale_transactions para un rango
+- daily_rows() responde un rango [inicio, fin] de datetimes: los días completos
+  salen del rollup y los tramos parciales de los extremos se agregan sobre la
+  tabla de transacciones, de modo que el resultado es el mismo que el de la
+  consulta original para cualquier rango
+"""
+
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..logging_config import get_logger
+from ..models import DailySalesRollup, PointOfSaleItem, PointOfSaleTransaction
+
+logger = get_logger(__name__)
+
+SalesSummaryRow = namedtuple("SalesSummaryRow", ["date", "total_transactions", "total_sales"])
+
+# (día, user_id) -> [transacciones, ingresos, unidades]
+DailyRows = Dict[Tuple[date, int], List]
+
+_UPSERT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+# Días con ventas nuevas o reconstruidas en la transacción en curso (db.info);
+# tras el commit se invalidan sus periodos en period_reports. ALL_DAYS: todo el histórico
+TOUCHED_DAYS_KEY = "sales_rollup_touched_days"
+ALL_DAYS = "all"
+
+
+def _touch(db: Session, days):
+    touched = db.info.get(TOUCHED_DAYS_KEY)
+    if touched == ALL_DAYS:
+        return
+    if days == ALL_DAYS:
+        db.info[TOUCHED_DAYS_KEY] = ALL_DAYS
+    else:
+        db.info.setdefault(TOUCHED_DAYS_KEY, set()).update(days)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_touched_periods(session):
+    days = session.info.pop(TOUCHED_DAYS_KEY, None)
+    if days:
+        from .period_reports import invalidate_days
+        invalidate_days(days)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_touched_days(session):
+    session.info.pop(TOUCHED_DAYS_KEY, None)
+
+
+def rollup_sales(db: Session, sales: Iterable[Tuple[int, datetime, Decimal, int]]):
+    """
+    Suma al rollup ventas (user_id, transaction_time, total_amount, unidades). No hace commit.
+
+    Las filas se actualizan en orden de clave para que dos transacciones que
+    tocan los mismos días y usuarios no se interbloqueen.
+    """
+    totals: DailyRows = {}
+    for user_id, transaction_time, total_amount, units in sales:
+        row = totals.setdefault((transaction_time.date(), user_id), [0, Decimal("0"), 0])
+        row[0] += 1
+        row[1] += Decimal(total_amount)
+        row[2] += units
+    if not totals:
+        return
+    _touch(db, {day for day, _ in totals})
+
+    now = datetime.utcnow()
+    rows = [
+        {"day": day, "user_id": user_id, "transactions": t, "revenue": revenue, "units": units, "updated_at": now}
+        for (day, user_id), (t, revenue, units) in sorted(totals.items())
+    ]
+    upsert_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if upsert_insert is not None:
+        stmt = upsert_insert(DailySalesRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailySalesRollup.day, DailySalesRollup.user_id],
+            set_={
+                "transactions": DailySalesRollup.transactions + stmt.excluded.transactions,
+                "revenue": DailySalesRollup.revenue + stmt.excluded.revenue,
+                "units": DailySalesRollup.units + stmt.excluded.units,
+                "updated_at": stmt.excluded.updated_at,
+            }
+        )
+        db.execute(stmt, rows)
+        return
+
+    for row in rows:
+        updated = db.query(DailySalesRollup).filter(
+            DailySalesRollup.day == row["day"], DailySalesRollup.user_id == row["user_id"]
+        ).update({
+            DailySalesRollup.transactions: DailySalesRollup.transactions + row["transactions"],
+            DailySalesRollup.revenue: DailySalesRollup.revenue + row["revenue"],
+            DailySalesRollup.units: DailySalesRollup.units + row["units"],
+            DailySalesRollup.updated_at: row["updated_at"],
+        }, synchronize_session=False)
+        if not updated:
+            db.execute(insert(DailySalesRollup), [row])
+
+
+def _units_per_transaction():
+    return select(
+        PointOfSaleItem.transaction_id,
+        func.sum(PointOfSaleItem.quantity_sold).label("units")
+    ).group_by(PointOfSaleItem.transaction_id).subquery()
+
+
+def _raw_daily_stmt(*conditions):
+    """Agregado por día y usuario directamente sobre point_of_sale_transactions"""
+    units = _units_per_transaction()
+    day = func.date(PointOfSaleTransaction.transaction_time)
+    return select(
+        day.label("day"),
+        PointOfSaleTransaction.user_id,
+        func.count(PointOfSaleTransaction.id).label("transactions"),
+        func.sum(PointOfSaleTransaction.total_amount).label("revenue"),
+        func.coalesce(func.sum(units.c.units), 0).label("units"),
+    ).select_from(PointOfSaleTransaction).outerjoin(
+        units, units.c.transaction_id == PointOfSaleTransaction.id
+    ).where(*conditions).group_by(day, PointOfSaleTransaction.user_id)
+
+
+def _as_date(value) -> date:
+    # func.date() devuelve texto en SQLite y date en PostgreSQL
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def backfill(db: Session, start_day: Optional[date] = None, end_day: Optional[date] = None) -> int:
+    """Reconstruye el rollup de los días [start_day, end_day] (todos si no se indican). No hace commit."""
+    day_conditions, transaction_conditions = [], []
+    if start_day is not None:
+        day_conditions.append(DailySalesRollup.day >= start_day)
+        transaction_conditions.append(
+            PointOfSaleTransaction.transaction_time >= datetime.combine(start_day, datetime.min.time())
+        )
+    if end_day is not None:
+        day_conditions.append(DailySalesRollup.day <= end_day)
+        transaction_conditions.append(
+            PointOfSaleTransaction.transaction_time < datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+        )
+
+    if start_day is None or end_day is None:
+        _touch(db, ALL_DAYS)
+    else:
+        _touch(db, {start_day + timedelta(days=d) for d in range((end_day - start_day).days + 1)})
+    db.execute(delete(DailySalesRollup).where(*day_conditions))
+    now = datetime.utcnow()
+    rows = [
+        {"day": _as_date(row.day), "user_id": row.user_id, "transactions": row.transactions,
+         "revenue": row.revenue, "units": int(row.units), "updated_at": now}
+        for row in db.execute(_raw_daily_stmt(*transaction_conditions))
+    ]
+    if rows:
+        db.execute(insert(DailySalesRollup), rows)
+    db.flush()
+    logger.info("Daily sales rollup backfilled", rows=len(rows))
+    return len(rows)
+
+
+def daily_rows(db: Session, start_dt: datetime, end_dt: datetime) -> DailyRows:
+    """Ventas por (día, usuario) con transaction_time en [start_dt, end_dt]"""
+    rows: DailyRows = {}
+    if start_dt > end_dt:
+        return rows
+
+    first_full = start_dt.date() if start_dt.time() == datetime.min.time() else start_dt.date() + timedelta(days=1)
+    last_full = end_dt.date() if end_dt.time() == datetime.max.time() else end_dt.date() - timedelta(days=1)
+
+    time = PointOfSaleTransaction.transaction_time
+    if first_full > last_full:
+        raw_ranges = [and_(time >= start_dt, time <= end_dt)]
+    else:
+        raw_ranges = []
+        first_full_start = datetime.combine(first_full, datetime.min.time())
+        last_full_end = datetime.combine(last_full, datetime.max.time())
+        if start_dt < first_full_start:
+            raw_ranges.append(and_(time >= start_dt, time < first_full_start))
+        if end_dt > last_full_end:
+            raw_ranges.append(and_(time > last_full_end, time <= end_dt))
+
+        for row in db.execute(
+            select(DailySalesRollup).where(DailySalesRollup.day >= first_full, DailySalesRollup.day <= last_full)
+        ).scalars():
+            rows[(row.day, row.user_id)] = [row.transactions, Decimal(row.revenue), row.units]
+
+    for condition in raw_ranges:
+        for row in db.execute(_raw_daily_stmt(condition)):
+            entry = rows.setdefault((_as_date(row.day), row.user_id), [0, Decimal("0"), 0])
+            entry[0] += row.transactions
+            entry[1] += Decimal(row.revenue or 0)
+            entry[2] += int(row.units)
+    return rows
+
+
+def sales_summary(db: Session, start_dt: datetime, end_dt: datetime) -> List[SalesSummaryRow]:
+    """Resumen por día equivalente a crud.get_sales_summary_by_date_range"""
+    by_day: Dict[date, List] = {}
+    for (day, _), (transactions, revenue, _) in daily_rows(db, start_dt, end_dt).items():
+        entry = by_day.setdefault(day, [0, Decimal("0")])
+        entry[0] += transactions
+        entry[1] += revenue
+    return [
+        SalesSummaryRow(day, transactions, revenue)
+        for day, (transactions, revenue) in sorted(by_day.items())
+        if transactions
+    ]
@@ -0,0 +1,198 @@
+# ==================================================================
+# PREVISIÓN DE ROTURA DE STOCK - VELOCIDAD DE VENTA CON NUMPY
+# ==================================================================
+
+"""
+Velocidad de venta, días hasta rotura y punto de pedido de todo el catálogo.
+
+Una sola consulta agrupa las unidades vendidas por (producto, día) en los
+últimos stock_forecast_window_days días cerrados. Con ese resultado se llena
+una matriz productos x días y todo el cálculo es vectorial:
+
+- velocidad: media exponencial (alpha = stock_forecast_alpha) de las unidades
+  diarias, con más peso en los días recientes. Los pesos se normalizan para
+  que una venta constante dé exactamente esa velocidad
+- desviación diaria de la demanda en la ventana
+- punto de pedido: velocidad x plazo de reposición + stock de seguridad
+  (z x desviación x raíz del plazo)
+- días hasta rotura: stock actual / velocidad (None si no hay ventas)
+
+La previsión solo usa días cerrados, así que se calcula una vez al día y se
+guarda en Redis (stock:forecast:<AAAA-MM-DD>) y en memoria del proceso. El
+stock no forma parte de la caché: los días hasta rotura se calculan en cada
+petición con el stock actual.
+"""
+
+import math
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..cache import cache_manager
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import PointOfSaleItem, PointOfSaleTransaction, Product
+from .sales_rollup import _as_date
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "stock:forecast:"
+CACHE_TTL = 2 * 86400
+
+# Previsión del día ya decodificada: {día: Forecast}
+_memo: Dict[date, "Forecast"] = {}
+
+
+class Forecast:
+    """Velocidad y punto de pedido por producto (solo productos con ventas en la ventana)"""
+
+    def __init__(self, day: date, product_ids: np.ndarray, velocity: np.ndarray, reorder_point: np.ndarray):
+        order = np.argsort(product_ids)
+        self.day = day
+        self.product_ids = product_ids[order]
+        self.velocity = velocity[order]
+        self.reorder_point = reorder_point[order]
+
+    def lookup(self, product_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """(velocidad, punto de pedido) de cada producto; 0 para los que no vendieron"""
+        ids = np.asarray(list(product_ids), dtype=np.int64)
+        velocity = np.zeros(len(ids))
+        reorder = np.zeros(len(ids), dtype=np.int64)
+        if len(ids) and len(self.product_ids):
+            pos = np.minimum(np.searchsorted(self.product_ids, ids), len(self.product_ids) - 1)
+            found = self.product_ids[pos] == ids
+            velocity[found] = self.velocity[pos[found]]
+            reorder[found] = self.reorder_point[pos[found]]
+        return velocity, reorder
+
+    def to_cache(self) -> Dict:
+        return {
+            "ids": self.product_ids.tolist(),
+            "velocity": np.round(self.velocity, 4).tolist(),
+            "reorder": self.reorder_point.tolist(),
+        }
+
+    @classmethod
+    def from_cache(cls, day: date, cached: Dict) -> "Forecast":
+        return cls(
+            day,
+            np.asarray(cached["ids"], dtype=np.int64),
+            np.asarray(cached["velocity"], dtype=np.float64),
+            np.asarray(cached["reorder"], dtype=np.int64),
+        )
+
+
+def daily_units(db: Session, day: date, window_days: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Matriz de unidades vendidas por (producto, día) en los window_days días anteriores a day
+
+    Devuelve (product_ids, matriz) con una fila por producto con ventas y las
+    columnas del día más antiguo al más reciente.
+    """
+    start = datetime.combine(day - timedelta(days=window_days), datetime.min.time())
+    end = datetime.combine(day, datetime.min.time())
+    time = PointOfSaleTransaction.transaction_time
+    stmt = select(
+        PointOfSaleItem.product_id,
+        func.date(time),
+        func.sum(PointOfSaleItem.quantity_sold),
+    ).join(
+        PointOfSaleTransaction, PointOfSaleItem.transaction_id == PointOfSaleTransaction.id
+    ).where(time >= start, time < end).group_by(PointOfSaleItem.product_id, func.date(time))
+
+    rows = db.execute(stmt).all()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, window_days))
+    pids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    cols = np.fromiter(((_as_date(row[1]) - start.date()).days for row in rows), dtype=np.int64, count=len(rows))
+    units = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+
+    product_ids, rows_index = np.unique(pids, return_inverse=True)
+    matrix = np.zeros((len(product_ids), window_days))
+    np.add.at(matrix, (rows_index, cols), units)
+    return product_ids, matrix
+
+
+def smoothed_velocity(matrix: np.ndarray, alpha: float) -> np.ndarray:
+    """Media exponencial por fila (unidades/día), con el último día como el más reciente"""
+    weights = alpha * (1 - alpha) ** np.arange(matrix.shape[1])[::-1]
+    return matrix @ weights / weights.sum()
+
+
+def reorder_points(velocity: np.ndarray, deviation: np.ndarray, lead_time_days: float, z: float) -> np.ndarray:
+    """Demanda esperada durante el plazo de reposición más stock de seguridad"""
+    safety = z * deviation * math.sqrt(lead_time_days)
+    return np.ceil(velocity * lead_time_days + safety).astype(np.int64)
+
+
+def days_until_stockout(stock: np.ndarray, velocity: np.ndarray) -> List[Optional[int]]:
+    """Días completos de stock al ritmo actual; None si el producto no vende"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = np.floor(np.maximum(stock, 0) / velocity)
+    return [int(d) if v > 0 else None for d, v in zip(days.tolist(), velocity.tolist())]
+
+
+def compute_forecast(db: Session, day: date) -> Forecast:
+    """Calcula la previsión con los días cerrados anteriores a day"""
+    product_ids, matrix = daily_units(db, day, settings.stock_forecast_window_days)
+    velocity = smoothed_velocity(matrix, settings.stock_forecast_alpha)
+    reorder = reorder_points(
+        velocity, matrix.std(axis=1),
+        settings.stock_forecast_lead_time_days, settings.stock_forecast_service_z
+    )
+    return Forecast(day, product_ids, velocity, reorder)
+
+
+def get_forecast(db: Session, day: Optional[date] = None) -> Forecast:
+    """Previsión del día: memoria del proceso, Redis o cálculo (y se guarda)"""
+    day = day or datetime.utcnow().date()
+    forecast = _memo.get(day)
+    if forecast is not None:
+        return forecast
+
+    key = f"{KEY_PREFIX}{day.isoformat()}"
+    cached = cache_manager.get(key)
+    if cached is not None:
+        metrics_registry.record_cache_hit("stock_forecast")
+        forecast = Forecast.from_cache(day, cached)
+    else:
+        metrics_registry.record_cache_miss("stock_forecast")
+        forecast = compute_forecast(db, day)
+        cache_manager.set(key, forecast.to_cache(), CACHE_TTL)
+        logger.info("Stock forecast computed", day=day.isoformat(), products=len(forecast.product_ids))
+    _memo.clear()
+    _memo[day] = forecast
+    return forecast
+
+
+def annotate(db: Session, products: List[Product], day: Optional[date] = None) -> List[Dict]:
+    """Días hasta rotura y punto de pedido de cada producto con su stock actual"""
+    forecast = get_forecast(db, day)
+    velocity, reorder = forecast.lookup(p.id for p in products)
+    stock = np.fromiter((p.stock_quantity for p in products), dtype=np.float64, count=len(products))
+    days = days_until_stockout(stock, velocity)
+    return [
+        {
+            "product": product,
+            "days_until_stockout": days[i],
+            "reorder_point": int(reorder[i]),
+            "daily_velocity": round(float(velocity[i]), 2),
+        }
+        for i, product in enumerate(products)
+    ]
+
+
+def products_to_reorder(db: Session, day: Optional[date] = None) -> List[int]:
+    """Ids de productos con ventas cuyo stock actual no supera su punto de pedido"""
+    forecast = get_forecast(db, day)
+    if not len(forecast.product_ids):
+        return []
+    rows = db.execute(select(Product.id, Product.stock_quantity)).all()
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    stock = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    velocity, reorder = forecast.lookup(ids)
+    return ids[(velocity > 0) & (stock <= reorder)].tolist()
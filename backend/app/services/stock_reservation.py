@@ -0,0 +1,567 @@
+# ==================================================================
+# RESERVA DE STOCK EN REDIS - MODO DE ALTO RENDIMIENTO PARA VENTAS
+# ==================================================================
+
+"""
+Modo opcional (settings.stock_reservation_enabled) en el que las ventas no
+bloquean filas de products:
+
+- cada producto tiene un contador de stock en Redis (stock:counter:<id>)
+- una venta reserva todas sus líneas con un script Lua atómico que comprueba y
+  descuenta los contadores y encola la venta en stock:reservations:pending; si
+  alguna línea no tiene stock no se descuenta nada
+- un escritor en segundo plano (drain_stock_reservations_task) mueve las ventas
+  encoladas a stock:reservations:processing con LMOVE, las inserta en bloque en
+  point_of_sale_transactions/point_of_sale_items y las retira al confirmar
+- las ventas que se escriben directamente en la base de datos (lotes de cajas
+  sin conexión y POST /sales) descuentan antes los contadores con el mismo
+  script (reserve_direct) y quedan anotadas en stock:reservations:direct hasta
+  que su transacción se confirma o se deshace; sin eso el descuento
+  incondicional del escritor podría dejar el stock en negativo
+
+Recuperación tras una caída:
+
+- si el escritor muere a mitad de un lote, las ventas siguen en processing y la
+  siguiente ejecución las vuelve a persistir; reservation_id es único, así que las
+  que ya se habían confirmado se descartan
+- si Redis pierde los contadores se recargan desde la base de datos restando lo
+  que sigue encolado. Las colas sí deben sobrevivir a un reinicio de Redis
+  (appendonly yes): una venta aceptada solo existe allí hasta que se persiste.
+  Por lo mismo no deben borrarse con la caché: settings.stock_reservation_redis_url
+  permite usar un Redis (o una base) propio, y si se comparte el de la caché los
+  borrados masivos (flush_all, delete_pattern) saltan las claves stock:reservations:*
+  y stock:counter:* (cache.PROTECTED_PREFIXES)
+- una reserva que no se puede insertar (producto borrado, venta duplicada) no
+  bloquea al escritor: si un lote falla por sus datos se reintenta reserva a
+  reserva y las que fallan pasan a stock:reservations:dead con su error para
+  revisarlas a mano. Su cantidad ya no está encolada, así que reconcile()
+  devuelve al contador el stock que habían reservado
+
+reconcile() recalcula los contadores como stock en BD menos ventas encoladas y
+corrige la deriva que dejan los cambios de stock hechos por otros caminos. La
+tarea reconcile-stock-reservations de celery beat lo ejecuta cada minuto.
+"""
+
+import json
+import uuid
+
+import redis
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from ..cache import cache_manager
+from ..config import settings
+from ..exceptions import InsufficientStockError, NotFoundError, ValidationError
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+from ..models import (
+    InventoryMovement,
+    InventoryMovementType,
+    PointOfSaleItem,
+    PointOfSaleTransaction,
+    Product,
+)
+from . import inventory_status
+from .sales_rollup import rollup_sales
+from .top_sellers import top_sellers
+
+logger = get_logger(__name__)
+
+COUNTER_PREFIX = "stock:counter:"
+PENDING_KEY = "stock:reservations:pending"
+PROCESSING_KEY = "stock:reservations:processing"
+DEAD_LETTER_KEY = "stock:reservations:dead"
+DIRECT_KEY = "stock:reservations:direct"
+WRITER_LOCK_KEY = "stock:reservations:writer"
+
+# KEYS: contadores de cada línea + cola (pendiente o direct); ARGV: venta serializada + cantidades
+RESERVE_SCRIPT = """
+local lines = #KEYS - 1
+local missing = {}
+for i = 1, lines do
+    if redis.call('EXISTS', KEYS[i]) == 0 then
+        table.insert(missing, i)
+    end
+end
+if #missing > 0 then
+    return {'missing', missing}
+end
+for i = 1, lines do
+    local available = tonumber(redis.call('GET', KEYS[i]))
+    if available < tonumber(ARGV[i + 1]) then
+        return {'insufficient', i, available}
+    end
+end
+for i = 1, lines do
+    redis.call('DECRBY', KEYS[i], ARGV[i + 1])
+end
+redis.call('RPUSH', KEYS[lines + 1], ARGV[1])
+return {'ok'}
+"""
+
+# KEYS: contadores + cola pendiente + cola en proceso + ventas directas en curso
+# ARGV: modo ('load' solo crea los que faltan, 'reconcile' corrige todos) y pares product_id, stock en BD
+LOAD_SCRIPT = """
+local counters = #KEYS - 3
+local queued = {}
+for q = counters + 1, #KEYS do
+    for _, raw in ipairs(redis.call('LRANGE', KEYS[q], 0, -1)) do
+        for _, line in ipairs(cjson.decode(raw)['items']) do
+            local product_id = tostring(line[1])
+            queued[product_id] = (queued[product_id] or 0) + line[2]
+        end
+    end
+end
+local drift = {}
+for i = 1, counters do
+    local product_id = ARGV[2 * i]
+    local expected = tonumber(ARGV[2 * i + 1]) - (queued[product_id] or 0)
+    local current = redis.call('GET', KEYS[i])
+    if not current then
+        redis.call('SET', KEYS[i], expected)
+    elseif ARGV[1] == 'reconcile' and tonumber(current) ~= expected then
+        redis.call('SET', KEYS[i], expected)
+        table.insert(drift, {product_id, current, tostring(expected)})
+    end
+end
+return drift
+"""
+
+# KEY: contador; ARGV: delta. No crea contadores: los que faltan se cargan desde la BD al usarse
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+# KEYS: contadores + ventas directas; ARGV: venta directa serializada + cantidades
+# Devuelve el stock solo si la venta seguía anotada (una sola vez)
+RELEASE_DIRECT_SCRIPT = """
+if redis.call('LREM', KEYS[#KEYS], 1, ARGV[1]) == 0 then
+    return 0
+end
+for i = 1, #KEYS - 1 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+# Errores propios de la reserva (no de la conexión): reintentarla no sirve
+_REJECTED_ERRORS = (IntegrityError, DataError, ValueError, KeyError, TypeError)
+
+_DECREMENT_STOCK_STMT = Product.__table__.update()\
+    .where(Product.__table__.c.id == bindparam("product_id"))\
+    .values(stock_quantity=Product.__table__.c.stock_quantity - bindparam("quantity"))
+
+
+def _counter_key(product_id: int) -> str:
+    return f"{COUNTER_PREFIX}{product_id}"
+
+
+def _decode(raw) -> str:
+    return raw.decode() if isinstance(raw, bytes) else raw
+
+
+class StockReservationService:
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or settings.stock_reservation_batch_size
+        self._scripts = {}
+        self._redis = None
+
+    def _client(self):
+        if not settings.stock_reservation_redis_url:
+            return cache_manager.get_sync_client()
+        if self._redis is None:
+            self._redis = redis.from_url(
+                settings.stock_reservation_redis_url,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+                retry_on_timeout=True,
+                health_check_interval=30
+            )
+        return self._redis
+
+    def _script(self, name: str, source: str):
+        client = self._client()
+        cached = self._scripts.get(name)
+        if cached is None or cached[0] is not client:
+            cached = (client, client.register_script(source))
+            self._scripts[name] = cached
+        return cached[1]
+
+    # ---------------------------------------------------------------
+    # Contadores
+    # ---------------------------------------------------------------
+
+    def _run_load_script(self, db: Session, product_ids: Iterable[int], mode: str) -> Dict[int, Dict[str, int]]:
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return {}
+        stock = dict(
+            db.query(Product.id, Product.stock_quantity).filter(Product.id.in_(product_ids)).all()
+        )
+        product_ids = [pid for pid in product_ids if pid in stock]
+        if not product_ids:
+            return {}
+        keys = [_counter_key(pid) for pid in product_ids] + [PENDING_KEY, PROCESSING_KEY, DIRECT_KEY]
+        args = [mode]
+        for pid in product_ids:
+            args.extend([pid, stock[pid]])
+        drift = self._script("load", LOAD_SCRIPT)(keys=keys, args=args)
+        return {
+            int(_decode(pid)): {"redis": int(_decode(current)), "expected": int(_decode(expected))}
+            for pid, current, expected in drift
+        }
+
+    def load_counters(self, db: Session, product_ids: Iterable[int]):
+        """Crea en Redis los contadores que falten (stock en BD menos ventas encoladas)"""
+        self._run_load_script(db, product_ids, "load")
+
+    def reconcile(self, db: Session, product_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, int]]:
+        """
+        Corrige los contadores que no coinciden con stock en BD menos ventas encoladas
+
+        Debe ejecutarse con el cerrojo del escritor (run_writer lo hace) para que
+        ninguna venta esté a la vez confirmada en BD y en la cola de proceso.
+        """
+        if product_ids is None:
+            product_ids = [pid for (pid,) in db.query(Product.id)]
+        self._prune_direct()
+        drift = self._run_load_script(db, product_ids, "reconcile")
+        if drift:
+            metrics_registry.counter('stock_reservation_drift_total').increment(len(drift))
+            logger.warning("Stock reservation counters corrected", products=len(drift))
+        return drift
+
+    def adjust(self, product_id: int, delta: int):
+        """
+        Refleja en el contador un cambio de stock hecho fuera de las reservas
+
+        Solo ajusta contadores existentes (comprobación e incremento en un mismo
+        script); los demás se cargan desde la BD al usarse. Si una carga lee el
+        stock ya actualizado antes de este ajuste, el delta se cuenta dos veces
+        hasta la siguiente reconcile() programada.
+        """
+        if not settings.stock_reservation_enabled or delta == 0:
+            return
+        try:
+            self._script("adjust", ADJUST_SCRIPT)(keys=[_counter_key(product_id)], args=[delta])
+        except Exception as e:
+            logger.warning("Stock counter adjust failed", product_id=product_id, error=str(e))
+
+    # ---------------------------------------------------------------
+    # Reserva (camino de la venta)
+    # ---------------------------------------------------------------
+
+    def _reserve(self, db: Session, quantities: Dict[int, int], queue: str, payload: str):
+        """Descuenta los contadores de todas las líneas y anota la venta en `queue`, o nada"""
+        product_ids = sorted(quantities)
+        keys = [_counter_key(pid) for pid in product_ids] + [queue]
+        args = [payload] + [quantities[pid] for pid in product_ids]
+
+        reserve = self._script("reserve", RESERVE_SCRIPT)
+        result = reserve(keys=keys, args=args)
+        if _decode(result[0]) == "missing":
+            self.load_counters(db, [product_ids[int(i) - 1] for i in result[1]])
+            result = reserve(keys=keys, args=args)
+
+        status = _decode(result[0])
+        if status == "missing":
+            # load_counters no crea contadores de productos que no están en la BD
+            raise NotFoundError(f"Productos no encontrados: {set(product_ids[int(i) - 1] for i in result[1])}")
+        if status == "insufficient":
+            product_id = product_ids[int(result[1]) - 1]
+            metrics_registry.counter('stock_reservation_rejected_total').increment()
+            raise InsufficientStockError(
+                "Stock insuficiente para algunos productos",
+                details={"insufficient_items": [{
+                    "product_id": product_id,
+                    "requested": quantities[product_id],
+                    "available": int(result[2]),
+                }]}
+            )
+        if status != "ok":
+            raise ValidationError("No se pudo reservar el stock de la venta", details={"result": status})
+
+    def available(self, db: Session, product_ids: Iterable[int]) -> Dict[int, int]:
+        """Stock disponible según los contadores (cargando los que falten); omite productos inexistentes"""
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return {}
+        self.load_counters(db, product_ids)
+        values = self._client().mget([_counter_key(pid) for pid in product_ids])
+        return {pid: int(value) for pid, value in zip(product_ids, values) if value is not None}
+
+    def reserve_direct(self, db: Session, quantities: Dict[int, int]) -> Optional[str]:
+        """
+        Descuenta de los contadores una venta que se escribe directamente en la BD
+
+        Lanza InsufficientStockError si alguna línea no cabe. Devuelve la anotación
+        en stock:reservations:direct, que se pasa a finish_direct tras el commit o
+        a release_direct si la transacción se deshace.
+        """
+        if not quantities:
+            return None
+        held = json.dumps({
+            "id": uuid.uuid4().hex,
+            "time": datetime.utcnow().isoformat(),
+            "items": [[pid, quantities[pid]] for pid in sorted(quantities)],
+        })
+        self._reserve(db, quantities, DIRECT_KEY, held)
+        return held
+
+    def finish_direct(self, held: Optional[str]):
+        """Retira la anotación de una venta directa ya confirmada (su stock ya está en la BD)"""
+        if held is None:
+            return
+        try:
+            self._client().lrem(DIRECT_KEY, 1, held)
+        except Exception as e:
+            # La anotación caduca en _prune_direct; hasta entonces el contador queda por debajo
+            logger.warning("Direct stock reservation not cleared", error=str(e))
+
+    def release_direct(self, held: Optional[str]):
+        """Devuelve a los contadores el stock de una venta directa que no se confirmó"""
+        if held is None:
+            return
+        items = json.loads(held)["items"]
+        try:
+            self._script("release_direct", RELEASE_DIRECT_SCRIPT)(
+                keys=[_counter_key(pid) for pid, _ in items] + [DIRECT_KEY],
+                args=[held] + [qty for _, qty in items]
+            )
+        except Exception as e:
+            logger.warning("Direct stock reservation not released", error=str(e))
+
+    def _prune_direct(self):
+        """
+        Retira las anotaciones de ventas directas más antiguas que el cerrojo del escritor
+
+        Una venta directa dura lo que su transacción; si sigue anotada tanto
+        tiempo, el proceso murió antes de retirarla y su stock ya está (o no
+        estará nunca) en la BD.
+        """
+        client = self._client()
+        limit = datetime.utcnow() - timedelta(seconds=settings.stock_reservation_writer_lock_ttl)
+        for raw in client.lrange(DIRECT_KEY, 0, -1):
+            if datetime.fromisoformat(json.loads(raw)["time"]) < limit:
+                client.lrem(DIRECT_KEY, 1, raw)
+
+    def reserve_sale(self, db: Session, items, user_id: int) -> Dict:
+        """
+        Reserva el stock de una venta y la encola para su persistencia
+
+        La base de datos solo se consulta para leer precios (sin bloqueos); el
+        stock se valida y descuenta en Redis de forma atómica.
+        """
+        quantities: Dict[int, int] = {}
+        for item in items:
+            if item.quantity_sold <= 0:
+                raise ValidationError(f"La cantidad debe ser mayor a 0 para el producto {item.product_id}")
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity_sold
+        if not quantities:
+            raise ValidationError("La venta debe tener al menos un producto")
+
+        product_ids = sorted(quantities)
+        prices = dict(
+            db.query(Product.id, Product.selling_price).filter(Product.id.in_(product_ids)).all()
+        )
+        missing = set(product_ids) - set(prices)
+        if missing:
+            raise NotFoundError(f"Productos no encontrados: {missing}")
+
+        transaction_time = datetime.utcnow()
+        reservation = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "time": transaction_time.isoformat(),
+            "items": [[pid, quantities[pid], str(prices[pid])] for pid in product_ids],
+        }
+        self._reserve(db, quantities, PENDING_KEY, json.dumps(reservation))
+
+        metrics_registry.counter('stock_reservations_total').increment()
+        # El ranking cuenta la venta al aceptarla, no al persistirla
+        top_sellers.record([(transaction_time, [
+            (pid, quantities[pid], prices[pid] * quantities[pid]) for pid in product_ids
+        ])])
+        return {
+            "reservation_id": reservation["id"],
+            "status": "pending",
+            "user_id": user_id,
+            "transaction_time": transaction_time,
+            "total_amount": sum(prices[pid] * qty for pid, qty in quantities.items()),
+            "items": [
+                {"product_id": pid, "quantity_sold": quantities[pid], "price_at_time_of_sale": prices[pid]}
+                for pid in product_ids
+            ],
+        }
+
+    # ---------------------------------------------------------------
+    # Escritor en segundo plano
+    # ---------------------------------------------------------------
+
+    def _persist(self, db: Session, raw_reservations: List) -> Dict[str, int]:
+        """Inserta en bloque un lote de reservas y confirma la transacción"""
+        reservations = {}
+        for raw in raw_reservations:
+            reservation = json.loads(raw)
+            reservations[reservation["id"]] = reservation
+
+        already = set(db.execute(
+            select(PointOfSaleTransaction.reservation_id)
+            .where(PointOfSaleTransaction.reservation_id.in_(list(reservations)))
+        ).scalars())
+        pending = [r for rid, r in reservations.items() if rid not in already]
+
+        if pending:
+            headers = [
+                {
+                    "reservation_id": r["id"],
+                    "user_id": r["user_id"],
+                    "transaction_time": datetime.fromisoformat(r["time"]),
+                    "total_amount": sum(Decimal(price) * qty for _, qty, price in r["items"]),
+                }
+                for r in pending
+            ]
+            ids = db.execute(
+                insert(PointOfSaleTransaction).returning(PointOfSaleTransaction.id, sort_by_parameter_order=True),
+                headers
+            ).scalars().all()
+
+            now = datetime.utcnow()
+            items, movements, totals = [], [], {}
+            for reservation, transaction_id in zip(pending, ids):
+                for product_id, quantity, price in reservation["items"]:
+                    items.append({
+                        "transaction_id": transaction_id,
+                        "product_id": product_id,
+                        "quantity_sold": quantity,
+                        "price_at_time_of_sale": Decimal(price),
+                    })
+                    movements.append({
+                        "product_id": product_id,
+                        "movement_type": InventoryMovementType.sale,
+                        "quantity": -quantity,
+                        "reference": f"sale:{transaction_id}",
+                        "created_at": now,
+                    })
+                    totals[product_id] = totals.get(product_id, 0) + quantity
+            db.execute(insert(PointOfSaleItem), items)
+            db.execute(insert(InventoryMovement), movements)
+            rollup_sales(db, [
+                (header["user_id"], header["transaction_time"], header["total_amount"],
+                 sum(quantity for _, quantity, _ in reservation["items"]))
+                for header, reservation in zip(headers, pending)
+            ])
+            # La venta ya se aceptó en Redis: el descuento es incondicional y en
+            # orden de product_id; una deriva con la BD la corrige reconcile()
+            db.execute(_DECREMENT_STOCK_STMT, [
+                {"product_id": pid, "quantity": totals[pid]} for pid in sorted(totals)
+            ])
+        db.commit()
+        if pending:
+            inventory_status.invalidate()
+        return {"persisted": len(pending), "duplicates": len(already)}
+
+    def _persist_batch(self, db: Session, client, batch: List) -> Dict[str, int]:
+        """
+        Persiste un lote; si alguna reserva lo rechaza, reintenta una a una
+
+        Las reservas rechazadas van a la cola de errores. Un fallo de conexión
+        se propaga y el lote queda en processing para el siguiente intento.
+        """
+        try:
+            return {**self._persist(db, batch), "dead": 0}
+        except _REJECTED_ERRORS as e:
+            db.rollback()
+            logger.warning("Stock reservation batch rejected, retrying one by one", count=len(batch), error=str(e))
+        except Exception:
+            db.rollback()
+            raise
+
+        stats = {"persisted": 0, "duplicates": 0, "dead": 0}
+        for raw in batch:
+            try:
+                result = self._persist(db, [raw])
+            except _REJECTED_ERRORS as e:
+                db.rollback()
+                self._dead_letter(client, raw, e)
+                stats["dead"] += 1
+                continue
+            except Exception:
+                db.rollback()
+                raise
+            stats["persisted"] += result["persisted"]
+            stats["duplicates"] += result["duplicates"]
+        return stats
+
+    def _dead_letter(self, client, raw, error: Exception):
+        client.rpush(DEAD_LETTER_KEY, json.dumps({
+            "reservation": _decode(raw),
+            "error": f"{type(error).__name__}: {error}",
+            "failed_at": datetime.utcnow().isoformat(),
+        }))
+        metrics_registry.counter('stock_reservations_dead_lettered_total').increment()
+        logger.error("Stock reservation moved to dead letter queue", reservation=_decode(raw)[:200], error=str(error))
+
+    def drain(self, db: Session, max_batches: Optional[int] = None) -> Dict[str, int]:
+        """
+        Persiste las ventas encoladas en lotes de batch_size
+
+        Primero recupera lo que una ejecución anterior dejó en la cola de proceso.
+        """
+        client = self._client()
+        stats = {"persisted": 0, "duplicates": 0, "dead": 0, "batches": 0}
+
+        leftover = client.lrange(PROCESSING_KEY, 0, -1)
+        if leftover:
+            logger.warning("Recovering stock reservations from a previous writer", count=len(leftover))
+            result = self._persist_batch(db, client, leftover)
+            client.delete(PROCESSING_KEY)
+            for name in ("persisted", "duplicates", "dead"):
+                stats[name] += result[name]
+            stats["batches"] += 1
+
+        while max_batches is None or stats["batches"] < max_batches:
+            pipe = client.pipeline(transaction=False)
+            for _ in range(self.batch_size):
+                pipe.lmove(PENDING_KEY, PROCESSING_KEY, "LEFT", "RIGHT")
+            batch = [raw for raw in pipe.execute() if raw is not None]
+            if not batch:
+                break
+            result = self._persist_batch(db, client, batch)
+            client.delete(PROCESSING_KEY)
+            for name in ("persisted", "duplicates", "dead"):
+                stats[name] += result[name]
+            stats["batches"] += 1
+
+        metrics_registry.counter('stock_reservations_persisted_total').increment(stats["persisted"])
+        metrics_registry.gauge('stock_reservations_pending').set(client.llen(PENDING_KEY))
+        return stats
+
+    def run_writer(self, db: Session, reconcile: bool = False) -> Dict:
+        """Drena la cola (y opcionalmente reconcilia) con un cerrojo para un solo escritor"""
+        client = self._client()
+        token = uuid.uuid4().hex
+        if not client.set(WRITER_LOCK_KEY, token, nx=True, ex=settings.stock_reservation_writer_lock_ttl):
+            return {"status": "skipped", "reason": "writer already running"}
+        try:
+            result = {"status": "completed", **self.drain(db)}
+            if reconcile:
+                result["drift"] = len(self.reconcile(db))
+            return result
+        finally:
+            if _decode(client.get(WRITER_LOCK_KEY) or b"") == token:
+                client.delete(WRITER_LOCK_KEY)
+
+
+# Instancia global
+stock_reservation = StockReservationService()
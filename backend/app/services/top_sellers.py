@@ -0,0 +1,246 @@
+# ==================================================================
+# TOP DE VENTAS EN TIEMPO REAL - SORTED SETS CON SPACE-SAVING
+# ==================================================================
+
+"""
+Ranking de productos más vendidos mantenido en Redis al registrar cada venta.
+
+Cada venta suma sus unidades a dos resúmenes: el del día (topsellers:day:<AAAA-MM-DD>)
+y el del tramo de 5 minutos (topsellers:5m:<AAAAMMDDHHMM>). Cada resumen es un
+sorted set producto -> unidades con un hash auxiliar de ingresos (céntimos) y
+error por producto.
+
+Los sorted sets están acotados a top_sellers_capacity productos con el
+algoritmo Space-Saving: si llega un producto nuevo con el resumen lleno,
+sustituye al de menor cuenta y la hereda como error máximo. Cualquier producto
+con más ventas que el mínimo del resumen está garantizado en él, así que el
+top-N es exacto mientras N sea pequeño frente a la capacidad.
+
+Ventanas:
+- today: un solo resumen diario, ZREVRANGE en O(log M + N)
+- hour: los 12 tramos de 5 minutos más recientes (entre 55 y 60 minutos)
+- 7d: los 7 resúmenes diarios (hoy y los 6 anteriores)
+
+Las ventanas de varios resúmenes se combinan sumando cuentas y errores, con un
+coste acotado por capacidad x resúmenes e independiente del volumen de ventas.
+Los ingresos solo cuentan mientras el producto está en el resumen.
+
+crud.get_top_selling_products sigue siendo el cálculo exacto en SQL: se usa si
+Redis no responde y con source=sql para verificar el ranking.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..cache import cache_manager
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import metrics_registry
+
+logger = get_logger(__name__)
+
+DAY_PREFIX = "topsellers:day:"
+BUCKET_PREFIX = "topsellers:5m:"
+BUCKET_MINUTES = 5
+
+WINDOWS = ("hour", "today", "7d")
+
+# Los resúmenes viven algo más que la ventana más larga que los usa
+DAY_TTL = 8 * 24 * 3600
+BUCKET_TTL = 2 * 3600
+
+TopSeller = namedtuple("TopSeller", ["product_id", "units", "revenue", "max_error"])
+
+# KEYS: pares (sorted set, hash) de cada resumen
+# ARGV: capacidad, TTL de cada resumen y ternas producto/unidades/céntimos
+RECORD_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local summaries = #KEYS / 2
+local first = 2 + summaries
+for s = 1, summaries do
+    local zkey, meta = KEYS[2 * s - 1], KEYS[2 * s]
+    for i = first, #ARGV, 3 do
+        local pid, units, cents = ARGV[i], tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2])
+        if redis.call('ZSCORE', zkey, pid) then
+            redis.call('ZINCRBY', zkey, units, pid)
+            redis.call('HINCRBY', meta, pid .. ':rev', cents)
+        elseif redis.call('ZCARD', zkey) < capacity then
+            redis.call('ZADD', zkey, units, pid)
+            redis.call('HSET', meta, pid .. ':rev', cents)
+        else
+            local victim = redis.call('ZRANGE', zkey, 0, 0, 'WITHSCORES')
+            local floor = tonumber(victim[2])
+            redis.call('ZREM', zkey, victim[1])
+            redis.call('HDEL', meta, victim[1] .. ':rev', victim[1] .. ':err')
+            redis.call('ZADD', zkey, floor + units, pid)
+            redis.call('HSET', meta, pid .. ':rev', cents, pid .. ':err', floor)
+        end
+    end
+    local ttl = tonumber(ARGV[1 + s])
+    redis.call('EXPIRE', zkey, ttl)
+    redis.call('EXPIRE', meta, ttl)
+end
+return summaries
+"""
+
+
+def _decode(raw) -> str:
+    return raw.decode() if isinstance(raw, bytes) else raw
+
+
+def day_key(moment: datetime) -> str:
+    return f"{DAY_PREFIX}{moment:%Y-%m-%d}"
+
+
+def bucket_key(moment: datetime) -> str:
+    minute = moment.minute - moment.minute % BUCKET_MINUTES
+    return f"{BUCKET_PREFIX}{moment:%Y%m%d%H}{minute:02d}"
+
+
+def window_keys(window: str, now: Optional[datetime] = None) -> List[str]:
+    """Resúmenes que componen la ventana, del más reciente al más antiguo"""
+    now = now or datetime.utcnow()
+    if window == "today":
+        return [day_key(now)]
+    if window == "7d":
+        return [day_key(now - timedelta(days=d)) for d in range(7)]
+    if window == "hour":
+        return [bucket_key(now - timedelta(minutes=BUCKET_MINUTES * b)) for b in range(60 // BUCKET_MINUTES)]
+    raise ValueError(f"Ventana desconocida: {window}")
+
+
+def window_start(window: str, now: Optional[datetime] = None) -> datetime:
+    """Inicio de la ventana para el cálculo exacto en SQL"""
+    now = now or datetime.utcnow()
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    if window == "today":
+        return midnight
+    if window == "7d":
+        return midnight - timedelta(days=6)
+    if window == "hour":
+        return now - timedelta(hours=1)
+    raise ValueError(f"Ventana desconocida: {window}")
+
+
+def merge_summaries(summaries: Iterable[Tuple[List[Tuple[str, float]], Dict[str, str]]],
+                    capacity: int) -> Dict[int, List]:
+    """
+    Combina resúmenes Space-Saving: product_id -> [unidades, céntimos, error]
+
+    Un producto ausente de un resumen lleno pudo vender hasta el mínimo de ese
+    resumen, así que ese mínimo se suma a su error.
+    """
+    merged: Dict[int, List] = {}
+    floors = []
+    for scores, meta in summaries:
+        floor = scores[0][1] if len(scores) >= capacity else 0
+        floors.append((floor, {_decode(pid) for pid, _ in scores}))
+        for pid, units in scores:
+            pid = _decode(pid)
+            entry = merged.setdefault(int(pid), [0, 0, 0])
+            entry[0] += int(units)
+            entry[1] += int(meta.get(f"{pid}:rev", 0))
+            entry[2] += int(meta.get(f"{pid}:err", 0))
+    for floor, present in floors:
+        if floor:
+            for pid, entry in merged.items():
+                if str(pid) not in present:
+                    entry[2] += int(floor)
+    return merged
+
+
+class TopSellersService:
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity or settings.top_sellers_capacity
+        self._scripts = {}
+
+    def _client(self):
+        return cache_manager.get_sync_client()
+
+    def _script(self, client):
+        cached = self._scripts.get("record")
+        if cached is None or cached[0] is not client:
+            cached = (client, client.register_script(RECORD_SCRIPT))
+            self._scripts["record"] = cached
+        return cached[1]
+
+    def record(self, sales: Iterable[Tuple[datetime, Iterable[Tuple[int, int, Decimal]]]]):
+        """
+        Suma ventas confirmadas al ranking: (transaction_time, [(product_id, unidades, importe)])
+
+        Las ventas fuera de la ventana más larga se ignoran. Un fallo de Redis
+        solo se registra: el ranking en tiempo real no debe romper una venta.
+        """
+        if not settings.top_sellers_enabled:
+            return
+        now = datetime.utcnow()
+        try:
+            client = self._client()
+            pipe = client.pipeline(transaction=False)
+            script = self._script(client)
+            recorded = 0
+            for transaction_time, lines in sales:
+                keys, ttls = [], []
+                if transaction_time >= now - timedelta(days=7):
+                    keys += [day_key(transaction_time), day_key(transaction_time) + ":meta"]
+                    ttls.append(DAY_TTL)
+                if transaction_time >= now - timedelta(hours=1):
+                    keys += [bucket_key(transaction_time), bucket_key(transaction_time) + ":meta"]
+                    ttls.append(BUCKET_TTL)
+                if not keys:
+                    continue
+                args = [self.capacity, *ttls]
+                for product_id, units, amount in lines:
+                    args += [product_id, units, int(Decimal(amount) * 100)]
+                script(keys=keys, args=args, client=pipe)
+                recorded += 1
+            if recorded:
+                pipe.execute()
+        except Exception as e:
+            metrics_registry.counter('top_sellers_record_errors_total').increment()
+            logger.warning("Top sellers record failed", error=str(e))
+
+    def top(self, window: str, limit: int = 10, now: Optional[datetime] = None) -> List[TopSeller]:
+        """Top-N de la ventana leído solo de Redis"""
+        keys = window_keys(window, now)
+        client = self._client()
+        if len(keys) == 1:
+            scores = client.zrevrange(keys[0], 0, limit - 1, withscores=True)
+            fields = [f"{_decode(pid)}:{suffix}" for pid, _ in scores for suffix in ("rev", "err")]
+            values = client.hmget(keys[0] + ":meta", fields) if fields else []
+            meta = {field: value for field, value in zip(fields, values) if value is not None}
+            merged = merge_summaries([(scores, meta)], self.capacity)
+        else:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.zrange(key, 0, -1, withscores=True)
+                pipe.hgetall(key + ":meta")
+            results = pipe.execute()
+            merged = merge_summaries(
+                [(results[i], {_decode(k): v for k, v in results[i + 1].items()}) for i in range(0, len(results), 2)],
+                self.capacity
+            )
+
+        ranked = sorted(merged.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [
+            TopSeller(pid, units, Decimal(cents) / 100, error)
+            for pid, (units, cents, error) in ranked
+        ]
+
+    def top_exact(self, db: Session, window: str, limit: int = 10, now: Optional[datetime] = None) -> List[TopSeller]:
+        """Mismo ranking calculado en SQL sobre las ventas (exacto)"""
+        from .. import crud
+
+        rows = crud.get_top_selling_products(db, limit, window_start(window, now), now)
+        return [
+            TopSeller(product.id, int(total_sold), Decimal(total_revenue or 0), 0)
+            for product, total_sold, total_revenue in rows
+        ]
+
+
+# Instancia global
+top_sellers = TopSellersService()
@@ -0,0 +1,305 @@
+"""
+Single-flight para fallos de caché (protección contra dogpile)
+
+Cuando una clave popular caduca, todas las peticiones concurrentes fallan a la
+vez y lanzan la misma consulta. fetch() lo evita en dos niveles:
+
+- En el proceso: las llamadas concurrentes con la misma clave esperan a una
+  única ejecución y reciben su resultado (o su excepción)
+- Entre procesos: el valor se guarda en Redis con stale_ttl segundos extra de
+  vida. Si al leerlo le quedan menos de stale_ttl segundos (o ya no existe), se
+  intenta un lock corto (SET NX PX) lock:<clave>. Quien lo consigue recalcula;
+  el resto sirve el valor viejo si lo hay o espera hasta lock_wait segundos a
+  que aparezca el nuevo. Si la espera se agota, recalcula por su cuenta
+
+Las claves invalidadas (generación nueva o borradas) no tienen valor viejo, así
+que nunca se sirve un dato invalidado. Si Redis no responde se calcula sin caché;
+un valor que no se puede decodificar (p. ej. de una versión de codec posterior)
+cuenta como fallo y se sobrescribe.
+
+afetch() es la variante para corrutinas: usa un cliente redis.asyncio y
+coalesce en el event loop en lugar de entre hilos.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .logging_config import get_logger
+from .metrics import metrics_registry
+
+logger = get_logger(__name__)
+
+LOCK_PREFIX = "lock:"
+
+_MISSING = object()
+
+# Borra el lock solo si sigue siendo nuestro (pudo caducar y tomarlo otro)
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalescencia de cálculos concurrentes con Redis como caché compartida"""
+
+    def __init__(self, stale_ttl: int = 30, lock_ttl: float = 10.0, lock_wait: float = 2.0,
+                 poll_interval: float = 0.05):
+        self.stale_ttl = stale_ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self.poll_interval = poll_interval
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, stale_ttl: int, lock_ttl: float, lock_wait: float):
+        self.stale_ttl = stale_ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Ejecuta fn una sola vez por clave entre las llamadas concurrentes del proceso"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics_registry.counter('single_flight_coalesced_waits_total').increment()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def fetch(
+        self,
+        client_factory: Callable[[], Any],
+        key: str,
+        compute: Callable[[], Any],
+        ttl: Optional[int],
+        encode: Callable[[Any], bytes],
+        decode: Callable[[bytes], Any],
+        should_store: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Valor de key en Redis o compute() con single-flight
+
+        ttl None guarda sin expiración (y sin valor viejo). should_store decide
+        si el resultado calculado se guarda (por defecto, si no es None).
+        """
+        return self.do(key, lambda: self._fetch_shared(
+            client_factory, key, compute, ttl, encode, decode, should_store
+        ))
+
+    def _fetch_shared(self, client_factory, key, compute, ttl, encode, decode, should_store):
+        try:
+            client = client_factory()
+            pipe = client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, remaining_ms = pipe.execute()
+        except Exception as e:
+            logger.warning("Cache unavailable, computing without single-flight", key=key, error=str(e))
+            return compute()
+
+        value = self._decode(decode, key, raw)
+        if value is not _MISSING and self._is_fresh(remaining_ms, ttl):
+            return value
+
+        token = uuid.uuid4().hex
+        lock_key = LOCK_PREFIX + key
+        try:
+            acquired = client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            logger.warning("Single-flight lock failed", key=key, error=str(e))
+            acquired = True
+            token = None
+
+        if acquired:
+            try:
+                return self._compute_and_store(client, key, compute, ttl, encode, should_store)
+            finally:
+                if token is not None:
+                    self._release(client, lock_key, token)
+
+        if value is not _MISSING:
+            # Otro worker recalcula: servir el valor viejo sin esperar
+            metrics_registry.counter('single_flight_stale_served_total').increment()
+            return value
+
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            try:
+                value = self._decode(decode, key, client.get(key))
+            except Exception:
+                break
+            if value is not _MISSING:
+                metrics_registry.counter('single_flight_remote_waits_total').increment()
+                return value
+
+        metrics_registry.counter('single_flight_lock_timeouts_total').increment()
+        logger.warning("Single-flight wait timed out, computing locally", key=key)
+        return self._compute_and_store(client, key, compute, ttl, encode, should_store)
+
+    def _is_fresh(self, remaining_ms, ttl) -> bool:
+        return ttl is None or remaining_ms < 0 or remaining_ms > self.stale_ttl * 1000
+
+    def _decode(self, decode, key: str, raw) -> Any:
+        """Valor guardado, o _MISSING si no hay o no se puede leer (se trata como fallo)"""
+        if raw is None:
+            return _MISSING
+        try:
+            return decode(raw)
+        except Exception as e:
+            metrics_registry.counter('single_flight_decode_errors_total').increment()
+            logger.warning("Unreadable cached value, recomputing", key=key, error=str(e))
+            return _MISSING
+
+    def _store_args(self, value, ttl, encode, should_store):
+        """Argumentos de SET para el valor calculado, o None si no se guarda"""
+        if not (should_store(value) if should_store else value is not None):
+            return None
+        return (encode(value), {"ex": int(ttl) + self.stale_ttl} if ttl else {})
+
+    def _compute_and_store(self, client, key, compute, ttl, encode, should_store):
+        metrics_registry.counter('single_flight_computes_total').increment()
+        value = compute()
+        store = self._store_args(value, ttl, encode, should_store)
+        if store is not None:
+            try:
+                client.set(key, store[0], **store[1])
+            except Exception as e:
+                logger.warning("Single-flight store failed", key=key, error=str(e))
+        return value
+
+    def _release(self, client, lock_key: str, token: str):
+        try:
+            client.eval(RELEASE_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            # El lock caduca solo en lock_ttl
+            logger.warning("Single-flight lock release failed", key=lock_key, error=str(e))
+
+    async def afetch(
+        self,
+        client_factory: Callable[[], Awaitable[Any]],
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int],
+        encode: Callable[[Any], bytes],
+        decode: Callable[[bytes], Any],
+        should_store: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Variante asíncrona de fetch()
+
+        client_factory devuelve (con await) un cliente redis.asyncio y compute
+        es una función que devuelve una corrutina. Las llamadas concurrentes del
+        event loop esperan a una única tarea; cancelar una espera no cancela el
+        cálculo compartido.
+        """
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            metrics_registry.counter('single_flight_coalesced_waits_total').increment()
+        else:
+            task = asyncio.ensure_future(self._afetch_shared(
+                client_factory, key, compute, ttl, encode, decode, should_store
+            ))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _afetch_shared(self, client_factory, key, compute, ttl, encode, decode, should_store):
+        try:
+            client = await client_factory()
+            pipe = client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, remaining_ms = await pipe.execute()
+        except Exception as e:
+            logger.warning("Cache unavailable, computing without single-flight", key=key, error=str(e))
+            return await compute()
+
+        value = self._decode(decode, key, raw)
+        if value is not _MISSING and self._is_fresh(remaining_ms, ttl):
+            return value
+
+        token = uuid.uuid4().hex
+        lock_key = LOCK_PREFIX + key
+        try:
+            acquired = await client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            logger.warning("Single-flight lock failed", key=key, error=str(e))
+            acquired = True
+            token = None
+
+        if acquired:
+            try:
+                return await self._acompute_and_store(client, key, compute, ttl, encode, should_store)
+            finally:
+                if token is not None:
+                    await self._arelease(client, lock_key, token)
+
+        if value is not _MISSING:
+            metrics_registry.counter('single_flight_stale_served_total').increment()
+            return value
+
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                value = self._decode(decode, key, await client.get(key))
+            except Exception:
+                break
+            if value is not _MISSING:
+                metrics_registry.counter('single_flight_remote_waits_total').increment()
+                return value
+
+        metrics_registry.counter('single_flight_lock_timeouts_total').increment()
+        logger.warning("Single-flight wait timed out, computing locally", key=key)
+        return await self._acompute_and_store(client, key, compute, ttl, encode, should_store)
+
+    async def _acompute_and_store(self, client, key, compute, ttl, encode, should_store):
+        metrics_registry.counter('single_flight_computes_total').increment()
+        value = await compute()
+        store = self._store_args(value, ttl, encode, should_store)
+        if store is not None:
+            try:
+                await client.set(key, store[0], **store[1])
+            except Exception as e:
+                logger.warning("Single-flight store failed", key=key, error=str(e))
+        return value
+
+    async def _arelease(self, client, lock_key: str, token: str):
+        try:
+            await client.eval(RELEASE_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            logger.warning("Single-flight lock release failed", key=lock_key, error=str(e))
+
+
+# Instancia global
+single_flight = SingleFlight()
@@ -9,8 +9,7 @@ from datetime import datetime, timedelta
 import json
 
 from ..celery_app import celery_app
-from ..database import get_db_session_maker
-from ..config import settings
+from ..database import get_session_local
 from ..logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -29,7 +28,7 @@ def cleanup_old_audit_logs_task(self, days_to_keep: int = 90):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -105,7 +104,7 @@ def generate_security_report_task(self, report_date: str = None):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -296,7 +295,7 @@ def analyze_system_health_task(self):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -470,7 +469,7 @@ def backup_critical_data_task(self, backup_type: str = "incremental"):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -8,13 +8,32 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 
 from ..celery_app import celery_app
-from ..database import get_db_session_maker
-from ..config import settings
+from ..database import get_session_local
 from ..logging_config import get_logger
+from ..models import InventoryMovementType
+from ..services.inventory_ledger import record_movement, ledger_drift
 
 logger = get_logger(__name__)
 
 
+def _stockout_order(forecast: Dict[str, Any]):
+    # Sin ventas recientes (None) al final
+    days = forecast['days_until_stockout']
+    return (days is None, days or 0, forecast['product'].stock_quantity)
+
+
+def _low_stock_entry(forecast: Dict[str, Any]) -> Dict[str, Any]:
+    product = forecast['product']
+    return {
+        'id': product.id,
+        'name': product.name,
+        'sku': product.sku,
+        'stock_quantity': product.stock_quantity,
+        'days_until_stockout': forecast['days_until_stockout'],
+        'reorder_point': forecast['reorder_point']
+    }
+
+
 @celery_app.task(bind=True, name="app.tasks.inventory_tasks.check_low_stock_task")
 def check_low_stock_task(self, threshold: int = 5):
     """Tarea para verificar productos con stock bajo"""
@@ -28,7 +47,7 @@ def check_low_stock_task(self, threshold: int = 5):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -37,13 +56,21 @@ def check_low_stock_task(self, threshold: int = 5):
                 meta={'message': 'Consultando productos con stock bajo'}
             )
             
-            # Obtener productos con stock bajo
-            from ..crud import get_products_with_low_stock
-            low_stock_products = get_products_with_low_stock(db, threshold)
+            # Obtener productos con stock bajo o bajo su punto de pedido, con previsión de rotura
+            from ..crud import get_low_stock_forecast
+            forecast = get_low_stock_forecast(db, threshold, include_reorder=True)
+            low_stock_products = [f for f in forecast if f['product'].stock_quantity <= threshold]
             
-            # Categorizar por criticidad
-            critical_products = [p for p in low_stock_products if p.stock_quantity == 0]
-            warning_products = [p for p in low_stock_products if 0 < p.stock_quantity <= threshold]
+            # Categorizar por criticidad; los avisos, primero los que antes se agotan
+            critical_products = [f for f in low_stock_products if f['product'].stock_quantity == 0]
+            warning_products = sorted(
+                (f for f in low_stock_products if f['product'].stock_quantity > 0),
+                key=_stockout_order
+            )
+            reorder_products = sorted(
+                (f for f in forecast if f['product'].stock_quantity > threshold),
+                key=_stockout_order
+            )
             
             result = {
                 'status': 'completed',
@@ -52,31 +79,19 @@ def check_low_stock_task(self, threshold: int = 5):
                 'summary': {
                     'total_low_stock': len(low_stock_products),
                     'critical_products': len(critical_products),
-                    'warning_products': len(warning_products)
+                    'warning_products': len(warning_products),
+                    'reorder_products': len(reorder_products)
                 },
-                'critical_products': [
-                    {
-                        'id': p.id,
-                        'name': p.name,
-                        'sku': p.sku,
-                        'stock_quantity': p.stock_quantity
-                    } for p in critical_products[:10]  # Limitar a 10 para el resultado
-                ],
-                'warning_products': [
-                    {
-                        'id': p.id,
-                        'name': p.name,
-                        'sku': p.sku,
-                        'stock_quantity': p.stock_quantity
-                    } for p in warning_products[:10]  # Limitar a 10
-                ]
+                'critical_products': [_low_stock_entry(f) for f in critical_products[:10]],  # Limitar a 10 para el resultado
+                'warning_products': [_low_stock_entry(f) for f in warning_products[:10]],  # Limitar a 10
+                'reorder_products': [_low_stock_entry(f) for f in reorder_products[:10]]
             }
             
             # Si hay productos críticos, enviar notificación
             if critical_products:
                 from .notification_tasks import send_low_stock_alert_task
                 send_low_stock_alert_task.delay(
-                    product_ids=[p.id for p in critical_products],
+                    product_ids=[f['product'].id for f in critical_products],
                     alert_type='critical'
                 )
             
@@ -110,7 +125,7 @@ def update_stock_levels_task(self, stock_updates: List[Dict[str, Any]]):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -147,6 +162,10 @@ def update_stock_levels_task(self, stock_updates: List[Dict[str, Any]]):
                     
                     # Actualizar stock
                     product.stock_quantity = new_stock
+                    record_movement(
+                        db, product_id, InventoryMovementType.adjustment,
+                        new_stock - old_stock, reference=f"bulk_update:{reason}"[:64]
+                    )
                     
                     # Registrar en auditoría
                     from ..services.audit_service import AuditService
@@ -181,9 +200,11 @@ def update_stock_levels_task(self, stock_updates: List[Dict[str, Any]]):
             if updated_products:
                 db.commit()
                 
-                # Invalidar caché de productos
+                # Invalidar caché de productos y snapshot del inventario
                 from ..services.intelligent_cache import ProductCacheManager
+                from ..services import inventory_status
                 ProductCacheManager.invalidate_all_products()
+                inventory_status.invalidate()
             
             result = {
                 'status': 'completed',
@@ -226,7 +247,7 @@ def reconcile_inventory_task(self, location: str = "main_warehouse"):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -266,6 +287,10 @@ def reconcile_inventory_task(self, location: str = "main_warehouse"):
                     })
                     
                     # Corregir stock negativo
+                    record_movement(
+                        db, product.id, InventoryMovementType.reconciliation,
+                        -product.stock_quantity, reference=f"reconciliation:{location}"[:64]
+                    )
                     product.stock_quantity = 0
                     reconciled_products.append(product.id)
                 
@@ -281,10 +306,23 @@ def reconcile_inventory_task(self, location: str = "main_warehouse"):
                         'suggested_action': 'Revisar precios'
                     })
             
+            # Productos cuyo stock no cuadra con el ledger de movimientos
+            for product_id, drift in ledger_drift(db).items():
+                discrepancies.append({
+                    'product_id': product_id,
+                    'issue': 'Stock distinto del ledger de movimientos',
+                    'current_stock': drift['stock_quantity'],
+                    'ledger_stock': drift['ledger'],
+                    'suggested_action': 'Revisar movimientos o ejecutar rebuild_inventory_ledger --seed'
+                })
+            
             # Commit correcciones automáticas
             if reconciled_products:
                 db.commit()
                 
+                from ..services import inventory_status
+                inventory_status.invalidate()
+                
                 # Registrar en auditoría
                 from ..services.audit_service import AuditService
                 from ..models.audit import AuditActionType, AuditSeverity
@@ -331,6 +369,70 @@ def reconcile_inventory_task(self, location: str = "main_warehouse"):
         raise self.retry(exc=e, countdown=600, max_retries=2)
 
 
+@celery_app.task(bind=True, name="app.tasks.inventory_tasks.fold_inventory_ledger_task")
+def fold_inventory_ledger_task(self, checkpoint: bool = False):
+    """Tarea para aplicar los movimientos nuevos del ledger a los saldos (y opcionalmente crear checkpoint)"""
+    
+    try:
+        SessionLocal = get_session_local()
+        db = SessionLocal()
+        
+        try:
+            from ..services.inventory_ledger import fold_movements, create_checkpoint
+            
+            if checkpoint:
+                checkpointed = create_checkpoint(db)
+                result = {'status': 'completed', 'checkpoint_rows': checkpointed}
+            else:
+                folded = fold_movements(db)
+                result = {'status': 'completed', **folded}
+            db.commit()
+            
+            logger.info("Ledger de inventario aplicado", extra=result)
+            return result
+            
+        except Exception as e:
+            db.rollback()
+            raise e
+        finally:
+            db.close()
+            
+    except Exception as e:
+        logger.error(f"Error aplicando ledger de inventario: {str(e)}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
+@celery_app.task(bind=True, name="app.tasks.inventory_tasks.drain_stock_reservations_task")
+def drain_stock_reservations_task(self, reconcile: bool = False):
+    """Tarea para persistir las ventas reservadas en Redis (y opcionalmente reconciliar contadores)"""
+    
+    from ..config import settings
+    if not settings.stock_reservation_enabled:
+        return {'status': 'skipped', 'reason': 'stock reservation disabled'}
+    
+    try:
+        SessionLocal = get_session_local()
+        db = SessionLocal()
+        
+        try:
+            from ..services.stock_reservation import stock_reservation
+            
+            result = stock_reservation.run_writer(db, reconcile=reconcile)
+            if result.get('persisted') or result.get('drift'):
+                logger.info("Reservas de stock persistidas", extra=result)
+            return result
+            
+        except Exception as e:
+            db.rollback()
+            raise e
+        finally:
+            db.close()
+            
+    except Exception as e:
+        logger.error(f"Error persistiendo reservas de stock: {str(e)}")
+        raise self.retry(exc=e, countdown=5, max_retries=3)
+
+
 @celery_app.task(bind=True, name="app.tasks.inventory_tasks.check_overdue_consignments_task")
 def check_overdue_consignments_task(self):
     """Tarea para verificar consignaciones vencidas"""
@@ -344,7 +446,7 @@ def check_overdue_consignments_task(self):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -7,8 +7,7 @@ from celery import current_task
 from sqlalchemy.orm import Session
 
 from ..celery_app import celery_app
-from ..database import get_db_session_maker
-from ..config import settings
+from ..database import get_session_local
 from ..logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -27,7 +26,7 @@ def send_low_stock_alert_task(self, product_ids: List[int], alert_type: str = 'w
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -173,7 +172,7 @@ def send_overdue_consignments_alert_task(self, loan_ids: List[int]):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -311,7 +310,7 @@ def send_daily_summary_task(self):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
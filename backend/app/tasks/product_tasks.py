@@ -6,9 +6,9 @@ from typing import List, Dict, Any
 from celery import current_task
 from sqlalchemy.orm import Session
 
+from ..cache import cache_manager
 from ..celery_app import celery_app
-from ..database import get_db_session_maker
-from ..config import settings
+from ..database import get_session_local
 from ..logging_config import get_logger
 from ..services.intelligent_cache import intelligent_cache, ProductCacheManager
 from ..utils.performance_optimizer import QueryOptimizer, PerformanceOptimizer
@@ -32,12 +32,16 @@ def cleanup_cache_task(self):
         # Ejecutar limpieza
         intelligent_cache.cleanup_expired()
         
+        # Borrar claves de generaciones ya invalidadas
+        reaped_keys = cache_manager.reap_stale_generations()
+        
         # Obtener métricas después de la limpieza
         metrics = intelligent_cache.get_metrics()
         
         result = {
             'status': 'completed',
             'message': 'Limpieza de caché completada exitosamente',
+            'reaped_keys': reaped_keys,
             'metrics': {
                 'total_keys': metrics.get('total_keys', 0),
                 'hit_rate_percent': metrics.get('hit_rate_percent', 0),
@@ -73,7 +77,7 @@ def optimize_database_task(self):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -143,7 +147,7 @@ def warm_up_cache_task(self, popular_product_ids: List[int] = None):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -198,7 +202,7 @@ def sync_product_data_task(self, product_ids: List[int] = None):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -285,7 +289,7 @@ def bulk_update_products_task(self, updates: List[Dict[str, Any]]):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
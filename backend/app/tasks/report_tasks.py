@@ -6,11 +6,12 @@ from typing import List, Dict, Any, Optional
 from celery import current_task
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
 import json
 
 from ..celery_app import celery_app
-from ..database import get_db_session_maker
-from ..config import settings
+from ..database import get_session_local
 from ..logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -34,7 +35,7 @@ def generate_daily_inventory_report(self, report_date: str = None):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -195,7 +196,7 @@ def generate_sales_report(self, start_date: str, end_date: str, group_by: str =
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -204,30 +205,25 @@ def generate_sales_report(self, start_date: str, end_date: str, group_by: str =
                 meta={'message': 'Consultando datos de ventas'}
             )
             
-            from ..models import PointOfSaleTransaction, PointOfSaleItem, Product, User
-            from sqlalchemy import func
+            from ..models import Product, User
             
-            # Consulta base de ventas
-            base_query = db.query(PointOfSaleTransaction).filter(
-                PointOfSaleTransaction.transaction_time >= start_dt,
-                PointOfSaleTransaction.transaction_time <= end_dt
-            )
+            # Periodos cerrados desde la caché de reportes (o el rollup diario si
+            # no están cacheados); solo hoy y los tramos parciales se calculan en vivo
+            from ..services.period_reports import range_report
             
-            # Estadísticas generales
-            total_transactions = base_query.count()
-            total_revenue = base_query.with_entities(
-                func.sum(PointOfSaleTransaction.total_amount)
-            ).scalar() or 0
+            report = range_report(db, start_dt, end_dt)
+            total_transactions = sum(transactions for transactions, _, _ in report["days"].values())
+            total_revenue = sum((revenue for _, revenue, _ in report["days"].values()), Decimal("0"))
             
             # Ventas por día/semana/mes según group_by
             if group_by == 'day':
-                date_group = func.date(PointOfSaleTransaction.transaction_time)
+                period_start = lambda day: day
                 date_format = '%Y-%m-%d'
             elif group_by == 'week':
-                date_group = func.date_trunc('week', PointOfSaleTransaction.transaction_time)
+                period_start = lambda day: day - timedelta(days=day.weekday())  # Lunes, como date_trunc('week')
                 date_format = '%Y-W%U'
             else:  # month
-                date_group = func.date_trunc('month', PointOfSaleTransaction.transaction_time)
+                period_start = lambda day: day.replace(day=1)
                 date_format = '%Y-%m'
             
             current_task.update_state(
@@ -235,14 +231,16 @@ def generate_sales_report(self, start_date: str, end_date: str, group_by: str =
                 meta={'message': f'Agrupando ventas por {group_by}'}
             )
             
-            sales_by_period = db.query(
-                date_group.label('period'),
-                func.count(PointOfSaleTransaction.id).label('transactions'),
-                func.sum(PointOfSaleTransaction.total_amount).label('revenue')
-            ).filter(
-                PointOfSaleTransaction.transaction_time >= start_dt,
-                PointOfSaleTransaction.transaction_time <= end_dt
-            ).group_by(date_group).order_by(date_group).all()
+            periods = {}
+            for day, (transactions, revenue, _) in report["days"].items():
+                period = periods.setdefault(period_start(day), [0, Decimal("0")])
+                period[0] += transactions
+                period[1] += revenue
+            revenue_by_user = {user_id: values[:2] for user_id, values in report["users"].items()}
+            sales_by_period = [
+                SimpleNamespace(period=period, transactions=transactions, revenue=revenue)
+                for period, (transactions, revenue) in sorted(periods.items())
+            ]
             
             # Top productos vendidos en el período
             current_task.update_state(
@@ -250,19 +248,16 @@ def generate_sales_report(self, start_date: str, end_date: str, group_by: str =
                 meta={'message': 'Analizando productos más vendidos'}
             )
             
-            top_products = db.query(
-                Product,
-                func.sum(PointOfSaleItem.quantity_sold).label('total_sold'),
-                func.sum(PointOfSaleItem.quantity_sold * PointOfSaleItem.price_at_time_of_sale).label('total_revenue'),
-                func.count(PointOfSaleItem.id).label('transaction_count')
-            ).join(
-                PointOfSaleItem, Product.id == PointOfSaleItem.product_id
-            ).join(
-                PointOfSaleTransaction, PointOfSaleItem.transaction_id == PointOfSaleTransaction.id
-            ).filter(
-                PointOfSaleTransaction.transaction_time >= start_dt,
-                PointOfSaleTransaction.transaction_time <= end_dt
-            ).group_by(Product.id).order_by(func.sum(PointOfSaleItem.quantity_sold).desc()).limit(20).all()
+            ranked = sorted(report["products"].items(), key=lambda item: item[1][0], reverse=True)[:20]
+            products = {
+                product.id: product
+                for product in db.query(Product).filter(Product.id.in_([pid for pid, _ in ranked]))
+            }
+            top_products = [
+                SimpleNamespace(Product=products[pid], total_sold=units, total_revenue=revenue, transaction_count=lines)
+                for pid, (units, revenue, lines) in ranked
+                if pid in products
+            ]
             
             # Ventas por vendedor/usuario
             current_task.update_state(
@@ -270,16 +265,14 @@ def generate_sales_report(self, start_date: str, end_date: str, group_by: str =
                 meta={'message': 'Analizando ventas por usuario'}
             )
             
-            sales_by_user = db.query(
-                User,
-                func.count(PointOfSaleTransaction.id).label('transactions'),
-                func.sum(PointOfSaleTransaction.total_amount).label('revenue')
-            ).join(
-                PointOfSaleTransaction, User.id == PointOfSaleTransaction.user_id
-            ).filter(
-                PointOfSaleTransaction.transaction_time >= start_dt,
-                PointOfSaleTransaction.transaction_time <= end_dt
-            ).group_by(User.id).order_by(func.sum(PointOfSaleTransaction.total_amount).desc()).all()
+            users = {user.id: user for user in db.query(User).filter(User.id.in_(list(revenue_by_user)))}
+            sales_by_user = [
+                SimpleNamespace(User=users[user_id], transactions=transactions, revenue=revenue)
+                for user_id, (transactions, revenue) in sorted(
+                    revenue_by_user.items(), key=lambda item: item[1][1], reverse=True
+                )
+                if user_id in users
+            ]
             
             current_task.update_state(
                 state='PROGRESS',
@@ -381,7 +374,7 @@ def generate_consignment_report(self, distributor_id: Optional[int] = None):
         )
         
         # Obtener sesión de base de datos
-        SessionLocal, engine = get_db_session_maker(settings.database_url)
+        SessionLocal = get_session_local()
         db = SessionLocal()
         
         try:
@@ -552,4 +545,27 @@ def generate_consignment_report(self, distributor_id: Optional[int] = None):
             meta={'error': str(e)}
         )
         
-        raise self.retry(exc=e, countdown=300, max_retries=2)
\ No newline at end of file
+        raise self.retry(exc=e, countdown=300, max_retries=2)
+
+
+@celery_app.task(bind=True, name="app.tasks.report_tasks.export_sales_parquet_task")
+def export_sales_parquet_task(self, full: bool = False):
+    """Tarea para añadir al dataset Parquet de analítica los días completos aún no exportados"""
+    
+    try:
+        SessionLocal = get_session_local()
+        db = SessionLocal()
+        
+        try:
+            from ..services.analytics_export import export_incremental
+            
+            result = export_incremental(db, full=full)
+            logger.info("Exportación Parquet de ventas", extra=result)
+            return result
+            
+        finally:
+            db.close()
+            
+    except Exception as e:
+        logger.error(f"Error exportando ventas a Parquet: {str(e)}")
+        raise self.retry(exc=e, countdown=300, max_retries=2)
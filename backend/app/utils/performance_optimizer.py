@@ -5,13 +5,15 @@
 from typing import Optional, Dict, Any, List, Union
 from functools import wraps
 import time
-import json
 import hashlib
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 from ..cache import cache_manager
+from ..cache_codec import LEGACY_GZIP_PICKLE, LEGACY_JSON, cache_codec
+from ..local_cache import local_cache
+from ..single_flight import single_flight
 from ..logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -132,26 +134,31 @@ class AdvancedCache:
                     logger.debug(f"Cache hit (memory): {full_key}")
                     return memory_result
                 
-                # Nivel 2: Caché en Redis
-                redis_result = AdvancedCache._get_from_redis_cache(full_key, compression)
-                if redis_result is not None:
-                    logger.debug(f"Cache hit (redis): {full_key}")
-                    # Guardar en memoria para próximas consultas
-                    AdvancedCache._set_memory_cache(full_key, redis_result, ttl_memory)
-                    return redis_result
+                # Nivel 2: Redis; en un fallo solo una llamada ejecuta la función
+                # (single-flight) y el resto espera o sirve el valor anterior
+                execution = {}
                 
-                # Nivel 3: Ejecutar función y cachear resultado
-                logger.debug(f"Cache miss: {full_key}")
-                start_time = time.time()
-                result = func(*args, **kwargs)
-                execution_time = time.time() - start_time
+                def compute():
+                    logger.debug(f"Cache miss: {full_key}")
+                    start_time = time.time()
+                    value = func(*args, **kwargs)
+                    execution['time'] = time.time() - start_time
+                    return value
                 
-                # Guardar en ambos niveles si la ejecución fue costosa (> 100ms)
-                if execution_time > 0.1:
+                # Guardar solo si la ejecución fue costosa (> 100ms)
+                result = single_flight.fetch(
+                    cache_manager.get_sync_client, full_key, compute, ttl_redis,
+                    lambda value: AdvancedCache._encode(value, compression),
+                    lambda data: AdvancedCache._decode(data, compression),
+                    should_store=lambda value: execution['time'] > 0.1
+                )
+                
+                if 'time' not in execution:
+                    logger.debug(f"Cache hit (redis): {full_key}")
                     AdvancedCache._set_memory_cache(full_key, result, ttl_memory)
-                    AdvancedCache._set_redis_cache(full_key, result, ttl_redis, compression)
-                    
-                    logger.debug(f"Cached result (execution_time: {execution_time:.3f}s): {full_key}")
+                elif execution['time'] > 0.1:
+                    AdvancedCache._set_memory_cache(full_key, result, ttl_memory)
+                    logger.debug(f"Cached result (execution_time: {execution['time']:.3f}s): {full_key}")
                 
                 return result
             
@@ -170,115 +177,31 @@ class AdvancedCache:
     
     @staticmethod
     def _get_from_memory_cache(key: str) -> Any:
-        """Obtiene valor del caché en memoria"""
+        """Obtiene valor de la L1 del proceso (namespace = prefijo de la clave)"""
         
-        try:
-            # Implementación simple con diccionario global (en producción usar algo como Redis)
-            if not hasattr(AdvancedCache, '_memory_cache'):
-                AdvancedCache._memory_cache = {}
-            
-            cache_entry = AdvancedCache._memory_cache.get(key)
-            if cache_entry:
-                if cache_entry['expires'] > time.time():
-                    return cache_entry['value']
-                else:
-                    # Expirado, remover
-                    del AdvancedCache._memory_cache[key]
-            
-            return None
-            
-        except Exception as e:
-            logger.debug(f"Error accessing memory cache: {str(e)}")
-            return None
+        namespace, _, local_key = key.partition(":")
+        return local_cache.get(namespace, local_key)
     
     @staticmethod
     def _set_memory_cache(key: str, value: Any, ttl: int):
-        """Guarda valor en caché en memoria"""
+        """Guarda valor en la L1 del proceso (acotada por bytes, TTL por entrada)"""
         
-        try:
-            if not hasattr(AdvancedCache, '_memory_cache'):
-                AdvancedCache._memory_cache = {}
-            
-            AdvancedCache._memory_cache[key] = {
-                'value': value,
-                'expires': time.time() + ttl
-            }
-            
-            # Limpiar entradas expiradas ocasionalmente
-            if len(AdvancedCache._memory_cache) > 1000:
-                AdvancedCache._cleanup_memory_cache()
-                
-        except Exception as e:
-            logger.debug(f"Error setting memory cache: {str(e)}")
+        namespace, _, local_key = key.partition(":")
+        local_cache.set(namespace, local_key, value, ttl)
     
     @staticmethod
-    def _get_from_redis_cache(key: str, compression: bool = True) -> Any:
-        """Obtiene valor del caché Redis"""
+    def _encode(value: Any, compression: bool = True) -> bytes:
+        """Serializa para Redis (comprime por encima del umbral del codec)"""
         
-        try:
-            redis_client = cache_manager.get_sync_client()
-            if not redis_client:
-                return None
-            
-            cached_data = redis_client.get(key)
-            if cached_data:
-                if compression:
-                    import gzip
-                    import pickle
-                    return pickle.loads(gzip.decompress(cached_data))
-                else:
-                    import json
-                    return json.loads(cached_data)
-            
-            return None
-            
-        except Exception as e:
-            logger.debug(f"Error accessing Redis cache: {str(e)}")
-            return None
+        return cache_codec.encode(
+            value, compress=compression, legacy=LEGACY_GZIP_PICKLE if compression else LEGACY_JSON
+        )
     
     @staticmethod
-    def _set_redis_cache(key: str, value: Any, ttl: int, compression: bool = True):
-        """Guarda valor en caché Redis"""
+    def _decode(data: bytes, compression: bool = True) -> Any:
+        """Deserializa un valor leído de Redis (formato actual o anterior)"""
         
-        try:
-            redis_client = cache_manager.get_sync_client()
-            if not redis_client:
-                return
-            
-            if compression:
-                import gzip
-                import pickle
-                data = gzip.compress(pickle.dumps(value))
-            else:
-                import json
-                data = json.dumps(value, default=str)
-            
-            redis_client.setex(key, ttl, data)
-            
-        except Exception as e:
-            logger.debug(f"Error setting Redis cache: {str(e)}")
-    
-    @staticmethod
-    def _cleanup_memory_cache():
-        """Limpia entradas expiradas del caché en memoria"""
-        
-        try:
-            if not hasattr(AdvancedCache, '_memory_cache'):
-                return
-            
-            current_time = time.time()
-            expired_keys = [
-                key for key, entry in AdvancedCache._memory_cache.items()
-                if entry['expires'] <= current_time
-            ]
-            
-            for key in expired_keys:
-                del AdvancedCache._memory_cache[key]
-            
-            logger.debug(f"Cleaned {len(expired_keys)} expired cache entries")
-            
-        except Exception as e:
-            logger.debug(f"Error cleaning memory cache: {str(e)}")
+        return cache_codec.decode(data)
 
 
 class QueryOptimizer:
@@ -0,0 +1,274 @@
+# ==================================================================
+# INSTRUMENTACIÓN DE SENTENCIAS SQL - FINGERPRINTS Y DETECCIÓN N+1
+# ==================================================================
+
+import hashlib
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..config import settings
+from ..logging_config import get_logger
+from ..metrics import Histogram, metrics_registry
+
+logger = get_logger(__name__)
+
+
+# ------------------------------------------------------------------
+# Normalización de sentencias
+# ------------------------------------------------------------------
+
+_COMMENT_RE = re.compile(r"(--[^\n]*)|(/\*.*?\*/)", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+|\?")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"\bVALUES\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """
+    Normaliza una sentencia SQL para agrupar ejecuciones equivalentes
+
+    Elimina comentarios, sustituye literales y placeholders por '?', colapsa
+    listas IN (...) y VALUES múltiples, y normaliza espacios.
+    """
+    normalized = _COMMENT_RE.sub(" ", statement)
+    normalized = _STRING_RE.sub("?", normalized)
+    normalized = _PLACEHOLDER_RE.sub("?", normalized)
+    normalized = _NUMBER_RE.sub("?", normalized)
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip()
+    normalized = _IN_LIST_RE.sub("IN (?)", normalized)
+    normalized = _VALUES_RE.sub(r"VALUES \1", normalized)
+    return normalized
+
+
+@lru_cache(maxsize=2048)
+def fingerprint_sql(statement: str) -> str:
+    """Identificador corto y estable para una sentencia normalizada"""
+    return hashlib.md5(normalize_sql(statement).encode()).hexdigest()[:12]
+
+
+# ------------------------------------------------------------------
+# Estadísticas por fingerprint (proceso)
+# ------------------------------------------------------------------
+
+class FingerprintStats:
+    """Latencias y filas de un fingerprint"""
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.calls = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.latency = Histogram()
+
+    def record(self, duration: float, rows: int):
+        self.calls += 1
+        self.rows += rows
+        self.total_time += duration
+        self.latency.observe(duration)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latency = self.latency.get_stats()
+        return {
+            "sql": self.sql,
+            "calls": self.calls,
+            "rows": self.rows,
+            "total_time_ms": self.total_time * 1000,
+            "avg_ms": latency["avg"] * 1000,
+            "p95_ms": latency["p95"] * 1000,
+            "max_ms": latency["max"] * 1000,
+        }
+
+
+class QueryStatsRegistry:
+    """Registro acotado de estadísticas por fingerprint y detecciones N+1"""
+
+    def __init__(self, max_fingerprints: int = 500, max_detections: int = 100):
+        self.max_fingerprints = max_fingerprints
+        self._stats: Dict[str, FingerprintStats] = {}
+        self._detections: deque = deque(maxlen=max_detections)
+        self._lock = threading.Lock()
+
+    def record(self, fingerprint: str, statement: str, duration: float, rows: int):
+        with self._lock:
+            stats = self._stats.get(fingerprint)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    # Descartar el fingerprint con menos tiempo acumulado
+                    coldest = min(self._stats, key=lambda fp: self._stats[fp].total_time)
+                    del self._stats[coldest]
+                stats = self._stats[fingerprint] = FingerprintStats(normalize_sql(statement))
+            stats.record(duration, rows)
+
+    def record_detection(self, detection: Dict[str, Any]):
+        with self._lock:
+            self._detections.append(detection)
+
+    def top(self, limit: int = 20, order_by: str = "total_time_ms") -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [dict(fingerprint=fp, **stats.to_dict()) for fp, stats in self._stats.items()]
+        return sorted(items, key=lambda item: item.get(order_by, 0), reverse=True)[:limit]
+
+    def detections(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._detections)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._detections.clear()
+
+
+query_stats = QueryStatsRegistry()
+
+
+# ------------------------------------------------------------------
+# Seguimiento por request
+# ------------------------------------------------------------------
+
+class QueryBudgetExceeded(AssertionError):
+    """Se superó el presupuesto de consultas de un bloque"""
+    pass
+
+
+class RequestQueryTracker:
+    """Consultas emitidas dentro de una request (o de un bloque de test)"""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.total = 0
+        self.total_time = 0.0
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.statements: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, fingerprint: str, statement: str, duration: float):
+        with self._lock:
+            self.total += 1
+            self.total_time += duration
+            self.counts[fingerprint] += 1
+            self.statements.setdefault(fingerprint, statement)
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Fingerprints ejecutados más de `threshold` veces (patrón N+1)"""
+        return {fp: count for fp, count in self.counts.items() if count > threshold}
+
+    def check_n_plus_one(self, threshold: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Registra y devuelve los fingerprints sospechosos de N+1"""
+        threshold = threshold or settings.db_n_plus_one_threshold
+        detections = []
+        for fingerprint, count in self.repeated(threshold).items():
+            detection = {
+                "request": self.label,
+                "fingerprint": fingerprint,
+                "sql": normalize_sql(self.statements[fingerprint]),
+                "count": count,
+                "threshold": threshold,
+                "detected_at": datetime.utcnow().isoformat(),
+            }
+            detections.append(detection)
+            query_stats.record_detection(detection)
+            metrics_registry.counter('db_n_plus_one_detected_total').increment()
+            logger.warning(
+                "Possible N+1 query pattern",
+                request=self.label,
+                fingerprint=fingerprint,
+                count=count,
+                sql=detection["sql"][:200],
+            )
+        return detections
+
+
+_current_tracker: ContextVar[Optional[RequestQueryTracker]] = ContextVar(
+    "request_query_tracker", default=None
+)
+
+
+def start_request_tracking(label: str = "") -> RequestQueryTracker:
+    """Activa el seguimiento de consultas para el contexto actual"""
+    tracker = RequestQueryTracker(label)
+    _current_tracker.set(tracker)
+    return tracker
+
+
+def get_current_tracker() -> Optional[RequestQueryTracker]:
+    return _current_tracker.get()
+
+
+@contextmanager
+def query_budget(max_queries: Optional[int] = None, max_per_fingerprint: Optional[int] = None):
+    """
+    Presupuesto de consultas para un bloque de código (uso en tests)
+
+        with query_budget(max_queries=3, max_per_fingerprint=1):
+            client.get("/products/")
+    """
+    tracker = RequestQueryTracker("query_budget")
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+    if max_queries is not None and tracker.total > max_queries:
+        raise QueryBudgetExceeded(
+            f"Se ejecutaron {tracker.total} consultas (máximo {max_queries})"
+        )
+    if max_per_fingerprint is not None:
+        repeated = tracker.repeated(max_per_fingerprint)
+        if repeated:
+            details = "; ".join(
+                f"{count}x {normalize_sql(tracker.statements[fp])[:120]}"
+                for fp, count in repeated.items()
+            )
+            raise QueryBudgetExceeded(
+                f"Consultas repetidas más de {max_per_fingerprint} veces: {details}"
+            )
+
+
+# ------------------------------------------------------------------
+# Hooks de SQLAlchemy
+# ------------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    fingerprint = fingerprint_sql(statement)
+    rows = max(getattr(cursor, "rowcount", 0) or 0, 0)
+
+    query_stats.record(fingerprint, statement, duration, rows)
+    metrics_registry.histogram('db_statement_duration_seconds').observe(duration)
+    metrics_registry.counter('db_statements_total').increment()
+
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.record(fingerprint, statement, duration)
+
+
+def install_query_instrumentation(engine: Engine):
+    """Registra los hooks before/after_cursor_execute en un engine (idempotente)"""
+    if not settings.db_query_instrumentation_enabled:
+        return
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -24,7 +24,7 @@ from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 from app.main import app
 from app.database import Base
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.models import User, Product, Sale
 from app.crud import create_user
 from app.schemas import UserCreate
@@ -72,6 +72,7 @@ def client(db_session):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     
     with TestClient(app) as test_client:
         yield test_client
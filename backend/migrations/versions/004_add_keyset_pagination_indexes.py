@@ -0,0 +1,32 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: 004
+Revises: 79a24bab3acc
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '79a24bab3acc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Índices compuestos (clave de ordenación, id) para la paginación por cursor"""
+    
+    op.create_index('idx_transaction_time_id', 'point_of_sale_transactions', ['transaction_time', 'id'])
+    op.create_index('idx_product_name_id', 'products', ['name', 'id'])
+    op.create_index('idx_loan_date_id', 'consignment_loans', ['loan_date', 'id'])
+
+
+def downgrade():
+    """Elimina los índices agregados en upgrade()"""
+    
+    op.drop_index('idx_loan_date_id', table_name='consignment_loans')
+    op.drop_index('idx_product_name_id', table_name='products')
+    op.drop_index('idx_transaction_time_id', table_name='point_of_sale_transactions')
@@ -0,0 +1,73 @@
+"""add_inventory_ledger
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+MOVEMENT_TYPES = (
+    'opening_balance', 'sale', 'consignment_loan',
+    'consignment_return', 'adjustment', 'reconciliation'
+)
+
+
+def upgrade():
+    """Ledger de movimientos de inventario, saldos por producto y checkpoints"""
+    
+    op.create_table(
+        'inventory_movements',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('movement_type', sa.Enum(*MOVEMENT_TYPES, name='inventorymovementtype'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('reference', sa.String(64), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_inventory_movements_reference', 'inventory_movements', ['reference'])
+    op.create_index('ix_inventory_movements_created_at', 'inventory_movements', ['created_at'])
+    op.create_index('idx_movement_product_time', 'inventory_movements', ['product_id', 'created_at'])
+    
+    op.create_table(
+        'product_stock_balances',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_product_stock_balances_as_of', 'product_stock_balances', ['as_of'])
+    
+    op.create_table(
+        'stock_checkpoints',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+    )
+    op.create_index('idx_checkpoint_asof_product', 'stock_checkpoints', ['as_of', 'product_id'], unique=True)
+    
+    # Saldo inicial del ledger: el stock actual de cada producto
+    op.execute("""
+    INSERT INTO inventory_movements (product_id, movement_type, quantity, reference, created_at)
+    SELECT id, 'opening_balance', stock_quantity, 'ledger:opening', CURRENT_TIMESTAMP
+    FROM products
+    WHERE stock_quantity <> 0
+    """)
+
+
+def downgrade():
+    """Elimina las tablas agregadas en upgrade()"""
+    
+    op.drop_table('stock_checkpoints')
+    op.drop_table('product_stock_balances')
+    op.drop_table('inventory_movements')
+    sa.Enum(name='inventorymovementtype').drop(op.get_bind(), checkfirst=True)
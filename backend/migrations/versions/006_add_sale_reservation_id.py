@@ -0,0 +1,31 @@
+"""add_sale_reservation_id
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Identificador de la reserva de stock en Redis que originó cada venta"""
+    
+    op.add_column('point_of_sale_transactions', sa.Column('reservation_id', sa.String(32), nullable=True))
+    op.create_index('idx_transaction_reservation_id', 'point_of_sale_transactions',
+                    ['reservation_id'], unique=True)
+
+
+def downgrade():
+    """Elimina la columna agregada en upgrade()"""
+    
+    op.drop_index('idx_transaction_reservation_id', table_name='point_of_sale_transactions')
+    op.drop_column('point_of_sale_transactions', 'reservation_id')
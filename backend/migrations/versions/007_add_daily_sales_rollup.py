@@ -0,0 +1,47 @@
+"""add_daily_sales_rollup
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Agregado diario de ventas por usuario, inicializado con el histórico"""
+    
+    op.create_table(
+        'daily_sales_rollup',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('transactions', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Numeric(12, 2), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+    )
+    
+    op.execute("""
+    INSERT INTO daily_sales_rollup (day, user_id, transactions, revenue, units)
+    SELECT date(t.transaction_time), t.user_id, COUNT(*), SUM(t.total_amount), COALESCE(SUM(u.units), 0)
+    FROM point_of_sale_transactions t
+    LEFT JOIN (
+        SELECT transaction_id, SUM(quantity_sold) AS units
+        FROM point_of_sale_items
+        GROUP BY transaction_id
+    ) u ON u.transaction_id = t.id
+    GROUP BY date(t.transaction_time), t.user_id
+    """)
+
+
+def downgrade():
+    """Elimina la tabla agregada en upgrade()"""
+    
+    op.drop_table('daily_sales_rollup')
@@ -0,0 +1,31 @@
+"""add_rollup_updated_at
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Hora de la última venta sumada a cada día del rollup (ventas tardías para la exportación analítica)"""
+    
+    # Las filas existentes quedan a NULL: ya están en el dataset exportado
+    op.add_column('daily_sales_rollup', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_daily_sales_rollup_updated_at', 'daily_sales_rollup', ['updated_at'])
+
+
+def downgrade():
+    """Elimina la columna agregada en upgrade()"""
+    
+    op.drop_index('ix_daily_sales_rollup_updated_at', table_name='daily_sales_rollup')
+    op.drop_column('daily_sales_rollup', 'updated_at')
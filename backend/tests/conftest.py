@@ -12,7 +12,7 @@ from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.database import Base, get_db
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.models import UserRole
 from app.schemas import UserCreate
 from app.crud import create_user
@@ -87,6 +87,7 @@ def client(db_session: Session):
             pass  # La sesión se cierra en el fixture db_session
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     try:
         with TestClient(app) as test_client:
             yield test_client
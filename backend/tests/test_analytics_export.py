@@ -0,0 +1,138 @@
+"""
+Tests para la exportación incremental a Parquet de las líneas de venta
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import insert
+
+from app import models
+from app.config import settings
+from app.database import Base, get_db_session_maker
+from app.services import analytics_export, sales_rollup
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_analytics_export.db"
+
+
+@pytest.fixture(name="db")
+def db_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed(db, start, days, sales_per_day):
+    user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+    product = models.Product(sku="PQ-1", name="Protector", cost_price=Decimal("1.00"),
+                             selling_price=Decimal("3.25"), stock_quantity=100)
+    db.add_all([user, product])
+    db.commit()
+    times = [
+        datetime.combine(start + timedelta(days=d), datetime.min.time()) + timedelta(hours=9, minutes=i)
+        for d in range(days) for i in range(sales_per_day)
+    ]
+    db.execute(insert(models.PointOfSaleTransaction), [
+        {"id": i + 1, "user_id": user.id, "total_amount": Decimal("6.50"), "transaction_time": t}
+        for i, t in enumerate(times)
+    ])
+    db.execute(insert(models.PointOfSaleItem), [
+        {"transaction_id": i + 1, "product_id": product.id, "quantity_sold": 2,
+         "price_at_time_of_sale": Decimal("3.25")}
+        for i in range(len(times))
+    ])
+    db.commit()
+
+
+class TestAnalyticsExport:
+    def test_incremental_runs_append_monthly_partitions(self, db, tmp_path):
+        _seed(db, date(2026, 1, 30), 4, 3)  # 30/01 a 02/02
+
+        first = analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 1, 31))
+        second = analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 2, 2))
+        noop = analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 2, 2))
+
+        assert [part["path"] for part in first["files"]] == ["month=2026-01/part-20260130-20260131.parquet"]
+        assert [part["path"] for part in second["files"]] == ["month=2026-02/part-20260201-20260202.parquet"]
+        assert noop["files"] == [] and noop["last_exported_day"] == "2026-02-02"
+
+        manifest = analytics_export.read_manifest(str(tmp_path))
+        assert manifest["total_rows"] == 12
+        assert {name: p["rows"] for name, p in manifest["partitions"].items()} == {
+            "month=2026-01": 6, "month=2026-02": 6
+        }
+
+        table = pq.read_table(tmp_path / "sales_items" / "month=2026-02" / "part-20260201-20260202.parquet")
+        assert table.schema == analytics_export.arrow_schema()
+        assert table.column("day").to_pylist()[0] == date(2026, 2, 1)
+        assert set(table.column("line_total").to_pylist()) == {Decimal("6.50")}
+
+    def test_late_sales_rewrite_already_exported_days(self, db, tmp_path, monkeypatch):
+        _seed(db, date(2026, 3, 1), 2, 2)
+        analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 3, 2))
+        user_id = db.query(models.User.id).scalar()
+        product_id = db.query(models.Product.id).scalar()
+
+        # Lote de una caja sin conexión que llega después con su hora de caja
+        for transaction_id, time in ((100, datetime(2026, 3, 1, 18, 0)), (101, datetime(2026, 2, 27, 12, 0))):
+            db.execute(insert(models.PointOfSaleTransaction), [
+                {"id": transaction_id, "user_id": user_id, "total_amount": Decimal("3.25"), "transaction_time": time}
+            ])
+            db.execute(insert(models.PointOfSaleItem), [
+                {"transaction_id": transaction_id, "product_id": product_id, "quantity_sold": 1,
+                 "price_at_time_of_sale": Decimal("3.25")}
+            ])
+            sales_rollup.rollup_sales(db, [(user_id, time, Decimal("3.25"), 1)])
+        db.commit()
+
+        result = analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 3, 2))
+
+        assert result["files"] == []
+        assert [part["path"] for part in result["rewritten"]] == [
+            "month=2026-03/part-20260301-20260302.parquet", "month=2026-02/part-20260227-20260227.parquet"
+        ]
+        manifest = analytics_export.read_manifest(str(tmp_path))
+        assert manifest["total_rows"] == 6
+        assert {name: p["rows"] for name, p in manifest["partitions"].items()} == {
+            "month=2026-03": 5, "month=2026-02": 1
+        }
+        table = pq.read_table(tmp_path / "sales_items" / "month=2026-03" / "part-20260301-20260302.parquet")
+        assert table.num_rows == 5
+        # Sin ventas nuevas (y sin margen de solape) no se reescribe nada
+        monkeypatch.setattr(settings, "analytics_export_late_margin", 0)
+        assert analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 3, 2))["rewritten"] == []
+
+    def test_full_rebuild_replaces_dataset(self, db, tmp_path):
+        _seed(db, date(2026, 3, 1), 2, 2)
+        analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 3, 1))
+
+        result = analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 3, 2), full=True)
+
+        assert result["rows"] == 4
+        manifest = analytics_export.read_manifest(str(tmp_path))
+        assert [f["path"] for f in manifest["partitions"]["month=2026-03"]["files"]] == [
+            "month=2026-03/part-20260301-20260302.parquet"
+        ]
+        assert sorted(p.name for p in tmp_path.iterdir()) == [".sales_items.lock", "sales_items"]
+
+    def test_failed_full_rebuild_keeps_current_dataset(self, db, tmp_path, monkeypatch):
+        _seed(db, date(2026, 3, 1), 2, 2)
+        analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 3, 1))
+        before = analytics_export.read_manifest(str(tmp_path))
+
+        def fail(*args):
+            raise RuntimeError("disco lleno")
+
+        monkeypatch.setattr(analytics_export, "_write_month", fail)
+        with pytest.raises(RuntimeError):
+            analytics_export.export_incremental(db, str(tmp_path), until=date(2026, 3, 2), full=True)
+
+        assert analytics_export.read_manifest(str(tmp_path)) == before
+        assert (tmp_path / "sales_items" / "month=2026-03" / "part-20260301-20260301.parquet").exists()
@@ -3,7 +3,7 @@ from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from app.main import app
 from app.database import Base, get_db_session_maker
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.crud import create_user
 from app.schemas import UserCreate
 from app.models import UserRole
@@ -36,6 +36,7 @@ def client_fixture(db_session: Session):
             db_session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     with TestClient(app) as client:
         yield client
     app.dependency_overrides.clear()
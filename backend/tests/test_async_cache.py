@@ -0,0 +1,95 @@
+"""
+Tests para la API asíncrona de CacheManager (redis.asyncio) y @async_cached
+"""
+import asyncio
+
+import pytest
+import redis.asyncio as aioredis
+
+from app.cache import async_cached, cache_manager
+
+
+def _redis_available():
+    try:
+        return cache_manager.get_sync_client().ping()
+    except Exception:
+        return False
+
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@pytest.fixture(name="backend")
+def backend_fixture(monkeypatch):
+    """fakeredis (clientes sync y async sobre el mismo servidor) o un redis-server local"""
+    if fakeredis is not None:
+        server = fakeredis.FakeServer()
+        sync_client = fakeredis.FakeRedis(server=server)
+        monkeypatch.setattr(cache_manager, "get_sync_client", lambda: sync_client)
+
+        class FakeAsyncRedis(fakeredis.aioredis.FakeRedis):
+            # fakeredis no implementa INFO
+            async def info(self):
+                return {"keyspace_hits": 3, "keyspace_misses": 1}
+
+        async def get_async_client():
+            return FakeAsyncRedis(server=server)
+
+        monkeypatch.setattr(cache_manager, "get_async_client", get_async_client)
+    elif not _redis_available():
+        pytest.skip("Requiere fakeredis o un servidor Redis")
+    yield
+    if fakeredis is None:
+        cache_manager.delete_pattern("cache:async_test*")
+        cache_manager.delete_pattern("cache:gen:async_test*")
+
+
+def test_async_client_is_a_pooled_asyncio_client_per_loop():
+    async def client():
+        return await cache_manager.get_async_client()
+
+    first = asyncio.run(client())
+    second = asyncio.run(client())
+    assert isinstance(first, aioredis.Redis)
+    assert first.connection_pool.max_connections == cache_manager.async_max_connections
+    assert second is not first
+
+
+def test_async_operations_round_trip(backend):
+    async def scenario():
+        assert await cache_manager.aset("cache:async_test:a", {"stock": 3}, 60)
+        assert await cache_manager.aset("cache:async_test:b", [1, 2])
+        assert await cache_manager.aget("cache:async_test:a") == {"stock": 3}
+        assert await cache_manager.aexists("cache:async_test:b")
+        assert await cache_manager.adelete_pattern("cache:async_test:*", batch_size=1) == 2
+        assert not await cache_manager.aexists("cache:async_test:a")
+        stats = await cache_manager.aget_stats()
+        assert "hit_rate" in stats
+        if fakeredis is not None:
+            assert stats["hit_rate"] == 75.0
+
+    asyncio.run(scenario())
+
+
+def test_async_cached_coalesces_and_follows_generations(backend):
+    calls = []
+
+    @async_cached(expire=60, key_prefix="async_test")
+    async def sales_summary(day, db=None):
+        calls.append(day)
+        await asyncio.sleep(0.05)
+        return {"day": day, "total": len(calls)}
+
+    async def burst():
+        return await asyncio.gather(*(sales_summary("2026-10-01") for _ in range(10)))
+
+    results = asyncio.run(burst())
+    assert calls == ["2026-10-01"]
+    assert all(result == {"day": "2026-10-01", "total": 1} for result in results)
+
+    assert asyncio.run(sales_summary("2026-10-01")) == {"day": "2026-10-01", "total": 1}
+    cache_manager.bump_generation("async_test")
+    assert asyncio.run(sales_summary("2026-10-01")) == {"day": "2026-10-01", "total": 2}
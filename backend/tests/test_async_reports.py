@@ -0,0 +1,168 @@
+"""
+Tests para la ruta asíncrona de reportes (AsyncSession)
+Incluye un benchmark de concurrencia: sesión síncrona dentro de async def vs AsyncSession
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.services import sales_rollup
+from app.database import (
+    Base, get_db_session_maker, get_async_db_session_maker, to_async_database_url, dispose_async_engines
+)
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_async_reports.db"
+
+
+@pytest.fixture(name="db_session", scope="module")
+def db_session_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        _seed_sales(db)
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed_sales(db: Session, days: int = 30, sales_per_day: int = 20):
+    user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+    db.add(user)
+    products = [
+        models.Product(
+            sku=f"ASYNC{i:03d}", name=f"Producto {i}", cost_price=Decimal("5.00"),
+            selling_price=Decimal("10.00"), stock_quantity=i
+        )
+        for i in range(10)
+    ]
+    db.add_all(products)
+    db.flush()
+
+    now = datetime.utcnow()
+    for day in range(days):
+        for n in range(sales_per_day):
+            product = products[n % len(products)]
+            sale = models.PointOfSaleTransaction(
+                user_id=user.id,
+                total_amount=Decimal("20.00"),
+                transaction_time=now - timedelta(days=day, minutes=n)
+            )
+            sale.items.append(models.PointOfSaleItem(
+                product_id=product.id, quantity_sold=2, price_at_time_of_sale=Decimal("10.00")
+            ))
+            db.add(sale)
+    db.commit()
+    sales_rollup.backfill(db)
+    db.commit()
+
+
+def _run(coro):
+    """Ejecuta en un loop nuevo y cierra el pool asíncrono antes de salir de él"""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await dispose_async_engines()
+    return asyncio.run(runner())
+
+
+async def _with_async_session(func, *args):
+    AsyncSessionLocal, _ = get_async_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    async with AsyncSessionLocal() as db:
+        return await func(db, *args)
+
+
+class TestAsyncDatabaseUrl:
+    """Conversión de URLs al driver asíncrono"""
+
+    @pytest.mark.parametrize("url,expected", [
+        ("postgresql://u:p@db:5432/app", "postgresql+asyncpg://u:p@db:5432/app"),
+        ("postgres://u:p@db/app", "postgresql+asyncpg://u:p@db/app"),
+        ("sqlite:///./app.db", "sqlite+aiosqlite:///./app.db"),
+        ("postgresql+asyncpg://u:p@db/app", "postgresql+asyncpg://u:p@db/app"),
+    ])
+    def test_to_async_database_url(self, url, expected):
+        assert to_async_database_url(url) == expected
+
+
+class TestAsyncCrudParity:
+    """Las versiones asíncronas devuelven lo mismo que las síncronas"""
+
+    def test_sales_summary(self, db_session: Session):
+        start, end = datetime.utcnow() - timedelta(days=7), datetime.utcnow()
+        sync_rows = crud.get_sales_summary_by_date_range(db_session, start, end)
+        async_rows = _run(_with_async_session(crud.get_sales_summary_by_date_range_async, start, end))
+
+        assert [tuple(r) for r in async_rows] == [tuple(r) for r in sync_rows]
+        assert len(sync_rows) > 0
+
+    def test_top_selling_products(self, db_session: Session):
+        sync_rows = crud.get_top_selling_products(db_session, 5)
+        async_rows = _run(_with_async_session(crud.get_top_selling_products_async, 5))
+
+        assert [(r[0].id, r[1], r[2]) for r in async_rows] == [(r[0].id, r[1], r[2]) for r in sync_rows]
+
+    def test_low_stock_and_overdue_loans(self, db_session: Session):
+        sync_low = crud.get_products_with_low_stock(db_session, 3)
+        async_low = _run(_with_async_session(crud.get_products_with_low_stock_async, 3))
+        async_overdue = _run(_with_async_session(crud.get_overdue_loans_async))
+
+        assert [p.id for p in async_low] == [p.id for p in sync_low]
+        assert async_overdue == []
+
+
+@pytest.mark.slow
+def test_benchmark_concurrent_report_throughput(db_session: Session):
+    """
+    Benchmark: N reportes concurrentes en un mismo event loop.
+    Antes: async def + Session síncrona (bloquea el loop).
+    Después: AsyncSession (el loop sigue atendiendo otras tareas).
+    """
+    concurrency = 50
+    start, end = datetime.utcnow() - timedelta(days=30), datetime.utcnow()
+    SessionLocal, _ = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+
+    async def blocking_report():
+        db = SessionLocal()
+        try:
+            return crud.get_sales_summary_by_date_range(db, start, end)
+        finally:
+            db.close()
+
+    async def async_report():
+        return await _with_async_session(crud.get_sales_summary_by_date_range_async, start, end)
+
+    async def measure(report):
+        max_lag = 0.0
+        done = False
+
+        async def heartbeat():
+            nonlocal max_lag
+            while not done:
+                tick = time.perf_counter()
+                await asyncio.sleep(0.001)
+                max_lag = max(max_lag, time.perf_counter() - tick - 0.001)
+
+        monitor = asyncio.create_task(heartbeat())
+        began = time.perf_counter()
+        await asyncio.gather(*(report() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - began
+        done = True
+        await monitor
+        return concurrency / elapsed, max_lag
+
+    before_rps, before_lag = _run(measure(blocking_report))
+    after_rps, after_lag = _run(measure(async_report))
+
+    print(
+        f"\nreportes/s sync-en-async: {before_rps:.1f} (lag máx. loop {before_lag * 1000:.1f} ms)"
+        f"\nreportes/s AsyncSession:  {after_rps:.1f} (lag máx. loop {after_lag * 1000:.1f} ms)"
+    )
+    assert before_rps > 0 and after_rps > 0
@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from app.main import app
 from app.database import Base, get_db_session_maker
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.crud import create_user, get_user_by_username
 from app.schemas import UserCreate
 from app.models import UserRole
@@ -70,6 +70,7 @@ def client_fixture(db_session: Session):
             db_session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     with TestClient(app) as client:
         yield client
     app.dependency_overrides.clear()
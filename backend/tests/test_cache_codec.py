@@ -0,0 +1,165 @@
+"""
+Tests para el codec de valores de caché (msgpack + compresión por umbral)
+"""
+import gzip
+import json
+import pickle
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import inspect
+
+from app import models, schemas
+from app.cache_codec import (
+    COMPRESSION_NONE,
+    LEGACY_GZIP_PICKLE,
+    LEGACY_PICKLE,
+    VERSION,
+    CacheCodec,
+    CodecError,
+)
+from app.single_flight import SingleFlight
+
+
+def _product(i):
+    return models.Product(
+        id=i, sku=f"SKU-{i:05d}", name=f"Funda silicona modelo {i}",
+        description="Funda de silicona con bordes reforzados", image_url=None,
+        cost_price=Decimal("3.50"), selling_price=Decimal("9.90"), stock_quantity=i % 40,
+    )
+
+
+def _schema_list(count):
+    products = [schemas.Product.model_validate(_product(i)) for i in range(1, count + 1)]
+    return schemas.ProductList(products=products, total=count, skip=0, limit=count, has_next=False)
+
+
+@pytest.fixture(name="codec")
+def codec_fixture():
+    return CacheCodec(compression="zstd", compress_threshold=1024)
+
+
+def test_orm_models_round_trip_as_detached_instances_without_state(codec):
+    products = [_product(i) for i in range(1, 4)]
+    data = codec.encode({"products": products, "at": datetime(2026, 10, 1, 12, 30)})
+
+    decoded = codec.decode(data)
+    assert data[0] == VERSION and data[1] == COMPRESSION_NONE
+    assert b"_sa_instance_state" not in data
+    assert decoded["at"] == datetime(2026, 10, 1, 12, 30)
+    first = decoded["products"][0]
+    assert isinstance(first, models.Product) and inspect(first).detached
+    assert (first.id, first.sku, first.cost_price, first.stock_quantity) == (1, "SKU-00001", Decimal("3.50"), 1)
+
+
+def test_schemas_round_trip_and_large_values_are_compressed(codec):
+    product_list = _schema_list(50)
+    data = codec.encode(product_list)
+
+    assert data[1] != COMPRESSION_NONE
+    decoded = codec.decode(data)
+    assert isinstance(decoded, schemas.ProductList)
+    assert decoded == product_list
+    assert len(codec.encode(product_list, compress=False)) > len(data)
+
+
+def test_reads_previous_formats_and_rejects_unknown_versions(codec):
+    assert codec.decode(json.dumps({"total": 3}).encode()) == {"total": 3}
+    assert codec.decode(pickle.dumps({"ids": {1, 2}})) == {"ids": {1, 2}}
+    assert codec.decode(gzip.compress(pickle.dumps([1, 2]))) == [1, 2]
+    with pytest.raises(CodecError):
+        codec.decode(bytes((VERSION + 1, COMPRESSION_NONE)) + b"\x90")
+
+    legacy = CacheCodec(write_version=0)
+    assert legacy.encode({"total": 3}) == json.dumps({"total": 3}).encode()
+
+
+def test_rollout_mode_writes_each_callers_previous_format():
+    legacy = CacheCodec(write_version=0)
+    products = [_product(1)]
+
+    # IntelligentCache y AdvancedCache escribían pickle: los workers antiguos lo leen igual
+    old_readers = {
+        LEGACY_PICKLE: pickle.loads,
+        LEGACY_GZIP_PICKLE: lambda data: pickle.loads(gzip.decompress(data)),
+    }
+    for fmt, old_reader in old_readers.items():
+        data = legacy.encode({"products": products, "price": Decimal("1.50")}, legacy=fmt)
+        for decoded in (old_reader(data), legacy.decode(data)):
+            assert isinstance(decoded["products"][0], models.Product)
+            assert decoded["products"][0].sku == "SKU-00001"
+            assert decoded["price"] == Decimal("1.50")
+
+
+def test_changed_fields_and_unreadable_values_count_as_cache_misses(codec, monkeypatch):
+    data = codec.encode(_product(1))
+    monkeypatch.setattr(codec._types[models.Product], "fingerprint", 0)
+    monkeypatch.setattr(codec._tags[16], "fingerprint", 0)
+    with pytest.raises(CodecError):
+        codec.decode(data)
+
+    class OneKeyRedis:
+        def __init__(self):
+            self.data = {"cache:x": bytes((VERSION + 1, 0))}
+
+        def pipeline(self, transaction=True):
+            return self
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def pttl(self, key):
+            return -1
+
+        def execute(self):
+            return [self.data.get("cache:x"), -1]
+
+        def set(self, key, value, **kwargs):
+            self.data[key] = value
+            return True
+
+        def eval(self, *args):
+            return 1
+
+    client = OneKeyRedis()
+    flight = SingleFlight()
+    assert flight.fetch(lambda: client, "cache:x", lambda: [1], 60, codec.encode, codec.decode) == [1]
+    assert codec.decode(client.data["cache:x"]) == [1]
+
+
+@pytest.mark.slow
+def test_benchmark_product_list_encoding():
+    """Benchmark: pickle (formato anterior) frente al codec para una lista de 100 productos"""
+    rounds = 200
+    orm_list = [_product(i) for i in range(1, 101)]
+    schema_list = _schema_list(100)
+    codecs = {
+        "codec msgpack": CacheCodec(compression="none"),
+        "codec msgpack+zstd": CacheCodec(compression="zstd", compress_threshold=1024),
+        "codec msgpack+lz4": CacheCodec(compression="lz4", compress_threshold=1024),
+    }
+
+    def measure(encode, decode, value):
+        data = encode(value)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            encode(value)
+        encode_us = (time.perf_counter() - started) / rounds * 1e6
+        started = time.perf_counter()
+        for _ in range(rounds):
+            decode(data)
+        decode_us = (time.perf_counter() - started) / rounds * 1e6
+        return len(data), encode_us, decode_us
+
+    results = {}
+    for label, value in (("ORM", orm_list), ("esquema", schema_list)):
+        results[(label, "pickle")] = measure(pickle.dumps, pickle.loads, value)
+        for name, codec in codecs.items():
+            results[(label, name)] = measure(codec.encode, codec.decode, value)
+
+    for (label, name), (size, encode_us, decode_us) in results.items():
+        print(f"\n{label:>7} {name:<20} {size:>7} B  encode {encode_us:8.1f} µs  decode {decode_us:8.1f} µs")
+    assert results[("ORM", "codec msgpack+zstd")][0] < results[("ORM", "pickle")][0] / 2
+    assert results[("esquema", "codec msgpack+zstd")][0] < results[("esquema", "pickle")][0]
@@ -0,0 +1,160 @@
+"""
+Tests para la invalidación de caché por generaciones
+"""
+import fnmatch
+import time
+
+import pytest
+
+from app.cache import cache_manager, cached
+from app.services.intelligent_cache import ProductCacheManager
+
+
+class DictRedis:
+    """Sustituto mínimo del cliente Redis; KEYS falla para detectar recorridos bloqueantes"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key.encode() if isinstance(key, str) else key)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key.encode() in self.data:
+            return None
+        self.data[key.encode()] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def pttl(self, key):
+        return -1 if key.encode() in self.data else -2
+
+    def eval(self, script, numkeys, key, token):
+        if self.get(key) == token.encode():
+            return self.unlink(key)
+        return 0
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.set(key, value)
+        return value
+
+    def delete(self, *keys):
+        return self.unlink(*keys)
+
+    def unlink(self, *keys):
+        keys = [key.encode() if isinstance(key, str) else key for key in keys]
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def scan_iter(self, match="*", count=None):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key.decode(), match)]
+
+    def publish(self, channel, message):
+        return 0
+
+    def keys(self, pattern):
+        raise AssertionError("KEYS no debe usarse para invalidar")
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+        return Pipeline()
+
+
+@pytest.fixture(name="redis")
+def redis_fixture(monkeypatch):
+    client = DictRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+    return client
+
+
+def test_bump_invalidates_cached_results_and_reaper_removes_old_generation(redis):
+    calls = []
+
+    @cached(expire=60, key_prefix="distributors")
+    def list_distributors(page):
+        calls.append(page)
+        return [f"distribuidor-{page}"]
+
+    list_distributors(1)
+    list_distributors(1)
+    assert calls == [1]
+
+    cache_manager.bump_generation("distributors")
+    list_distributors(1)
+    assert calls == [1, 1]
+
+    assert cache_manager.reap_stale_generations() == 1
+    remaining = [key for key in redis.data if key.startswith(b"cache:distributors:")]
+    assert len(remaining) == 1 and remaining[0].startswith(b"cache:distributors:v1:")
+    list_distributors(1)
+    assert calls == [1, 1]
+
+
+def test_product_update_invalidates_lists_without_scanning_keys(redis):
+    ProductCacheManager.get_products_list(0, 20, fetch_function=lambda: ["p1", "p2"])
+    ProductCacheManager.get_search_results("Funda", 10, fetch_function=lambda: ["p1"])
+
+    ProductCacheManager.invalidate_product(1)
+
+    assert ProductCacheManager.get_products_list(0, 20, fetch_function=lambda: ["nuevo"]) == ["nuevo"]
+    assert ProductCacheManager.get_search_results("funda", 10, fetch_function=lambda: ["nuevo"]) == ["nuevo"]
+    assert cache_manager.generation("products") == 1 and cache_manager.generation("product") == 0
+
+
+def _redis_available():
+    try:
+        return cache_manager.get_sync_client().ping()
+    except Exception:
+        return False
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not _redis_available(), reason="Requiere un servidor Redis")
+def test_benchmark_invalidation_cost_vs_keyspace():
+    """Benchmark: borrado por patrón (SCAN + UNLINK) frente a un INCR de generación"""
+    client = cache_manager.get_sync_client()
+    namespace = "bench_generations"
+    results = []
+    try:
+        for size in (1_000, 10_000, 100_000):
+            cache_manager.delete_pattern(f"cache:{namespace}*")
+            prefix = cache_manager.versioned_key(namespace, "")
+            pipe = client.pipeline(transaction=False)
+            for i in range(size):
+                pipe.set(f"cache:{namespace}_pattern:{i}", b"x", ex=600)
+                pipe.set(f"{prefix}{i}", b"x", ex=600)
+            pipe.execute()
+
+            started = time.perf_counter()
+            cache_manager.delete_pattern(f"cache:{namespace}_pattern:*")
+            pattern_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            cache_manager.bump_generation(namespace)
+            bump_ms = (time.perf_counter() - started) * 1000
+            results.append((size, pattern_ms, bump_ms))
+
+            assert next(client.scan_iter(match=f"cache:{namespace}_pattern:*", count=1000), None) is None
+            assert cache_manager.versioned_key(namespace, "") != prefix
+    finally:
+        cache_manager.delete_pattern(f"cache:{namespace}*")
+        client.delete(f"cache:gen:{namespace}")
+
+    for size, pattern_ms, bump_ms in results:
+        print(f"\n{size:>7} claves: patrón {pattern_ms:.1f} ms, generación {bump_ms:.2f} ms")
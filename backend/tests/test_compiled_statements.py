@@ -0,0 +1,89 @@
+"""
+Tests para las sentencias precompiladas de las rutas calientes
+Incluye un micro-benchmark del coste por llamada frente a db.query(...)
+"""
+import time
+from decimal import Decimal
+
+import pytest
+
+from app import crud, models
+from app.database import Base, get_db_session_maker
+from app.exceptions import NotFoundError
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_compiled_statements.db"
+
+
+@pytest.fixture(name="db_session", scope="module")
+def db_session_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        db.add(models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff))
+        db.add(models.Distributor(name="Distribuidor", access_code="ACC-001"))
+        db.add_all([
+            models.Product(
+                sku=f"HOT{i:03d}", name=f"Producto {i}", cost_price=Decimal("5.00"),
+                selling_price=Decimal("10.00"), stock_quantity=i
+            )
+            for i in range(100)
+        ])
+        db.commit()
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+class TestCompiledLookups:
+    """Las búsquedas precompiladas mantienen el comportamiento anterior"""
+
+    def test_get_product(self, db_session):
+        product = db_session.query(models.Product).filter(models.Product.sku == "HOT007").one()
+        assert crud.get_product(db_session, product.id) is product
+        with pytest.raises(NotFoundError):
+            crud.get_product(db_session, 999999)
+
+    def test_get_user_and_distributor(self, db_session):
+        assert crud.get_user_by_username(db_session, "cajero").email == "cajero@test.com"
+        assert crud.get_distributor_by_access_code(db_session, "ACC-001").name == "Distribuidor"
+        with pytest.raises(NotFoundError):
+            crud.get_user_by_username(db_session, "nadie")
+
+    def test_sku_exists(self, db_session):
+        product = db_session.query(models.Product).filter(models.Product.sku == "HOT001").one()
+        assert crud.sku_exists(db_session, "HOT001")
+        assert not crud.sku_exists(db_session, "HOT001", exclude_product_id=product.id)
+        assert not crud.sku_exists(db_session, "NOPE")
+
+
+@pytest.mark.slow
+def test_benchmark_per_call_overhead(db_session):
+    """
+    Benchmark: coste por llamada de get_product.
+    Antes: db.query(Product).filter(Product.id == id).first() reconstruido en cada llamada.
+    Después: select() precompilado con bindparam.
+    """
+    iterations = 3000
+    ids = [p.id for p in db_session.query(models.Product.id)]
+
+    def before(product_id):
+        return db_session.query(models.Product).filter(models.Product.id == product_id).first()
+
+    def after(product_id):
+        return crud.get_product(db_session, product_id)
+
+    def measure(lookup):
+        lookup(ids[0])  # calentar la caché de compilación
+        began = time.perf_counter()
+        for n in range(iterations):
+            lookup(ids[n % len(ids)])
+        return (time.perf_counter() - began) / iterations * 1_000_000
+
+    before_us = measure(before)
+    after_us = measure(after)
+
+    print(f"\nget_product db.query: {before_us:.1f} µs/llamada\nget_product precompilado: {after_us:.1f} µs/llamada")
+    # Solo se comprueba el resultado: los tiempos dependen de la carga de la máquina
+    assert [after(pid).id for pid in ids] == [before(pid).id for pid in ids]
@@ -0,0 +1,129 @@
+"""
+Tests para el proveedor de conteos (exact / cached / estimate)
+"""
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from app import crud, models, schemas
+from app.cache import cache_manager
+from app.database import Base, get_db_session_maker
+from app.services.count_provider import product_count
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_count_provider.db"
+
+
+class DictRedis:
+    """Sustituto mínimo del cliente Redis para los comandos que usa el contador"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value)
+
+    def eval(self, script, numkeys, key, delta):
+        # ADJUST_SCRIPT: INCRBY solo si la clave existe
+        if key not in self.data:
+            return None
+        # Como Redis: error si el valor no es un entero
+        try:
+            value = int(self.data.get(key, b"0"))
+        except ValueError:
+            raise AssertionError(f"INCRBY sobre un valor no entero: {self.data[key]!r}")
+        self.data[key] = str(value + delta).encode()
+        return value + delta
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+
+@pytest.fixture(name="db_session")
+def db_session_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        db.add_all([
+            models.Product(
+                sku=f"CNT{i:03d}", name=f"Producto {i}", cost_price=Decimal("5.00"),
+                selling_price=Decimal("10.00"), stock_quantity=i
+            )
+            for i in range(12)
+        ])
+        db.commit()
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+@pytest.fixture(name="fake_redis")
+def fake_redis_fixture(monkeypatch):
+    client = DictRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+    return client
+
+
+def test_exact_count(db_session):
+    assert crud.get_products_count(db_session) == 12
+
+
+def test_cached_count_follows_create_and_delete(db_session, fake_redis):
+    assert crud.get_products_count(db_session, mode="cached") == 12
+    assert product_count.cache_key in fake_redis.data
+
+    product = crud.create_product(db_session, schemas.ProductCreate(
+        sku="CNT-NEW", name="Producto nuevo", cost_price=Decimal("1.00"),
+        selling_price=Decimal("2.00"), stock_quantity=1
+    ))
+    # El alta incrementa la clave existente en vez de borrarla y recontar
+    assert fake_redis.data[product_count.cache_key] == b"13"
+    assert crud.get_products_count(db_session, mode="cached") == 13
+
+    crud.delete_product(db_session, product.id)
+    assert fake_redis.data[product_count.cache_key] == b"12"
+    assert crud.get_products_count(db_session, mode="cached") == 12
+
+
+def test_estimate_uses_sqlite_stat1(db_session):
+    # Sin ANALYZE no hay estadísticas y se usa el conteo exacto
+    assert crud.get_products_count(db_session, mode="estimate") == 12
+
+    db_session.execute(text("ANALYZE"))
+    db_session.add(models.Product(
+        sku="CNT-POST", name="Tras ANALYZE", cost_price=Decimal("1.00"),
+        selling_price=Decimal("2.00"), stock_quantity=0
+    ))
+    db_session.commit()
+
+    # La estimación refleja el último ANALYZE, no la fila añadida después
+    assert crud.get_products_count(db_session, mode="estimate") == 12
+    assert crud.get_products_count(db_session, mode="exact") == 13
+
+
+def test_adjust_increments_the_stored_counter_in_redis(db_session, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+
+    assert product_count.cached_count(db_session) == 12
+    product_count.adjust(+1)
+
+    assert client.get(product_count.cache_key) == b"13"
+    assert 0 < client.ttl(product_count.cache_key) <= product_count.cache_ttl
+    assert product_count.cached_count(db_session) == 13
+
+    # Clave caducada: el ajuste no la recrea sin TTL
+    client.delete(product_count.cache_key)
+    product_count.adjust(-1)
+    assert client.get(product_count.cache_key) is None
+    assert product_count.cached_count(db_session) == 12
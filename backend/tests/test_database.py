@@ -0,0 +1,66 @@
+"""
+Tests para el registro de engines y el pool de conexiones compartido
+"""
+import pytest
+from sqlalchemy import text
+
+from app.database import (
+    get_db_session_maker, get_engine, get_pool_stats, calculate_pool_sizing
+)
+from app.config import settings
+from app.metrics import metrics_registry
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_database_registry.db"
+
+
+class TestEngineRegistry:
+    """Tests para el registro de engines por proceso"""
+
+    def test_same_url_returns_same_engine(self):
+        """La misma URL reutiliza engine y sessionmaker"""
+        first = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+        second = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+
+        assert first is second
+        assert get_engine(SQLALCHEMY_DATABASE_URL) is first[1]
+
+    def test_sessions_share_pool(self):
+        """Sesiones sucesivas reutilizan conexiones del mismo pool"""
+        SessionLocal, engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+        checkouts = metrics_registry.counter('db_pool_checkouts_total')
+        opened = metrics_registry.counter('db_pool_connections_opened_total')
+        before_checkouts, before_opened = checkouts.value, opened.value
+
+        for _ in range(5):
+            db = SessionLocal()
+            try:
+                db.execute(text("SELECT 1"))
+            finally:
+                db.close()
+
+        assert checkouts.value - before_checkouts == 5
+        assert opened.value - before_opened <= 1
+        assert "test_database_registry.db" in "".join(get_pool_stats().keys())
+
+
+class TestPoolSizing:
+    """Tests para el dimensionamiento del pool según workers"""
+
+    @pytest.mark.parametrize("workers", [1, 2, 4, 8])
+    def test_budget_is_split_between_workers(self, monkeypatch, workers):
+        """El total de conexiones de todos los workers no excede el presupuesto"""
+        monkeypatch.setattr(settings, "db_pool_size", None)
+        monkeypatch.setattr(settings, "db_max_overflow", None)
+        monkeypatch.setattr(settings, "db_max_connections", 60)
+
+        pool_size, max_overflow = calculate_pool_sizing(workers)
+
+        assert pool_size >= 1
+        assert (pool_size + max_overflow) * workers <= 60
+
+    def test_explicit_settings_take_precedence(self, monkeypatch):
+        """Valores explícitos de pool_size / max_overflow se respetan"""
+        monkeypatch.setattr(settings, "db_pool_size", 3)
+        monkeypatch.setattr(settings, "db_max_overflow", 1)
+
+        assert calculate_pool_sizing(4) == (3, 1)
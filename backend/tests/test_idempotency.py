@@ -0,0 +1,152 @@
+"""
+Tests para la cabecera Idempotency-Key de POST /pos/sales
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud
+from app.cache import cache_manager
+from app.dependencies import get_current_sales_staff_user, get_db
+from app.main import app
+from app.services.idempotency import (
+    COMPLETE_SCRIPT,
+    IDEMPOTENT_REPLAY_HEADER,
+    IdempotencyConflict,
+    IdempotencyStore,
+    request_fingerprint,
+)
+
+
+class DictRedis:
+    """Sustituto mínimo del cliente Redis para SET NX/GET y los scripts de complete/release"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, ex=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode() if isinstance(value, str) else value
+            return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def eval(self, script, numkeys, key, token, *args):
+        with self.lock:
+            raw = self.data.get(key)
+            if raw is None or json.loads(raw).get("token") != token:
+                return 0
+            if script == COMPLETE_SCRIPT:
+                self.data[key] = args[0].encode()
+            else:
+                del self.data[key]
+            return 1
+
+
+@pytest.fixture(name="fake_redis")
+def fake_redis_fixture(monkeypatch):
+    client = DictRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+    return client
+
+
+class TestIdempotencyStore:
+    def test_claim_complete_and_replay(self, fake_redis):
+        store = IdempotencyStore("test", wait_timeout=0.2)
+        fingerprint = request_fingerprint({"items": [1]})
+
+        claim = store.claim(1, "abc", fingerprint)
+        assert claim.token and not claim.replayed
+        store.complete(claim, fingerprint, {"id": 7})
+
+        replay = store.claim(1, "abc", fingerprint)
+        assert replay.replayed and replay.response == {"id": 7}
+        # Otro usuario con la misma clave no comparte resultado
+        assert not store.claim(2, "abc", fingerprint).replayed
+
+        with pytest.raises(IdempotencyConflict) as exc_info:
+            store.claim(1, "abc", request_fingerprint({"items": [2]}))
+        assert exc_info.value.reason == "payload_mismatch"
+
+    def test_release_allows_retry_and_timeout_reports_in_flight(self, fake_redis):
+        store = IdempotencyStore("test", wait_timeout=0.1)
+        claim = store.claim(1, "k", "fp")
+
+        with pytest.raises(IdempotencyConflict) as exc_info:
+            store.claim(1, "k", "fp")
+        assert exc_info.value.reason == "in_flight"
+
+        store.release(claim)
+        assert store.claim(1, "k", "fp").token
+
+    def test_concurrent_duplicate_waits_for_first(self, fake_redis):
+        store = IdempotencyStore("test", wait_timeout=2, poll_interval=0.01)
+        first = store.claim(1, "k", "fp")
+
+        def finish():
+            time.sleep(0.1)
+            store.complete(first, "fp", {"id": 1})
+
+        worker = threading.Thread(target=finish)
+        worker.start()
+        second = store.claim(1, "k", "fp")
+        worker.join()
+
+        assert second.replayed and second.response == {"id": 1}
+
+    def test_expired_claim_does_not_touch_the_new_owner(self, monkeypatch):
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeRedis()
+        monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+        store = IdempotencyStore("test", wait_timeout=0.1)
+
+        stale = store.claim(1, "k", "fp")
+        client.delete(stale.key)  # La reserva pendiente expira
+        owner = store.claim(1, "k", "fp")
+
+        store.complete(stale, "fp", {"id": 1})
+        store.release(stale)
+        assert json.loads(client.get(owner.key))["token"] == owner.token
+
+        store.complete(owner, "fp", {"id": 2})
+        store.release(owner)  # Ya terminada: no se borra
+        assert store.claim(1, "k", "fp").response == {"id": 2}
+
+
+def test_post_sale_replays_without_touching_database(fake_redis, monkeypatch):
+    calls = []
+
+    def fake_create_pos_sale(db, sale, user_id):
+        calls.append(sale)
+        return SimpleNamespace(id=len(calls), user_id=user_id, total_amount=10.0,
+                               transaction_time=datetime(2026, 1, 1, 10), items=[])
+
+    monkeypatch.setattr(crud, "create_pos_sale", fake_create_pos_sale)
+    app.dependency_overrides[get_db] = lambda: None
+    app.dependency_overrides[get_current_sales_staff_user] = lambda: SimpleNamespace(id=3)
+    try:
+        client = TestClient(app)
+        body = {"items": [{"product_id": 1, "quantity_sold": 1}]}
+        headers = {"Idempotency-Key": "register-1-sale-42"}
+
+        first = client.post("/pos/sales", json=body, headers=headers)
+        retry = client.post("/pos/sales", json=body, headers=headers)
+        other_payload = client.post("/pos/sales", json={"items": [{"product_id": 2, "quantity_sold": 1}]},
+                                    headers=headers)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert first.status_code == 200 and retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers.get(IDEMPOTENT_REPLAY_HEADER) == "true"
+    assert len(calls) == 1
+    assert other_payload.status_code == 422
@@ -0,0 +1,148 @@
+"""
+Tests para el ledger de movimientos de inventario y las consultas de stock a fecha
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func
+
+from app import crud, models, schemas
+from app.database import Base, get_db_session_maker
+from app.services import inventory_ledger
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_inventory_ledger.db"
+
+
+@pytest.fixture(name="db_session")
+def db_session_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _create_product(db, sku="LED001", stock=20):
+    return crud.create_product(db, schemas.ProductCreate(
+        sku=sku, name=f"Producto {sku}", cost_price=Decimal("5.00"),
+        selling_price=Decimal("10.00"), stock_quantity=stock
+    ))
+
+
+def _ledger_sum(db, product_id):
+    return db.query(func.sum(models.InventoryMovement.quantity))\
+        .filter(models.InventoryMovement.product_id == product_id).scalar()
+
+
+class TestStockPathsAppendMovements:
+    """Cada camino que cambia stock deja su movimiento en el ledger"""
+
+    def test_sale_loan_and_report(self, db_session):
+        product = _create_product(db_session)
+        user = models.User(username="cajero", email="c@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+        distributor = models.Distributor(name="Dist", access_code="LEDGER-1")
+        db_session.add_all([user, distributor])
+        db_session.commit()
+
+        sale = crud.create_pos_sale(db_session, schemas.PointOfSaleTransactionCreate(
+            items=[schemas.PointOfSaleItemCreate(product_id=product.id, quantity_sold=3)]
+        ), user.id)
+        loan = crud.create_consignment_loan(db_session, schemas.ConsignmentLoanCreate(
+            distributor_id=distributor.id, product_id=product.id, quantity_loaned=5,
+            loan_date=date.today(), return_due_date=date.today() + timedelta(days=7),
+            status=models.LoanStatus.en_prestamo
+        ))
+        crud.create_consignment_report(db_session, schemas.ConsignmentReportCreate(
+            loan_id=loan.id, quantity_sold=3, quantity_returned=2, report_date=date.today()
+        ))
+        crud.update_product(db_session, product.id, schemas.ProductUpdate(stock_quantity=30))
+
+        movements = db_session.query(models.InventoryMovement)\
+            .filter(models.InventoryMovement.product_id == product.id)\
+            .order_by(models.InventoryMovement.id).all()
+
+        assert [(m.movement_type.value, m.quantity) for m in movements] == [
+            ("opening_balance", 20), ("sale", -3), ("consignment_loan", -5),
+            ("consignment_return", 2), ("adjustment", 16),
+        ]
+        assert movements[1].reference == f"sale:{sale.id}"
+        assert _ledger_sum(db_session, product.id) == db_session.get(models.Product, product.id).stock_quantity == 30
+        assert inventory_ledger.ledger_drift(db_session) == {}
+
+
+class TestBalancesAndAsOf:
+    """Saldos incrementales, checkpoints y consultas a fecha"""
+
+    def _history(self, db, product_id, start):
+        # +10 el día 0, -2 cada día durante 4 días
+        inventory_ledger.record_movement(db, product_id, models.InventoryMovementType.opening_balance, 10, created_at=start)
+        for day in range(1, 5):
+            inventory_ledger.record_movement(
+                db, product_id, models.InventoryMovementType.sale, -2, created_at=start + timedelta(days=day)
+            )
+        db.commit()
+
+    def test_as_of_from_ledger_checkpoints_and_balance(self, db_session):
+        product = _create_product(db_session, stock=0)
+        start = datetime(2026, 1, 1, 10, 0)
+        self._history(db_session, product.id, start)
+
+        expected = {start + timedelta(days=d, hours=1): 10 - 2 * d for d in range(5)}
+        ledger_only = {at: inventory_ledger.get_stock_as_of(db_session, at, [product.id])[product.id] for at in expected}
+        assert ledger_only == expected
+
+        inventory_ledger.create_checkpoint(db_session, start + timedelta(days=2, hours=12))
+        db_session.commit()
+        inventory_ledger.fold_movements(db_session)
+        db_session.commit()
+
+        for at, quantity in expected.items():
+            assert inventory_ledger.get_stock_as_of(db_session, at, [product.id])[product.id] == quantity
+
+        balance = db_session.get(models.ProductStockBalance, product.id)
+        assert balance.quantity == 2
+
+    def test_fold_is_incremental(self, db_session):
+        product = _create_product(db_session, stock=0)
+        start = datetime(2026, 2, 1)
+        self._history(db_session, product.id, start)
+
+        first = inventory_ledger.fold_movements(db_session, start + timedelta(days=2, hours=1))
+        second = inventory_ledger.fold_movements(db_session, start + timedelta(days=10))
+
+        assert first["movements"] == 3
+        assert second["movements"] == 2
+        assert db_session.get(models.ProductStockBalance, product.id).quantity == 2
+
+    def test_rebuild_from_ledger(self, db_session):
+        product = _create_product(db_session, stock=0)
+        start = datetime(2026, 3, 1)
+        self._history(db_session, product.id, start)
+        inventory_ledger.fold_movements(db_session, start + timedelta(days=1, hours=1))
+        db_session.get(models.ProductStockBalance, product.id).quantity = 999  # saldo corrupto
+        db_session.commit()
+
+        result = inventory_ledger.rebuild_from_ledger(db_session)
+        db_session.commit()
+
+        assert result["checkpoints"] >= 4
+        assert db_session.get(models.ProductStockBalance, product.id).quantity == 2
+        assert inventory_ledger.get_stock_as_of(db_session, start + timedelta(days=2, hours=1))[product.id] == 6
+
+    def test_seed_opening_balances(self, db_session):
+        product = models.Product(
+            sku="LEGACY1", name="Anterior al ledger", cost_price=Decimal("1.00"),
+            selling_price=Decimal("2.00"), stock_quantity=7
+        )
+        db_session.add(product)
+        db_session.commit()
+        assert product.id in inventory_ledger.ledger_drift(db_session)
+
+        assert inventory_ledger.seed_opening_balances(db_session) == 1
+        db_session.commit()
+
+        assert inventory_ledger.ledger_drift(db_session) == {}
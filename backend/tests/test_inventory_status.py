@@ -0,0 +1,102 @@
+"""
+Tests para /reports/inventory-status: totales agregados en SQL y snapshot cacheado
+"""
+from decimal import Decimal
+
+import pytest
+
+from app import crud, models, schemas
+from app.cache import cache_manager
+from app.database import Base, get_db_session_maker
+from app.services import inventory_status
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_inventory_status.db"
+
+
+class DictRedis:
+    """Sustituto mínimo del cliente Redis para GET/SETEX/DELETE"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+
+@pytest.fixture(name="db_session")
+def db_session_fixture(monkeypatch):
+    client = DictRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        db.add(models.User(username="cajero", email="cajero@test.com", hashed_password="x",
+                           role=models.UserRole.sales_staff))
+        db.add_all([
+            models.Product(
+                sku=f"INV{i:03d}", name=f"Producto {i:03d}", cost_price=Decimal("2.50") + i,
+                selling_price=Decimal("6.00") + i, stock_quantity=i % 9
+            )
+            for i in range(40)
+        ])
+        db.commit()
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+class TestInventoryStatus:
+    def test_totals_match_python_sums(self, db_session):
+        products = db_session.query(models.Product).all()
+        totals = inventory_status.compute_totals(db_session)
+
+        assert totals["total_products"] == 40
+        assert totals["low_stock_count"] == sum(1 for p in products if p.stock_quantity <= 5)
+        assert totals["no_stock_count"] == sum(1 for p in products if p.stock_quantity <= 0)
+        assert totals["total_inventory_cost_value"] == \
+            pytest.approx(float(sum(p.cost_price * p.stock_quantity for p in products)))
+        assert totals["total_inventory_retail_value"] == \
+            pytest.approx(float(sum(p.selling_price * p.stock_quantity for p in products)))
+
+    def test_snapshot_is_cached_and_invalidated_by_writes(self, db_session):
+        first = inventory_status.get_snapshot(db_session)
+        product = db_session.query(models.Product).filter(models.Product.stock_quantity == 8).first()
+        db_session.query(models.Product).filter(models.Product.id == product.id)\
+            .update({models.Product.stock_quantity: 100})
+        db_session.commit()
+        assert inventory_status.get_snapshot(db_session) == first  # Escritura sin pasar por crud
+
+        crud.update_product(db_session, product.id, schemas.ProductUpdate(stock_quantity=3))
+        after_update = inventory_status.get_snapshot(db_session)
+        assert after_update["low_stock_count"] == first["low_stock_count"] + 1
+
+        user = db_session.query(models.User).first()
+        crud.create_pos_sale(db_session, schemas.PointOfSaleTransactionCreate(
+            items=[schemas.PointOfSaleItemCreate(product_id=product.id, quantity_sold=3)]
+        ), user.id)
+        assert inventory_status.get_snapshot(db_session)["no_stock_count"] == first["no_stock_count"] + 1
+
+    def test_low_stock_listing_is_paginated(self, db_session):
+        expected = [p.id for p in crud.get_products_with_low_stock(db_session, 5)]
+        seen, cursor = [], None
+        while True:
+            page, cursor = crud.get_products_with_low_stock_keyset(db_session, 5, cursor, limit=7)
+            seen.extend(p.id for p in page)
+            if cursor is None:
+                break
+        assert seen == expected
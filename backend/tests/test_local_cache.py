@@ -0,0 +1,133 @@
+"""
+Tests para la caché L1 en memoria y su invalidación por pub/sub
+"""
+import queue
+import time
+
+import pytest
+
+from app import local_cache as local_cache_module
+from app.local_cache import InvalidationBus, LocalCache
+from app.metrics import metrics_registry
+
+
+class PubSubRedis:
+    """Sustituto mínimo de Redis con PUBLISH/SUBSCRIBE entre clientes del mismo proceso"""
+
+    subscribers = []
+
+    def publish(self, channel, message):
+        for pubsub in self.subscribers:
+            if channel in pubsub.channels:
+                pubsub.messages.put({"type": "message", "channel": channel, "data": message})
+        return len(self.subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        client = self
+
+        class PubSub:
+            def __init__(self):
+                self.channels = set()
+                self.messages = queue.Queue()
+
+            def subscribe(self, channel):
+                self.channels.add(channel)
+                client.subscribers.append(self)
+
+            def get_message(self, timeout=0.0):
+                try:
+                    return self.messages.get(timeout=timeout)
+                except queue.Empty:
+                    return None
+
+            def close(self):
+                client.subscribers.remove(self)
+
+        return PubSub()
+
+
+def _active_cache(max_bytes=64 * 1024, ttl=60):
+    cache = LocalCache(max_bytes=max_bytes, default_ttl=ttl)
+    cache.active = True
+    return cache
+
+
+def test_byte_bound_admits_frequent_entries_and_rejects_cold_ones():
+    cache = _active_cache(max_bytes=16_000)
+    payload = "x" * 1500
+    evictions = metrics_registry.counter('l1_cache_evictions_total').value
+    rejections = metrics_registry.counter('l1_cache_admission_rejections_total').value
+
+    for i in range(10):
+        cache.get("products", f"cold-{i}")
+        cache.set("products", f"cold-{i}", payload)
+    for _ in range(5):
+        cache.get("products", "hot")
+    assert cache.set("products", "hot", payload) is True
+    cache.get("products", "new-cold")
+    assert cache.set("products", "new-cold", payload) is False
+
+    assert cache.get("products", "hot") == payload
+    assert cache.get("products", "cold-0") is None
+    assert cache.stats()["bytes"] <= 16_000
+    assert metrics_registry.counter('l1_cache_evictions_total').value > evictions
+    assert metrics_registry.counter('l1_cache_admission_rejections_total').value > rejections
+
+
+def test_entries_expire_and_invalidation_wins_over_inflight_loads(monkeypatch):
+    cache = _active_cache(ttl=30)
+    now = [1000.0]
+    monkeypatch.setattr(local_cache_module.time, "monotonic", lambda: now[0])
+
+    cache.set("distributors", "page:1", ["a"], ttl=10)
+    now[0] += 11
+    assert cache.get("distributors", "page:1") is None
+
+    epoch = cache.epoch("distributors")
+    cache.invalidate("distributors")
+    assert cache.set("distributors", "page:1", ["viejo"], epoch=epoch) is False
+    assert cache.set("distributors", "page:1", ["nuevo"], epoch=cache.epoch("distributors")) is True
+
+
+def _wait(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture(name="workers")
+def workers_fixture():
+    buses = [InvalidationBus(LocalCache(), "cache:test-invalidate") for _ in range(2)]
+    for bus in buses:
+        bus.start(PubSubRedis)
+    try:
+        assert _wait(lambda: all(bus.connected for bus in buses))
+        yield buses
+    finally:
+        for bus in buses:
+            bus.stop()
+
+
+def test_write_in_one_worker_drops_entries_in_the_others(workers):
+    writer, reader = workers
+    reader.cache.set("product", "7", {"stock": 10})
+    reader.cache.set("product", "8", {"stock": 3})
+    reader.cache.set("products", "list:0:20", ["p7", "p8"])
+
+    started = time.monotonic()
+    writer.publish(PubSubRedis(), "product", [7])
+    writer.publish(PubSubRedis(), "products")
+
+    assert _wait(lambda: reader.cache.get("products", "list:0:20") is None)
+    assert time.monotonic() - started < 0.5
+    assert reader.cache.get("product", "7") is None
+    assert reader.cache.get("product", "8") == {"stock": 3}
+
+
+def test_cache_is_bypassed_while_unsubscribed():
+    cache = LocalCache()
+    assert cache.set("product", "1", {"stock": 1}) is False
+    assert cache.get("product", "1") is None
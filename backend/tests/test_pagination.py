@@ -0,0 +1,119 @@
+"""
+Tests para la paginación por cursor (keyset)
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app import crud, models
+from app.database import Base, get_db_session_maker
+from app.exceptions import ValidationError
+from app.pagination import decode_cursor, encode_cursor
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_pagination.db"
+
+
+@pytest.fixture(name="db_session", scope="module")
+def db_session_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+        db.add(user)
+        # Nombres repetidos para comprobar el desempate por id
+        db.add_all([
+            models.Product(
+                sku=f"PAG{i:03d}", name=f"Producto {i % 7}", cost_price=Decimal("5.00"),
+                selling_price=Decimal("10.00"), stock_quantity=i
+            )
+            for i in range(23)
+        ])
+        db.flush()
+        # Varias ventas comparten transaction_time
+        base_time = datetime(2026, 1, 1, 12, 0, 0)
+        db.add_all([
+            models.PointOfSaleTransaction(
+                user_id=user.id, total_amount=Decimal("10.00"),
+                transaction_time=base_time - timedelta(minutes=i // 3)
+            )
+            for i in range(31)
+        ])
+        db.commit()
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _walk(fetch, limit):
+    items, cursor, pages = [], None, 0
+    while True:
+        page, cursor = fetch(cursor, limit)
+        items.extend(page)
+        pages += 1
+        if cursor is None:
+            return items, pages
+
+
+class TestKeysetPagination:
+    """Recorrido completo por cursor"""
+
+    def test_products_walk_matches_full_ordering(self, db_session):
+        expected = db_session.query(models.Product)\
+            .order_by(models.Product.name, models.Product.id).all()
+
+        items, pages = _walk(lambda c, l: crud.get_products_keyset(db_session, cursor=c, limit=l), 5)
+
+        assert [p.id for p in items] == [p.id for p in expected]
+        assert pages == 5
+
+    def test_sales_walk_is_descending_without_gaps(self, db_session):
+        expected = db_session.query(models.PointOfSaleTransaction).order_by(
+            models.PointOfSaleTransaction.transaction_time.desc(), models.PointOfSaleTransaction.id.desc()
+        ).all()
+
+        items, _ = _walk(lambda c, l: crud.get_sales_with_details_keyset(db_session, cursor=c, limit=l), 4)
+
+        assert [s.id for s in items] == [s.id for s in expected]
+
+    def test_last_page_has_no_cursor(self, db_session):
+        users, next_cursor = crud.get_users_keyset(db_session, limit=10)
+        assert len(users) == 1
+        assert next_cursor is None
+
+
+class TestSalesDateRange:
+    """Filtro de fechas en SQL y proyección de solo cabeceras"""
+
+    def test_date_range_is_applied_before_paging(self, db_session):
+        day = date(2026, 1, 1)
+        assert len(crud.get_sales_with_details(db_session, 0, 100, start_date=day, end_date=day)) == 31
+        assert crud.get_sales_with_details(db_session, 0, 10, start_date=day + timedelta(days=1)) == []
+        assert crud.get_sales_with_details(db_session, 0, 10, end_date=day - timedelta(days=1)) == []
+
+        items, _ = _walk(lambda c, l: crud.get_sales_with_details_keyset(
+            db_session, cursor=c, limit=l, start_date=day, end_date=day
+        ), 8)
+        assert len(items) == 31
+
+    def test_headers_only_skips_relationships(self, db_session):
+        headers, next_cursor = crud.get_sales_with_details_keyset(db_session, limit=5, headers_only=True)
+
+        assert len(headers) == 5 and next_cursor is not None
+        assert set(headers[0]._fields) == {"id", "transaction_time", "total_amount", "user_id"}
+
+
+class TestCursorToken:
+    """Codificación del token opaco"""
+
+    def test_roundtrip_preserves_types(self):
+        values = (datetime(2026, 1, 1, 8, 30), Decimal("9.99"), 42)
+        assert decode_cursor("sales", encode_cursor("sales", values)) == values
+
+    def test_invalid_and_foreign_cursors_are_rejected(self):
+        with pytest.raises(ValidationError):
+            decode_cursor("sales", "no-es-un-cursor")
+        with pytest.raises(ValidationError):
+            decode_cursor("sales", encode_cursor("products", ["a", 1]))
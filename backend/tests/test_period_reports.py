@@ -0,0 +1,142 @@
+"""
+Tests para la caché de reportes por periodos cerrados
+"""
+import fnmatch
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app import crud, models, schemas
+from app.cache import cache_manager
+from app.database import Base, get_db_session_maker
+from app.metrics import metrics_registry
+from app.services import period_reports
+from app.services.sales_rollup import backfill
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_period_reports.db"
+
+
+class DictRedis:
+    """Sustituto mínimo del cliente Redis para la caché de periodos"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None, nx=False):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def keys(self, pattern):
+        return [key for key in self.data if fnmatch.fnmatch(key, pattern)]
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+        return Pipeline()
+
+
+@pytest.fixture(name="db_session")
+def db_session_fixture(monkeypatch):
+    client = DictRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed(db, start, days):
+    """Dos productos y tres ventas por día desde start; devuelve (user_id, product_ids)"""
+    user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+    products = [
+        models.Product(sku=f"PR-{i}", name=f"Producto {i}", cost_price=Decimal("1.00"),
+                       selling_price=Decimal("2.00") * (i + 1), stock_quantity=10000)
+        for i in range(2)
+    ]
+    db.add_all([user, *products])
+    db.commit()
+    for d in range(days):
+        for hour, (index, quantity) in zip((9, 13, 18), ((0, 1), (1, 2), (0, 3))):
+            db.add(models.PointOfSaleTransaction(
+                user_id=user.id,
+                transaction_time=datetime.combine(start + timedelta(days=d), datetime.min.time()) + timedelta(hours=hour),
+                total_amount=products[index].selling_price * quantity,
+                items=[models.PointOfSaleItem(product_id=products[index].id, quantity_sold=quantity,
+                                              price_at_time_of_sale=products[index].selling_price)]
+            ))
+    db.commit()
+    backfill(db)
+    db.commit()
+    return user.id, [product.id for product in products]
+
+
+def _hits():
+    return metrics_registry.counter('report_period_cache_hits_total').value
+
+
+class TestPeriodReports:
+    def test_plan_uses_months_then_weeks_then_days(self):
+        plan = period_reports.plan_periods(date(2026, 2, 26), date(2026, 4, 14))
+
+        assert plan[:3] == [("day", date(2026, 2, 26), date(2026, 2, 26)),
+                            ("day", date(2026, 2, 27), date(2026, 2, 27)),
+                            ("day", date(2026, 2, 28), date(2026, 2, 28))]
+        assert plan[3] == ("month", date(2026, 3, 1), date(2026, 3, 31))
+        assert ("week", date(2026, 4, 6), date(2026, 4, 12)) in plan
+        assert plan[-1] == ("day", date(2026, 4, 14), date(2026, 4, 14))
+
+    def test_range_matches_live_computation_and_reuses_closed_periods(self, db_session):
+        _, product_ids = _seed(db_session, date(2026, 2, 20), 20)  # 20/02 a 11/03
+        today = date(2026, 3, 11)
+        start, end = datetime(2026, 2, 21, 12), datetime.combine(today, datetime.max.time())
+
+        first = period_reports.range_report(db_session, start, end, today=today)
+        hits = _hits()
+        second = period_reports.range_report(db_session, start, end, today=today)
+
+        live = period_reports._compute(db_session, start, end, end_inclusive=True)
+        assert first == second == live
+        assert _hits() > hits
+        assert first["products"][product_ids[0]][0] == 4 * 18 + 3  # 21/02 solo desde las 12:00
+
+    def test_late_sale_invalidates_its_closed_periods(self, db_session):
+        user_id, product_ids = _seed(db_session, date(2026, 3, 2), 7)  # semana completa 02/03 - 08/03
+        today = datetime.utcnow().date()
+        start, end = datetime(2026, 3, 2), datetime(2026, 3, 8, 23, 59, 59, 999999)
+        before = period_reports.range_report(db_session, start, end, today=today)
+
+        crud.create_pos_sales_batch(db_session, [schemas.PointOfSaleBatchSale(
+            items=[schemas.PointOfSaleItemCreate(product_id=product_ids[1], quantity_sold=5)],
+            transaction_time=datetime(2026, 3, 4, 20)
+        )], user_id)
+
+        after = period_reports.range_report(db_session, start, end, today=today)
+        assert after["products"][product_ids[1]][0] == before["products"][product_ids[1]][0] + 5
+        assert after["days"][date(2026, 3, 4)][0] == before["days"][date(2026, 3, 4)][0] + 1
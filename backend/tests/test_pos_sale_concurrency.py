@@ -0,0 +1,246 @@
+"""
+Tests para la venta POS atómica (descuento condicional de stock en una transacción)
+Incluye un benchmark de concurrencia: N hilos vendiendo el mismo SKU
+"""
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, text
+
+from app import crud, models, schemas
+from app.database import Base, get_db_session_maker
+from app.exceptions import InsufficientStockError, NotFoundError
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_pos_sale_concurrency.db"
+
+
+@pytest.fixture(name="session_factory")
+def session_factory_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    try:
+        yield TestingSessionLocal
+    finally:
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed(SessionLocal, stock):
+    db = SessionLocal()
+    try:
+        user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+        hot = models.Product(sku="HOT-SKU", name="Funda popular", cost_price=Decimal("5.00"),
+                             selling_price=Decimal("12.50"), stock_quantity=stock)
+        other = models.Product(sku="OTHER-SKU", name="Cable", cost_price=Decimal("1.00"),
+                               selling_price=Decimal("3.00"), stock_quantity=stock)
+        db.add_all([user, hot, other])
+        db.commit()
+        return user.id, hot.id, other.id
+    finally:
+        db.close()
+
+
+def _sale(*items):
+    return schemas.PointOfSaleTransactionCreate(
+        items=[schemas.PointOfSaleItemCreate(product_id=pid, quantity_sold=qty) for pid, qty in items]
+    )
+
+
+class TestAtomicSale:
+    """Semántica de la venta en una sola transacción"""
+
+    def test_sale_decrements_and_inserts_items(self, session_factory):
+        user_id, hot_id, other_id = _seed(session_factory, 10)
+        db = session_factory()
+        try:
+            sale = crud.create_pos_sale(db, _sale((hot_id, 2), (other_id, 3)), user_id)
+
+            assert sale.total_amount == Decimal("34.00")
+            assert {(i.product_id, i.quantity_sold) for i in sale.items} == {(hot_id, 2), (other_id, 3)}
+            assert db.get(models.Product, hot_id).stock_quantity == 8
+            assert db.get(models.Product, other_id).stock_quantity == 7
+        finally:
+            db.close()
+
+    def test_insufficient_stock_rolls_back_every_item(self, session_factory):
+        user_id, hot_id, other_id = _seed(session_factory, 5)
+        db = session_factory()
+        try:
+            with pytest.raises(InsufficientStockError) as exc_info:
+                crud.create_pos_sale(db, _sale((hot_id, 1), (other_id, 6)), user_id)
+
+            assert exc_info.value.details["insufficient_items"][0]["product_id"] == other_id
+            assert db.get(models.Product, hot_id).stock_quantity == 5
+            assert db.query(models.PointOfSaleTransaction).count() == 0
+
+            with pytest.raises(NotFoundError):
+                crud.create_pos_sale(db, _sale((999, 1)), user_id)
+        finally:
+            db.close()
+
+
+def _batch_sale(reference, *items, transaction_time=None):
+    return schemas.PointOfSaleBatchSale(
+        client_reference=reference,
+        transaction_time=transaction_time,
+        items=[schemas.PointOfSaleItemCreate(product_id=pid, quantity_sold=qty) for pid, qty in items]
+    )
+
+
+class TestSalesBatch:
+    """Ingesta en bloque de ventas encoladas por cajas sin conexión"""
+
+    def test_best_effort_registers_valid_sales(self, session_factory):
+        user_id, hot_id, other_id = _seed(session_factory, 5)
+        db = session_factory()
+        try:
+            result = crud.create_pos_sales_batch(db, [
+                _batch_sale("a", (hot_id, 3), (other_id, 1)),
+                _batch_sale("b", (hot_id, 3)),  # ya no quedan 3 tras la venta "a"
+                _batch_sale("c", (hot_id, 2)),
+                _batch_sale("d", (999, 1)),
+            ], user_id, mode="best_effort")
+
+            assert result["committed"] is True
+            assert [r["status"] for r in result["results"]] == ["created", "rejected", "created", "rejected"]
+            assert result["results"][1]["details"]["insufficient_items"][0]["available"] == 2
+            assert result["results"][0]["total_amount"] == Decimal("40.50")
+
+            assert db.get(models.Product, hot_id).stock_quantity == 0
+            assert db.get(models.Product, other_id).stock_quantity == 4
+            assert db.query(models.PointOfSaleTransaction).count() == 2
+            assert db.query(func.sum(models.InventoryMovement.quantity))\
+                .filter(models.InventoryMovement.product_id == hot_id).scalar() == -5
+        finally:
+            db.close()
+
+    def test_all_or_nothing_applies_nothing_on_rejection(self, session_factory):
+        user_id, hot_id, _ = _seed(session_factory, 5)
+        db = session_factory()
+        try:
+            result = crud.create_pos_sales_batch(db, [
+                _batch_sale("a", (hot_id, 3)),
+                _batch_sale("b", (hot_id, 3)),
+            ], user_id, mode="all_or_nothing")
+
+            assert result["committed"] is False
+            assert [r["status"] for r in result["results"]] == ["skipped", "rejected"]
+            assert db.get(models.Product, hot_id).stock_quantity == 5
+            assert db.query(models.PointOfSaleTransaction).count() == 0
+        finally:
+            db.close()
+
+    def test_repeated_client_times_reject_only_those_sales(self, session_factory):
+        user_id, hot_id, _ = _seed(session_factory, 10)
+        # Índice único (user_id, transaction_time) de la migración 003
+        with session_factory.kw["bind"].begin() as connection:
+            connection.execute(text(
+                "CREATE UNIQUE INDEX uq_test_user_time ON point_of_sale_transactions (user_id, transaction_time)"
+            ))
+        first, second = datetime(2026, 10, 1, 9, 0), datetime(2026, 10, 1, 9, 5)
+        db = session_factory()
+        try:
+            result = crud.create_pos_sales_batch(db, [
+                _batch_sale("a", (hot_id, 1), transaction_time=first),
+                _batch_sale("b", (hot_id, 1), transaction_time=first),
+            ], user_id, mode="best_effort")
+            assert [r["status"] for r in result["results"]] == ["created", "rejected"]
+
+            # Lote reenviado: la venta ya registrada se rechaza, la nueva entra
+            result = crud.create_pos_sales_batch(db, [
+                _batch_sale("a", (hot_id, 1), transaction_time=first),
+                _batch_sale("c", (hot_id, 2), transaction_time=second),
+            ], user_id, mode="best_effort")
+            assert [r["status"] for r in result["results"]] == ["rejected", "created"]
+            assert result["results"][0]["details"]["transaction_time"] == first.isoformat()
+
+            assert db.query(models.PointOfSaleTransaction).count() == 2
+            assert db.get(models.Product, hot_id).stock_quantity == 7
+        finally:
+            db.close()
+
+
+def _legacy_create_pos_sale(db, sale, user_id):
+    """Implementación anterior: leer, validar en Python, dos commits"""
+    product_ids = [item.product_id for item in sale.items]
+    products = {p.id: p for p in db.query(models.Product).filter(models.Product.id.in_(product_ids))}
+    for item in sale.items:
+        if products[item.product_id].stock_quantity < item.quantity_sold:
+            raise InsufficientStockError("Stock insuficiente")
+    db_sale = models.PointOfSaleTransaction(
+        user_id=user_id,
+        total_amount=sum(products[i.product_id].selling_price * i.quantity_sold for i in sale.items),
+        transaction_time=datetime.utcnow()
+    )
+    db.add(db_sale)
+    db.commit()
+    for item in sale.items:
+        products[item.product_id].stock_quantity -= item.quantity_sold
+        db.add(models.PointOfSaleItem(
+            transaction_id=db_sale.id, product_id=item.product_id,
+            quantity_sold=item.quantity_sold, price_at_time_of_sale=products[item.product_id].selling_price
+        ))
+    db.commit()
+    return db_sale
+
+
+def _run_registers(SessionLocal, create_sale, user_id, product_id, threads, attempts):
+    sold = []
+    lock = threading.Lock()
+
+    def register():
+        db = SessionLocal()
+        try:
+            for _ in range(attempts):
+                try:
+                    create_sale(db, _sale((product_id, 1)), user_id)
+                    with lock:
+                        sold.append(1)
+                except Exception:
+                    db.rollback()
+        finally:
+            db.close()
+
+    workers = [threading.Thread(target=register) for _ in range(threads)]
+    began = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(sold), time.perf_counter() - began
+
+
+@pytest.mark.slow
+def test_benchmark_hot_sku_concurrency(session_factory):
+    """
+    Benchmark: N cajas vendiendo el mismo SKU a la vez.
+    Antes: leer-validar-escribir con dos commits (puede sobrevender).
+    Después: UPDATE condicional en una transacción (nunca sobrevende).
+    """
+    stock, threads, attempts = 60, 8, 12  # 96 intentos para 60 unidades
+
+    db = session_factory()
+    results = {}
+    for label, create_sale in (("antes", _legacy_create_pos_sale), ("después", crud.create_pos_sale)):
+        Base.metadata.drop_all(bind=db.get_bind())
+        Base.metadata.create_all(bind=db.get_bind())
+        user_id, hot_id, _ = _seed(session_factory, stock)
+
+        sold, elapsed = _run_registers(session_factory, create_sale, user_id, hot_id, threads, attempts)
+        units = db.query(func.coalesce(func.sum(models.PointOfSaleItem.quantity_sold), 0))\
+            .filter(models.PointOfSaleItem.product_id == hot_id).scalar()
+        final_stock = db.query(models.Product.stock_quantity).filter(models.Product.id == hot_id).scalar()
+        results[label] = (sold, units, final_stock, sold / elapsed)
+        db.rollback()
+    db.close()
+
+    for label, (sold, units, final_stock, rate) in results.items():
+        print(f"\n{label}: {sold} ventas confirmadas, {units} unidades en ítems, "
+              f"stock final {final_stock} (inicial {stock}), {rate:.0f} ventas/s")
+
+    sold, units, final_stock, _ = results["después"]
+    assert units <= stock
+    assert final_stock == stock - units
+    assert final_stock >= 0
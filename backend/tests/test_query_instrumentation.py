@@ -0,0 +1,96 @@
+"""
+Tests para la instrumentación de sentencias SQL y el presupuesto de consultas
+"""
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from app import models
+from app.database import Base, get_db_session_maker
+from app.utils.query_instrumentation import (
+    QueryBudgetExceeded, fingerprint_sql, normalize_sql, query_budget, query_stats
+)
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_query_instrumentation.db"
+
+
+@pytest.fixture(name="db_session", scope="module")
+def db_session_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        db.add_all([
+            models.Product(
+                sku=f"QI{i:03d}", name=f"Producto {i}", cost_price=Decimal("5.00"),
+                selling_price=Decimal("10.00"), stock_quantity=i
+            )
+            for i in range(15)
+        ])
+        db.commit()
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+class TestFingerprint:
+    """Normalización de sentencias"""
+
+    def test_literals_and_placeholders_are_collapsed(self):
+        assert normalize_sql("SELECT * FROM products WHERE id = 5") == \
+            normalize_sql("SELECT *  FROM products\n WHERE id = %(id_1)s")
+        assert fingerprint_sql("SELECT * FROM users WHERE username = 'ana'") == \
+            fingerprint_sql("SELECT * FROM users WHERE username = ?")
+
+    def test_in_lists_and_multi_values(self):
+        assert normalize_sql("SELECT 1 FROM t WHERE id IN (1, 2, 3)") == "SELECT ? FROM t WHERE id IN (?)"
+        assert normalize_sql("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)") == "INSERT INTO t (a, b) VALUES (?, ?)"
+
+    def test_different_tables_differ(self):
+        assert fingerprint_sql("SELECT * FROM products") != fingerprint_sql("SELECT * FROM users")
+
+
+class TestQueryBudget:
+    """Conteo por bloque y detección N+1"""
+
+    def test_counts_statements(self, db_session):
+        with query_budget(max_queries=2) as tracker:
+            db_session.execute(text("SELECT 1"))
+            db_session.query(models.Product).count()
+
+        assert tracker.total == 2
+
+    def test_budget_exceeded(self, db_session):
+        with pytest.raises(QueryBudgetExceeded):
+            with query_budget(max_queries=1):
+                for _ in range(3):
+                    db_session.execute(text("SELECT 1"))
+
+    def test_n_plus_one_is_detected(self, db_session):
+        ids = [p.id for p in db_session.query(models.Product.id)]
+
+        with pytest.raises(QueryBudgetExceeded, match="repetidas"):
+            with query_budget(max_per_fingerprint=1):
+                for product_id in ids:
+                    db_session.execute(
+                        text("SELECT name FROM products WHERE id = :id"), {"id": product_id}
+                    )
+
+        with query_budget() as tracker:
+            for product_id in ids:
+                db_session.execute(text("SELECT name FROM products WHERE id = :id"), {"id": product_id})
+        detections = tracker.check_n_plus_one(threshold=10)
+
+        assert len(detections) == 1
+        assert detections[0]["count"] == len(ids)
+        assert detections[0] in query_stats.detections()
+
+    def test_per_fingerprint_stats(self, db_session):
+        db_session.execute(text("SELECT sku FROM products WHERE stock_quantity > 3"))
+        fingerprint = fingerprint_sql("SELECT sku FROM products WHERE stock_quantity > 3")
+
+        entry = next(q for q in query_stats.top(limit=500) if q["fingerprint"] == fingerprint)
+        assert entry["calls"] >= 1
+        assert entry["p95_ms"] >= 0
@@ -0,0 +1,81 @@
+"""
+Tests para el enrutamiento de lecturas a réplicas (dos ficheros SQLite locales)
+"""
+import time
+
+import pytest
+
+from app.read_replicas import ReplicaRouter, issue_consistency_token
+
+PRIMARY_URL = "sqlite:///./test_primary.db"
+REPLICA_A_URL = "sqlite:///./test_replica_a.db"
+REPLICA_B_URL = "sqlite:///./test_replica_b.db"
+UNREACHABLE_URL = "sqlite:////nonexistent-dir/replica.db"
+
+
+@pytest.fixture
+def router():
+    replica_router = ReplicaRouter(
+        primary_url=PRIMARY_URL,
+        replica_urls=[REPLICA_A_URL, REPLICA_B_URL],
+        max_lag_seconds=5.0,
+        health_check_interval=3600,
+    )
+    replica_router.check_replicas()
+    return replica_router
+
+
+class TestReplicaRouting:
+    """Round-robin, health checks y fallback al primario"""
+
+    def test_without_replicas_uses_primary(self):
+        replica_router = ReplicaRouter(primary_url=PRIMARY_URL, replica_urls=[])
+        assert replica_router.get_read_url() == PRIMARY_URL
+
+    def test_unchecked_replicas_are_not_used(self):
+        replica_router = ReplicaRouter(
+            primary_url=PRIMARY_URL, replica_urls=[REPLICA_A_URL], health_check_interval=3600
+        )
+        replica_router._last_refresh = time.time()  # Evitar el chequeo en segundo plano
+        assert replica_router.get_read_url() == PRIMARY_URL
+
+    def test_round_robin_between_healthy_replicas(self, router):
+        urls = [router.get_read_url() for _ in range(4)]
+        assert urls == [REPLICA_A_URL, REPLICA_B_URL, REPLICA_A_URL, REPLICA_B_URL]
+
+    def test_unhealthy_replica_is_skipped(self):
+        replica_router = ReplicaRouter(
+            primary_url=PRIMARY_URL,
+            replica_urls=[UNREACHABLE_URL, REPLICA_B_URL],
+            health_check_interval=3600,
+        )
+        statuses = replica_router.check_replicas()
+
+        assert statuses[UNREACHABLE_URL].healthy is False
+        assert {replica_router.get_read_url() for _ in range(3)} == {REPLICA_B_URL}
+
+    def test_lagging_replicas_fall_back_to_primary(self, router):
+        for status in router._replicas.values():
+            status.lag_seconds = 30.0
+        assert router.get_read_url() == PRIMARY_URL
+
+
+class TestReadYourWrites:
+    """El token de escritura evita réplicas que aún no la han aplicado"""
+
+    def test_write_after_last_check_goes_to_primary(self, router):
+        time.sleep(0.01)
+        token = issue_consistency_token()
+        assert router.get_read_url(token) == PRIMARY_URL
+
+    def test_write_before_last_check_can_use_replica(self):
+        token = issue_consistency_token()
+        time.sleep(0.01)
+        replica_router = ReplicaRouter(
+            primary_url=PRIMARY_URL, replica_urls=[REPLICA_A_URL], health_check_interval=3600
+        )
+        replica_router.check_replicas()
+        assert replica_router.get_read_url(token) == REPLICA_A_URL
+
+    def test_invalid_token_is_ignored(self, router):
+        assert router.get_read_url("not-a-token") in (REPLICA_A_URL, REPLICA_B_URL)
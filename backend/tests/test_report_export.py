@@ -0,0 +1,151 @@
+"""
+Tests para la exportación en streaming de /reports/export/*
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from app import models
+from app.database import Base, get_db_session_maker
+from app.dependencies import get_current_sales_staff_user
+from app.main import app
+from app.routers import reports
+from app.services import report_export
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_report_export.db"
+
+
+@pytest.fixture(name="session_factory")
+def session_factory_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    try:
+        yield TestingSessionLocal
+    finally:
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed(SessionLocal, sales, start=datetime(2026, 3, 1, 9)):
+    """Un producto y `sales` ventas de una línea, una por minuto desde start"""
+    db = SessionLocal()
+    try:
+        user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+        product = models.Product(sku="EXP-1", name="Cable, USB-C", cost_price=Decimal("2.00"),
+                                 selling_price=Decimal("4.50"), stock_quantity=7)
+        db.add_all([user, product])
+        db.commit()
+        db.execute(insert(models.PointOfSaleTransaction), [
+            {"id": i + 1, "user_id": user.id, "total_amount": Decimal("4.50"),
+             "transaction_time": start + timedelta(minutes=i)}
+            for i in range(sales)
+        ])
+        db.execute(insert(models.PointOfSaleItem), [
+            {"transaction_id": i + 1, "product_id": product.id, "quantity_sold": 1,
+             "price_at_time_of_sale": Decimal("4.50")}
+            for i in range(sales)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+class TestReportExport:
+    def test_sales_csv_filters_range_across_chunks(self, session_factory):
+        _seed(session_factory, 3 * 24 * 60, start=datetime(2026, 3, 1))  # 3 días, una venta por minuto
+
+        body = b"".join(report_export.stream_sales(
+            session_factory, date(2026, 3, 2), date(2026, 3, 2), "csv", chunk_size=500
+        ))
+        rows = list(csv.reader(io.StringIO(body.decode())))
+
+        assert rows[0] == report_export.SALES_COLUMNS
+        assert len(rows) - 1 == 24 * 60
+        assert rows[1][1].startswith("2026-03-02T00:00") and rows[-1][1].startswith("2026-03-02T23:59")
+        assert rows[1][6] == "Cable, USB-C"
+
+    def test_ndjson_gzip_round_trip(self, session_factory):
+        _seed(session_factory, 120)
+
+        body = b"".join(report_export.stream_inventory(session_factory, "ndjson", compress=True, chunk_size=7))
+        records = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+
+        assert records == [{"id": 1, "sku": "EXP-1", "name": "Cable, USB-C", "stock_quantity": 7,
+                            "cost_price": "2.00", "selling_price": "4.50"}]
+
+        sales = b"".join(report_export.stream_sales(session_factory, fmt="ndjson", compress=True, chunk_size=7))
+        assert len(gzip.decompress(sales).decode().splitlines()) == 120
+
+    def test_endpoint_streams_download(self, session_factory, monkeypatch):
+        _seed(session_factory, 5)
+        monkeypatch.setattr(reports, "_export_session_factory", lambda request: session_factory)
+        app.dependency_overrides[get_current_sales_staff_user] = lambda: SimpleNamespace(id=1)
+        try:
+            client = TestClient(app)
+            response = client.get("/reports/export/sales", params={"format": "csv", "gzip": "true"})
+            invalid = client.get("/reports/export/sales", params={"start_date": "2026-03-02", "end_date": "2026-03-01"})
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        assert 'filename="sales.csv.gz"' in response.headers["content-disposition"]
+        assert len(gzip.decompress(response.content).decode().splitlines()) == 6
+        assert invalid.status_code in (400, 422)
+
+
+_RSS_SCRIPT = textwrap.dedent("""
+    import resource, sys
+    from app.database import get_db_session_maker
+    from app.services import report_export
+
+    SessionLocal = get_db_session_maker(sys.argv[1])[0]
+    if sys.argv[2] == "stream":
+        for _ in report_export.stream_sales(SessionLocal, fmt="csv"):
+            pass
+    else:
+        db = SessionLocal()
+        rows = db.execute(report_export._sales_stmt(None, None)).all()
+        db.close()
+    # ru_maxrss se hereda del proceso padre a través de fork/exec; VmHWM no
+    try:
+        with open("/proc/self/status") as status:
+            print(next(line.split()[1] for line in status if line.startswith("VmHWM:")))
+    except OSError:
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+""")
+
+
+@pytest.mark.slow
+def test_benchmark_peak_rss_vs_rows(session_factory):
+    """Benchmark: RSS máximo de la exportación en streaming frente a cargar todo el resultado"""
+    engine = session_factory.kw["bind"]
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for sales in (10_000, 50_000, 200_000):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        _seed(session_factory, sales)
+        for mode in ("stream", "materialize"):
+            output = subprocess.run(
+                [sys.executable, "-c", _RSS_SCRIPT, SQLALCHEMY_DATABASE_URL, mode],
+                cwd=backend_dir, capture_output=True, text=True, check=True
+            ).stdout
+            results[(sales, mode)] = int(output.strip().splitlines()[-1]) // 1024
+
+    for (sales, mode), rss_mb in sorted(results.items()):
+        print(f"\n{sales:>7} filas, {mode}: {rss_mb} MB de RSS máximo")
+    # El streaming no crece con el número de filas (margen para ruido del intérprete)
+    assert results[(200_000, "stream")] - results[(10_000, "stream")] < 20
+    assert results[(200_000, "materialize")] > results[(200_000, "stream")]
@@ -0,0 +1,111 @@
+"""
+Tests para el rollup diario de ventas (daily_sales_rollup)
+El resumen leído del rollup debe coincidir con la consulta sobre las transacciones
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app import crud, models, schemas
+from app.database import Base, get_db_session_maker
+from app.services import sales_rollup
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_sales_rollup.db"
+
+
+@pytest.fixture(name="db_session")
+def db_session_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed(db, days=6):
+    users = [
+        models.User(username=f"cajero{i}", email=f"cajero{i}@test.com", hashed_password="x",
+                    role=models.UserRole.sales_staff)
+        for i in range(2)
+    ]
+    product = models.Product(sku="ROLL-1", name="Cargador", cost_price=Decimal("4.00"),
+                             selling_price=Decimal("9.99"), stock_quantity=10_000)
+    db.add_all(users + [product])
+    db.commit()
+
+    # Ventas históricas escritas directamente: solo el backfill las lleva al rollup
+    base = datetime(2026, 3, 1)
+    for day in range(days):
+        for hour in (0, 9, 13, 23):
+            for user in users:
+                sale = models.PointOfSaleTransaction(
+                    user_id=user.id, total_amount=Decimal("9.99") * (hour % 3 + 1),
+                    transaction_time=base + timedelta(days=day, hours=hour, minutes=user.id)
+                )
+                sale.items.append(models.PointOfSaleItem(
+                    product_id=product.id, quantity_sold=hour % 3 + 1, price_at_time_of_sale=Decimal("9.99")
+                ))
+                db.add(sale)
+    db.commit()
+    sales_rollup.backfill(db)
+    db.commit()
+    return users, product, base
+
+
+def _summary(rows):
+    return [(str(r.date), r.total_transactions, Decimal(r.total_sales)) for r in rows]
+
+
+class TestSalesRollup:
+    def test_matches_raw_query_for_full_and_partial_ranges(self, db_session):
+        _, _, base = _seed(db_session)
+        ranges = [
+            (base, datetime.combine((base + timedelta(days=5)).date(), datetime.max.time())),
+            (base + timedelta(hours=5), base + timedelta(days=3, hours=12)),
+            (base + timedelta(days=2, hours=8), base + timedelta(days=2, hours=14)),
+            (base - timedelta(days=3), base + timedelta(days=30)),
+        ]
+        for start, end in ranges:
+            assert _summary(crud.get_sales_summary_by_date_range(db_session, start, end)) == \
+                _summary(crud.get_sales_summary_by_date_range_raw(db_session, start, end))
+
+    def test_sale_updates_rollup_in_same_transaction(self, db_session):
+        users, product, _ = _seed(db_session, days=1)
+        today = datetime.utcnow().date()
+        sale = schemas.PointOfSaleTransactionCreate(
+            items=[schemas.PointOfSaleItemCreate(product_id=product.id, quantity_sold=3)]
+        )
+        crud.create_pos_sale(db_session, sale, users[0].id)
+        crud.create_pos_sales_batch(db_session, [
+            schemas.PointOfSaleBatchSale(items=sale.items), schemas.PointOfSaleBatchSale(items=sale.items)
+        ], users[1].id)
+
+        rollup = {
+            row.user_id: (row.transactions, row.revenue, row.units)
+            for row in db_session.query(models.DailySalesRollup).filter(models.DailySalesRollup.day == today)
+        }
+        assert rollup == {
+            users[0].id: (1, Decimal("29.97"), 3),
+            users[1].id: (2, Decimal("59.94"), 6),
+        }
+
+        start = datetime.combine(today, datetime.min.time())
+        end = datetime.combine(today, datetime.max.time())
+        assert _summary(crud.get_sales_summary_by_date_range(db_session, start, end)) == \
+            _summary(crud.get_sales_summary_by_date_range_raw(db_session, start, end))
+
+    def test_backfill_range_is_idempotent(self, db_session):
+        _, _, base = _seed(db_session, days=3)
+        before = {(r.day, r.user_id, r.transactions, r.revenue, r.units)
+                  for r in db_session.query(models.DailySalesRollup)}
+
+        sales_rollup.backfill(db_session, base.date() + timedelta(days=1), base.date() + timedelta(days=1))
+        db_session.commit()
+
+        after = {(r.day, r.user_id, r.transactions, r.revenue, r.units)
+                 for r in db_session.query(models.DailySalesRollup)}
+        assert after == before and len(after) == 6
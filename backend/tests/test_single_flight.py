@@ -0,0 +1,136 @@
+"""
+Tests para la protección contra dogpile (single-flight) en los fallos de caché
+"""
+import pickle
+import threading
+import time
+
+import pytest
+
+from app.metrics import metrics_registry
+from app.single_flight import SingleFlight
+
+
+class TtlRedis:
+    """Sustituto mínimo de Redis con SET NX, PTTL y el script de liberación del lock"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self._lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+            if ex:
+                self.ttls[key] = ex * 1000
+            return True
+
+    def pttl(self, key):
+        if key not in self.data:
+            return -2
+        return self.ttls.get(key, -1)
+
+    def eval(self, script, numkeys, key, token):
+        with self._lock:
+            if self.data.get(key) == token.encode():
+                del self.data[key]
+                return 1
+            return 0
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args: self.calls.append((name, args))
+
+            def execute(self):
+                return [getattr(client, name)(*args) for name, args in self.calls]
+
+        return Pipeline()
+
+
+def _fetch(flight, client, compute, key="cache:report:1"):
+    return flight.fetch(lambda: client, key, compute, 60, pickle.dumps, pickle.loads)
+
+
+def _counter(name):
+    return metrics_registry.counter(name).value
+
+
+@pytest.fixture(name="flight")
+def flight_fixture():
+    return SingleFlight(stale_ttl=30, lock_ttl=5.0, lock_wait=0.5, poll_interval=0.01)
+
+
+def test_concurrent_misses_compute_once(flight):
+    client = TtlRedis()
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"total": 42}
+
+    waits = _counter('single_flight_coalesced_waits_total')
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_fetch(flight, client, compute)))
+               for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [{"total": 42}] * 10
+    assert _counter('single_flight_coalesced_waits_total') - waits == 9
+    assert client.ttls["cache:report:1"] == 90_000
+    assert client.get("lock:cache:report:1") is None
+
+
+def test_expiring_value_is_served_stale_while_another_worker_recomputes(flight):
+    client = TtlRedis()
+    client.set("cache:report:1", pickle.dumps("viejo"), ex=10)
+    client.set("lock:cache:report:1", "otro-worker", px=5000)
+    stale = _counter('single_flight_stale_served_total')
+
+    assert _fetch(flight, client, lambda: pytest.fail("no debe recalcular")) == "viejo"
+    assert _counter('single_flight_stale_served_total') - stale == 1
+
+
+def test_expiring_value_is_refreshed_by_the_lock_holder(flight):
+    client = TtlRedis()
+    client.set("cache:report:1", pickle.dumps("viejo"), ex=10)
+
+    assert _fetch(flight, client, lambda: "nuevo") == "nuevo"
+    assert pickle.loads(client.get("cache:report:1")) == "nuevo"
+
+
+def test_waits_for_other_worker_without_stale_value_and_times_out(flight):
+    client = TtlRedis()
+    client.set("lock:cache:report:1", "otro-worker", px=5000)
+    timer = threading.Timer(0.1, lambda: client.set("cache:report:1", pickle.dumps("calculado"), ex=60))
+    timer.start()
+    waits = _counter('single_flight_remote_waits_total')
+
+    assert _fetch(flight, client, lambda: pytest.fail("no debe recalcular")) == "calculado"
+    assert _counter('single_flight_remote_waits_total') - waits == 1
+    timer.join()
+
+    timeouts = _counter('single_flight_lock_timeouts_total')
+    assert _fetch(flight, client, lambda: "local", key="cache:report:2") == "local"
+    assert _counter('single_flight_lock_timeouts_total') == timeouts
+    client.set("lock:cache:report:3", "otro-worker", px=5000)
+    assert _fetch(flight, client, lambda: "local", key="cache:report:3") == "local"
+    assert _counter('single_flight_lock_timeouts_total') - timeouts == 1
@@ -0,0 +1,152 @@
+"""
+Tests para la previsión de rotura de stock
+"""
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import insert
+
+from app import crud, models
+from app.cache import cache_manager
+from app.database import Base, get_db_session_maker
+from app.services import stock_forecast
+
+np = pytest.importorskip("numpy")
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_stock_forecast.db"
+
+
+class DictRedis:
+    """Sustituto mínimo del cliente Redis para la caché diaria"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value)
+
+    def get(self, key):
+        return self.data.get(key)
+
+
+@pytest.fixture(name="redis")
+def redis_fixture(monkeypatch):
+    client = DictRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+    stock_forecast._memo.clear()
+    yield client
+    stock_forecast._memo.clear()
+
+
+@pytest.fixture(name="db")
+def db_fixture(redis):
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed(db, today, stocks, daily_units, days=28):
+    """Productos con el stock dado; el producto i vende daily_units[i] cada uno de los días anteriores a today"""
+    user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+    db.add(user)
+    db.commit()
+    db.execute(insert(models.Product), [
+        {"id": i + 1, "sku": f"FC-{i}", "name": f"Producto {i:05d}", "cost_price": Decimal("1.00"),
+         "selling_price": Decimal("2.00"), "stock_quantity": stock}
+        for i, stock in enumerate(stocks)
+    ])
+    sales = [(i + 1, d, units) for i, units in enumerate(daily_units) for d in range(1, days + 1) if units]
+    db.execute(insert(models.PointOfSaleTransaction), [
+        {"id": n + 1, "user_id": user.id, "total_amount": Decimal("2.00") * units,
+         "transaction_time": datetime.combine(today - timedelta(days=d), datetime.min.time()) + timedelta(hours=12)}
+        for n, (_, d, units) in enumerate(sales)
+    ])
+    db.execute(insert(models.PointOfSaleItem), [
+        {"transaction_id": n + 1, "product_id": pid, "quantity_sold": units, "price_at_time_of_sale": Decimal("2.00")}
+        for n, (pid, _, units) in enumerate(sales)
+    ])
+    db.commit()
+
+
+def test_smoothing_weights_recent_days_and_keeps_constant_demand():
+    matrix = np.array([[3.0] * 10, [0.0] * 9 + [10.0], [10.0] + [0.0] * 9])
+
+    velocity = stock_forecast.smoothed_velocity(matrix, alpha=0.3)
+
+    assert velocity[0] == pytest.approx(3.0)
+    assert velocity[1] > velocity[2]
+    assert stock_forecast.reorder_points(velocity[:1], np.zeros(1), 7, 1.65).tolist() == [21]
+    assert stock_forecast.days_until_stockout(np.array([10.0, 4.0]), np.array([3.0, 0.0])) == [3, None]
+
+
+def test_low_stock_report_uses_cached_daily_forecast(db, redis):
+    today = datetime.utcnow().date()
+    _seed(db, today, stocks=[4, 3, 30, 100], daily_units=[2, 0, 5, 1])
+
+    result = crud.get_low_stock_forecast(db, threshold=5)
+    first_compute = dict(redis.data)
+    stock_forecast._memo.clear()
+    with_reorder = crud.get_low_stock_forecast(db, threshold=5, include_reorder=True)
+
+    assert [r["product"].sku for r in result] == ["FC-1", "FC-0"]
+    assert [r["days_until_stockout"] for r in result] == [None, 2]
+    assert result[1]["reorder_point"] == 14 and result[1]["daily_velocity"] == 2.0
+    # FC-2 (30 uds, 5/día) está bajo su punto de pedido de 35; FC-3 no
+    assert [r["product"].sku for r in with_reorder] == ["FC-1", "FC-0", "FC-2"]
+    assert with_reorder[2]["days_until_stockout"] == 6
+    assert redis.data == first_compute and len(redis.data) == 1
+
+
+def test_forecast_ignores_sales_of_the_open_day(db):
+    today = datetime.utcnow().date()
+    _seed(db, today, stocks=[10], daily_units=[1], days=3)
+    db.execute(insert(models.PointOfSaleItem), [{
+        "transaction_id": 1, "product_id": 1, "quantity_sold": 500, "price_at_time_of_sale": Decimal("2.00")
+    }])
+    db.execute(models.PointOfSaleTransaction.__table__.update().values(
+        transaction_time=datetime.combine(today, datetime.min.time()) + timedelta(hours=9)
+    ).where(models.PointOfSaleTransaction.id == 1))
+    db.commit()
+
+    product_ids, matrix = stock_forecast.daily_units(db, today, 28)
+
+    assert product_ids.tolist() == [1] and matrix.sum() == 2
+
+
+@pytest.mark.slow
+def test_benchmark_50k_skus(db):
+    """Benchmark: cálculo inicial y respuesta con la previsión en caché para 50.000 productos"""
+    rng = np.random.default_rng(7)
+    skus = 50_000
+    today = datetime.utcnow().date()
+    stocks = rng.integers(0, 200, skus).tolist()
+    # Un 10% de productos vende a diario; el resto no tiene ventas recientes
+    daily = [int(u) if i % 10 == 0 else 0 for i, u in enumerate(rng.integers(1, 6, skus))]
+    _seed(db, today, stocks, daily)
+
+    started = time.perf_counter()
+    forecast = stock_forecast.get_forecast(db, today)
+    computed = time.perf_counter() - started
+
+    stock_forecast._memo.clear()
+    started = time.perf_counter()
+    report = crud.get_low_stock_forecast(db, threshold=5, include_reorder=True)
+    reloaded = stock_forecast.get_forecast(db, today)
+    cached = time.perf_counter() - started
+
+    print(f"\nCálculo: {computed:.3f}s, informe con previsión en Redis: {cached:.3f}s ({len(report)} productos)")
+    # Solo se comprueba el resultado: los tiempos dependen de la carga de la máquina
+    assert report
+    assert reloaded.product_ids.tolist() == forecast.product_ids.tolist()
+    assert np.allclose(reloaded.velocity, forecast.velocity)
@@ -0,0 +1,377 @@
+"""
+Tests para el modo de reservas de stock en Redis y su escritor en segundo plano
+"""
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, text
+
+from app import crud, models, schemas
+from app.cache import cache_manager
+from app.config import settings
+from app.database import Base, get_db_session_maker
+from app.dependencies import get_current_sales_staff_user, get_db
+from app.exceptions import InsufficientStockError
+from app.main import app
+from app.services.stock_reservation import (
+    DEAD_LETTER_KEY,
+    DIRECT_KEY,
+    PENDING_KEY,
+    PROCESSING_KEY,
+    StockReservationService,
+    stock_reservation,
+)
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_stock_reservation.db"
+
+
+class ListRedis:
+    """Sustituto mínimo del cliente Redis para las colas del escritor"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(v.encode() if isinstance(v, str) else v for v in values)
+        return len(self.data[key])
+
+    def lrange(self, key, start, end):
+        values = self.data.get(key, [])
+        return list(values[start:] if end == -1 else values[start:end + 1])
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def lmove(self, source, destination, src_side, dest_side):
+        values = self.data.get(source)
+        if not values:
+            return None
+        value = values.pop(0)
+        self.rpush(destination, value)
+        return value
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args: self.calls.append((name, args))
+
+            def execute(self):
+                return [getattr(client, name)(*args) for name, args in self.calls]
+
+        return Pipeline()
+
+
+@pytest.fixture(name="session_factory")
+def session_factory_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    try:
+        yield TestingSessionLocal
+    finally:
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed(SessionLocal, stock):
+    db = SessionLocal()
+    try:
+        user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+        product = models.Product(sku="HOT-SKU", name="Funda popular", cost_price=Decimal("5.00"),
+                                 selling_price=Decimal("12.50"), stock_quantity=stock)
+        db.add_all([user, product])
+        db.commit()
+        return user.id, product.id
+    finally:
+        db.close()
+
+
+def _reservation(user_id, product_id, quantity, reservation_id=None, time=None):
+    return json.dumps({
+        "id": reservation_id or uuid.uuid4().hex,
+        "user_id": user_id,
+        "time": (time or datetime.utcnow()).isoformat(),
+        "items": [[product_id, quantity, "12.50"]],
+    })
+
+
+class TestReservationWriter:
+    def test_drain_persists_queued_sales_in_batches(self, session_factory, monkeypatch):
+        client = ListRedis()
+        monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+        user_id, product_id = _seed(session_factory, 10)
+        for _ in range(5):
+            client.rpush(PENDING_KEY, _reservation(user_id, product_id, 1))
+
+        db = session_factory()
+        try:
+            stats = StockReservationService(batch_size=2).drain(db)
+
+            assert stats == {"persisted": 5, "duplicates": 0, "dead": 0, "batches": 3}
+            assert client.llen(PENDING_KEY) == 0 and client.llen(PROCESSING_KEY) == 0
+            assert db.query(models.PointOfSaleTransaction).count() == 5
+            assert db.query(func.sum(models.PointOfSaleItem.quantity_sold)).scalar() == 5
+            assert db.get(models.Product, product_id).stock_quantity == 5
+            assert db.query(func.sum(models.InventoryMovement.quantity)).scalar() == -5
+        finally:
+            db.close()
+
+    def test_recovery_skips_sales_persisted_before_crash(self, session_factory, monkeypatch):
+        client = ListRedis()
+        monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+        user_id, product_id = _seed(session_factory, 10)
+        service = StockReservationService(batch_size=10)
+
+        # El escritor anterior confirmó en BD pero murió antes de vaciar processing
+        persisted = _reservation(user_id, product_id, 2)
+        client.rpush(PENDING_KEY, persisted)
+        db = session_factory()
+        try:
+            service.drain(db)
+            client.rpush(PROCESSING_KEY, persisted, _reservation(user_id, product_id, 3))
+
+            stats = service.drain(db)
+
+            assert stats["persisted"] == 1 and stats["duplicates"] == 1
+            assert db.query(models.PointOfSaleTransaction).count() == 2
+            assert db.get(models.Product, product_id).stock_quantity == 5
+        finally:
+            db.close()
+
+    def test_rejected_reservation_goes_to_dead_letter_without_blocking(self, session_factory, monkeypatch):
+        client = ListRedis()
+        monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+        user_id, product_id = _seed(session_factory, 10)
+        # Índice único de la migración 003 (create_all no lo crea)
+        with session_factory.kw["bind"].begin() as connection:
+            connection.execute(text(
+                "CREATE UNIQUE INDEX uq_test_user_time ON point_of_sale_transactions (user_id, transaction_time)"
+            ))
+        same_time = datetime(2026, 10, 1, 10, 0, 0)
+        # Misma caja y mismo instante: viola el índice único (user_id, transaction_time)
+        client.rpush(
+            PENDING_KEY,
+            _reservation(user_id, product_id, 1, time=same_time),
+            _reservation(user_id, product_id, 2, time=same_time),
+            _reservation(user_id, product_id, 3),
+        )
+        client.rpush(PROCESSING_KEY, "{no es json")
+
+        db = session_factory()
+        try:
+            stats = StockReservationService(batch_size=10).drain(db)
+
+            assert stats["persisted"] == 2 and stats["dead"] == 2
+            assert client.llen(PENDING_KEY) == 0 and client.llen(PROCESSING_KEY) == 0
+            assert client.llen(DEAD_LETTER_KEY) == 2
+            assert "IntegrityError" in json.loads(client.lrange(DEAD_LETTER_KEY, 0, -1)[1])["error"]
+            assert db.get(models.Product, product_id).stock_quantity == 6
+
+            client.rpush(PENDING_KEY, _reservation(user_id, product_id, 1))
+            assert StockReservationService(batch_size=10).drain(db)["persisted"] == 1
+        finally:
+            db.close()
+
+
+def _redis_available():
+    try:
+        return cache_manager.get_sync_client().ping()
+    except Exception:
+        return False
+
+
+@pytest.mark.skipif(not _redis_available(), reason="Requiere un servidor Redis (scripts Lua)")
+class TestReserveWithRedis:
+    @pytest.fixture(autouse=True)
+    def clean_redis(self):
+        client = cache_manager.get_sync_client()
+        client.delete(PENDING_KEY, PROCESSING_KEY, *client.keys("stock:counter:*"))
+        yield
+        client.delete(PENDING_KEY, PROCESSING_KEY, *client.keys("stock:counter:*"))
+
+    def test_reserve_never_oversells_and_reconciles(self, session_factory):
+        user_id, product_id = _seed(session_factory, 3)
+        service = StockReservationService()
+        db = session_factory()
+        try:
+            items = [schemas.PointOfSaleItemCreate(product_id=product_id, quantity_sold=2)]
+            reservation = service.reserve_sale(db, items, user_id)
+            assert reservation["total_amount"] == Decimal("25.00")
+            with pytest.raises(InsufficientStockError):
+                service.reserve_sale(db, items, user_id)
+
+            # Stock en BD aún sin descontar: el contador descuenta lo encolado
+            assert service.reconcile(db) == {}
+            service.drain(db)
+            assert db.get(models.Product, product_id).stock_quantity == 1
+            assert service.reconcile(db) == {}
+        finally:
+            db.close()
+
+    @pytest.mark.slow
+    def test_benchmark_reservation_vs_synchronous(self, session_factory, monkeypatch):
+        """Benchmark: N cajas vendiendo el mismo SKU, camino síncrono frente a reservas"""
+        stock, threads, attempts = 200, 8, 30
+        service = StockReservationService()
+        results = {}
+
+        def sync_sale(db, user_id, product_id):
+            crud.create_pos_sale(db, schemas.PointOfSaleTransactionCreate(
+                items=[schemas.PointOfSaleItemCreate(product_id=product_id, quantity_sold=1)]
+            ), user_id)
+
+        def reserved_sale(db, user_id, product_id):
+            service.reserve_sale(db, [schemas.PointOfSaleItemCreate(product_id=product_id, quantity_sold=1)], user_id)
+
+        for label, sell in (("síncrono", sync_sale), ("reservas", reserved_sale)):
+            engine = session_factory.kw["bind"]
+            Base.metadata.drop_all(bind=engine)
+            Base.metadata.create_all(bind=engine)
+            user_id, product_id = _seed(session_factory, stock)
+            sold = []
+
+            def register():
+                db = session_factory()
+                try:
+                    for _ in range(attempts):
+                        try:
+                            sell(db, user_id, product_id)
+                            sold.append(1)
+                        except Exception:
+                            db.rollback()
+                finally:
+                    db.close()
+
+            workers = [threading.Thread(target=register) for _ in range(threads)]
+            began = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - began
+
+            db = session_factory()
+            try:
+                service.drain(db)
+                final_stock = db.get(models.Product, product_id).stock_quantity
+            finally:
+                db.close()
+            results[label] = (len(sold), final_stock, len(sold) / elapsed)
+
+        for label, (sold, final_stock, rate) in results.items():
+            print(f"\n{label}: {sold} ventas, stock final {final_stock}, {rate:.0f} ventas/s")
+        sold, final_stock, _ = results["reservas"]
+        assert final_stock == stock - sold >= 0
+
+
+def test_cache_wipes_keep_queued_reservations(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+    client.rpush(PENDING_KEY, _reservation(1, 1, 1))
+    client.set("stock:counter:1", 4)
+    client.set("cache:products:v0:list", b"x")
+
+    cache_manager.delete_pattern("*")
+    assert cache_manager.flush_all()
+
+    assert client.llen(PENDING_KEY) == 1 and client.get("stock:counter:1") == b"4"
+    assert client.get("cache:products:v0:list") is None
+
+
+class TestDirectSalesWithReservations:
+    @pytest.fixture(name="fake_redis")
+    def fake_redis_fixture(self, monkeypatch):
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeRedis()
+        monkeypatch.setattr(cache_manager, "get_sync_client", lambda: client)
+        monkeypatch.setattr(settings, "stock_reservation_enabled", True)
+        return client
+
+    def test_batch_sales_reserve_against_queued_sales(self, session_factory, fake_redis):
+        user_id, product_id = _seed(session_factory, 5)
+        db = session_factory()
+        app.dependency_overrides[get_db] = lambda: db
+        app.dependency_overrides[get_current_sales_staff_user] = lambda: db.get(models.User, user_id)
+        try:
+            client = TestClient(app)
+            items = [schemas.PointOfSaleItemCreate(product_id=product_id, quantity_sold=3)]
+            stock_reservation.reserve_sale(db, items, user_id)
+
+            def post_batch(quantity):
+                return client.post("/pos/sales/batch", json={"mode": "best_effort", "sales": [
+                    {"items": [{"product_id": product_id, "quantity_sold": quantity}]}
+                ]}).json()["results"][0]
+
+            # La BD aún tiene 5 unidades, pero 3 están encoladas
+            rejected = post_batch(3)
+            assert rejected["status"] == "rejected"
+            assert rejected["details"]["insufficient_items"][0]["available"] == 2
+            assert post_batch(2)["status"] == "created"
+            assert fake_redis.get(f"stock:counter:{product_id}") == b"0"
+            assert fake_redis.llen(DIRECT_KEY) == 0
+
+            stock_reservation.drain(db)
+            db.expire_all()
+            assert db.get(models.Product, product_id).stock_quantity == 0
+            assert stock_reservation.reconcile(db) == {}
+        finally:
+            app.dependency_overrides.clear()
+            db.close()
+
+    def test_failed_direct_sale_returns_its_reservation(self, session_factory, fake_redis, monkeypatch):
+        user_id, product_id = _seed(session_factory, 4)
+        db = session_factory()
+        try:
+            sale = schemas.PointOfSaleTransactionCreate(
+                items=[schemas.PointOfSaleItemCreate(product_id=product_id, quantity_sold=3)]
+            )
+
+            def fail(*args):
+                raise RuntimeError("conexión perdida")
+
+            monkeypatch.setattr(crud.sales_rollup, "rollup_sales", fail)
+            with pytest.raises(Exception):
+                crud.create_pos_sale(db, sale, user_id)
+            assert fake_redis.get(f"stock:counter:{product_id}") == b"4"
+            assert fake_redis.llen(DIRECT_KEY) == 0
+
+            monkeypatch.undo()
+            monkeypatch.setattr(cache_manager, "get_sync_client", lambda: fake_redis)
+            monkeypatch.setattr(settings, "stock_reservation_enabled", True)
+            crud.create_pos_sale(db, sale, user_id)
+            assert fake_redis.get(f"stock:counter:{product_id}") == b"1"
+            with pytest.raises(InsufficientStockError):
+                crud.create_pos_sale(db, sale, user_id)
+            assert db.get(models.Product, product_id).stock_quantity == 1
+        finally:
+            db.close()
+
+    def test_adjust_never_recreates_a_missing_counter(self, session_factory, fake_redis):
+        stock_reservation.adjust(7, -1)
+        assert fake_redis.get("stock:counter:7") is None
+
+        fake_redis.set("stock:counter:7", 5)
+        stock_reservation.adjust(7, 2)
+        assert fake_redis.get("stock:counter:7") == b"7"
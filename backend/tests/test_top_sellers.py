@@ -0,0 +1,132 @@
+"""
+Tests para el ranking de más vendidos en tiempo real
+"""
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud, models, schemas
+from app.cache import cache_manager
+from app.database import Base, get_db_session_maker
+from app.dependencies import get_current_sales_staff_user, get_read_db
+from app.main import app
+from app.services.top_sellers import TopSellersService, merge_summaries, window_keys
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_top_sellers.db"
+
+
+@pytest.fixture(name="session_factory")
+def session_factory_fixture():
+    TestingSessionLocal, test_engine = get_db_session_maker(SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=test_engine)
+    try:
+        yield TestingSessionLocal
+    finally:
+        Base.metadata.drop_all(bind=test_engine)
+
+
+def _seed_sales(SessionLocal, sales):
+    """Crea productos y registra ventas [(índice de producto, unidades)] por el camino normal"""
+    db = SessionLocal()
+    try:
+        user = models.User(username="cajero", email="cajero@test.com", hashed_password="x", role=models.UserRole.sales_staff)
+        products = [
+            models.Product(sku=f"TOP-{i}", name=f"Producto {i}", cost_price=Decimal("1.00"),
+                           selling_price=Decimal("2.50"), stock_quantity=1000)
+            for i in range(4)
+        ]
+        db.add_all([user, *products])
+        db.commit()
+        for index, quantity in sales:
+            crud.create_pos_sale(db, schemas.PointOfSaleTransactionCreate(
+                items=[schemas.PointOfSaleItemCreate(product_id=products[index].id, quantity_sold=quantity)]
+            ), user.id)
+        return [product.id for product in products]
+    finally:
+        db.close()
+
+
+def test_merge_adds_floor_of_full_summaries_to_missing_products():
+    # Resumen lleno (capacidad 2) sin el producto 3: pudo vender hasta su mínimo (4)
+    full = ([(b"1", 4.0), (b"2", 9.0)], {"1:rev": "400", "2:rev": "900", "1:err": "1"})
+    partial = ([(b"3", 6.0)], {"3:rev": "600"})
+
+    merged = merge_summaries([full, partial], capacity=2)
+
+    assert merged[1] == [4, 400, 1]
+    assert merged[2] == [9, 900, 0]
+    assert merged[3] == [6, 600, 4]
+
+
+def test_hour_window_spans_twelve_buckets():
+    keys = window_keys("hour", datetime(2026, 5, 4, 10, 7))
+    assert len(keys) == 12
+    assert keys[0] == "topsellers:5m:202605041005" and keys[-1] == "topsellers:5m:202605040910"
+
+
+def test_endpoint_falls_back_to_sql_without_redis(session_factory, monkeypatch):
+    def unavailable():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(cache_manager, "get_sync_client", unavailable)
+    product_ids = _seed_sales(session_factory, [(0, 1), (1, 5), (2, 3), (1, 2)])
+
+    def override_get_read_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    app.dependency_overrides[get_current_sales_staff_user] = lambda: SimpleNamespace(id=1)
+    try:
+        client = TestClient(app)
+        response = client.get("/reports/top-sellers/realtime", params={"window": "today", "limit": 2})
+        strict = client.get("/reports/top-sellers/realtime", params={"source": "redis"})
+    finally:
+        app.dependency_overrides.clear()
+
+    body = response.json()
+    assert body["source"] == "sql" and body["approximate"] is False
+    assert [(item["product_id"], item["units"]) for item in body["items"]] == [
+        (product_ids[1], 7), (product_ids[2], 3)
+    ]
+    assert strict.status_code == 503
+
+
+def _redis_available():
+    try:
+        return cache_manager.get_sync_client().ping()
+    except Exception:
+        return False
+
+
+def _clear_rankings(client):
+    keys = client.keys("topsellers:*")
+    if keys:
+        client.delete(*keys)
+
+
+@pytest.mark.skipif(not _redis_available(), reason="Requiere un servidor Redis (scripts Lua)")
+def test_redis_ranking_matches_sql(session_factory):
+    client = cache_manager.get_sync_client()
+    _clear_rankings(client)
+    try:
+        _seed_sales(session_factory, [(0, 1), (1, 5), (2, 3), (3, 2), (1, 2), (2, 1)])
+        service = TopSellersService(capacity=3)
+        db = session_factory()
+        try:
+            exact = service.top_exact(db, "today", 2)
+        finally:
+            db.close()
+
+        for window in ("hour", "today", "7d"):
+            ranking = service.top(window, 2)
+            assert [(item.product_id, item.units) for item in ranking] == \
+                [(item.product_id, item.units) for item in exact]
+    finally:
+        _clear_rankings(client)